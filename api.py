@@ -0,0 +1,510 @@
+"""
+Headless JSON API over PrinterServiceCRM, for the website intake form and
+the label printers.
+
+    uvicorn api:app --port 8502                  # one process
+    uvicorn api:app --port 8502 --workers 4      # one process per core
+
+Every request except /health needs "Authorization: Bearer <api.token>":
+
+    GET    /health
+    GET    /orders?status=&technician=&phone=&q=&received_from=&received_to=&archive=1&limit=&offset=
+    POST   /orders
+    GET    /orders/{order_id}
+    PATCH  /orders/{order_id}
+    GET    /orders/{order_id}/receipt/initial.pdf
+    GET    /orders/{order_id}/receipt/completion.pdf
+
+printer.py is imported in Streamlit "bare mode", so the API uses the same
+CRM class, the same Sheets connection (one per process, reused by every
+request) and the same in-process registries as the UI. The CRM is
+blocking: handlers run it on a bounded thread pool (api.threads). Every
+write reads the whole worksheet, changes it and writes it back (and a new
+order takes the lowest free number), so writes hold the branch's write
+lock (printer.get_write_lock, a lock file under locks.path): across the
+threads and the --workers processes of the API, the Streamlit app and the
+batch CLI. The lock file orders the processes of one machine only; run
+every process that writes a branch's sheets on the same host.
+
+Secrets:
+
+    [api]
+    token = "..."
+    threads = 16        # concurrent Sheets calls per process
+    list_ttl = 5        # seconds a GET /orders frame is reused (writes through the API drop it)
+    user = "api"        # recorded as the author in the audit log
+    branch = "main"     # the branch (see branches.py) whose orders this process serves
+"""
+import contextlib
+import hmac
+import io
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime
+from functools import partial
+from pathlib import Path
+from typing import Optional
+
+_UVICORN_LOGGERS = ("uvicorn", "uvicorn.access", "uvicorn.asgi", "uvicorn.error")
+# uvicorn își configurează logurile înainte să importe aplicația; Streamlit le preia când își citește configul
+_UVICORN_LOG_STATE = {
+    name: (logging.getLogger(name).level, logging.getLogger(name).propagate) for name in _UVICORN_LOGGERS
+}
+
+import anyio  # noqa: E402
+import pandas as pd  # noqa: E402
+import streamlit as st  # noqa: E402
+import streamlit.logger  # noqa: E402
+from streamlit import config as st_config  # noqa: E402
+
+# printer.py rulează în "bare mode"; avertismentele de la import nu au ce căuta în logul API-ului
+streamlit.logger.set_log_level("error")
+
+from starlette.applications import Starlette  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+from starlette.responses import JSONResponse, Response  # noqa: E402
+from starlette.routing import Route  # noqa: E402
+
+import printer  # noqa: E402
+from clients import client_id_for_phone, client_ids_for_phones  # noqa: E402
+from lineitems import ITEM_STATUSES  # noqa: E402
+
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+# câmpurile pe care PATCH le poate modifica (restul sunt calculate de CRM)
+UPDATABLE_FIELDS = (
+    "client_name", "client_phone", "client_email",
+    "issue_description", "accessories", "notes",
+    "date_pickup_scheduled", "date_completed", "date_picked_up",
+    "status", "technician", "repair_details", "parts_used",
+    "labor_cost", "parts_cost",
+)
+DATE_FIELDS = ("date_received", "date_pickup_scheduled", "date_completed", "date_picked_up")
+COST_FIELDS = ("labor_cost", "parts_cost")
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def get_api_settings() -> dict:
+    try:
+        return dict(st.secrets.get("api", {}))
+    except Exception:
+        return {}
+
+
+def get_company_info() -> dict:
+    try:
+        return dict(st.secrets.get("company_info", {}))
+    except Exception:
+        return {}
+
+
+def quiet_streamlit():
+    """
+    printer.py runs in Streamlit "bare mode": silence Streamlit's loggers
+    (every worker thread warns about a missing ScriptRunContext) and give the
+    uvicorn loggers Streamlit adopted back to uvicorn.
+    """
+    st_config.get_option("logger.level")   # forțează citirea configului (altfel ar reseta nivelul mai târziu)
+    streamlit.logger.set_log_level("error")
+    for name, (level, propagate) in _UVICORN_LOG_STATE.items():
+        log = logging.getLogger(name)
+        handler = getattr(log, "streamlit_console_handler", None)
+        if handler is not None:
+            log.removeHandler(handler)
+        log.setLevel(level)
+        log.propagate = propagate
+
+
+# ============================================================================
+# SERIALIZATION
+# ============================================================================
+def _json_value(key: str, value):
+    """Empty cells → "" (costs → 0.0), numpy scalars → Python."""
+    if key in printer.COST_COLUMNS:
+        return printer.safe_float(value)
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    if hasattr(value, "item"):
+        try:
+            value = value.item()
+        except (ValueError, AttributeError):
+            pass
+    return value
+
+
+def _json_row(rec) -> dict:
+    row = {key: _json_value(key, value) for key, value in rec.items() if key != "printers_json"}
+    row["printers"] = printer.load_printers_from_order(rec)
+    return row
+
+
+def order_json(order) -> dict:
+    """One order as JSON: sheet columns, printers as a list, per-printer items if any."""
+    data = _json_row(order.to_dict())
+    order_id = data.get("order_id") or ""
+    line_items = printer.get_line_items(printer.order_branch(order_id))
+    if line_items.has_items(order_id):
+        data["items"] = [
+            {k: v for k, v in it.to_row(order_id).items() if k != "order_id"}
+            for it in line_items.items_for(order_id, data["printers"])
+        ]
+    return data
+
+
+def rows_json(df: pd.DataFrame) -> list:
+    return [_json_row(rec) for rec in df.to_dict("records")]
+
+
+# ============================================================================
+# VALIDATION
+# ============================================================================
+def _text_field(body: dict, key: str, required: bool = False) -> str:
+    value = body.get(key, "")
+    if value is None:
+        value = ""
+    if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+        raise ApiError(422, f"{key} must be a string")
+    value = str(value).strip()
+    if required and not value:
+        raise ApiError(422, f"{key} is required")
+    return value
+
+
+def _date_field(body: dict, key: str) -> str:
+    value = _text_field(body, key)
+    if not value:
+        return ""
+    try:
+        return date.fromisoformat(value).strftime("%Y-%m-%d")
+    except ValueError:
+        raise ApiError(422, f"{key} must be a date (YYYY-MM-DD)")
+
+
+def _cost_field(body: dict, key: str) -> float:
+    value = body.get(key)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value != value or value < 0:
+        raise ApiError(422, f"{key} must be a non-negative number")
+    return round(float(value), 2)
+
+
+def _printers_field(body: dict) -> list:
+    printers = body.get("printers")
+    if not isinstance(printers, list):
+        raise ApiError(422, "printers must be a list")
+    cleaned = []
+    for p in printers:
+        if not isinstance(p, dict):
+            raise ApiError(422, "each printer must be an object")
+        brand = printer.safe_text(p.get("brand", "")).strip()
+        model = printer.safe_text(p.get("model", "")).strip()
+        serial = printer.safe_text(p.get("serial", "")).strip()
+        if brand or model or serial:
+            cleaned.append({"brand": brand, "model": model, "serial": serial, "warranty": bool(p.get("warranty", False))})
+    if not cleaned:
+        raise ApiError(422, "at least one printer (brand, model or serial) is required")
+    return cleaned
+
+
+def parse_new_order(body: dict) -> dict:
+    """create_service_order keyword arguments from a POST /orders body (same rules as the New Order tab)."""
+    return {
+        "client_name": _text_field(body, "client_name", required=True),
+        "client_phone": _text_field(body, "client_phone", required=True),
+        "client_email": _text_field(body, "client_email"),
+        "printers_list": _printers_field(body),
+        "issue_description": _text_field(body, "issue_description", required=True),
+        "accessories": _text_field(body, "accessories"),
+        "notes": _text_field(body, "notes"),
+        "date_received": _date_field(body, "date_received") or date.today(),
+        "date_pickup": _date_field(body, "date_pickup_scheduled"),
+    }
+
+
+def parse_update(body: dict, order) -> dict:
+    """update_order keyword arguments from a PATCH body, with the Update tab's side effects."""
+    unknown = [key for key in body if key not in UPDATABLE_FIELDS and key != "printers"]
+    if unknown:
+        raise ApiError(422, f"fields cannot be updated: {', '.join(sorted(unknown))}")
+    order_id = printer.safe_text(order.get("order_id"))
+    updates = {}
+    for key in body:
+        if key in COST_FIELDS:
+            if printer.get_line_items(printer.order_branch(order_id)).has_items(order_id):
+                raise ApiError(409, "costs of a multi-printer order are set per printer")
+            updates[key] = _cost_field(body, key)
+        elif key in DATE_FIELDS:
+            updates[key] = _date_field(body, key)
+        elif key == "printers":
+            printers = _printers_field(body)
+            updates["printers_json"] = json.dumps(printers, ensure_ascii=False)
+            updates["printer_brand"] = printers[0]["brand"]
+            updates["printer_model"] = printers[0]["model"]
+            updates["printer_serial"] = printers[0]["serial"]
+        elif key in ("client_name", "client_phone"):
+            updates[key] = _text_field(body, key, required=True)
+        else:
+            updates[key] = _text_field(body, key)
+
+    status = updates.get("status")
+    if status is not None:
+        if status not in ITEM_STATUSES:
+            raise ApiError(422, f"status must be one of: {', '.join(ITEM_STATUSES)}")
+        today = datetime.now().strftime("%Y-%m-%d")
+        if status == "Ready for Pickup" and not order.get("date_completed") and "date_completed" not in updates:
+            updates["date_completed"] = today
+        if status == "Completed" and "date_picked_up" not in updates:
+            updates["date_picked_up"] = today
+    if "client_phone" in updates:
+        updates["client_id"] = client_id_for_phone(updates["client_phone"])
+    return updates
+
+
+def filter_orders_df(df: pd.DataFrame, params) -> pd.DataFrame:
+    """Filters of GET /orders; every one is optional and they combine with AND."""
+    if df.empty:
+        return df
+    mask = pd.Series(True, index=df.index)
+    for key in ("status", "technician"):
+        value = params.get(key, "").strip()
+        if value and key in df.columns:
+            mask &= (df[key].astype(str) == value).to_numpy()
+    phone = params.get("phone", "").strip()
+    if phone and "client_phone" in df.columns:
+        mask &= (client_ids_for_phones(df["client_phone"].astype(object)) == client_id_for_phone(phone)).to_numpy()
+    received = df["date_received"].astype(str) if "date_received" in df.columns else None
+    for key, op in (("received_from", "ge"), ("received_to", "le")):
+        value = params.get(key, "").strip()
+        if value and received is not None:
+            try:
+                bound = date.fromisoformat(value).strftime("%Y-%m-%d")
+            except ValueError:
+                raise ApiError(422, f"{key} must be a date (YYYY-MM-DD)")
+            # datele sunt scrise ca YYYY-MM-DD, deci compararea textului e corectă
+            mask &= getattr(received, op)(bound).to_numpy() & (received != "").to_numpy()
+    df = df[mask.to_numpy()]
+    query = params.get("q", "").strip()
+    return printer.filter_orders(df, query) if query else df
+
+
+def _int_param(params, key: str, default: int, maximum: Optional[int] = None) -> int:
+    raw = params.get(key, "")
+    if raw == "":
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ApiError(422, f"{key} must be an integer")
+    if value < 0:
+        raise ApiError(422, f"{key} must not be negative")
+    return min(value, maximum) if maximum is not None else value
+
+
+# ============================================================================
+# SERVICE
+# ============================================================================
+class OrderService:
+    """Blocking CRM calls behind the API; every method runs on a worker thread."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.crm = None
+        self.company_info = get_company_info()
+        logo_path = Path("logo.png")
+        self.logo_bytes = logo_path.read_bytes() if logo_path.exists() else None
+        self.list_ttl = float(get_api_settings().get("list_ttl", 5))
+        self._frames = {}   # include_archive → (monotonic, frame compact)
+        self._frames_lock = threading.Lock()
+
+    def start(self):
+        if self.conn is None:
+            raise RuntimeError("Google Sheets connection is not available")
+        settings = get_api_settings()
+        # update_order / record_audit citesc aceste chei din session_state (global în bare mode)
+        st.session_state["username"] = settings.get("user", "api")
+        st.session_state["company_info"] = self.company_info
+        branches = printer.get_branches()
+        code = settings.get("branch", next(iter(branches)))
+        if code not in branches:
+            raise RuntimeError(f"api.branch '{code}' is not a configured branch")
+        self.crm = printer.PrinterServiceCRM(self.conn, branch=branches[code])
+        df_live, _ = printer.load_indexes(self.crm)
+        printer.sync_work_queue(self.crm, df_live)
+
+    def _logo(self):
+        return io.BytesIO(self.logo_bytes) if self.logo_bytes else None
+
+    def _orders_frame(self, include_archive: bool) -> pd.DataFrame:
+        """list_orders_df, reused for list_ttl seconds: listing is the hot path of the intake site."""
+        now = time.monotonic()
+        with self._frames_lock:
+            cached = self._frames.get(include_archive)
+        if cached is not None and now - cached[0] < self.list_ttl:
+            return cached[1]
+        df = self.crm.list_orders_df(include_archive=include_archive)
+        with self._frames_lock:
+            self._frames[include_archive] = (now, df)
+        return df
+
+    def _invalidate(self):
+        with self._frames_lock:
+            self._frames.clear()
+
+    def list_orders(self, params) -> dict:
+        include_archive = params.get("archive", "") in ("1", "true", "yes")
+        limit = _int_param(params, "limit", DEFAULT_LIMIT, MAX_LIMIT)
+        offset = _int_param(params, "offset", 0)
+        df = filter_orders_df(self._orders_frame(include_archive), params)
+        return {"total": len(df), "offset": offset, "limit": limit, "orders": rows_json(df.iloc[offset:offset + limit])}
+
+    def get_order(self, order_id: str):
+        order = self.crm.get_order(order_id)
+        if order is None:
+            raise ApiError(404, f"order {order_id} not found")
+        return order
+
+    def create_order(self, body: dict) -> dict:
+        args = parse_new_order(body)
+        with self.crm.write_lock:
+            order_id = self.crm.create_service_order(**args)
+            self._invalidate()
+        if not order_id:
+            raise ApiError(502, "order could not be saved to Google Sheets")
+        return order_json(self.get_order(order_id))
+
+    def update_order(self, order_id: str, body: dict) -> dict:
+        # citirea comenzii intră sub lacăt: parse_update pornește de la ea
+        with self.crm.write_lock:
+            order = self.get_order(order_id)
+            updates = parse_update(body, order)
+            if updates:
+                saved = self.crm.update_order(order_id, **updates)
+                self._invalidate()
+                if not saved:
+                    raise ApiError(502, "order could not be saved to Google Sheets")
+        return order_json(self.get_order(order_id))
+
+    def receipt(self, order_id: str, kind: str) -> bytes:
+        order = self.get_order(order_id)
+        if kind == "initial":
+            pdf = printer.generate_initial_receipt_pdf(
+                order, self.company_info, self._logo(), equipment=printer.get_equipment_registry(self.crm.branch.code)
+            )
+        else:
+            line_items = printer.get_line_items(self.crm.branch.code)
+            pdf = printer.generate_completion_receipt_pdf(
+                order, self.company_info, self._logo(),
+                items=line_items.items_for(order_id, printer.load_printers_from_order(order))
+                if line_items.has_items(order_id) else None,
+            )
+        return pdf.getvalue()
+
+
+# ============================================================================
+# HTTP
+# ============================================================================
+def _error(status: int, message: str) -> JSONResponse:
+    return JSONResponse({"error": message}, status_code=status)
+
+
+def create_app(conn=None, token: Optional[str] = None) -> Starlette:
+    """The ASGI app; conn defaults to the app's Sheets connection, token to secrets api.token."""
+    quiet_streamlit()
+    settings = get_api_settings()
+    token = token if token is not None else str(settings.get("token", ""))
+    limiter = anyio.CapacityLimiter(int(settings.get("threads", 16)))
+    service = OrderService(conn)
+
+    async def run(fn, *args):
+        return await anyio.to_thread.run_sync(partial(fn, *args), limiter=limiter)
+
+    def endpoint(handler):
+        """Bearer-token check + ApiError → JSON error response."""
+        async def wrapped(request: Request):
+            if not token:
+                return _error(503, "api.token is not configured")
+            supplied = request.headers.get("authorization", "")
+            if not hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode()):
+                return _error(401, "missing or invalid bearer token")
+            try:
+                return await handler(request)
+            except ApiError as e:
+                return _error(e.status, e.message)
+        return wrapped
+
+    async def _body(request: Request) -> dict:
+        try:
+            body = await request.json()
+        except (ValueError, UnicodeDecodeError):
+            raise ApiError(400, "body must be JSON")
+        if not isinstance(body, dict):
+            raise ApiError(400, "body must be a JSON object")
+        return body
+
+    async def health(request: Request):
+        return JSONResponse({"ok": service.crm is not None, "worker": os.getpid()})
+
+    async def list_orders(request: Request):
+        return JSONResponse(await run(service.list_orders, dict(request.query_params)))
+
+    async def create_order(request: Request):
+        body = await _body(request)
+        return JSONResponse(await run(service.create_order, body), status_code=201)
+
+    async def get_order(request: Request):
+        order = await run(service.get_order, request.path_params["order_id"])
+        return JSONResponse(order_json(order))
+
+    async def update_order(request: Request):
+        body = await _body(request)
+        return JSONResponse(await run(service.update_order, request.path_params["order_id"], body))
+
+    async def receipt(request: Request):
+        order_id = request.path_params["order_id"]
+        kind = request.path_params["kind"]
+        if kind not in ("initial", "completion"):
+            raise ApiError(404, "receipt must be initial.pdf or completion.pdf")
+        pdf = await run(service.receipt, order_id, kind)
+        return Response(pdf, media_type="application/pdf", headers={
+            "Content-Disposition": f'inline; filename="{kind.capitalize()}_{order_id}.pdf"',
+        })
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        await run(service.start)
+        yield
+
+    app = Starlette(
+        routes=[
+            Route("/health", health),
+            Route("/orders", endpoint(list_orders), methods=["GET"]),
+            Route("/orders", endpoint(create_order), methods=["POST"]),
+            Route("/orders/{order_id}", endpoint(get_order), methods=["GET"]),
+            Route("/orders/{order_id}", endpoint(update_order), methods=["PATCH"]),
+            Route("/orders/{order_id}/receipt/{kind}.pdf", endpoint(receipt), methods=["GET"]),
+        ],
+        lifespan=lifespan,
+    )
+    app.state.service = service
+    return app
+
+
+def _default_app() -> Starlette:
+    return create_app(printer.get_sheets_connection())
+
+
+def __getattr__(name):
+    # `uvicorn api:app` — aplicația (și conexiunea la Sheets) se construiesc doar la cerere
+    if name == "app":
+        globals()["app"] = _default_app()
+        return globals()["app"]
+    raise AttributeError(name)
@@ -0,0 +1,255 @@
+"""
+Photos and documents attached to an order or to one printer of an order.
+
+The files live in a content-addressed blob store on local disk:
+
+    blobs/ab/<sha256>         the uploaded bytes, stored once per content
+    thumbs/ab/<sha256>.jpg    preview of an image, made in a background pool
+
+The sheets only hold references: one row per attachment in the child
+worksheet Order_Attachments (attachment id, order, printer line, sha256,
+name, type, size), never file contents. The same photo uploaded to two
+orders is one blob; a blob is removed with its last reference.
+
+Thumbnails are made by PIL in a small thread pool (decoding and resizing
+release the GIL), so an upload returns as soon as the bytes are on disk.
+Reads are lazy and memory-mapped: the UI maps only the thumbnails of the
+order on screen, and a full file only when its download is clicked.
+"""
+import hashlib
+import mmap
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from cells import safe_text
+
+
+ATTACHMENT_COLUMNS = [
+    "attachment_id", "order_id", "line_no", "sha256", "file_name", "mime", "size", "uploaded_at", "uploaded_by",
+]
+IMAGE_TYPES = ("jpg", "jpeg", "png", "webp", "heic", "gif", "bmp", "tif", "tiff")
+DOCUMENT_TYPES = ("pdf", "txt", "csv", "xlsx", "docx")
+
+
+class Attachment:
+    __slots__ = ("attachment_id", "order_id", "line_no", "sha256", "file_name", "mime", "size",
+                 "uploaded_at", "uploaded_by")
+
+    def __init__(self, attachment_id: str, order_id: str, line_no: Optional[int], sha256: str,
+                 file_name: str, mime: str = "", size: int = 0, uploaded_at: str = "", uploaded_by: str = ""):
+        self.attachment_id = attachment_id
+        self.order_id = order_id
+        self.line_no = line_no          # None = toată comanda, altfel indexul imprimantei (0-based)
+        self.sha256 = sha256
+        self.file_name = file_name
+        self.mime = mime
+        self.size = size
+        self.uploaded_at = uploaded_at
+        self.uploaded_by = uploaded_by
+
+    @property
+    def is_image(self) -> bool:
+        return self.mime.startswith("image/")
+
+    @classmethod
+    def new(cls, order_id: str, line_no: Optional[int], sha256: str, file_name: str, mime: str,
+            size: int, user: str = "") -> "Attachment":
+        return cls(
+            uuid.uuid4().hex[:12], order_id, line_no, sha256, file_name, mime, size,
+            datetime.now().isoformat(timespec="seconds"), user,
+        )
+
+    @classmethod
+    def from_row(cls, rec: dict) -> "Attachment":
+        line_no = safe_text(rec.get("line_no")).strip()
+        return cls(
+            safe_text(rec.get("attachment_id")),
+            safe_text(rec.get("order_id")),
+            int(float(line_no)) if line_no else None,
+            safe_text(rec.get("sha256")),
+            safe_text(rec.get("file_name")),
+            safe_text(rec.get("mime")),
+            int(float(safe_text(rec.get("size")) or 0)),
+            safe_text(rec.get("uploaded_at")),
+            safe_text(rec.get("uploaded_by")),
+        )
+
+    def to_row(self) -> dict:
+        row = {col: getattr(self, col) for col in ATTACHMENT_COLUMNS}
+        row["line_no"] = "" if self.line_no is None else self.line_no
+        return row
+
+
+class AttachmentIndex:
+    """order_id → attachments, plus reference counts per blob."""
+
+    def __init__(self):
+        self._by_order = {}
+        self._refs = {}      # sha256 → câte atașamente o folosesc
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def load(self, df: Optional[pd.DataFrame]):
+        """Build the index from the Order_Attachments worksheet (once per process)."""
+        with self._lock:
+            self._by_order.clear()
+            self._refs.clear()
+            if df is not None and not df.empty and "attachment_id" in df.columns:
+                for rec in df.to_dict("records"):
+                    att = Attachment.from_row(rec)
+                    if att.attachment_id and att.order_id:
+                        self._add(att)
+            self.loaded = True
+
+    def _add(self, att: Attachment):
+        self._by_order.setdefault(att.order_id, []).append(att)
+        self._refs[att.sha256] = self._refs.get(att.sha256, 0) + 1
+
+    def add(self, attachments: list):
+        with self._lock:
+            for att in attachments:
+                self._add(att)
+
+    def remove(self, attachment_ids: set) -> list:
+        """Drop attachments by id; returns the blobs no attachment refers to any more."""
+        orphaned = []
+        with self._lock:
+            for order_id, items in list(self._by_order.items()):
+                keep = [a for a in items if a.attachment_id not in attachment_ids]
+                for att in items:
+                    if att.attachment_id in attachment_ids:
+                        self._refs[att.sha256] -= 1
+                        if self._refs[att.sha256] <= 0:
+                            del self._refs[att.sha256]
+                            orphaned.append(att.sha256)
+                if keep:
+                    self._by_order[order_id] = keep
+                else:
+                    del self._by_order[order_id]
+        return orphaned
+
+    def refers_to(self, digest: str) -> bool:
+        with self._lock:
+            return digest in self._refs
+
+    def for_order(self, order_id: str) -> list:
+        with self._lock:
+            return list(self._by_order.get(order_id, ()))
+
+    def count(self, order_id: str) -> int:
+        return len(self._by_order.get(order_id, ()))
+
+
+class BlobStore:
+    def __init__(self, path, workers: int = 2, thumb_px: int = 320):
+        self.path = Path(path)
+        self.thumb_px = thumb_px
+        self._blobs = self.path / "blobs"
+        self._thumbs = self.path / "thumbs"
+        self._blobs.mkdir(parents=True, exist_ok=True)
+        self._thumbs.mkdir(parents=True, exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbs")
+        self._pending = {}       # sha256 → Future
+        self._no_preview = set() # blob-uri pe care PIL nu le poate deschide
+        self._lock = threading.Lock()
+
+    def _blob_path(self, digest: str) -> Path:
+        return self._blobs / digest[:2] / digest
+
+    def _thumb_path(self, digest: str) -> Path:
+        return self._thumbs / digest[:2] / f"{digest}.jpg"
+
+    # ------------------------------------------------------------------ write
+    def put(self, data: bytes, image: bool = False) -> tuple:
+        """Store `data` unless the same content is already there. Returns (sha256, newly written)."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        written = False
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{digest}.{uuid.uuid4().hex[:8]}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+            written = True
+        if image:
+            self._schedule_thumbnail(digest)
+        return digest, written
+
+    def remove(self, digest: str):
+        self._blob_path(digest).unlink(missing_ok=True)
+        self._thumb_path(digest).unlink(missing_ok=True)
+
+    def _schedule_thumbnail(self, digest: str):
+        with self._lock:
+            if digest in self._pending or digest in self._no_preview or self._thumb_path(digest).exists():
+                return
+            future = self._pool.submit(self._make_thumbnail, digest)
+            self._pending[digest] = future
+        future.add_done_callback(lambda _: self._pending.pop(digest, None))
+
+    def _make_thumbnail(self, digest: str):
+        target = self._thumb_path(digest)
+        try:
+            with Image.open(self._blob_path(digest)) as img:
+                # JPEG: decodează direct la o rezoluție redusă (mult mai rapid pentru poze de telefon)
+                img.draft("RGB", (self.thumb_px * 2, self.thumb_px * 2))
+                thumb = ImageOps.exif_transpose(img)
+                thumb.thumbnail((self.thumb_px, self.thumb_px))
+                if thumb.mode != "RGB":
+                    thumb = thumb.convert("RGBA")
+                    flat = Image.new("RGB", thumb.size, "white")
+                    flat.paste(thumb, mask=thumb.getchannel("A"))
+                    thumb = flat
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp = target.with_suffix(".tmp")
+            thumb.save(tmp, "JPEG", quality=80, optimize=True)
+            os.replace(tmp, target)
+        except (OSError, UnidentifiedImageError, ValueError, Image.DecompressionBombError):
+            with self._lock:
+                self._no_preview.add(digest)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the queued thumbnails are done (batch jobs, shutdown)."""
+        with self._lock:
+            futures = list(self._pending.values())
+        return not wait(futures, timeout=timeout).not_done
+
+    # ------------------------------------------------------------------ read
+    @staticmethod
+    def _mapped(path: Path) -> Optional[bytes]:
+        try:
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return b""
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return mm[:]
+        except FileNotFoundError:
+            return None
+
+    def read(self, digest: str) -> Optional[bytes]:
+        return self._mapped(self._blob_path(digest))
+
+    def thumbnail(self, digest: str) -> Optional[bytes]:
+        """
+        The JPEG preview of an image blob, or None while it is being made (a
+        missing preview is queued here, e.g. after the thumbs folder was
+        cleared) or if the blob is not an image PIL can read.
+        """
+        data = self._mapped(self._thumb_path(digest))
+        if data is None and self._blob_path(digest).exists():
+            self._schedule_thumbnail(digest)
+        return data
+
+    def has_preview(self, digest: str) -> bool:
+        return digest not in self._no_preview
+
+    def size_bytes(self) -> int:
+        return sum(p.stat().st_size for p in self._blobs.glob("*/*") if not p.name.endswith(".tmp"))
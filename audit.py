@@ -0,0 +1,274 @@
+"""
+Append-only audit log of order changes.
+
+Every create/update/delete is recorded as one entry with field-level diffs
+({field: [old, new]}), the user and a timestamp. Storage layout (one
+directory):
+
+    active.jsonl      entries not yet compressed (appended + flushed per write)
+    seg-000001.bin    sealed segments: a sequence of zlib-compressed blocks
+    index.jsonl       one line per block: segment, offset, length, last seq,
+                      and the order ids the block contains
+
+When active.jsonl reaches block_records entries it is compressed into one
+block at the end of the current segment; segments roll over at
+segment_bytes. Sealed segments and the index are only ever appended to.
+
+The in-memory index maps order_id → blocks, so the history of one order
+decompresses only the blocks that mention it, never the whole log.
+Recovery is by sequence number: a block is only visible once its index line
+is written, and active entries already covered by an indexed block are
+dropped on open.
+
+Several processes write the same directory (the Streamlit server, the
+batch CLI, every API worker). Appends and seals hold the cross-process
+lock on .lock, and under it a process first catches up with what the
+others wrote: the index lines added since it last looked, and the active
+entries (active.jsonl is rewritten whole when a block is sealed). The next
+sequence number is taken from that, so it is unique across processes.
+"""
+import json
+import os
+import threading
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+from filelocks import FileLock
+
+
+ACTION_CREATE = "create"
+ACTION_UPDATE = "update"
+ACTION_DELETE = "delete"
+
+
+def _plain(value):
+    """JSON-friendly cell value: NaN/None → None, numpy scalars → Python, rest unchanged."""
+    if value is None:
+        return None
+    if isinstance(value, float) and value != value:
+        return None
+    if hasattr(value, "item"):
+        try:
+            value = value.item()
+        except (ValueError, AttributeError):
+            pass
+    return value
+
+
+def _same(old, new) -> bool:
+    if old is None or old == "":
+        return new is None or new == ""
+    if isinstance(old, (int, float)) or isinstance(new, (int, float)):
+        try:
+            return float(old) == float(new)
+        except (TypeError, ValueError):
+            return False
+    return str(old) == str(new)
+
+
+def diff_fields(old: Optional[dict], new: Optional[dict], fields=None) -> dict:
+    """{field: [old, new]} for every field whose value changed (None on the missing side)."""
+    old = old or {}
+    new = new or {}
+    keys = fields if fields is not None else list(dict.fromkeys(list(old) + list(new)))
+    changes = {}
+    for key in keys:
+        o, n = _plain(old.get(key)), _plain(new.get(key))
+        if not _same(o, n):
+            changes[key] = [o, n]
+    return changes
+
+
+class AuditLog:
+    def __init__(self, path, block_records: int = 256, segment_bytes: int = 4 * 1024 * 1024):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.block_records = block_records
+        self.segment_bytes = segment_bytes
+        self._active_path = self.path / "active.jsonl"
+        self._index_path = self.path / "index.jsonl"
+        self._blocks = []          # [(segment, offset, length, last_seq)]
+        self._by_order = {}        # order_id → [index în _blocks]
+        self._active = []          # intrări încă necomprimate
+        self._seq = 0
+        self._segment = 1
+        self._index_pos = 0        # cât din index.jsonl a fost citit
+        self._indexed_seq = 0      # ultimul seq dintr-un bloc indexat
+        self._lock = FileLock(self.path / ".lock")
+        with self._lock:
+            self._catch_up()
+            # rescriem active.jsonl doar cu intrările valide
+            self._rewrite_active()
+
+    # ------------------------------------------------------------------ recovery
+    def _catch_up(self):
+        """Read what other processes appended since the last call (lock held)."""
+        if self._index_path.exists():
+            with open(self._index_path, "rb") as f:
+                f.seek(self._index_pos)
+                data = f.read()
+            # o linie fără \n e scrisă pe jumătate (sau încă se scrie): o citim data viitoare
+            complete = data[:data.rfind(b"\n") + 1]
+            self._index_pos += len(complete)
+            for line in complete.decode("utf-8").splitlines():
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue   # linie scrisă pe jumătate la o oprire bruscă
+                self._add_block(rec["seg"], rec["off"], rec["len"], rec["last_seq"], rec["orders"])
+                self._segment = max(self._segment, rec["seg"])
+                self._indexed_seq = max(self._indexed_seq, rec["last_seq"])
+        indexed_seq = self._indexed_seq
+        self._active = []
+        if self._active_path.exists():
+            with open(self._active_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if entry.get("seq", 0) > indexed_seq:
+                        self._active.append(entry)
+        self._seq = max([indexed_seq] + [e["seq"] for e in self._active])
+
+    def _add_block(self, seg, off, length, last_seq, orders):
+        self._blocks.append((seg, off, length, last_seq))
+        pos = len(self._blocks) - 1
+        for order_id in orders:
+            self._by_order.setdefault(order_id, []).append(pos)
+
+    def _segment_path(self, seg: int) -> Path:
+        return self.path / f"seg-{seg:06d}.bin"
+
+    def _rewrite_active(self):
+        tmp = self._active_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entry in self._active:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._active_path)
+
+    # ------------------------------------------------------------------ write
+    def record(self, action: str, order_id: str, changes: dict, user: str = "",
+               when: Optional[datetime] = None) -> Optional[dict]:
+        """Append one entry; updates with no field changes are not recorded."""
+        if action == ACTION_UPDATE and not changes:
+            return None
+        with self._lock:
+            self._catch_up()
+            self._seq += 1
+            entry = {
+                "seq": self._seq,
+                "ts": (when or datetime.now()).strftime("%Y-%m-%d %H:%M:%S"),
+                "user": user,
+                "action": action,
+                "order_id": order_id,
+                "changes": changes,
+            }
+            with open(self._active_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._active.append(entry)
+            if len(self._active) >= self.block_records:
+                self._seal_block()
+            return entry
+
+    def _seal_block(self):
+        if not self._active:
+            return
+        payload = "\n".join(json.dumps(e, ensure_ascii=False) for e in self._active).encode("utf-8")
+        block = zlib.compress(payload, 6)
+        seg_path = self._segment_path(self._segment)
+        if seg_path.exists() and seg_path.stat().st_size + len(block) > self.segment_bytes:
+            self._segment += 1
+            seg_path = self._segment_path(self._segment)
+        with open(seg_path, "ab") as f:
+            offset = f.tell()
+            f.write(block)
+            f.flush()
+            os.fsync(f.fileno())
+        orders = sorted({e["order_id"] for e in self._active})
+        last_seq = self._active[-1]["seq"]
+        with open(self._index_path, "ab") as f:
+            if f.tell() and not _ends_with_newline(self._index_path):
+                f.write(b"\n")    # linia rămasă pe jumătate nu lipește de cea nouă
+            f.write((json.dumps({
+                "seg": self._segment, "off": offset, "len": len(block),
+                "last_seq": last_seq, "orders": orders,
+            }) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        # blocul nou intră în index prin _catch_up, ca al oricărui alt proces
+        self._catch_up()
+        self._rewrite_active()
+
+    def flush(self):
+        """Compress the pending entries now (e.g. before a backup)."""
+        with self._lock:
+            self._catch_up()
+            self._seal_block()
+
+    # ------------------------------------------------------------------ read
+    def _read_block(self, pos: int) -> list:
+        seg, off, length, _ = self._blocks[pos]
+        with open(self._segment_path(seg), "rb") as f:
+            f.seek(off)
+            data = zlib.decompress(f.read(length))
+        return [json.loads(line) for line in data.decode("utf-8").splitlines() if line]
+
+    def history(self, order_id: str) -> list:
+        """All entries for one order, oldest first (reads only the blocks that mention it)."""
+        with self._lock:
+            self._catch_up()
+            positions = list(self._by_order.get(order_id, ()))
+            pending = [e for e in self._active if e["order_id"] == order_id]
+        entries = []
+        for pos in positions:
+            entries.extend(e for e in self._read_block(pos) if e["order_id"] == order_id)
+        entries.extend(pending)
+        return sorted(entries, key=lambda e: e["seq"])
+
+    def history_df(self, order_id: str) -> pd.DataFrame:
+        """One row per changed field: when, who, action, field, old, new."""
+        rows = []
+        for entry in self.history(order_id):
+            changes = entry.get("changes") or {}
+            if not changes:
+                rows.append({"ts": entry["ts"], "user": entry["user"], "action": entry["action"],
+                             "field": "", "old": "", "new": ""})
+            for field, (old, new) in changes.items():
+                rows.append({
+                    "ts": entry["ts"],
+                    "user": entry["user"],
+                    "action": entry["action"],
+                    "field": field,
+                    "old": "" if old is None else str(old),
+                    "new": "" if new is None else str(new),
+                })
+        return pd.DataFrame(rows, columns=["ts", "user", "action", "field", "old", "new"])
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._catch_up()
+            segments = sorted({b[0] for b in self._blocks})
+            return {
+                "entries": self._seq,
+                "pending": len(self._active),
+                "blocks": len(self._blocks),
+                "segments": len(segments),
+                "bytes": sum(self._segment_path(s).stat().st_size for s in segments
+                             if self._segment_path(s).exists()),
+                "orders": len(self._by_order),
+            }
+
+
+def _ends_with_newline(path: Path) -> bool:
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
@@ -0,0 +1,265 @@
+"""
+Incremental snapshot backups of the worksheets, with point-in-time restore.
+
+A snapshot is a small JSON manifest; the data lives in content-addressed
+Parquet chunks (zstd):
+
+    snapshots/<id>.json     worksheet → columns, dtypes, [(chunk key, hash, rows)]
+    chunks/ab/<hash>.parquet
+
+Order sheets are chunked by order number (SRV-00001..01000 is one chunk),
+other sheets by row position, so an edit touches one chunk and every other
+chunk of the next snapshot is the same file as before: a daily snapshot of
+100k orders only writes the chunks that changed.
+
+Restore reads the chunks of one snapshot in parallel and concatenates them
+in manifest order.
+
+    python -m backup list
+    python -m backup export --at "2026-10-01 18:00" --sheet Orders --out orders.csv
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+CHUNK_ORDERS = 1000      # comenzi pe chunk (după numărul din SRV-xxxxx)
+CHUNK_ROWS = 5000        # rânduri pe chunk pentru celelalte foi
+_ID_FORMAT = "%Y%m%d-%H%M%S"
+
+
+def _normalize(df: pd.DataFrame) -> tuple:
+    """
+    Stable, Parquet-friendly copy of a sheet frame: columns whose non-empty
+    cells are all numbers become float64, the rest nullable strings.
+    Returns (frame, {column: "num"|"str"}).
+    """
+    out, kinds = {}, {}
+    for col in df.columns:
+        s = df[col]
+        if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+            out[col], kinds[col] = s.astype("float64"), "num"
+            continue
+        values = [v for v in s.tolist() if v is not None and v == v and v != ""]
+        if values and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+            out[col], kinds[col] = pd.to_numeric(s, errors="coerce").astype("float64"), "num"
+        else:
+            # textul rămâne text (telefoanele își păstrează zeroul din față)
+            out[col] = pd.Series(
+                [None if v is None or v != v else str(v) for v in s.tolist()], index=s.index, dtype=object
+            )
+            kinds[col] = "str"
+    return pd.DataFrame(out, index=df.index), kinds
+
+
+def _schema(kinds: dict) -> pa.Schema:
+    return pa.schema([(col, pa.float64() if kind == "num" else pa.string()) for col, kind in kinds.items()])
+
+
+def _chunk_keys(df: pd.DataFrame) -> np.ndarray:
+    if "order_id" in df.columns:
+        numbers = pd.to_numeric(
+            df["order_id"].astype(str).str.extract(r"(\d+)$", expand=False), errors="coerce"
+        ).fillna(-CHUNK_ORDERS)
+        return (numbers // CHUNK_ORDERS).astype(int).to_numpy()
+    return np.arange(len(df)) // CHUNK_ROWS
+
+
+def _chunk_hash(columns: list, row_hashes: np.ndarray) -> str:
+    h = hashlib.sha256()
+    h.update(json.dumps(columns).encode())
+    h.update(row_hashes.tobytes())
+    return h.hexdigest()
+
+
+class SnapshotStore:
+    def __init__(self, path, workers: int = 8):
+        self.path = Path(path)
+        self.workers = workers
+        self._snapshots = self.path / "snapshots"
+        self._chunks = self.path / "chunks"
+        self._snapshots.mkdir(parents=True, exist_ok=True)
+        self._chunks.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        latest = self.latest()
+        self.last_snapshot_at = datetime.fromisoformat(latest["created"]) if latest else None
+
+    # ------------------------------------------------------------------ write
+    def _chunk_path(self, digest: str) -> Path:
+        return self._chunks / digest[:2] / f"{digest}.parquet"
+
+    def _write_chunk(self, digest: str, chunk: pd.DataFrame, schema: pa.Schema) -> int:
+        path = self._chunk_path(digest)
+        if path.exists():
+            return 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        # schemă fixă: un chunk cu o coloană goală nu devine tip "null"
+        pq.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False), tmp, compression="zstd")
+        os.replace(tmp, path)
+        return 1
+
+    def snapshot(self, sheets: dict, label: str = "", now: Optional[datetime] = None) -> dict:
+        """
+        Store {worksheet: DataFrame}; only chunks not already in the store are
+        written. Returns the manifest (plus "new_chunks").
+        """
+        now = now or datetime.now()
+        with self._lock:
+            snap_id = now.strftime(_ID_FORMAT)
+            n = 1
+            while (self._snapshots / f"{snap_id}.json").exists():
+                n += 1
+                snap_id = f"{now.strftime(_ID_FORMAT)}-{n}"
+            manifest = {"id": snap_id, "created": now.isoformat(timespec="seconds"), "label": label, "sheets": {}}
+            jobs = []
+            for name, df in sheets.items():
+                if df is None:
+                    continue
+                norm, kinds = _normalize(df)
+                schema = _schema(kinds)
+                keys = _chunk_keys(norm)
+                # un singur hash vectorizat pe rând; chunk-ul = sha256 peste hash-urile rândurilor lui
+                row_hashes = pd.util.hash_pandas_object(norm, index=False).to_numpy()
+                columns = list(norm.columns)
+                chunks = []
+                # ordinea chunk-urilor = ordinea primei apariții în foaie
+                for key in pd.unique(keys):
+                    in_chunk = keys == key
+                    chunk = norm[in_chunk]
+                    digest = _chunk_hash(columns, row_hashes[in_chunk])
+                    chunks.append([int(key), digest, len(chunk)])
+                    jobs.append((digest, chunk, schema))
+                manifest["sheets"][name] = {"columns": list(norm.columns), "kinds": kinds,
+                                            "rows": len(norm), "chunks": chunks}
+            with ThreadPoolExecutor(self.workers) as pool:
+                new_chunks = sum(pool.map(lambda job: self._write_chunk(*job), jobs))
+            tmp = self._snapshots / f"{snap_id}.tmp"
+            tmp.write_text(json.dumps(manifest), encoding="utf-8")
+            os.replace(tmp, self._snapshots / f"{snap_id}.json")
+            self.last_snapshot_at = now
+        manifest["new_chunks"] = new_chunks
+        return manifest
+
+    # ------------------------------------------------------------------ read
+    def list(self) -> list:
+        """Manifests, newest first."""
+        out = []
+        for path in self._snapshots.glob("*.json"):
+            try:
+                out.append(json.loads(path.read_text(encoding="utf-8")))
+            except (OSError, json.JSONDecodeError):
+                continue
+        # "20261019-101500" < "20261019-101500-2": sortăm după id, nu după numele fișierului
+        return sorted(out, key=lambda m: (m["created"], len(m["id"]), m["id"]), reverse=True)
+
+    def get(self, snap_id: str) -> Optional[dict]:
+        path = self._snapshots / f"{snap_id}.json"
+        if not path.exists():
+            return None
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def latest(self) -> Optional[dict]:
+        snaps = self.list()
+        return snaps[0] if snaps else None
+
+    def at(self, when: datetime) -> Optional[dict]:
+        """The newest snapshot taken at or before `when`."""
+        stamp = when.isoformat(timespec="seconds")
+        return next((m for m in self.list() if m["created"] <= stamp), None)
+
+    def restore(self, snap_id: str, sheet: str) -> Optional[pd.DataFrame]:
+        """The worksheet exactly as it was in the snapshot ("" for empty cells)."""
+        manifest = self.get(snap_id)
+        if manifest is None or sheet not in manifest["sheets"]:
+            return None
+        meta = manifest["sheets"][sheet]
+        schema = _schema(meta["kinds"])
+        paths = [self._chunk_path(digest) for _, digest, _ in meta["chunks"]]
+        with ThreadPoolExecutor(self.workers) as pool:
+            tables = list(pool.map(lambda p: pq.read_table(p, schema=schema), paths))
+        table = pa.concat_tables(tables) if tables else schema.empty_table()
+        # celulele goale revin ca "" (așa le scrie și aplicația)
+        table = pa.table({
+            name: table[name].fill_null("") if meta["kinds"][name] == "str" else table[name]
+            for name in meta["columns"]
+        })
+        df = table.to_pandas()
+        for col, kind in meta["kinds"].items():
+            if kind == "str":
+                df[col] = df[col].astype(object)
+        return df
+
+    # ------------------------------------------------------------------ retention
+    def prune(self, keep: int) -> int:
+        """Keep the newest `keep` snapshots; delete chunks no longer referenced. Returns chunks removed."""
+        with self._lock:
+            snaps = self.list()
+            for manifest in snaps[keep:]:
+                (self._snapshots / f"{manifest['id']}.json").unlink(missing_ok=True)
+            live = {digest for m in snaps[:keep] for meta in m["sheets"].values() for _, digest, _ in meta["chunks"]}
+            removed = 0
+            for path in self._chunks.glob("*/*.parquet"):
+                if path.stem not in live:
+                    path.unlink(missing_ok=True)
+                    removed += 1
+            return removed
+
+    def size_bytes(self) -> int:
+        return sum(p.stat().st_size for p in self._chunks.glob("*/*.parquet"))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default=".backups")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list")
+    exp = sub.add_parser("export", help="write one worksheet of a snapshot to CSV or Parquet")
+    exp.add_argument("--id", help="snapshot id (default: --at, or the latest)")
+    exp.add_argument("--at", help='point in time, e.g. "2026-10-01 18:00"')
+    exp.add_argument("--sheet", default="Orders")
+    exp.add_argument("--out", required=True, help="*.csv or *.parquet")
+    args = parser.parse_args(argv)
+
+    store = SnapshotStore(args.path)
+    if args.cmd == "list":
+        for m in store.list():
+            sheets = ", ".join(f"{k}={v['rows']}" for k, v in m["sheets"].items())
+            print(f"{m['id']}  {m['created']}  {m.get('label', '')}  {sheets}")
+        return 0
+
+    if args.id:
+        manifest = store.get(args.id)
+    elif args.at:
+        manifest = store.at(datetime.fromisoformat(args.at))
+    else:
+        manifest = store.latest()
+    if manifest is None:
+        print("no matching snapshot", file=sys.stderr)
+        return 1
+    df = store.restore(manifest["id"], args.sheet)
+    if df is None:
+        print(f"snapshot {manifest['id']} has no sheet {args.sheet}", file=sys.stderr)
+        return 1
+    if args.out.endswith(".parquet"):
+        df.to_parquet(args.out, index=False)
+    else:
+        df.to_csv(args.out, index=False)
+    print(f"{manifest['id']}: {len(df)} rows of {args.sheet} → {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
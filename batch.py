@@ -0,0 +1,390 @@
+"""
+Bulk order maintenance from the command line.
+
+    python -m batch close-stale --older-than 90                 # "Ready for Pickup" for 90+ days → Completed
+    python -m batch recompute-totals
+    python -m batch normalize-printers --ids SRV-00012,SRV-00040 --apply
+    python -m batch render-receipts --kind completion --status Completed --out receipts/
+    python -m batch render-labels --day 2024-05-14 --format zpl --out /dev/usb/lp0
+    python -m batch render-labels --ids SRV-00012 --format escpos --lp LABELS   # raw, via CUPS
+    python -m batch recompute-totals --branch clj --apply       # one branch's worksheets (default: the first)
+
+Commands that change orders are dry runs unless --apply is given: they
+print the field-level diff and a summary. With --apply the changed frame is
+written to the live Orders sheet in ONE write (PrinterServiceCRM.commit_bulk),
+the in-process indexes are updated and every changed order is audited;
+the branch's write lock is held from the read to the write, so the app,
+the API and other batch runs cannot write the sheet in between.
+Archived orders are never touched. The Sheets connection and company
+details come from the app's secrets (.streamlit/secrets.toml).
+"""
+import argparse
+import getpass
+import io
+import json
+import subprocess
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import streamlit.logger
+from streamlit import config as st_config
+
+# printer.py rulează în "bare mode"; configul se citește întâi (altfel resetează nivelul la "info")
+st_config.get_option("logger.level")
+streamlit.logger.set_log_level("error")
+
+import streamlit as st  # noqa: E402
+
+import printer  # noqa: E402
+from labels import LABEL_LAYOUTS  # noqa: E402
+from lineitems import ITEM_STATUSES  # noqa: E402
+
+
+PRINTER_FIELDS = ["printers_json", "printer_brand", "printer_model", "printer_serial"]
+
+
+class Timings:
+    """Wall time per phase, printed as one line at the end."""
+
+    def __init__(self):
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - t0))
+
+    def __str__(self) -> str:
+        return " · ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases)
+
+
+# ============================================================================
+# SELECTION / DIFF
+# ============================================================================
+def selected_mask(df: pd.DataFrame, ids: str = "", status: str = "") -> pd.Series:
+    mask = pd.Series(True, index=df.index)
+    if ids:
+        wanted = {i.strip() for i in ids.split(",") if i.strip()}
+        mask &= df["order_id"].astype(str).isin(wanted)
+    if status:
+        mask &= df["status"].fillna("").astype(str) == status
+    return mask
+
+
+def _text(s: pd.Series) -> pd.Series:
+    return s.astype(object).where(s.notna(), "").astype(str)
+
+
+def diff_frames(old: pd.DataFrame, new: pd.DataFrame, columns: list) -> tuple:
+    """
+    (changed row mask, [(order_id, field, old, new)]) between two versions of
+    the same frame; costs compare as numbers, everything else as text.
+    """
+    changed = pd.Series(False, index=old.index)
+    changes = []
+    order_ids = old["order_id"].astype(str).to_numpy()
+    for col in columns:
+        if col in printer.COST_COLUMNS:
+            a = pd.to_numeric(old[col], errors="coerce").fillna(0.0).round(2)
+            b = pd.to_numeric(new[col], errors="coerce").fillna(0.0).round(2)
+        else:
+            a, b = _text(old[col]), _text(new[col])
+        diff = (a != b).to_numpy()
+        changed |= diff
+        for pos in np.flatnonzero(diff):
+            changes.append((pos, order_ids[pos], col, a.iat[pos], b.iat[pos]))
+    # în ordinea foii, câmpurile unei comenzi împreună
+    changes.sort(key=lambda c: c[0])
+    return changed, [c[1:] for c in changes]
+
+
+# ============================================================================
+# OPERATIONS (each returns a changed copy of the raw live frame)
+# ============================================================================
+def close_stale(df: pd.DataFrame, sel: pd.Series, status: str, older_than: int, to_status: str,
+                today: date) -> pd.DataFrame:
+    """
+    Orders sitting in `status` for more than `older_than` days move to
+    `to_status`. Age counts from date_completed, falling back to date_received.
+    """
+    ref = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+    for col in ("date_completed", "date_received"):
+        if col in df.columns:
+            ref = ref.fillna(pd.to_datetime(df[col], errors="coerce", format="%Y-%m-%d"))
+    cutoff = pd.Timestamp(today) - pd.Timedelta(days=older_than)
+    mask = sel & (df["status"].fillna("").astype(str) == status) & ref.notna() & (ref < cutoff)
+    new = df.copy()
+    new.loc[mask, "status"] = to_status
+    if to_status == "Completed":
+        # ca în tabul Update: o comandă finalizată are data ridicării
+        no_pickup = mask & (_text(df["date_picked_up"]).str.strip() == "")
+        new.loc[no_pickup, "date_picked_up"] = today.strftime("%Y-%m-%d")
+    return new
+
+
+def recompute_totals(df: pd.DataFrame, sel: pd.Series, branch: str = printer.MAIN_CODE) -> pd.DataFrame:
+    """
+    total_cost = labor_cost + parts_cost. Multi-printer orders first take
+    labor/parts from their line items (plus parts from stock), like the Update tab.
+    """
+    labor = pd.to_numeric(df["labor_cost"], errors="coerce").fillna(0.0)
+    parts = pd.to_numeric(df["parts_cost"], errors="coerce").fillna(0.0)
+    line_items = printer.get_line_items(branch)
+    inventory = printer.get_inventory(branch)
+    order_ids = df["order_id"].astype(str).to_numpy()
+    for pos in np.flatnonzero(sel.to_numpy()):
+        totals = line_items.totals(order_ids[pos])
+        if totals is not None:
+            labor.iat[pos] = totals[0]
+            parts.iat[pos] = round(totals[1] + inventory.order_cost(order_ids[pos]), 2)
+    new = df.copy()
+    new.loc[sel, "labor_cost"] = labor[sel].round(2)
+    new.loc[sel, "parts_cost"] = parts[sel].round(2)
+    new.loc[sel, "total_cost"] = (labor[sel] + parts[sel]).round(2)
+    return new
+
+
+def normalize_printers(df: pd.DataFrame, sel: pd.Series) -> pd.DataFrame:
+    """
+    Re-serialize printers_json in the app's current shape (legacy single-printer
+    columns become a one-item list) and re-sync the first-printer columns.
+    """
+    new = df.copy()
+    positions = np.flatnonzero(sel.to_numpy())
+    records = df.iloc[positions][[c for c in PRINTER_FIELDS if c in df.columns]].to_dict("records")
+    values = {col: df[col].astype(object).to_numpy().copy() for col in PRINTER_FIELDS}
+    for pos, rec in zip(positions, records):
+        printers = [
+            {
+                "brand": p["brand"].strip(),
+                "model": p["model"].strip(),
+                "serial": p["serial"].strip(),
+                "warranty": p["warranty"],
+            }
+            for p in printer.load_printers_from_order(rec)
+        ]
+        if not printers:
+            continue
+        values["printers_json"][pos] = json.dumps(printers, ensure_ascii=False)
+        values["printer_brand"][pos] = printers[0]["brand"]
+        values["printer_model"][pos] = printers[0]["model"]
+        values["printer_serial"][pos] = printers[0]["serial"]
+    for col, arr in values.items():
+        new[col] = arr
+    return new
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+def _company_info() -> dict:
+    try:
+        return dict(st.secrets.get("company_info", {}))
+    except Exception:
+        return {}
+
+
+def _progress(done: int, total: int, label: str):
+    if sys.stderr.isatty():
+        print(f"\r[{done:>{len(str(total))}}/{total}] {label:<12}", end="", file=sys.stderr, flush=True)
+        if done == total:
+            print(file=sys.stderr)
+    elif done == total or done % max(total // 10, 1) == 0:
+        print(f"[{done}/{total}] {label}", file=sys.stderr, flush=True)
+
+
+def render_receipts(crm, df: pd.DataFrame, sel: pd.Series, kind: str, out: Path) -> int:
+    """Re-render one PDF per selected order into `out`; returns how many were written."""
+    out.mkdir(parents=True, exist_ok=True)
+    company_info = _company_info()
+    logo_path = Path("logo.png")
+    logo_bytes = logo_path.read_bytes() if logo_path.exists() else None
+    if kind == "initial":
+        equipment = printer.sync_equipment_registry(crm, crm.list_orders_df())
+    else:
+        line_items = printer.sync_line_items(crm)
+    records = df[sel].to_dict("records")
+    for done, rec in enumerate(records, 1):
+        order = printer.OrderRecord(rec)
+        order_id = printer.safe_text(order.get("order_id"))
+        logo = io.BytesIO(logo_bytes) if logo_bytes else None
+        if kind == "initial":
+            pdf = printer.generate_initial_receipt_pdf(order, company_info, logo, equipment=equipment)
+        else:
+            items = (
+                line_items.items_for(order_id, printer.load_printers_from_order(order))
+                if line_items.has_items(order_id) else None
+            )
+            pdf = printer.generate_completion_receipt_pdf(order, company_info, logo, items=items)
+        (out / f"{kind.capitalize()}_{order_id}.pdf").write_bytes(pdf.getvalue())
+        _progress(done, len(records), order_id)
+    return len(records)
+
+
+def render_labels(df: pd.DataFrame, sel: pd.Series, fmt: str, layout: str, out: str, lp: str) -> tuple:
+    """
+    Equipment labels of the selected orders in one PDF or raw printer stream.
+    `out` may be a file, a printer device (/dev/usb/lp0) or "-" for stdout;
+    with `lp` the stream goes to that CUPS queue unfiltered (lp -o raw).
+    Returns (label count, where they went).
+    """
+    data, suffix, _, count = printer.render_order_labels(df[sel].to_dict("records"), fmt, layout)
+    if lp:
+        subprocess.run(["lp", "-d", lp, "-o", "raw"], input=data, check=True, stdout=subprocess.DEVNULL)
+        return count, f"lp -d {lp}"
+    if out == "-":
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+        return count, "stdout"
+    out = out or f"labels.{suffix}"
+    Path(out).write_bytes(data)
+    return count, out
+
+
+def print_diff(changes: list, show: int):
+    def short(value) -> str:
+        text = f"{value:.2f}" if isinstance(value, float) else repr(value)
+        return text if len(text) <= 60 else text[:57] + "..."
+
+    for order_id, field, old, new in changes[:show]:
+        print(f"  {order_id}  {field}: {short(old)} → {short(new)}")
+    if len(changes) > show:
+        print(f"  … {len(changes) - show} more change(s) (--show N to see more)")
+
+
+def main(argv=None, conn=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    def add(name: str, help_text: str, writes: bool = True):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--ids", default="", help="comma-separated order ids (default: all live orders)")
+        p.add_argument("--branch", default="", help="branch whose worksheets to use (default: the first configured)")
+        if writes:
+            p.add_argument("--apply", action="store_true", help="write the changes (default: dry run)")
+            p.add_argument("--show", type=int, default=30, help="diff lines to print")
+            p.add_argument("--user", default=getpass.getuser(), help="author recorded in the audit log")
+        return p
+
+    p = add("close-stale", "move orders stuck in one status to another")
+    p.add_argument("--status", default="Ready for Pickup", choices=ITEM_STATUSES)
+    p.add_argument("--older-than", type=int, default=90, help="days since completion (or receipt)")
+    p.add_argument("--to", default="Completed", choices=ITEM_STATUSES)
+    p = add("recompute-totals", "recompute total_cost (and line-item sums of multi-printer orders)")
+    p.add_argument("--status", default="", help="only orders in this status")
+    p = add("normalize-printers", "re-serialize printers_json and the first-printer columns")
+    p.add_argument("--status", default="", help="only orders in this status")
+    p = add("render-receipts", "re-render receipt PDFs into a folder", writes=False)
+    p.add_argument("--status", default="", help="only orders in this status")
+    p.add_argument("--kind", default="completion", choices=["initial", "completion"])
+    p.add_argument("--out", default="receipts", help="output folder")
+    p = add("render-labels", "equipment tag labels (PDF sheet/roll, ZPL or ESC/POS)", writes=False)
+    p.add_argument("--day", default="", help="orders received on this day (YYYY-MM-DD)")
+    p.add_argument("--status", default="", help="only orders in this status")
+    p.add_argument("--format", default="pdf", choices=["pdf", "zpl", "escpos"])
+    p.add_argument("--layout", default=None, choices=sorted(LABEL_LAYOUTS), help="PDF layout (default: secrets)")
+    p.add_argument("--out", default="", help='file or printer device, "-" for stdout (default: labels.<ext>)')
+    p.add_argument("--lp", default="", help="send the raw stream to this CUPS queue instead")
+    args = parser.parse_args(argv)
+
+    timings = Timings()
+    with timings.phase("connect"):
+        conn = conn if conn is not None else printer.get_sheets_connection()
+        if conn is None:
+            print("Google Sheets connection failed (check .streamlit/secrets.toml)", file=sys.stderr)
+            return 1
+        branches = printer.get_branches()
+        code = args.branch or next(iter(branches))
+        if code not in branches:
+            print(f"unknown branch '{code}' (configured: {', '.join(branches)})", file=sys.stderr)
+            return 1
+        crm = printer.PrinterServiceCRM(conn, branch=branches[code])
+    # cu --apply, de la citire până la scriere nu mai scrie nimeni foaia (app, API, alt batch)
+    with crm.write_lock if getattr(args, "apply", False) else nullcontext():
+        return run(args, crm, timings)
+
+
+def run(args, crm, timings: Timings) -> int:
+    with timings.phase("read"):
+        df = crm._read_df(raw=True, ttl=0)
+    if df is None or df.empty or "order_id" not in df.columns:
+        print("no live orders")
+        return 0
+
+    if args.cmd == "render-receipts":
+        sel = selected_mask(df, args.ids, args.status)
+        with timings.phase("render"):
+            written = render_receipts(crm, df, sel, args.kind, Path(args.out))
+        per = timings.phases[-1][1] / written * 1000 if written else 0.0
+        print(f"{written} {args.kind} receipt(s) → {args.out}/ ({per:.0f} ms each)")
+        print(timings)
+        return 0
+
+    if args.cmd == "render-labels":
+        sel = selected_mask(df, args.ids, args.status)
+        if args.day:
+            sel &= _text(df["date_received"]).str[:10] == args.day
+        with timings.phase("render"):
+            try:
+                count, target = render_labels(df, sel, args.format, args.layout, args.out, args.lp)
+            except (OSError, subprocess.CalledProcessError) as exc:
+                print(f"cannot send labels: {exc}", file=sys.stderr)
+                return 1
+        # cu --out - datele merg pe stdout, deci rezumatul merge pe stderr
+        log = sys.stderr if target == "stdout" else sys.stdout
+        print(f"{count} label(s) from {int(sel.sum())} order(s) → {target}", file=log)
+        print(timings, file=log)
+        return 0
+
+    if args.cmd == "close-stale":
+        sel = selected_mask(df, args.ids)
+        columns = ["status", "date_picked_up"]
+        op = lambda: close_stale(df, sel, args.status, args.older_than, args.to, date.today())  # noqa: E731
+    elif args.cmd == "recompute-totals":
+        sel = selected_mask(df, args.ids, args.status)
+        columns = list(printer.COST_COLUMNS)
+        printer.sync_line_items(crm)
+        printer.sync_inventory(crm)
+        op = lambda: recompute_totals(df, sel, crm.branch.code)  # noqa: E731
+    else:
+        sel = selected_mask(df, args.ids, args.status)
+        columns = PRINTER_FIELDS
+        op = lambda: normalize_printers(df, sel)  # noqa: E731
+
+    with timings.phase("compute"):
+        new_df = op()
+        changed, changes = diff_frames(df, new_df, columns)
+    print_diff(changes, args.show)
+    n_orders = int(changed.sum())
+    print(f"{args.cmd}: {int(sel.sum())} order(s) checked, {n_orders} to change ({len(changes)} field(s))")
+
+    if not args.apply:
+        if n_orders:
+            print("dry run, nothing written (use --apply)")
+        print(timings)
+        return 0
+    if n_orders:
+        st.session_state["username"] = args.user
+        # commit_bulk pune în outbox notificările schimbărilor de status (ca update_order)
+        st.session_state["company_info"] = _company_info()
+        with timings.phase("write"):
+            ok = crm.commit_bulk(df, new_df, changed)
+        if not ok:
+            print("write to Google Sheets failed, nothing changed", file=sys.stderr)
+            print(timings)
+            return 1
+        print(f"written: {n_orders} order(s) in one sheet write")
+    print(timings)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
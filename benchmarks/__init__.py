@@ -0,0 +1 @@
+"""Benchmarks for PrinterServiceCRM (run with `python -m benchmarks.bench_crm`)."""
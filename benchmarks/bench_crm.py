@@ -0,0 +1,236 @@
+"""
+Benchmark PrinterServiceCRM operations against growing order histories.
+
+    python -m benchmarks.bench_crm                       # 1k, 10k, 100k rows
+    python -m benchmarks.bench_crm --sizes 1000,5000 --repeat 3
+    python -m benchmarks.bench_crm --fail-on-regression  # CI gate
+
+Each run is appended to a JSONL history (one record per run, tagged with
+the git commit) and compared against the latest run of a different commit.
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import patch
+
+import streamlit.logger
+
+# printer.py runs in Streamlit "bare mode" here; keep its warnings out of the report
+streamlit.logger.set_log_level("error")
+
+import printer  # noqa: E402
+from audit import AuditLog  # noqa: E402
+from backup import SnapshotStore  # noqa: E402
+from benchmarks.fake_gsheets import FakeGSheetsConnection  # noqa: E402
+from benchmarks.synthetic import make_orders, new_order_args  # noqa: E402
+import pdfassets  # noqa: E402
+from pdfassets import BASE14  # noqa: E402
+
+
+DEFAULT_HISTORY = Path(".benchmarks") / "history.jsonl"
+COMPANY_INFO = {
+    "company_name": "PRINTHEAD Complete Solutions SRL",
+    "company_address": "Str. Exemplu nr. 1, București",
+    "cui": "RO12345678",
+    "reg_com": "J40/1234/2020",
+    "phone": "0700000000",
+    "email": "service@example.ro",
+}
+
+
+def time_call(fn, repeat: int, setup=None) -> dict:
+    """Run fn() `repeat` times; setup() runs before each call, untimed."""
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return {
+        "min_ms": round(min(samples), 3),
+        "median_ms": round(statistics.median(samples), 3),
+    }
+
+
+def make_crm(df):
+    conn = FakeGSheetsConnection()
+    conn.load("Orders", df)
+    return conn, printer.PrinterServiceCRM(conn)
+
+
+def bench_size(n: int, repeat: int) -> dict:
+    df = make_orders(n, gap_every=0)
+    conn, crm = make_crm(df)
+    mid_id = df["order_id"].iloc[n // 2]
+    last_id = df["order_id"].iloc[-1]
+    seeded = conn.sheets["Orders"]
+
+    def reset():
+        conn.sheets["Orders"] = seeded
+
+    results = {
+        "compute_next_order_id": time_call(crm._compute_next_order_id, repeat),
+        "create_service_order": time_call(lambda: crm.create_service_order(**new_order_args()), repeat, reset),
+        "update_order": time_call(
+            lambda: crm.update_order(mid_id, status="In Progress", labor_cost=120.0, parts_cost=30.0),
+            repeat, reset,
+        ),
+        "delete_order": time_call(lambda: crm.delete_order(last_id), repeat, reset),
+    }
+
+    reset()
+    orders = seeded.to_dict("records")
+
+    def load_all():
+        for order in orders:
+            printer.load_printers_from_order(order)
+
+    results["load_printers_from_order_all"] = time_call(load_all, repeat)
+    results["compact_orders_df"] = time_call(lambda: printer.compact_orders_df(seeded), repeat)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SnapshotStore(tmp)
+        first = store.snapshot({"Orders": seeded})
+        # snapshot-urile următoare scriu doar chunk-urile modificate
+        results["backup_snapshot_incremental"] = time_call(lambda: store.snapshot({"Orders": seeded}), repeat)
+        results["backup_restore"] = time_call(lambda: store.restore(first["id"], "Orders"), repeat)
+    return results
+
+
+def bench_pdfs(repeat: int) -> tuple:
+    """
+    Receipt timings and sizes with the configured output (embedded fonts,
+    prepared logo) and with the old one (base-14 Helvetica, full-size logo,
+    ASCII85 streams) under "[base14]". Returns (timings, sizes in bytes).
+    """
+    order = make_orders(1).iloc[0].to_dict()
+    logo = None
+    logo_path = Path("logo.png")
+    if logo_path.exists():
+        import io
+        logo = io.BytesIO(logo_path.read_bytes())
+    generators = {
+        "generate_initial_receipt_pdf": printer.generate_initial_receipt_pdf,
+        "generate_completion_receipt_pdf": printer.generate_completion_receipt_pdf,
+    }
+    modes = (("", {}, 0), ("[base14]", {"fonts": BASE14, "logo_dpi": 0}, 1))
+    timings, sizes = {}, {}
+    try:
+        for suffix, kwargs, use_a85 in modes:
+            pdfassets.USE_A85 = use_a85
+            for name, generate in generators.items():
+                def render(generate=generate, kwargs=kwargs):
+                    return generate(order, COMPANY_INFO, logo, **kwargs)
+                timings[name + suffix] = time_call(render, repeat)
+                sizes[name + suffix] = len(render().getvalue())
+    finally:
+        pdfassets.USE_A85 = 0
+    return timings, sizes
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def load_history(path: Path) -> list:
+    if not path.exists():
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(current: dict, previous: dict, threshold: float) -> list:
+    """Return (key, old, new, ratio) for every benchmark slower by more than threshold."""
+    regressions = []
+    for key, res in current["results"].items():
+        old = previous["results"].get(key)
+        if not old or old["median_ms"] <= 0:
+            continue
+        ratio = res["median_ms"] / old["median_ms"]
+        if ratio > 1 + threshold:
+            regressions.append((key, old["median_ms"], res["median_ms"], ratio))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma-separated row counts")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--history", type=Path, default=DEFAULT_HISTORY)
+    parser.add_argument("--threshold", type=float, default=0.20, help="allowed slowdown (0.20 = 20%%)")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    results = {}
+    memory = {}
+    # create/update/delete se auditează: intrările sintetice merg într-un jurnal temporar, nu în .audit/
+    with tempfile.TemporaryDirectory() as tmp:
+        audit = AuditLog(tmp)
+        with patch.object(printer, "get_audit_log", lambda: audit):
+            for n in sizes:
+                print(f"→ {n} orders ...", flush=True)
+                for op, res in bench_size(n, args.repeat).items():
+                    results[f"{op}@{n}"] = res
+                conn = FakeGSheetsConnection()
+                conn.load("Orders", make_orders(n))
+                memory[str(n)] = printer.orders_memory_report(conn.read("Orders"))
+    pdf_timings, pdf_sizes = bench_pdfs(args.repeat)
+    results.update(pdf_timings)
+
+    record = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "repeat": args.repeat,
+        "results": results,
+        "memory": memory,
+        "pdf_bytes": pdf_sizes,
+    }
+
+    width = max(len(k) for k in results)
+    print(f"\n{'benchmark'.ljust(width)}  {'median ms':>12}  {'min ms':>12}")
+    for key, res in results.items():
+        print(f"{key.ljust(width)}  {res['median_ms']:>12.3f}  {res['min_ms']:>12.3f}")
+
+    print("\nMemory per 10k orders (raw object frame → compact frame):")
+    for n, rep in memory.items():
+        print(f"  {n:>7} rows: {rep['raw_per_10k'] / 1e6:8.2f} MB → {rep['compact_per_10k'] / 1e6:8.2f} MB")
+
+    print("\nReceipt PDF size:")
+    for key, size in pdf_sizes.items():
+        print(f"  {key.ljust(width)}  {size / 1024:8.1f} KB")
+
+    history = load_history(args.history)
+    previous = next((r for r in reversed(history) if r["commit"] != record["commit"]), None)
+    regressions = compare(record, previous, args.threshold) if previous else []
+    if previous:
+        print(f"\nCompared with {previous['commit']} ({previous['timestamp']}):")
+        if regressions:
+            for key, old, new, ratio in regressions:
+                print(f"  REGRESSION {key}: {old:.3f} → {new:.3f} ms (x{ratio:.2f})")
+        else:
+            print(f"  no regressions above {args.threshold:.0%}")
+
+    if not args.no_save:
+        args.history.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
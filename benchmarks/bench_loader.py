@@ -0,0 +1,156 @@
+"""
+Serial vs parallel startup reads of the CRM worksheets.
+
+    python -m benchmarks.bench_loader                                  # 0.3 s per Sheets read
+    python -m benchmarks.bench_loader --latency 0.5 --orders 20000 --repeat 3
+    python -m benchmarks.bench_loader --slow Parts=5 --timeout 2       # one worksheet hangs
+    python -m benchmarks.bench_loader --fail Order_Items               # one worksheet errors
+
+The worksheets (orders, archive, parts, stock ledger, line items,
+attachments) live in a FakeGSheetsConnection with a fixed latency per
+read. Three ways to build the indexes of a cold start are timed, each
+from empty indexes:
+
+    sync_* one by one     what run_app did before: every sync reads its own worksheets
+    snapshot, 1 worker    load_indexes() with the reads one after another
+    snapshot, parallel    load_indexes() as the app runs it
+
+The fake connection has no read cache, so the legacy path pays for the
+archive twice (the real connection would serve the second read from its
+TTL cache); the 1-worker snapshot is the like-for-like serial baseline.
+"""
+import argparse
+import statistics
+import sys
+import time
+
+import pandas as pd
+import streamlit.logger
+
+# printer.py runs in Streamlit "bare mode" here; keep its warnings out of the report
+streamlit.logger.set_log_level("error")
+
+import printer  # noqa: E402
+from attachments import ATTACHMENT_COLUMNS  # noqa: E402
+from benchmarks.fake_gsheets import FakeGSheetsConnection  # noqa: E402
+from benchmarks.synthetic import make_orders  # noqa: E402
+from inventory import LEDGER_COLUMNS, PART_COLUMNS  # noqa: E402
+from lineitems import ITEM_COLUMNS  # noqa: E402
+
+
+INDEXES = (
+    printer.get_client_registry,
+    printer.get_equipment_registry,
+    printer.get_inventory,
+    printer.get_line_items,
+    printer.get_attachment_index,
+)
+
+
+def seed(conn: FakeGSheetsConnection, n: int):
+    live = make_orders(n, gap_every=0)
+    archived = make_orders(n // 2, seed=7)
+    archived["order_id"] = [f"SRV-{n + i + 1:05d}" for i in range(len(archived))]
+    conn.load("Orders", live)
+    conn.load("Orders_Archive", archived)
+    skus = [f"P{i:04d}" for i in range(200)]
+    conn.load("Parts", pd.DataFrame(
+        [[sku, f"Part {sku}", 10.0 + i % 90, 5] for i, sku in enumerate(skus)], columns=PART_COLUMNS
+    ))
+    conn.load("Stock_Ledger", pd.DataFrame(
+        [["2024-01-01T10:00:00", skus[i % 200], 10 if i % 3 else -1, 10.0, "", "receive", ""] for i in range(2000)],
+        columns=LEDGER_COLUMNS,
+    ))
+    ids = live["order_id"].tolist()
+    conn.load("Order_Items", pd.DataFrame(
+        [[ids[i // 2], i % 2, f"SN{i:06d}", "In Progress", 50.0, 20.0] for i in range(min(1000, 2 * len(ids)))],
+        columns=ITEM_COLUMNS,
+    ))
+    conn.load("Order_Attachments", pd.DataFrame(
+        [[f"a{i:05d}", ids[i], "", f"{i:064x}", f"photo{i}.jpg", "image/jpeg", 1000, "2024-01-01T10:00:00", ""]
+         for i in range(min(200, len(ids)))],
+        columns=ATTACHMENT_COLUMNS,
+    ))
+
+
+def reset_indexes():
+    for get_index in INDEXES:
+        get_index.clear()
+
+
+def legacy_start(crm):
+    df_live = crm.list_orders_df()
+    printer.sync_client_registry(crm, df_live)
+    printer.sync_equipment_registry(crm, df_live)
+    printer.sync_inventory(crm)
+    printer.sync_line_items(crm)
+    printer.sync_attachments(crm)
+
+
+def bench(conn, crm, start, repeat: int) -> dict:
+    samples, reads = [], 0
+    for _ in range(repeat):
+        reset_indexes()
+        conn.reset_calls()
+        t0 = time.perf_counter()
+        start()
+        samples.append((time.perf_counter() - t0) * 1000)
+        reads = conn.calls["read"]
+    return {"median_ms": statistics.median(samples), "min_ms": min(samples), "reads": reads}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds per Sheets read")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=10.0, help="per-read timeout of the snapshot")
+    parser.add_argument("--slow", action="append", default=[], metavar="SHEET=SECONDS",
+                        help="latency of one worksheet (repeatable)")
+    parser.add_argument("--fail", action="append", default=[], metavar="SHEET", help="reads of this worksheet raise")
+    args = parser.parse_args(argv)
+
+    if "Orders" in args.fail:
+        parser.error("--fail Orders: the CRM cannot start without the live sheet")
+
+    slow = {name: float(sec) for name, sec in (item.split("=", 1) for item in args.slow)}
+    conn = FakeGSheetsConnection(read_latency=args.latency, sheet_latency=slow, failing=set(args.fail))
+    seed(conn, args.orders)
+    crm = printer.PrinterServiceCRM(conn)
+
+    def snapshot_start(workers: int):
+        def start():
+            start.snapshot = printer.load_indexes(crm, timeout=args.timeout, workers=workers)[1]
+        return start
+
+    serial, parallel = snapshot_start(1), snapshot_start(printer.DEFAULT_WORKERS)
+    results = {
+        "sync_* one by one": bench(conn, crm, lambda: legacy_start(crm), args.repeat),
+        "snapshot, 1 worker": bench(conn, crm, serial, args.repeat),
+        "snapshot, parallel": bench(conn, crm, parallel, args.repeat),
+    }
+
+    print(f"{args.orders} orders, {args.latency * 1000:.0f} ms per read, timeout {args.timeout:g} s\n")
+    width = max(len(k) for k in results)
+    print(f"{'path'.ljust(width)}  {'median ms':>10}  {'min ms':>10}  {'reads':>5}")
+    for key, res in results.items():
+        print(f"{key.ljust(width)}  {res['median_ms']:>10.0f}  {res['min_ms']:>10.0f}  {res['reads']:>5}")
+    base = results["snapshot, 1 worker"]["median_ms"]
+    print(f"\nparallel speed-up over the serial snapshot: x{base / results['snapshot, parallel']['median_ms']:.1f}")
+
+    failed = parallel.snapshot.failed
+    if failed:
+        print("\nPartial snapshot (parallel):")
+        for read in failed:
+            kind = "timed out" if read.timed_out else "failed"
+            print(f"  {read.worksheet}: {kind} · {read.error}")
+        print(f"  indexes loaded: {', '.join(f.__name__[4:] for f in INDEXES if _loaded(f(crm.branch.code)))}")
+    return 0
+
+
+def _loaded(index) -> bool:
+    return bool(getattr(index, "loaded", False) or getattr(index, "history_loaded", False))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
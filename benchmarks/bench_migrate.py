@@ -0,0 +1,149 @@
+"""
+Schema migration of a large Orders sheet: whole-sheet rewrites vs chunks.
+
+    python -m benchmarks.bench_migrate                          # 50k orders, 5000 rows per chunk
+    python -m benchmarks.bench_migrate --orders 100000 --chunk-rows 2000 --write-latency 0.2
+
+The sheet starts at schema v0 (no printers_json, no client_id) in a
+FakeGSheetsConnection. Three ways of bringing it to the current schema are
+measured, each from the same sheet:
+
+    inline, per case     what _init_sheet did before: every case edits the
+                         whole frame and rewrites the whole sheet
+    engine, whole sheet  the migration engine on a connection that can only
+                         replace a sheet (one write at the end)
+    engine, row ranges   the engine writing chunk by chunk into row ranges
+                         (service-account connection)
+
+plus a CRM start on the migrated sheet, which only reads. Peak memory is
+the tracemalloc peak of the read and the migration (the fake connection's
+stored copy of what was written is included, as the real client builds
+the upload in memory too). --write-latency is a fixed cost per upload, so
+it counts against the chunked path; a real upload also grows with its
+size, and one of a whole large sheet risks the request limits and
+timeouts of the Sheets API. All three paths must leave the same sheet.
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+import streamlit.logger
+
+# printer.py runs in Streamlit "bare mode" here; keep its warnings out of the report
+streamlit.logger.set_log_level("error")
+
+import printer  # noqa: E402
+from benchmarks.fake_gsheets import FakeGSheetsConnection  # noqa: E402
+from benchmarks.synthetic import make_orders  # noqa: E402
+from clients import client_ids_for_phones  # noqa: E402
+from migrations import RangeWriter, SheetWriter, migrate_frame  # noqa: E402
+
+
+class WholeSheetOnly:
+    """The fake connection without row-range writes, like a connection that can only replace sheets."""
+
+    def __init__(self, conn: FakeGSheetsConnection):
+        self.conn = conn
+
+    def read(self, *args, **kwargs):
+        return self.conn.read(*args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        return self.conn.update(*args, **kwargs)
+
+
+def inline_migration(conn):
+    """The former _init_sheet cases 3 and 3b."""
+    df = conn.read(worksheet="Orders", ttl=0)
+    if "printers_json" not in df.columns:
+        df["printers_json"] = ""
+        conn.update(worksheet="Orders", data=df)
+    if "client_id" not in df.columns:
+        df["client_id"] = ""
+    unlinked = df["client_id"].isna() | (df["client_id"] == "")
+    if unlinked.any() and "client_phone" in df.columns:
+        ids = client_ids_for_phones(df.loc[unlinked, "client_phone"])
+        if (ids != "").any():
+            df.loc[unlinked, "client_id"] = ids
+            conn.update(worksheet="Orders", data=df)
+
+
+def engine_migration(conn, chunk_rows: int, ranges: bool):
+    df = conn.read(worksheet="Orders", ttl=0)
+    if ranges:
+        writer = RangeWriter(conn, "Orders")
+    else:
+        writer = SheetWriter(lambda frame: conn.update(worksheet="Orders", data=frame) is not None)
+    migrate_frame(df, printer.ORDER_SCHEMA.migrations, writer, printer.ORDER_SCHEMA.key, chunk_rows)
+
+
+def measure(conn: FakeGSheetsConnection, run) -> dict:
+    conn.reset_calls()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    t0 = time.perf_counter()
+    run()
+    elapsed = (time.perf_counter() - t0) * 1000
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    calls = conn.calls
+    return {
+        "ms": elapsed,
+        "peak_mb": peak / 2**20,
+        "reads": calls["read"],
+        "uploads": calls["update"] + calls["write_rows"],
+        "rows": calls["rows_written"],
+        "largest": calls["largest_write"],
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=50000)
+    parser.add_argument("--chunk-rows", type=int, default=printer.CHUNK_ROWS)
+    parser.add_argument("--write-latency", type=float, default=0.0, help="seconds per upload")
+    args = parser.parse_args(argv)
+
+    v0 = make_orders(args.orders, gap_every=0).drop(columns=["printers_json", "client_id"], errors="ignore")
+    # comenzi vechi, dinainte de client_id: o parte fără telefon rămân nelegate
+    v0.loc[v0.index % 50 == 0, "client_phone"] = ""
+
+    def fresh() -> FakeGSheetsConnection:
+        conn = FakeGSheetsConnection(write_latency=args.write_latency)
+        conn.load("Orders", v0)
+        return conn
+
+    results, sheets = {}, {}
+    conn = fresh()
+    results["inline, per case"] = measure(conn, lambda: inline_migration(conn))
+    sheets["inline"] = conn.sheets["Orders"]
+
+    conn = fresh()
+    results["engine, whole sheet"] = measure(conn, lambda: engine_migration(WholeSheetOnly(conn), args.chunk_rows, False))
+    sheets["whole"] = conn.sheets["Orders"]
+
+    conn = fresh()
+    results["engine, row ranges"] = measure(conn, lambda: engine_migration(conn, args.chunk_rows, True))
+    sheets["ranges"] = conn.sheets["Orders"]
+
+    printer.PrinterServiceCRM(conn)          # înregistrează versiunea în foaia Schema
+    results["CRM start, migrated"] = measure(conn, lambda: printer.PrinterServiceCRM(conn))
+
+    print(f"{args.orders} orders at schema v0 → v{printer.ORDER_SCHEMA.version}, "
+          f"{args.chunk_rows} rows per chunk, {args.write_latency * 1000:.0f} ms per upload\n")
+    width = max(len(k) for k in results)
+    print(f"{'path'.ljust(width)}  {'ms':>8}  {'peak MB':>8}  {'reads':>5}  {'uploads':>7}  {'rows up':>8}  {'largest':>8}")
+    for key, res in results.items():
+        print(f"{key.ljust(width)}  {res['ms']:>8.0f}  {res['peak_mb']:>8.1f}  {res['reads']:>5}  "
+              f"{res['uploads']:>7}  {res['rows']:>8}  {res['largest']:>8}")
+
+    reference = sheets["inline"].fillna("")
+    same = all(reference.equals(sheet.fillna("")) for sheet in sheets.values())
+    print(f"\nsame sheet after every path: {'yes' if same else 'NO'}")
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
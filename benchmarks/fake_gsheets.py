@@ -0,0 +1,92 @@
+"""
+In-memory stand-in for streamlit_gsheets.GSheetsConnection.
+
+Only the calls the CRM uses are implemented: read(worksheet, ttl) and
+update(worksheet, data), plus the row-range writes of a service-account
+connection's gspread worksheet that migrations use (resize, write_rows).
+Reads return a copy shaped like the real connection's output (object
+columns, NaN for empty cells), so the CRM code paths behave the same as
+against Google Sheets. calls counts every call, the rows uploaded
+("rows_written") and the largest single upload ("largest_write").
+"""
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+class FakeGSheetsConnection:
+    def __init__(self, read_latency: float = 0.0, write_latency: float = 0.0,
+                 sheet_latency: Optional[dict] = None, failing: Optional[set] = None):
+        self.read_latency = read_latency
+        self.write_latency = write_latency
+        self.sheet_latency = dict(sheet_latency or {})   # worksheet → latența citirii (în loc de read_latency)
+        self.failing = set(failing or ())                # foi ale căror citiri ridică o excepție
+        self.sheets = {}
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def read(self, worksheet: Optional[str] = None, ttl=None, **kwargs) -> Optional[pd.DataFrame]:
+        with self._lock:
+            self.calls["read"] += 1
+            df = self.sheets.get(worksheet)
+        latency = self.sheet_latency.get(worksheet, self.read_latency)
+        if latency:
+            time.sleep(latency)
+        if worksheet in self.failing:
+            raise ConnectionError(f"simulated failure reading {worksheet}")
+        if df is None:
+            return None
+        return df.copy()
+
+    def update(self, worksheet: Optional[str] = None, data: Optional[pd.DataFrame] = None, **kwargs):
+        if self.write_latency:
+            time.sleep(self.write_latency)
+        # Sheets stores text; empty cells come back as NaN
+        stored = data.astype(object).replace("", np.nan)
+        with self._lock:
+            self.calls["update"] += 1
+            self._count_rows(len(stored))
+            self.sheets[worksheet] = stored
+        return stored
+
+    def resize(self, worksheet: str, rows: int, columns: int):
+        """Data rows × columns, as gspread's Worksheet.resize (new columns are unnamed until a header is written)."""
+        with self._lock:
+            self.calls["resize"] += 1
+            df = self.sheets.get(worksheet, pd.DataFrame())
+            names = list(df.columns[:columns]) + [f"column_{i + 1}" for i in range(len(df.columns), columns)]
+            self.sheets[worksheet] = df.iloc[:rows, :columns].reset_index(drop=True).reindex(
+                index=range(rows), columns=names
+            ).astype(object)
+
+    def write_rows(self, worksheet: str, start: int, data: pd.DataFrame, header: bool = False):
+        """Overwrite data rows start.. (0-based) from the first column, and the header if asked for."""
+        if self.write_latency:
+            time.sleep(self.write_latency)
+        stored = data.astype(object).replace("", np.nan)
+        with self._lock:
+            self.calls["write_rows"] += 1
+            self._count_rows(len(stored))
+            df = self.sheets[worksheet]
+            if start + len(stored) > len(df) or len(stored.columns) > len(df.columns):
+                raise ValueError(f"range exceeds grid limits of {worksheet}")
+            df.iloc[start:start + len(stored), :len(stored.columns)] = stored.to_numpy()
+            if header:
+                df.columns = list(stored.columns) + list(df.columns[len(stored.columns):])
+
+    def _count_rows(self, rows: int):
+        self.calls["rows_written"] += rows
+        self.calls["largest_write"] = max(self.calls["largest_write"], rows)
+
+    def load(self, worksheet: str, df: pd.DataFrame):
+        """Seed a worksheet without counting it as a backend call."""
+        with self._lock:
+            self.sheets[worksheet] = df.astype(object).replace("", np.nan)
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls.clear()
@@ -0,0 +1,115 @@
+"""
+Local SMTP stand-in for exercising the notification outbox.
+
+    python -m benchmarks.fake_smtp --port 1025      # prints every message received
+
+Point the app at it with secrets:
+
+    [notifications.email]
+    host = "localhost"
+    port = 1025
+    starttls = false
+
+Only the plain SMTP subset smtplib needs is implemented (no TLS, no AUTH).
+"""
+import argparse
+import email
+import socketserver
+import threading
+from email import policy
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _reply(self, line: str):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        server = self.server
+        self._reply("220 fake-smtp ready")
+        mail_from, rcpt_to = "", []
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            cmd = raw.decode(errors="replace").strip()
+            verb = cmd.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self._reply("250 fake-smtp")
+            elif verb == "MAIL":
+                mail_from, rcpt_to = cmd[10:].strip("<> "), []
+                self._reply("250 OK")
+            elif verb == "RCPT":
+                if server.reject_rcpt and server.reject_rcpt in cmd:
+                    self._reply("550 mailbox unavailable")
+                    continue
+                rcpt_to.append(cmd[8:].strip("<> "))
+                self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    line = self.rfile.readline()
+                    if line in (b".\r\n", b".\n", b""):
+                        break
+                    lines.append(line[1:] if line.startswith(b"..") else line)
+                msg = email.message_from_bytes(b"".join(lines), policy=policy.default)
+                with server.lock:
+                    server.messages.append({"from": mail_from, "to": rcpt_to, "message": msg})
+                if server.verbose:
+                    print(f"✉️  {mail_from} → {', '.join(rcpt_to)}: {msg['Subject']}", flush=True)
+                self._reply("250 OK queued")
+            elif verb == "RSET":
+                mail_from, rcpt_to = "", []
+                self._reply("250 OK")
+            elif verb == "NOOP":
+                self._reply("250 OK")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, verbose: bool = False):
+        super().__init__((host, port), _Handler)
+        self.messages = []
+        self.lock = threading.Lock()
+        self.verbose = verbose
+        self.reject_rcpt = ""   # RCPT care conține acest text primește 550
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> "FakeSMTPServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    args = parser.parse_args(argv)
+    server = FakeSMTPServer(args.host, args.port, verbose=True)
+    print(f"fake SMTP listening on {args.host}:{server.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Load test for the JSON API (api.py) against synthetic orders.
+
+    python -m benchmarks.load_api                           # 1 worker pinned to one core, then 4 workers
+    python -m benchmarks.load_api --workers 1,2,4 --connections 32 --duration 10
+    python -m benchmarks.load_api --scenarios get,list --orders 10000 --read-latency 0.05
+
+Each worker count starts `uvicorn --factory benchmarks.load_api:make_app`
+on a free port. Every worker seeds its own in-memory sheet from the same
+seed, so the data is identical across workers; keep write scenarios
+("create") out of multi-worker runs unless diverging order ids are fine.
+The client is a plain asyncio HTTP/1.1 keep-alive client (one connection
+per concurrent user), so it adds little overhead of its own.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+TOKEN = "load-test"
+SCENARIOS = ("get", "list", "search", "receipt", "create")
+DEFAULT_SCENARIOS = "get,list,search,receipt"
+MAX_IDS = 1000          # comenzi din care se aleg id-urile pentru get/receipt
+
+
+def make_app():
+    """uvicorn factory: the API over a FakeGSheetsConnection (settings via LOAD_API_* env vars)."""
+    import api
+    from benchmarks.fake_gsheets import FakeGSheetsConnection
+    from benchmarks.synthetic import make_orders
+
+    conn = FakeGSheetsConnection(
+        read_latency=float(os.environ.get("LOAD_API_READ_LATENCY", "0")),
+        write_latency=float(os.environ.get("LOAD_API_WRITE_LATENCY", "0")),
+    )
+    conn.load("Orders", make_orders(int(os.environ.get("LOAD_API_ORDERS", "5000")), gap_every=0))
+    return api.create_app(conn, token=TOKEN)
+
+
+# ============================================================================
+# CLIENT
+# ============================================================================
+class Connection:
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method: str, path: str, body: bytes = b"") -> tuple:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = (
+            f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+            f"Authorization: Bearer {TOKEN}\r\nContent-Length: {len(body)}\r\n"
+        )
+        if body:
+            head += "Content-Type: application/json\r\n"
+        self.writer.write(head.encode() + b"\r\n" + body)
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("server closed the connection")
+        status = int(status_line.split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+        payload = await self.reader.readexactly(length) if length else b""
+        return status, payload
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def make_request(scenario: str, order_ids: list, rng: random.Random) -> tuple:
+    if scenario == "get":
+        return "GET", f"/orders/{rng.choice(order_ids)}", b""
+    if scenario == "list":
+        return "GET", f"/orders?status={rng.choice(['Received', 'In%20Progress', 'Ready%20for%20Pickup'])}&limit=50", b""
+    if scenario == "search":
+        return "GET", f"/orders?q={rng.choice(['HP', 'Canon', 'Brother', '0722'])}&limit=20", b""
+    if scenario == "receipt":
+        return "GET", f"/orders/{rng.choice(order_ids)}/receipt/completion.pdf", b""
+    if scenario == "create":
+        from benchmarks.synthetic import new_order_args
+        args = new_order_args(rng.randrange(10**6))
+        body = {
+            "client_name": args["client_name"],
+            "client_phone": args["client_phone"],
+            "printers": args["printers_list"],
+            "issue_description": args["issue_description"],
+        }
+        return "POST", "/orders", json.dumps(body).encode()
+    raise ValueError(scenario)
+
+
+async def run_scenario(port: int, scenario: str, order_ids: list, connections: int, duration: float) -> dict:
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def user(n: int):
+        nonlocal errors
+        rng = random.Random(n)
+        conn = Connection("127.0.0.1", port)
+        try:
+            while time.perf_counter() < deadline:
+                method, path, body = make_request(scenario, order_ids, rng)
+                t0 = time.perf_counter()
+                try:
+                    status, _ = await conn.request(method, path, body)
+                except (ConnectionError, asyncio.IncompleteReadError, OSError):
+                    errors += 1
+                    conn.close()
+                    conn = Connection("127.0.0.1", port)
+                    continue
+                latencies.append((time.perf_counter() - t0) * 1000)
+                if status >= 400:
+                    errors += 1
+        finally:
+            conn.close()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(user(n) for n in range(connections)))
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2) if latencies else None,
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 2) if latencies else None,
+    }
+
+
+# ============================================================================
+# SERVER
+# ============================================================================
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers: int, port: int, env: dict, pin: bool) -> subprocess.Popen:
+    cmd = [
+        sys.executable, "-m", "uvicorn", "benchmarks.load_api:make_app", "--factory",
+        "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers),
+        "--log-level", "warning", "--no-access-log",
+    ]
+    preexec = None
+    if pin and hasattr(os, "sched_setaffinity"):
+        cpu = min(os.sched_getaffinity(0))
+        preexec = lambda: os.sched_setaffinity(0, {cpu})  # noqa: E731
+    return subprocess.Popen(cmd, env=env, preexec_fn=preexec)
+
+
+def wait_ready(port: int, workers: int, timeout: float = 120.0):
+    """Poll /health until every worker process has answered (or, after the timeout, fail)."""
+    t0 = time.perf_counter()
+    seen = set()
+    while time.perf_counter() - t0 < timeout:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=5) as resp:
+                health = json.loads(resp.read())
+            if health.get("ok"):
+                seen.add(health.get("worker"))
+                if len(seen) >= workers:
+                    return
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.05)
+    if not seen:
+        raise TimeoutError(f"API did not start on port {port}")
+
+
+def fetch_order_ids(port: int, limit: int) -> list:
+    req = urllib.request.Request(
+        f"http://127.0.0.1:{port}/orders?limit={limit}", headers={"Authorization": f"Bearer {TOKEN}"}
+    )
+    with urllib.request.urlopen(req, timeout=60) as resp:
+        return [o["order_id"] for o in json.loads(resp.read())["orders"]]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,4", help="comma-separated uvicorn worker counts")
+    parser.add_argument("--scenarios", default=DEFAULT_SCENARIOS, help=f"comma-separated, from {','.join(SCENARIOS)}")
+    parser.add_argument("--connections", type=int, default=16, help="concurrent keep-alive connections")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per scenario")
+    parser.add_argument("--orders", type=int, default=5000, help="synthetic orders in the sheet")
+    parser.add_argument("--read-latency", type=float, default=0.0, help="simulated Sheets read latency (s)")
+    parser.add_argument("--write-latency", type=float, default=0.0, help="simulated Sheets write latency (s)")
+    parser.add_argument("--no-pin", action="store_true", help="do not pin the 1-worker run to one core")
+    args = parser.parse_args(argv)
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    env = dict(os.environ)
+    env.update({
+        "LOAD_API_ORDERS": str(args.orders),
+        "LOAD_API_READ_LATENCY": str(args.read_latency),
+        "LOAD_API_WRITE_LATENCY": str(args.write_latency),
+        "PYTHONPATH": os.pathsep.join(filter(None, [os.getcwd(), env.get("PYTHONPATH", "")])),
+    })
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    print(f"{args.orders} orders, {args.connections} connections, {args.duration:g}s per scenario, {cores} core(s) available")
+    print(f"{'workers':>10}  {'scenario':<9} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+
+    for workers in [int(w) for w in args.workers.split(",")]:
+        port = _free_port()
+        server = start_server(workers, port, env, pin=workers == 1 and not args.no_pin)
+        try:
+            wait_ready(port, workers)
+            order_ids = fetch_order_ids(port, MAX_IDS)
+            for scenario in scenarios:
+                res = asyncio.run(run_scenario(port, scenario, order_ids, args.connections, args.duration))
+                label = f"{workers}" + (" (1 core)" if workers == 1 and not args.no_pin else "")
+                print(f"{label:>10}  {scenario:<9} {res['rps']:>9.1f} {res['p50_ms'] or 0:>8.2f} "
+                      f"{res['p99_ms'] or 0:>8.2f} {res['errors']:>7}", flush=True)
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
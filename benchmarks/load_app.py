@@ -0,0 +1,402 @@
+"""
+Load test for the Streamlit app (printer.py): N operators at once.
+
+    python -m benchmarks.load_app                                   # 4, 8 and 16 sessions, 20 s each
+    python -m benchmarks.load_app --sessions 1,8,32 --duration 30 --orders 10000
+    python -m benchmarks.load_app --read-latency 0.3 --write-latency 0.5 --think 2
+    python -m benchmarks.load_app --mix list=1,receipt=3,update=2,create=1
+
+Every session is a streamlit.testing AppTest of printer.py, logged in,
+driven by its own thread the way an operator at a counter uses the app:
+
+    list      click the All Orders tab
+    search    type a client / brand into the orders search
+    receipt   open an order in the Update tab (which renders its initial,
+              completion and label PDFs) and download the three files
+    update    change the status of the open order and save it
+    create    fill the New Order form, submit it, download the receipt
+
+All sessions run in this one process against one FakeGSheetsConnection,
+like the sessions of one `streamlit run` server: script runs share the
+GIL, the st.cache_resource indexes and the CRM's TTL cache. AppTest swaps
+the Runtime, st.secrets and the appTest config option in and out around
+every run, which is not safe from several threads, so the harness
+installs one of each for the whole process (install_runtime()), plus
+one ScriptCache, so printer.py is compiled once as on a real server, and
+gives every AppTest a session id of its own (they all use "test session
+id", and the media files of one session would replace another's).
+
+Reported for each session count: rerun latency (p50/p95/p99) per action
+and overall, reruns per second, errors (script exceptions), backend reads
+and writes per rerun, session_state per session (approx_size, the same
+estimate as the admin panel) and the growth of the process RSS per
+session, with the files of the download buttons still held in the
+in-memory media storage reported on their own.
+"""
+import argparse
+import contextlib
+import gc
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import streamlit as st
+import streamlit.logger
+
+# printer.py warns about use_container_width on every rerun; keep it out of the report
+streamlit.logger.set_log_level("error")
+
+from streamlit.components.v2.component_manager import BidiComponentManager  # noqa: E402
+from streamlit.runtime import Runtime  # noqa: E402
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager  # noqa: E402
+from streamlit.runtime.dataframe_source_manager import DataframeSourceManager  # noqa: E402
+from streamlit.runtime.media_file_manager import MediaFileManager  # noqa: E402
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage  # noqa: E402
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache  # noqa: E402
+from streamlit.runtime.secrets import Secrets  # noqa: E402
+from streamlit.testing.v1 import AppTest, app_test, local_script_runner  # noqa: E402
+from streamlit.testing.v1.util import patch_config_options  # noqa: E402
+
+from benchmarks.fake_gsheets import FakeGSheetsConnection  # noqa: E402
+from benchmarks.synthetic import make_orders, new_order_args  # noqa: E402
+from sessionstate import approx_size  # noqa: E402
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "printer.py")
+ACTIONS = ("list", "search", "receipt", "update", "create")
+DEFAULT_MIX = "list=3,search=2,receipt=3,update=2,create=1"
+SEARCH_TERMS = ("HP", "Canon", "Brother", "Epson", "0722", "Ion")
+MAX_IDS = 1000          # comenzi din care operatorii aleg ce deschid
+
+
+# ============================================================================
+# RUNTIME
+# ============================================================================
+def install_runtime(secrets: dict) -> tuple:
+    """
+    One mock Runtime, one ScriptCache, one st.secrets and global.appTest=True
+    for every AppTest of the process. Returns (runtime, exit stack that
+    undoes it).
+    """
+    runtime = MagicMock(spec=Runtime)
+    bidi = BidiComponentManager()
+    bidi.discover_and_register_components(start_file_watching=False)
+    runtime.bidi_component_registry = bidi
+    reset_runtime(runtime)
+
+    shared = Secrets()
+    shared._secrets = secrets
+    stack = contextlib.ExitStack()
+    stack.enter_context(patch.object(Runtime, "instance", classmethod(lambda cls: runtime)))
+    stack.enter_context(patch.object(Runtime, "exists", classmethod(lambda cls: True)))
+    stack.enter_context(patch.object(st, "secrets", shared))
+    # un ScriptCache nou la fiecare run ar compila scriptul din mai multe fire deodată
+    script_cache = ScriptCache()
+    for module in (app_test, local_script_runner):
+        stack.enter_context(patch.object(module, "ScriptCache", lambda: script_cache))
+    stack.enter_context(patch.object(app_test, "LocalScriptRunner", SessionScriptRunner))
+    # AppTest.run() patches config.get_option per run; one patch for the whole process instead
+    stack.enter_context(patch.object(app_test, "patch_config_options", lambda *_: contextlib.nullcontext()))
+    stack.enter_context(patch_config_options({"global.appTest": True}))
+    return runtime, stack
+
+
+class SessionScriptRunner(local_script_runner.LocalScriptRunner):
+    """LocalScriptRunner with the session id of its AppTest's session state."""
+
+    def __init__(self, script_path, session_state, *args, **kwargs):
+        super().__init__(script_path, session_state, *args, **kwargs)
+        self._session_id = f"load-{id(session_state)}"
+
+
+def reset_runtime(runtime):
+    """Fresh media files and st.cache_data storage, as after a server restart."""
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.dataframe_source_mgr = DataframeSourceManager()
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+
+
+def media_bytes(runtime) -> int:
+    storage = runtime.media_file_mgr._storage
+    return sum(len(f.content) for f in storage._files_by_id.values())
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # fără /proc: vârful, nu valoarea curentă
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def harness_secrets(workdir: str) -> dict:
+    """Everything the app writes to disk goes under `workdir`; no warm cache, no scheduled backups."""
+    return {
+        "passwords": {"admin_password": "load-test"},
+        "company_info": {
+            "company_name": "Load Test SRL", "company_address": "Str. Exemplu 1", "cui": "RO1",
+            "reg_com": "J00/0/2024", "phone": "0700000000", "email": "service@example.com",
+        },
+        "warm_cache": {"enabled": False},
+        "backup": {"interval_hours": 0, "path": os.path.join(workdir, "backups")},
+        "audit": {"path": os.path.join(workdir, "audit")},
+        "attachments": {"path": os.path.join(workdir, "attachments")},
+    }
+
+
+# ============================================================================
+# OPERATORS
+# ============================================================================
+class Operator:
+    """One logged-in session and the actions of one operator."""
+
+    def __init__(self, n: int, runtime, bidi, order_ids: list, mix: dict, timeout: float):
+        self.n = n
+        self.runtime = runtime
+        self.order_ids = order_ids
+        self.rng = random.Random(n)
+        self.names = list(mix)
+        self.weights = [mix[a] for a in self.names]
+        self.samples = []           # (action, ms)
+        self.errors = []
+        self.downloaded = 0
+        self.open_order = None
+        self.at = AppTest.from_file(APP, default_timeout=timeout)
+        self.at._bidi_component_manager = bidi
+        self.at.session_state["authenticated"] = True
+        self.at.session_state["username"] = f"operator{n}"
+
+    def _run(self, action: str, run):
+        t0 = time.perf_counter()
+        try:
+            run()
+        except Exception as e:      # timeout sau un widget care lipsește
+            self.errors.append(f"{action}: {type(e).__name__}: {e}")
+            return False
+        self.samples.append((action, (time.perf_counter() - t0) * 1000))
+        if self.at.exception:
+            self.errors.append(f"{action}: {self.at.exception[0].message}")
+            return False
+        return True
+
+    def _goto(self, tab: int, action: str) -> bool:
+        if self.at.session_state["active_tab"] == tab:
+            return True
+        return self._run(action, self.at.button(key=f"tab_btn_{tab}").click().run)
+
+    def _download(self, prefix: str) -> int:
+        """Fetch the files of the download buttons whose key starts with `prefix`, as the browser would."""
+        storage = self.runtime.media_file_mgr._storage
+        total = 0
+        for button in self.at.get("download_button"):
+            key = button.proto.id.split("-", 1)[-1]
+            if prefix in key and button.proto.url:
+                total += len(storage.get_file(button.proto.url.rsplit("/", 1)[-1]).content)
+        self.downloaded += total
+        return total
+
+    def start(self):
+        self._run("start", self.at.run)
+
+    def step(self):
+        action = self.rng.choices(self.names, self.weights)[0]
+        try:
+            getattr(self, f"do_{action}")()
+        except Exception as e:      # pagina nu s-a randat (un run eșuat): lipsesc widget-urile
+            self.errors.append(f"{action}: {type(e).__name__}: {e}")
+            self.open_order = None
+            self._run("start", self.at.run)
+
+    def do_list(self):
+        self._run("list", self.at.button(key="tab_btn_1").click().run)
+
+    def do_search(self):
+        if self._goto(1, "list"):
+            term = self.rng.choice(SEARCH_TERMS)
+            self._run("search", self.at.text_input(key="orders_search").input(term).run)
+
+    def do_receipt(self):
+        if not self._goto(2, "receipt"):
+            return
+        order_id = self.rng.choice(self.order_ids)
+
+        def open_and_download():
+            self.at.selectbox(key="update_order_select").select(order_id).run()
+            self._download(f"_{order_id}")
+        if self._run("receipt", open_and_download):
+            self.open_order = order_id
+
+    def do_update(self):
+        if self.open_order is None or self.at.session_state["active_tab"] != 2:
+            self.do_receipt()
+        order_id = self.open_order
+        if order_id is None:
+            return
+        status = self.at.selectbox(key=f"update_status_{order_id}")
+        status.select(self.rng.choice([s for s in status.options if s != status.value] or status.options))
+        self._run("update", self.at.button(key=f"update_order_btn_{order_id}").click().run)
+
+    def do_create(self):
+        if not self._goto(0, "create"):
+            return
+        args = new_order_args(self.rng.randrange(10**6))
+        printer_ = args["printers_list"][0]
+        self.at.text_input(key="new_client_name").input(args["client_name"])
+        self.at.text_input(key="new_client_phone").input(args["client_phone"])
+        self.at.text_input(key="new_printer_brand_0").input(printer_["brand"])
+        self.at.text_input(key="new_printer_model_0").input(printer_["model"])
+        self.at.text_area(key="new_issue_description").input(args["issue_description"])
+        submit = next(b for b in self.at.button if b.label == "🎫 Create Order")
+
+        def submit_and_download():
+            submit.click().run()
+            self._download("dl_new_init")
+        self._run("create", submit_and_download)
+
+    def session_bytes(self) -> int:
+        # starea sesiunii fără widget-urile interne ale AppTest
+        return approx_size(dict(self.at.session_state._state.filtered_state))
+
+
+# ============================================================================
+# ROUNDS
+# ============================================================================
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values))) - 1))]
+
+
+def seed_connection(args) -> FakeGSheetsConnection:
+    conn = FakeGSheetsConnection(read_latency=args.read_latency, write_latency=args.write_latency)
+    conn.load("Orders", make_orders(args.orders, gap_every=0))
+    return conn
+
+
+def run_round(sessions: int, duration: float, args, runtime, mix: dict) -> dict:
+    """`sessions` operators for `duration` seconds against a freshly seeded sheet and empty caches."""
+    conn = seed_connection(args)
+    order_ids = conn.sheets["Orders"]["order_id"].tolist()[:MAX_IDS]
+    reset_runtime(runtime)
+    st.cache_resource.clear()
+    gc.collect()
+    rss0 = rss_bytes()
+
+    operators = [
+        Operator(n, runtime, runtime.bidi_component_registry, order_ids, mix, args.timeout) for n in range(sessions)
+    ]
+    deadline = time.perf_counter() + duration
+
+    def work(op: Operator):
+        op.start()
+        while time.perf_counter() < deadline:
+            op.step()
+            if args.think:
+                time.sleep(op.rng.uniform(0, 2 * args.think))
+
+    t0 = time.perf_counter()
+    with patch("streamlit.connection", lambda *a, **k: conn):
+        threads = [threading.Thread(target=work, args=(op,), name=f"operator-{op.n}") for op in operators]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    elapsed = time.perf_counter() - t0
+
+    gc.collect()
+    by_action = {}
+    for op in operators:
+        for action, ms in op.samples:
+            by_action.setdefault(action, []).append(ms)
+    every = sorted(ms for samples in by_action.values() for ms in samples)
+    sizes = [op.session_bytes() for op in operators]
+    return {
+        "sessions": sessions,
+        "reruns": len(every),
+        "rps": len(every) / elapsed,
+        "latency": {action: sorted(v) for action, v in by_action.items()},
+        "all": every,
+        "errors": [e for op in operators for e in op.errors],
+        "reads": conn.calls["read"],
+        "writes": conn.calls["update"] + conn.calls["write_rows"],
+        "session_kb": statistics.median(sizes) / 1024,
+        "session_kb_max": max(sizes) / 1024,
+        "rss_mb_per_session": (rss_bytes() - rss0) / sessions / 2**20,
+        "media_mb": media_bytes(runtime) / 2**20,
+        "downloaded_mb": sum(op.downloaded for op in operators) / 2**20,
+    }
+
+
+def print_round(res: dict):
+    reruns = max(res["reruns"], 1)
+    print(f"\n{res['sessions']} sessions · {res['reruns']} reruns · {res['rps']:.1f} reruns/s · "
+          f"{len(res['errors'])} errors")
+    print(f"  {'action':<8} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    rows = [a for a in ("start",) + ACTIONS if a in res["latency"]] + ["all"]
+    for action in rows:
+        values = res["all"] if action == "all" else res["latency"][action]
+        print(f"  {action:<8} {len(values):>6} {percentile(values, 0.50):>9.0f} "
+              f"{percentile(values, 0.95):>9.0f} {percentile(values, 0.99):>9.0f}")
+    print(f"  backend: {res['reads']} reads ({res['reads'] / reruns:.2f}/rerun), "
+          f"{res['writes']} writes ({res['writes'] / reruns:.2f}/rerun)")
+    print(f"  memory: session_state {res['session_kb']:.0f} KB median / {res['session_kb_max']:.0f} KB max, "
+          f"RSS +{res['rss_mb_per_session']:.1f} MB per session "
+          f"(media files {res['media_mb']:.1f} MB, downloaded {res['downloaded_mb']:.1f} MB)")
+    for error in sorted(set(res["errors"]))[:5]:
+        print(f"  ! {error[:160]}")
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        name, _, weight = item.partition("=")
+        if name not in ACTIONS:
+            raise ValueError(f"unknown action '{name}'")
+        mix[name] = float(weight or 1)
+    if not mix or not any(mix.values()):
+        raise ValueError("the mix needs at least one action with a positive weight")
+    return mix
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", default="4,8,16", help="comma-separated numbers of concurrent sessions")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per session count")
+    parser.add_argument("--orders", type=int, default=2000, help="synthetic orders in the sheet")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"action=weight, from {','.join(ACTIONS)}")
+    parser.add_argument("--think", type=float, default=0.0, help="mean pause between an operator's actions (s)")
+    parser.add_argument("--read-latency", type=float, default=0.0, help="simulated Sheets read latency (s)")
+    parser.add_argument("--write-latency", type=float, default=0.0, help="simulated Sheets write latency (s)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds before a rerun counts as failed")
+    args = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    counts = [int(n) for n in args.sessions.split(",") if n.strip()]
+
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    print(f"{args.orders} orders, {args.duration:g}s per round, think {args.think:g}s, "
+          f"read {args.read_latency * 1000:.0f} ms / write {args.write_latency * 1000:.0f} ms, {cores} core(s)")
+    print(f"mix: {', '.join(f'{a}={w:g}' for a, w in mix.items())}")
+
+    with tempfile.TemporaryDirectory(prefix="load-app-") as workdir:
+        runtime, stack = install_runtime(harness_secrets(workdir))
+        with stack:
+            # imports, the compiled script and the fonts of the PDFs stay out of the first round's numbers
+            run_round(1, 0.0, args, runtime, mix)
+            for sessions in counts:
+                print_round(run_round(sessions, args.duration, args, runtime, mix))
+                sys.stdout.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""Reproducible synthetic order history for benchmarks."""
+import json
+import random
+from datetime import date, timedelta
+
+import pandas as pd
+
+
+BRANDS = {
+    "HP": ["LaserJet Pro M404", "LaserJet M428", "OfficeJet 8012", "DesignJet T230"],
+    "Canon": ["i-SENSYS MF443", "PIXMA G6050", "imageRUNNER 2425"],
+    "Epson": ["EcoTank L3250", "WorkForce WF-2930", "SureColor SC-T3100"],
+    "Brother": ["HL-L2350DW", "MFC-L2710DN", "DCP-T720DW"],
+    "Kyocera": ["ECOSYS M2135dn", "ECOSYS P2040dn"],
+    "Xerox": ["B210", "VersaLink C405"],
+}
+STATUSES = ["Received", "In Progress", "Ready for Pickup", "Completed"]
+STATUS_WEIGHTS = [0.08, 0.07, 0.05, 0.80]
+TECHNICIANS = ["", "Andrei", "Mihai", "Ioana", "Radu"]
+FIRST_NAMES = ["Ion", "Maria", "Andrei", "Elena", "Ștefan", "Ana", "Mihai", "Cristina", "Gheorghe", "Ioana"]
+LAST_NAMES = ["Popescu", "Ionescu", "Popa", "Dumitru", "Stan", "Stoica", "Gheorghiu", "Matei", "Ciobanu", "Țurcanu"]
+ISSUES = [
+    "Nu trage hârtia", "Blocaj hârtie frecvent", "Printează cu dungi", "Eroare cartuș",
+    "Nu pornește", "Zgomot la printare", "Scanerul nu funcționează", "Pete pe pagină",
+]
+
+
+def _printer(rng: random.Random) -> dict:
+    brand = rng.choice(list(BRANDS))
+    return {
+        "brand": brand,
+        "model": rng.choice(BRANDS[brand]),
+        "serial": f"{brand[:2].upper()}{rng.randrange(10**7, 10**8)}",
+        "warranty": rng.random() < 0.2,
+    }
+
+
+def make_orders(n: int, seed: int = 42, clients: int = 0, gap_every: int = 0) -> pd.DataFrame:
+    """
+    Generate n orders shaped like the Orders worksheet.
+
+    clients   -- size of the returning-customer pool (default n // 3)
+    gap_every -- leave out every k-th order id (exercises fill-the-gap logic)
+    """
+    rng = random.Random(seed)
+    pool_size = clients or max(1, n // 3)
+    pool = [
+        (
+            f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            f"07{rng.randrange(10**7, 10**8)}",
+            f"client{i}@example.ro" if rng.random() < 0.5 else "",
+        )
+        for i in range(pool_size)
+    ]
+    start = date.today() - timedelta(days=5 * 365)
+
+    rows = []
+    num = 0
+    while len(rows) < n:
+        num += 1
+        if gap_every and num % gap_every == 0:
+            continue
+        name, phone, email = rng.choice(pool)
+        printers = [_printer(rng) for _ in range(rng.choices([1, 2, 3, 4], [0.75, 0.15, 0.07, 0.03])[0])]
+        received = start + timedelta(days=rng.randrange(5 * 365))
+        status = rng.choices(STATUSES, STATUS_WEIGHTS)[0]
+        completed = received + timedelta(days=rng.randrange(1, 20)) if status in ("Ready for Pickup", "Completed") else None
+        picked_up = completed + timedelta(days=rng.randrange(0, 10)) if status == "Completed" else None
+        labor = float(rng.choice([0, 50, 80, 100, 150, 200]))
+        parts = float(rng.choice([0, 0, 35, 60, 120, 250]))
+        rows.append({
+            "order_id": f"SRV-{num:05d}",
+            "client_name": name,
+            "client_phone": phone,
+            "client_email": email,
+            "printer_brand": printers[0]["brand"],
+            "printer_model": printers[0]["model"],
+            "printer_serial": printers[0]["serial"],
+            "printers_json": json.dumps(printers, ensure_ascii=False),
+            "issue_description": rng.choice(ISSUES),
+            "accessories": rng.choice(["", "", "cablu alimentare", "cablu USB, cartușe"]),
+            "notes": "",
+            "date_received": received.strftime("%Y-%m-%d"),
+            "date_pickup_scheduled": "",
+            "date_completed": completed.strftime("%Y-%m-%d") if completed else "",
+            "date_picked_up": picked_up.strftime("%Y-%m-%d") if picked_up else "",
+            "status": status,
+            "technician": rng.choice(TECHNICIANS) if status != "Received" else "",
+            "repair_details": "Curățare și înlocuire role" if status != "Received" else "",
+            "parts_used": "Kit role" if parts else "",
+            "labor_cost": labor,
+            "parts_cost": parts,
+            "total_cost": labor + parts,
+        })
+    return pd.DataFrame(rows)
+
+
+def new_order_args(seed: int = 0) -> dict:
+    """Keyword arguments for PrinterServiceCRM.create_service_order."""
+    rng = random.Random(seed)
+    return {
+        "client_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        "client_phone": f"07{rng.randrange(10**7, 10**8)}",
+        "client_email": "",
+        "printers_list": [_printer(rng) for _ in range(2)],
+        "issue_description": rng.choice(ISSUES),
+        "accessories": "",
+        "notes": "",
+        "date_received": date.today(),
+        "date_pickup": None,
+    }
@@ -0,0 +1,112 @@
+"""
+Service branches (locations), each with its own shard of worksheets.
+
+Every branch keeps its orders in its own worksheets and numbers them with
+its own prefix, so two locations never write to the same sheet and an
+order id says which branch owns it:
+
+    branch   prefix   worksheets
+    main     SRV-     Orders, Orders_Archive, Parts, Stock_Ledger, Order_Items, Order_Attachments
+    clj      CLJ-     Orders_CLJ, Orders_Archive_CLJ, Parts_CLJ, ...
+
+Without a [branches] section in the secrets there is one branch, "main",
+with the worksheet names and SRV- ids the app always used. Example:
+
+    [branches.main]
+    name = "București"
+
+    [branches.clj]
+    name = "Cluj"
+    prefix = "CLJ-"         # default: code in capitals + "-"
+    suffix = "CLJ"          # worksheet suffix; default: code in capitals ("" for main)
+
+Queries over every branch (reports, scans of another branch's receipt)
+read the shards in parallel with fan_out() and tag the rows with their
+branch before merging them.
+"""
+import contextvars
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import pandas as pd
+
+
+MAIN_CODE = "main"
+BRANCH_COLUMN = "branch"
+_PREFIX_RE = re.compile(r"^[A-Z]+-$")   # ca parse_order_code să recunoască id-urile
+
+
+class Branch:
+    __slots__ = ("code", "name", "prefix", "suffix")
+
+    def __init__(self, code: str, name: str = "", prefix: str = "SRV-", suffix: str = ""):
+        self.code = code
+        self.name = name or code
+        self.prefix = prefix
+        self.suffix = suffix
+
+    def worksheet(self, base: str) -> str:
+        """The branch's shard of a worksheet: Orders → Orders_CLJ (main keeps the plain names)."""
+        return f"{base}_{self.suffix}" if self.suffix else base
+
+    def owns(self, order_id: str) -> bool:
+        return isinstance(order_id, str) and order_id.startswith(self.prefix)
+
+    @property
+    def label(self) -> str:
+        return f"{self.name} ({self.prefix[:-1]})"
+
+
+DEFAULT_BRANCH = Branch(MAIN_CODE, "Main", "SRV-", "")
+
+
+def parse_branches(cfg: Optional[dict]) -> dict:
+    """
+    code → Branch from the [branches] secrets section, in file order; the
+    single default branch if the section is missing or empty. Raises
+    ValueError for an invalid prefix or two branches sharing a prefix or
+    a worksheet suffix.
+    """
+    if not cfg:
+        return {MAIN_CODE: DEFAULT_BRANCH}
+    branches = {}
+    for code, spec in cfg.items():
+        spec = dict(spec or {})
+        main = code == MAIN_CODE
+        prefix = str(spec.get("prefix", "SRV-" if main else f"{code.upper()}-")).upper()
+        if not _PREFIX_RE.match(prefix):
+            raise ValueError(f"branch '{code}': prefix must be letters followed by '-', got '{prefix}'")
+        suffix = str(spec.get("suffix", "" if main else code.upper()))
+        branches[code] = Branch(code, str(spec.get("name", "")), prefix, suffix)
+    for attr in ("prefix", "suffix"):
+        values = [getattr(b, attr) for b in branches.values()]
+        if len(set(values)) != len(values):
+            raise ValueError(f"two branches share the same {attr}")
+    return branches
+
+
+def branch_for_order(order_id: str, branches: dict) -> Optional[Branch]:
+    """The branch whose prefix the order id carries (None for an unknown prefix)."""
+    return next((b for b in branches.values() if b.owns(order_id)), None)
+
+
+def fan_out(fn, items: list, max_workers: int = 8) -> list:
+    """
+    fn(item) for every item on a thread pool, results in input order. Each
+    call runs in a copy of the caller's context, so tracing spans opened
+    inside it still belong to the current rerun.
+    """
+    if len(items) <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items)), thread_name_prefix="branches") as pool:
+        futures = [pool.submit(contextvars.copy_context().run, fn, item) for item in items]
+        return [f.result() for f in futures]
+
+
+def merge_branch_frames(frames: dict) -> pd.DataFrame:
+    """Concatenate per-branch frames (code → frame), tagging every row with its branch code."""
+    tagged = [df.assign(**{BRANCH_COLUMN: code}) for code, df in frames.items() if df is not None and not df.empty]
+    if not tagged:
+        return pd.DataFrame()
+    return pd.concat(tagged, ignore_index=True)
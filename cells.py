@@ -0,0 +1,35 @@
+"""
+Sheet cells as plain Python values.
+
+Google Sheets returns empty cells as NaN and numbers as floats or text, so
+every module that turns rows into objects needs the same NaN-safe
+conversions; they live here.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+
+def safe_text(value: object) -> str:
+    """Transformă None / NaN în string gol, altfel în string normal."""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    return str(value)
+
+
+def safe_float(value: object, default: float = 0.0) -> float:
+    """Transformă None / NaN / string gol (sau orice nu e număr) în 0 (sau default)."""
+    try:
+        if value is None or (isinstance(value, str) and not value.strip()):
+            return default
+        number = float(value)
+    except (TypeError, ValueError, OverflowError):
+        return default
+    return default if math.isnan(number) else number
+
+
+def unseen_mask(values: pd.Series, seen) -> np.ndarray:
+    """Boolean mask of the values not in `seen` (a dict or set)."""
+    # listă Python + dict: mult mai rapid decât isin() pe coloane string/arrow
+    return np.array([value not in seen for value in values.tolist()], dtype=bool)
@@ -0,0 +1,248 @@
+"""
+Client registry derived from order history.
+
+Clients are deduplicated by normalized phone number. The registry keeps a
+hash index (phone → client) plus sorted prefix indexes for phone and name,
+so autocomplete is a dict hit or a bisect, not a scan of the order sheet.
+It is built incrementally: a rerun only ingests orders not seen before;
+orders the CRM writes or deletes are pushed in with refresh() and
+remove_order(), so edits and reused order ids reach the registry too.
+"""
+import bisect
+import hashlib
+import re
+import threading
+from typing import Optional
+
+import pandas as pd
+
+from cells import safe_text, unseen_mask
+from textnorm import name_index_keys, search_key
+
+
+_NON_DIGITS = re.compile(r"\D+")
+
+
+def normalize_phone(phone) -> str:
+    """
+    Canonical national form for Romanian numbers (07xxxxxxxx);
+    other numbers keep their digits only. Empty string if there are no digits.
+    """
+    if phone is None:
+        return ""
+    if isinstance(phone, float):
+        # Sheets poate returna numărul ca float (722123456.0) sau NaN
+        if phone != phone:
+            return ""
+        phone = str(int(phone))
+    digits = _NON_DIGITS.sub("", str(phone))
+    if digits.startswith("0040"):
+        digits = "0" + digits[4:]
+    elif digits.startswith("40") and len(digits) == 11:
+        digits = "0" + digits[2:]
+    elif len(digits) == 9 and digits.startswith("7"):
+        # zeroul din față pierdut la importul în Sheets
+        digits = "0" + digits
+    return digits
+
+
+def client_id_for_phone(phone) -> str:
+    """Stable client id derived from the normalized phone ("" if no phone)."""
+    key = normalize_phone(phone)
+    if not key:
+        return ""
+    return "CL-" + hashlib.sha1(key.encode()).hexdigest()[:8].upper()
+
+
+def client_ids_for_phones(phones: pd.Series) -> pd.Series:
+    """Vectorized client_id_for_phone (one hash per distinct phone)."""
+    codes, uniques = pd.factorize(phones, sort=False)
+    ids = [client_id_for_phone(u) for u in uniques] + [""]
+    return pd.Series([ids[c] for c in codes], index=phones.index, dtype=object)
+
+
+class Client:
+    __slots__ = ("client_id", "phone", "name", "email", "order_ids", "last_order_date")
+
+    def __init__(self, client_id: str, phone: str, name: str = "", email: str = ""):
+        self.client_id = client_id
+        self.phone = phone
+        self.name = name
+        self.email = email
+        self.order_ids = []
+        self.last_order_date = ""
+
+    @property
+    def label(self) -> str:
+        return f"{self.name} · {self.phone}" + (f" · {self.email}" if self.email else "")
+
+
+class ClientRegistry:
+    def __init__(self):
+        self._by_phone = {}        # phone normalizat → Client
+        self._phone_keys = []      # sortat, pentru căutare după prefix
+        self._name_keys = []       # sortat: (sufix de nume normalizat, telefon)
+        self._orders = {}          # order_id → (telefon normalizat, date_received) = comenzi văzute
+        self._lock = threading.Lock()
+        self.history_loaded = False  # arhiva a fost citită o dată
+
+    def __len__(self) -> int:
+        return len(self._by_phone)
+
+    def get(self, phone) -> Optional[Client]:
+        return self._by_phone.get(normalize_phone(phone))
+
+    def add_order(self, order_id, name, phone, email="", date_received="") -> Optional[Client]:
+        """Register (or re-register, replacing the earlier entry) one order."""
+        with self._lock:
+            self._drop(order_id)
+            return self._add(order_id, name, phone, email, date_received)
+
+    def _add(self, order_id, name, phone, email, date_received) -> Optional[Client]:
+        key = normalize_phone(phone)
+        date_received = str(date_received or "")
+        self._orders[order_id] = (key, date_received)
+        if not key:
+            return None
+        name = str(name or "").strip()
+        email = str(email or "").strip()
+        client = self._by_phone.get(key)
+        if client is None:
+            client = Client(client_id_for_phone(key), key, name, email)
+            self._by_phone[key] = client
+            bisect.insort(self._phone_keys, key)
+            self._index_name(client)
+        if date_received >= client.last_order_date:
+            # datele cele mai recente câștigă (numele/emailul pot fi corectate)
+            client.last_order_date = date_received
+            if name and name != client.name:
+                self._rename(client, name)
+            if email:
+                client.email = email
+        client.order_ids.append(order_id)
+        return client
+
+    def remove_order(self, order_id):
+        with self._lock:
+            self._drop(order_id)
+
+    def _drop(self, order_id):
+        key, _ = self._orders.pop(order_id, ("", ""))
+        client = self._by_phone.get(key)
+        if client is None or order_id not in client.order_ids:
+            return
+        client.order_ids.remove(order_id)
+        if client.order_ids:
+            client.last_order_date = max(self._orders[oid][1] for oid in client.order_ids)
+            return
+        # ultima comandă a clientului: iese din toate indexurile
+        del self._by_phone[key]
+        i = bisect.bisect_left(self._phone_keys, key)
+        if i < len(self._phone_keys) and self._phone_keys[i] == key:
+            del self._phone_keys[i]
+        self._unindex_name(client)
+
+    def _index_name(self, client: Client):
+        for key in name_index_keys(client.name):
+            bisect.insort(self._name_keys, (key, client.phone))
+
+    def _unindex_name(self, client: Client):
+        for key in name_index_keys(client.name):
+            old = (key, client.phone)
+            i = bisect.bisect_left(self._name_keys, old)
+            if i < len(self._name_keys) and self._name_keys[i] == old:
+                del self._name_keys[i]
+
+    def _rename(self, client: Client, name: str):
+        self._unindex_name(client)
+        client.name = name
+        self._index_name(client)
+
+    def sync(self, df: pd.DataFrame) -> int:
+        """Ingest orders from df that were not seen before; returns how many."""
+        if df is None or df.empty or "order_id" not in df.columns or "client_phone" not in df.columns:
+            return 0
+        with self._lock:
+            seen = self._orders
+            new_mask = unseen_mask(df["order_id"], seen)
+            if not new_mask.any():
+                return 0
+            return self._ingest_rows(df.loc[new_mask], replace=False)
+
+    def refresh(self, df: pd.DataFrame) -> int:
+        """Re-ingest the given (created or updated) orders, replacing older entries."""
+        if df is None or df.empty or "order_id" not in df.columns or "client_phone" not in df.columns:
+            return 0
+        with self._lock:
+            return self._ingest_rows(df, replace=True)
+
+    def _ingest_rows(self, df: pd.DataFrame, replace: bool) -> int:
+        cols = ["order_id", "client_name", "client_phone", "client_email", "date_received"]
+        rows = df[[c for c in cols if c in df.columns]]
+        for row in rows.itertuples(index=False):
+            rec = row._asdict()
+            if replace:
+                self._drop(rec["order_id"])
+            self._add(
+                rec["order_id"],
+                safe_text(rec.get("client_name")),
+                safe_text(rec.get("client_phone")),
+                safe_text(rec.get("client_email")),
+                safe_text(rec.get("date_received")),
+            )
+        return len(rows)
+
+    def search(self, query: str, limit: int = 8) -> list:
+        """Clients whose phone, or any word of whose (folded) name, starts with query."""
+        query = (query or "").strip()
+        if not query:
+            return []
+        found = {}
+        phone_prefix = _phone_prefix(query) if any(ch.isdigit() for ch in query) else ""
+        with self._lock:
+            if phone_prefix:
+                for key in _prefix_scan(self._phone_keys, phone_prefix, limit):
+                    found.setdefault(key, self._by_phone[key])
+            name_prefix = search_key(query)
+            if len(found) < limit and name_prefix and not phone_prefix:
+                lo = bisect.bisect_left(self._name_keys, (name_prefix, ""))
+                for name_key, phone in self._name_keys[lo:]:
+                    if not name_key.startswith(name_prefix) or len(found) >= limit:
+                        break
+                    found.setdefault(phone, self._by_phone[phone])
+        return list(found.values())[:limit]
+
+    def top_clients(self, n: int = 10) -> pd.DataFrame:
+        with self._lock:
+            clients = sorted(self._by_phone.values(), key=lambda c: len(c.order_ids), reverse=True)[:n]
+        return pd.DataFrame([
+            {
+                "client_id": c.client_id,
+                "name": c.name,
+                "phone": c.phone,
+                "orders": len(c.order_ids),
+                "last_order": c.last_order_date,
+            }
+            for c in clients
+        ])
+
+
+def _phone_prefix(query: str) -> str:
+    """Like normalize_phone, but for a partially typed number."""
+    digits = _NON_DIGITS.sub("", query)
+    if digits.startswith("0040"):
+        return "0" + digits[4:]
+    if query.lstrip().startswith("+40"):
+        return "0" + digits[2:]
+    if digits.startswith("7"):
+        return "0" + digits
+    return digits
+
+
+def _prefix_scan(keys: list, prefix: str, limit: int) -> list:
+    out = []
+    i = bisect.bisect_left(keys, prefix)
+    while i < len(keys) and keys[i].startswith(prefix) and len(out) < limit:
+        out.append(keys[i])
+        i += 1
+    return out
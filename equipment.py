@@ -0,0 +1,194 @@
+"""
+Equipment registry: every printer that passed through the service, indexed
+by serial number and by brand/model, with its repair history.
+
+Orders are ingested incrementally: a rerun only parses printers_json for
+order ids it has not seen yet. Orders changed through the CRM are pushed in
+explicitly with refresh(), so nothing rescans the whole sheet.
+"""
+import re
+import threading
+from datetime import date, timedelta
+from typing import Callable, Optional
+
+import pandas as pd
+
+from cells import safe_text, unseen_mask
+from textnorm import search_key
+
+
+_SERIAL_JUNK = re.compile(r"[\s\-_./]+")
+# tot ce citesc _ingest și load_printers_from_order (inclusiv coloanele legacy)
+INGEST_COLUMNS = [
+    "order_id", "printers_json", "printer_brand", "printer_model", "printer_serial",
+    "date_received", "issue_description", "status",
+]
+REPEAT_WINDOW_DAYS = 90
+
+
+def normalize_serial(serial) -> str:
+    if serial is None or (isinstance(serial, float) and serial != serial):
+        return ""
+    return _SERIAL_JUNK.sub("", str(serial)).upper()
+
+
+class Visit:
+    __slots__ = ("order_id", "date_received", "issue", "status", "warranty")
+
+    def __init__(self, order_id: str, date_received: str, issue: str, status: str, warranty: bool):
+        self.order_id = order_id
+        self.date_received = date_received
+        self.issue = issue
+        self.status = status
+        self.warranty = warranty
+
+
+class Equipment:
+    __slots__ = ("serial", "brand", "model", "visits")
+
+    def __init__(self, serial: str, brand: str, model: str):
+        self.serial = serial
+        self.brand = brand
+        self.model = model
+        self.visits = []
+
+    def visits_before(self, order_id: str) -> list:
+        """Visits other than order_id, most recent first."""
+        return sorted(
+            (v for v in self.visits if v.order_id != order_id),
+            key=lambda v: v.date_received,
+            reverse=True,
+        )
+
+    def is_repeat_failure(self, order_id: str = "", window_days: int = REPEAT_WINDOW_DAYS,
+                          on: Optional[date] = None) -> bool:
+        """True if the unit was already in service within window_days of `on` (default today)."""
+        ref = pd.to_datetime(on or date.today())
+        cutoff = (ref - timedelta(days=window_days)).strftime("%Y-%m-%d")
+        return any(v.date_received >= cutoff for v in self.visits_before(order_id))
+
+
+class EquipmentRegistry:
+    def __init__(self):
+        self._by_serial = {}       # serial normalizat → Equipment
+        self._by_model = {}        # (brand, model) normalizate → set de seriale
+        self._order_serials = {}   # order_id → seriale din comandă (= comenzi văzute)
+        self._lock = threading.Lock()
+        self.history_loaded = False
+
+    def __len__(self) -> int:
+        return len(self._by_serial)
+
+    def get(self, serial) -> Optional[Equipment]:
+        return self._by_serial.get(normalize_serial(serial))
+
+    def serials_for_model(self, brand: str, model: str) -> list:
+        return sorted(self._by_model.get((search_key(brand), search_key(model)), ()))
+
+    def sync(self, df: Optional[pd.DataFrame], load_printers: Callable[[dict], list]) -> int:
+        """
+        Ingest orders from df not seen before; returns how many.
+        load_printers turns an order dict into a list of printer dicts.
+        """
+        if df is None or df.empty or "order_id" not in df.columns:
+            return 0
+        with self._lock:
+            seen = self._order_serials
+            new_mask = unseen_mask(df["order_id"], seen)
+            if not new_mask.any():
+                return 0
+            return self._ingest_rows(df[new_mask], load_printers)
+
+    def refresh(self, df: Optional[pd.DataFrame], load_printers: Callable[[dict], list]) -> int:
+        """Re-ingest the given (created or updated) orders, replacing older entries."""
+        if df is None or df.empty or "order_id" not in df.columns:
+            return 0
+        with self._lock:
+            return self._ingest_rows(df, load_printers)
+
+    def _ingest_rows(self, df: pd.DataFrame, load_printers) -> int:
+        cols = [c for c in INGEST_COLUMNS if c in df.columns]
+        orders = df[cols].to_dict("records")
+        for order in orders:
+            self._ingest(order, load_printers(order))
+        return len(orders)
+
+    def remove_order(self, order_id: str):
+        with self._lock:
+            self._drop(order_id)
+
+    def _drop(self, order_id: str):
+        serials = self._order_serials.pop(order_id, ())
+        for serial in serials:
+            eq = self._by_serial.get(serial)
+            if eq is None:
+                continue
+            eq.visits = [v for v in eq.visits if v.order_id != order_id]
+            if not eq.visits:
+                del self._by_serial[serial]
+                key = (search_key(eq.brand), search_key(eq.model))
+                self._by_model.get(key, set()).discard(serial)
+
+    def _ingest(self, order: dict, printers: list):
+        order_id = safe_text(order.get("order_id"))
+        self._drop(order_id)
+        serials = []
+        for p in printers:
+            serial = normalize_serial(p.get("serial"))
+            if not serial:
+                continue
+            brand = safe_text(p.get("brand")).strip()
+            model = safe_text(p.get("model")).strip()
+            eq = self._by_serial.get(serial)
+            if eq is None:
+                eq = Equipment(serial, brand, model)
+                self._by_serial[serial] = eq
+            elif (brand, model) != (eq.brand, eq.model) and brand:
+                self._by_model.get((search_key(eq.brand), search_key(eq.model)), set()).discard(serial)
+                eq.brand, eq.model = brand, model
+            self._by_model.setdefault((search_key(eq.brand), search_key(eq.model)), set()).add(serial)
+            eq.visits.append(Visit(
+                order_id,
+                safe_text(order.get("date_received")),
+                safe_text(order.get("issue_description")),
+                safe_text(order.get("status")),
+                bool(p.get("warranty", False)),
+            ))
+            serials.append(serial)
+        self._order_serials[order_id] = tuple(serials)
+
+    def history_df(self, serial) -> pd.DataFrame:
+        eq = self.get(serial)
+        if eq is None:
+            return pd.DataFrame(columns=["order_id", "date_received", "status", "issue", "warranty"])
+        return pd.DataFrame([
+            {
+                "order_id": v.order_id,
+                "date_received": v.date_received,
+                "status": v.status,
+                "issue": v.issue,
+                "warranty": v.warranty,
+            }
+            for v in eq.visits_before("")
+        ])
+
+    def top_models(self, n: int = 10) -> pd.DataFrame:
+        """Brand/model pairs with the most service visits."""
+        with self._lock:
+            rows = []
+            for serials in self._by_model.values():
+                if not serials:
+                    continue
+                units = [self._by_serial[s] for s in serials if s in self._by_serial]
+                if not units:
+                    continue
+                rows.append({
+                    "brand": units[0].brand,
+                    "model": units[0].model,
+                    "units": len(units),
+                    "visits": sum(len(u.visits) for u in units),
+                    "repeat_units": sum(1 for u in units if len(u.visits) > 1),
+                })
+        if not rows:
+            return pd.DataFrame(columns=["brand", "model", "units", "visits", "repeat_units"])
+        return pd.DataFrame(rows).sort_values("visits", ascending=False).head(n)
@@ -0,0 +1,96 @@
+"""
+Cross-process locks on a lock file.
+
+The Streamlit server, the batch CLI and every uvicorn worker of the API are
+separate processes working on the same files (.audit/, .outbox/) and the
+same worksheets. A threading.Lock only orders the threads of one of them;
+FileLock orders all of them:
+
+    lock = FileLock(".audit/.lock")
+    with lock:
+        ...                 # re-read the shared state, change it, write it
+
+It is a threading.RLock too, so the threads of one process queue up in
+Python and only one of them at a time waits on the file, and a thread
+that holds it can take it again (a CRM write inside a caller's read →
+check → write). The lock is held on an open file (flock on POSIX,
+msvcrt.locking on Windows), so the system releases it when a process dies
+while holding it. It only orders processes of one machine.
+"""
+import os
+import threading
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:         # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._thread_lock = threading.RLock()
+        self._fd = None
+        self._depth = 0
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        self._depth += 1
+        if self._depth > 1:
+            return
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                _lock_fd(fd)
+            except BaseException:
+                os.close(fd)
+                raise
+            self._fd = fd
+        except BaseException:
+            self._depth -= 1
+            self._thread_lock.release()
+            raise
+
+    def release(self):
+        self._depth -= 1
+        if self._depth:
+            self._thread_lock.release()
+            return
+        fd, self._fd = self._fd, None
+        try:
+            _unlock_fd(fd)
+        finally:
+            os.close(fd)
+            self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def _lock_fd(fd: int):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return
+    while True:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            # LK_LOCK renunță după ~10 s; mai încercăm
+            time.sleep(0.05)
+
+
+def _unlock_fd(fd: int):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,297 @@
+"""
+Parts catalog and stock ledger.
+
+The catalog (one row per SKU) and the ledger (one row per stock movement)
+live in their own worksheets. Stock on hand is never re-aggregated from
+order text: every ledger entry is applied once to running totals
+(per SKU on hand, per order consumed quantity and cost), so the stock
+level of a part, the parts on an order and the low-stock report are all
+dict lookups.
+
+Ledger sign convention: qty_delta > 0 puts parts on the shelf (receive,
+return from an order), qty_delta < 0 takes them off (consume on an order).
+Each entry records the unit price at the time, so changing the catalog
+price does not change the cost of orders already billed.
+
+The ledger is append-only and other processes (API workers, the batch
+CLI) append to it too: before a write, catch_up() applies the rows past
+the ones this process has seen, so new entries start from the sheet's
+totals, not from this process's.
+"""
+import bisect
+import threading
+from datetime import datetime
+from typing import Optional
+
+import pandas as pd
+
+from cells import safe_float, safe_text
+from textnorm import name_index_keys, search_key
+
+
+PART_COLUMNS = ["sku", "name", "unit_price", "reorder_level"]
+LEDGER_COLUMNS = ["timestamp", "sku", "qty_delta", "unit_price", "order_id", "kind", "note"]
+KIND_RECEIVE = "receive"
+KIND_CONSUME = "consume"
+KIND_RETURN = "return"
+KIND_ADJUST = "adjust"
+
+
+def normalize_sku(sku) -> str:
+    return safe_text(sku).strip().upper()
+
+
+class Part:
+    __slots__ = ("sku", "name", "unit_price", "reorder_level", "on_hand")
+
+    def __init__(self, sku: str, name: str, unit_price: float = 0.0, reorder_level: int = 0):
+        self.sku = sku
+        self.name = name
+        self.unit_price = unit_price
+        self.reorder_level = reorder_level
+        self.on_hand = 0
+
+    @property
+    def label(self) -> str:
+        return f"{self.name} ({self.sku}) · {self.unit_price:.2f} RON · stock {self.on_hand}"
+
+    @property
+    def is_low(self) -> bool:
+        return self.on_hand <= self.reorder_level
+
+
+class Inventory:
+    def __init__(self):
+        self._parts = {}           # sku → Part
+        self._name_keys = []       # sortat: (sufix de nume normalizat, sku)
+        self._order_qty = {}       # order_id → {sku: cantitate netă consumată}
+        self._order_cost = {}      # order_id → {sku: cost net}
+        self._ledger_rows = 0      # câte rânduri din ledger sunt aplicate
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._parts)
+
+    # ------------------------------------------------------------------ catalog
+    def get(self, sku) -> Optional[Part]:
+        return self._parts.get(normalize_sku(sku))
+
+    def parts(self) -> list:
+        with self._lock:
+            return sorted(self._parts.values(), key=lambda p: search_key(p.name))
+
+    def upsert_part(self, sku, name, unit_price=0.0, reorder_level=0) -> Optional[Part]:
+        with self._lock:
+            return self._upsert_part(sku, name, unit_price, reorder_level)
+
+    def _upsert_part(self, sku, name, unit_price, reorder_level) -> Optional[Part]:
+        sku = normalize_sku(sku)
+        if not sku:
+            return None
+        name = safe_text(name).strip() or sku
+        part = self._parts.get(sku)
+        if part is None:
+            part = Part(sku, name)
+            self._parts[sku] = part
+        else:
+            self._unindex_name(part)
+            part.name = name
+        part.unit_price = safe_float(unit_price)
+        part.reorder_level = int(safe_float(reorder_level))
+        for key in name_index_keys(part.name) + [search_key(sku)]:
+            bisect.insort(self._name_keys, (key, sku))
+        return part
+
+    def _unindex_name(self, part: Part):
+        for key in name_index_keys(part.name) + [search_key(part.sku)]:
+            entry = (key, part.sku)
+            i = bisect.bisect_left(self._name_keys, entry)
+            if i < len(self._name_keys) and self._name_keys[i] == entry:
+                del self._name_keys[i]
+
+    def search(self, query: str, limit: int = 20) -> list:
+        """Parts whose SKU, or any word of whose (folded) name, starts with query."""
+        prefix = search_key((query or "").strip())
+        if not prefix:
+            return self.parts()[:limit]
+        found = {}
+        with self._lock:
+            i = bisect.bisect_left(self._name_keys, (prefix, ""))
+            while i < len(self._name_keys) and len(found) < limit:
+                key, sku = self._name_keys[i]
+                if not key.startswith(prefix):
+                    break
+                found.setdefault(sku, self._parts[sku])
+                i += 1
+        return list(found.values())
+
+    # ------------------------------------------------------------------ ledger
+    def load(self, parts_df: Optional[pd.DataFrame], ledger_df: Optional[pd.DataFrame]):
+        """Rebuild catalog and running totals from the two worksheets (once per process)."""
+        with self._lock:
+            self._parts.clear()
+            self._name_keys.clear()
+            if parts_df is not None and not parts_df.empty and "sku" in parts_df.columns:
+                cols = [c for c in PART_COLUMNS if c in parts_df.columns]
+                for rec in parts_df[cols].to_dict("records"):
+                    self._upsert_part(rec.get("sku"), rec.get("name"),
+                                      rec.get("unit_price"), rec.get("reorder_level"))
+            self._replay(ledger_df)
+            self.loaded = True
+
+    def catch_up(self, ledger_df: Optional[pd.DataFrame]) -> int:
+        """
+        Apply the ledger rows after the ones already applied (appended by
+        another process). A shorter ledger (restored from a backup) is
+        replayed from the start. Returns how many rows were applied.
+        """
+        rows = 0 if ledger_df is None or "sku" not in ledger_df.columns else len(ledger_df)
+        with self._lock:
+            if rows < self._ledger_rows:
+                self._replay(ledger_df)
+                return rows
+            tail = ledger_df.iloc[self._ledger_rows:] if rows > self._ledger_rows else None
+            if tail is None:
+                return 0
+            cols = [c for c in LEDGER_COLUMNS if c in tail.columns]
+            for rec in tail[cols].to_dict("records"):
+                self._apply(rec)
+            return len(tail)
+
+    def _replay(self, ledger_df: Optional[pd.DataFrame]):
+        self._order_qty.clear()
+        self._order_cost.clear()
+        self._ledger_rows = 0
+        for part in self._parts.values():
+            part.on_hand = 0
+        if ledger_df is not None and not ledger_df.empty and "sku" in ledger_df.columns:
+            cols = [c for c in LEDGER_COLUMNS if c in ledger_df.columns]
+            for rec in ledger_df[cols].to_dict("records"):
+                self._apply(rec)
+
+    def apply(self, entries: list):
+        """Apply new ledger entries (already written to the sheet) to the running totals."""
+        with self._lock:
+            for entry in entries:
+                self._apply(entry)
+
+    def _apply(self, entry: dict):
+        self._ledger_rows += 1
+        sku = normalize_sku(entry.get("sku"))
+        if not sku:
+            return
+        qty = int(safe_float(entry.get("qty_delta")))
+        part = self._parts.get(sku)
+        if part is None:
+            # mișcare pe un SKU șters din catalog: îl păstrăm ca să nu pierdem stocul
+            part = self._upsert_part(sku, sku, 0.0, 0)
+        part.on_hand += qty
+        order_id = safe_text(entry.get("order_id")).strip()
+        if order_id:
+            used = self._order_qty.setdefault(order_id, {})
+            used[sku] = used.get(sku, 0) - qty
+            cost = self._order_cost.setdefault(order_id, {})
+            cost[sku] = cost.get(sku, 0.0) - qty * safe_float(entry.get("unit_price"))
+            if used[sku] == 0:
+                del used[sku]
+                del cost[sku]
+
+    def order_parts(self, order_id: str) -> dict:
+        """{sku: quantity} currently consumed by the order."""
+        with self._lock:
+            return dict(self._order_qty.get(order_id, {}))
+
+    def order_cost(self, order_id: str) -> float:
+        with self._lock:
+            return round(sum(self._order_cost.get(order_id, {}).values()), 2)
+
+    def entries_for_order(self, order_id: str, wanted: dict, now: Optional[datetime] = None) -> list:
+        """
+        Ledger entries that move the order from its current parts to `wanted`
+        ({sku: quantity}). Returns are priced at the order's average cost for
+        the SKU, new consumption at the current catalog price.
+        """
+        stamp = (now or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+        entries = []
+        with self._lock:
+            current = self._order_qty.get(order_id, {})
+            costs = self._order_cost.get(order_id, {})
+            wanted = {normalize_sku(s): int(q) for s, q in wanted.items() if normalize_sku(s) and int(q) > 0}
+            for sku in sorted(set(current) | set(wanted)):
+                delta = wanted.get(sku, 0) - current.get(sku, 0)
+                if delta == 0:
+                    continue
+                if delta > 0:
+                    part = self._parts.get(sku)
+                    price = part.unit_price if part else 0.0
+                    kind = KIND_CONSUME
+                else:
+                    price = costs.get(sku, 0.0) / current[sku] if current.get(sku) else 0.0
+                    kind = KIND_RETURN
+                entries.append({
+                    "timestamp": stamp,
+                    "sku": sku,
+                    "qty_delta": -delta,
+                    "unit_price": round(price, 2),
+                    "order_id": order_id,
+                    "kind": kind,
+                    "note": "",
+                })
+        return entries
+
+    def cost_of(self, order_id: str, wanted: dict) -> float:
+        """parts_cost the order would have after entries_for_order(order_id, wanted)."""
+        total = self.order_cost(order_id)
+        for entry in self.entries_for_order(order_id, wanted):
+            total -= entry["qty_delta"] * entry["unit_price"]
+        return round(total, 2)
+
+    def describe(self, wanted: dict) -> list:
+        """Receipt lines for a {sku: quantity} selection ("2x Fuser unit")."""
+        lines = []
+        for sku, qty in wanted.items():
+            if int(qty) <= 0:
+                continue
+            part = self.get(sku)
+            lines.append(f"{int(qty)}x {part.name if part else normalize_sku(sku)}")
+        return lines
+
+    # ------------------------------------------------------------------ reports
+    def low_stock(self) -> pd.DataFrame:
+        with self._lock:
+            rows = [
+                {
+                    "sku": p.sku,
+                    "name": p.name,
+                    "on_hand": p.on_hand,
+                    "reorder_level": p.reorder_level,
+                    "shortfall": max(p.reorder_level - p.on_hand, 0),
+                }
+                for p in self._parts.values()
+                if p.is_low
+            ]
+        if not rows:
+            return pd.DataFrame(columns=["sku", "name", "on_hand", "reorder_level", "shortfall"])
+        return pd.DataFrame(rows).sort_values(["on_hand", "sku"])
+
+    def stock_df(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            [
+                {"sku": p.sku, "name": p.name, "unit_price": p.unit_price,
+                 "on_hand": p.on_hand, "reorder_level": p.reorder_level}
+                for p in self.parts()
+            ],
+            columns=["sku", "name", "unit_price", "on_hand", "reorder_level"],
+        )
+
+    def catalog_df(self) -> pd.DataFrame:
+        """Catalog rows as stored in the Parts worksheet."""
+        return self.stock_df()[PART_COLUMNS]
+
+
+def strip_stock_lines(parts_used: str, lines: list) -> str:
+    """Remove generated stock lines from a parts_used text, keeping the free-text part."""
+    generated = set(lines)
+    kept = [seg for seg in safe_text(parts_used).split("; ") if seg.strip() and seg not in generated]
+    return "; ".join(kept)
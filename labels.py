@@ -0,0 +1,246 @@
+"""
+Equipment tag labels: one label per printer of an order (printers_json),
+for a single order or for every order received on a day.
+
+Three outputs:
+    PDF       labels laid out on a sheet (A4, 3 x 8 labels of 70 x 37 mm) or
+              one label per page for roll printers (62 x 29 mm)
+    ZPL       Zebra printers: the label format is sent once (^DF) and every
+              label only fills in its fields (^XF), so a batch stays small
+    ESC/POS   receipt/label printers: text, CODE128 and a cut per label
+
+Each label carries the order id, printer line (1/2), client, brand/model,
+serial, and the order code of the receipt QR as CODE128, so scanning a tag
+opens the order. One canvas holds the whole batch, and the bars of each
+barcode are turned into PDF operators once per code (LRU), so a few
+hundred labels render well under a second. Text is folded to ASCII, which
+the fonts built into label printers can show.
+"""
+import io
+from functools import lru_cache
+
+from reportlab.graphics.barcode.code128 import Code128
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+
+from cells import safe_text
+from pdfassets import flate_streams
+from qrcodes import order_code
+from textnorm import fold_text
+
+
+class Label:
+    __slots__ = ("order_id", "line_no", "count", "client", "brand", "model", "serial", "date_received")
+
+    def __init__(self, order_id: str, line_no: int, count: int, client: str = "", brand: str = "",
+                 model: str = "", serial: str = "", date_received: str = ""):
+        self.order_id = order_id
+        self.line_no = line_no
+        self.count = count
+        self.client = client
+        self.brand = brand
+        self.model = model
+        self.serial = serial
+        self.date_received = date_received
+
+    @property
+    def code(self) -> str:
+        return order_code(self.order_id)
+
+    @property
+    def lines(self) -> tuple:
+        """(header, client, equipment, serial) as ASCII text."""
+        return (
+            f"{self.order_id}  {self.line_no}/{self.count}",
+            fold_text(self.client),
+            fold_text(f"{self.brand} {self.model}".strip()),
+            f"SN: {fold_text(self.serial)}" if self.serial else "SN: -",
+        )
+
+
+def labels_for_orders(orders, load_printers) -> list:
+    """One Label per printer of each order (order rows as dicts; load_printers = load_printers_from_order)."""
+    labels = []
+    for order in orders:
+        order_id = safe_text(order.get("order_id"))
+        if not order_id:
+            continue
+        printers = load_printers(order) or [{}]
+        for line_no, p in enumerate(printers, start=1):
+            labels.append(Label(
+                order_id, line_no, len(printers),
+                client=safe_text(order.get("client_name")).strip(),
+                brand=safe_text(p.get("brand")).strip(),
+                model=safe_text(p.get("model")).strip(),
+                serial=safe_text(p.get("serial")).strip(),
+                date_received=safe_text(order.get("date_received")),
+            ))
+    return labels
+
+
+# ============================================================================
+# PDF
+# ============================================================================
+class SheetLayout:
+    __slots__ = ("name", "page", "cols", "rows", "label", "origin", "gap")
+
+    def __init__(self, name: str, page: tuple, cols: int, rows: int, label: tuple,
+                 origin: tuple = (0.0, 0.0), gap: tuple = (0.0, 0.0)):
+        self.name = name
+        self.page = page          # (lățime, înălțime) în puncte
+        self.cols = cols
+        self.rows = rows
+        self.label = label        # (lățime, înălțime) a unei etichete
+        self.origin = origin      # colțul stânga-sus al primei etichete, față de colțul stânga-sus al paginii
+        self.gap = gap
+
+    @property
+    def per_page(self) -> int:
+        return self.cols * self.rows
+
+    def position(self, slot: int) -> tuple:
+        """Bottom-left corner of label `slot` (0-based, row by row) on its page."""
+        row, col = divmod(slot, self.cols)
+        x = self.origin[0] + col * (self.label[0] + self.gap[0])
+        top = self.page[1] - self.origin[1] - row * (self.label[1] + self.gap[1])
+        return x, top - self.label[1]
+
+
+LABEL_LAYOUTS = {
+    "a4-3x8": SheetLayout("A4, 3 x 8 (70 x 37 mm)", A4, 3, 8, (70 * mm, 37 * mm), origin=(0, 0.5 * mm)),
+    "roll-62x29": SheetLayout("Roll, 62 x 29 mm", (62 * mm, 29 * mm), 1, 1, (62 * mm, 29 * mm)),
+}
+DEFAULT_LAYOUT = "a4-3x8"
+
+
+@lru_cache(maxsize=4096)
+def _barcode_ops(code: str, width: float, height: float) -> str:
+    """
+    PDF path operators for the CODE128 bars of `code`, `width` wide, origin at
+    (0, 0). Built once per code and size; every label reuses the literal
+    instead of formatting each bar's coordinates again.
+    """
+    barcode = Code128(code, barWidth=1, barHeight=height, quiet=False)
+    scale = width / barcode.width
+    ops, left = [], 0
+    for ch in barcode.decomposed:
+        # litere mici = spațiu, litere mari = bară; litera dă lățimea în module
+        if ch.islower():
+            left += ord(ch) - ord("a") + 1
+        elif ch.isupper():
+            n = ord(ch) - ord("A") + 1
+            ops.append(f"{left * scale:.2f} 0 {n * scale:.2f} {height:.2f} re")
+            left += n
+    ops.append("f")
+    return "\n".join(ops)
+
+
+def _fit(c, text: str, font: str, size: float, width: float) -> str:
+    if c.stringWidth(text, font, size) <= width:
+        return text
+    while text and c.stringWidth(text + "...", font, size) > width:
+        text = text[:-1]
+    return text + "..."
+
+
+def _draw_label(c, label: Label, x: float, y: float, w: float, h: float):
+    pad = 2.5 * mm
+    inner = w - 2 * pad
+    header, client, equipment, serial = label.lines
+    top = y + h - pad
+    rows = (
+        ("Helvetica-Bold", 9, header),
+        ("Helvetica", 7, client),
+        ("Helvetica-Bold", 8, equipment),
+        ("Helvetica", 7, serial),
+    )
+    for font, size, text in rows:
+        top -= size * 1.2
+        c.setFont(font, size)
+        c.drawString(x + pad, top, _fit(c, text, font, size, inner))
+    bar_height = min(10 * mm, top - y - pad - 1 * mm)
+    if bar_height > 4 * mm:
+        c.saveState()
+        c.translate(x + pad, y + pad)
+        c.addLiteral(_barcode_ops(label.code, round(inner, 2), round(bar_height, 2)))
+        c.restoreState()
+
+
+@flate_streams()
+def render_label_pdf(labels: list, layout: str = DEFAULT_LAYOUT) -> bytes:
+    """All labels in one PDF, filling the sheets of `layout` row by row."""
+    sheet = LABEL_LAYOUTS[layout]
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=sheet.page)
+    c.setTitle(f"Labels ({len(labels)})")
+    w, h = sheet.label
+    for i, label in enumerate(labels):
+        slot = i % sheet.per_page
+        if i and slot == 0:
+            c.showPage()
+        x, y = sheet.position(slot)
+        _draw_label(c, label, x, y, w, h)
+    c.save()
+    return buf.getvalue()
+
+
+# ============================================================================
+# ZPL / ESC-POS
+# ============================================================================
+def _zpl_field(text: str) -> str:
+    # cu ^FH, "_" introduce un cod hex; ^ și ~ sunt comenzi ZPL
+    return text.replace("_", "_5F").replace("^", "_5E").replace("~", "_7E")
+
+
+def render_zpl(labels: list, dpi: int = 203, width_mm: float = 50, height_mm: float = 25) -> bytes:
+    """One stored format (^DF) followed by one short ^XF block per label."""
+    dots = dpi / 25.4
+    s = dpi / 203
+    pw, ll, m = round(width_mm * dots), round(height_mm * dots), round(2 * dots)
+    font = lambda size: f"^A0N,{round(size * s)},{round(size * s)}"  # noqa: E731
+    out = [
+        "^XA^DFR:SRVTAG.ZPL^FS",
+        f"^PW{pw}^LL{ll}^CI0",
+        f"^FO{m},{m}{font(26)}^FN1^FS",
+        f"^FO{m},{m + round(30 * s)}{font(20)}^FN2^FS",
+        f"^FO{m},{m + round(54 * s)}{font(22)}^FN3^FS",
+        f"^FO{m},{m + round(80 * s)}{font(20)}^FN4^FS",
+        f"^FO{m},{m + round(106 * s)}^BY{max(1, round(2 * s))}^BCN,{max(ll - m - round(112 * s), round(30 * s))},N,N,N^FN5^FS",
+        "^XZ",
+    ]
+    for label in labels:
+        fields = "".join(f"^FN{n}^FH^FD{_zpl_field(text)}^FS" for n, text in enumerate(label.lines + (label.code,), 1))
+        out.append(f"^XA^XFR:SRVTAG.ZPL^FS{fields}^XZ")
+    return ("\n".join(out) + "\n").encode("ascii", "replace")
+
+
+ESC, GS = b"\x1b", b"\x1d"
+
+
+def render_escpos(labels: list) -> bytes:
+    """ESC/POS stream: initialize once, then text + CODE128 + partial cut per label."""
+    out = [ESC + b"@"]
+    for label in labels:
+        header, client, equipment, serial = (line.encode("ascii", "replace") for line in label.lines)
+        code = label.code.encode("ascii")
+        out += [
+            ESC + b"E\x01", header, b"\n", ESC + b"E\x00",
+            client, b"\n",
+            ESC + b"E\x01", equipment, b"\n", ESC + b"E\x00",
+            serial, b"\n",
+            # cod de bare: înălțime 60 puncte, modul 2, fără text sub cod; CODE128 setul B
+            GS + b"h\x3c", GS + b"w\x02", GS + b"H\x00",
+            GS + b"k\x49" + bytes([len(code) + 2]) + b"{B" + code, b"\n",
+            GS + b"V\x42\x03",
+        ]
+    return b"".join(out)
+
+
+def render_labels(labels: list, fmt: str, layout: str = DEFAULT_LAYOUT, **zpl) -> tuple:
+    """(bytes, file name suffix, mime type) for fmt in "pdf", "zpl", "escpos"."""
+    if fmt == "zpl":
+        return render_zpl(labels, **zpl), "zpl", "application/octet-stream"
+    if fmt == "escpos":
+        return render_escpos(labels), "bin", "application/octet-stream"
+    return render_label_pdf(labels, layout), "pdf", "application/pdf"
@@ -0,0 +1,139 @@
+"""
+Per-printer line items for multi-printer orders.
+
+Each printer in an order can have its own status, labor cost and parts
+cost. These live in a child worksheet (Order_Items, one row per printer)
+keyed by (order_id, line_no), so editing one printer's cost does not
+re-serialize printers_json. The printer identity (brand/model/serial/
+warranty) stays in printers_json; items carry the serial only to stay
+aligned when printers are removed or reordered.
+
+Order totals are kept per order and recomputed only for the order whose
+items changed.
+"""
+import threading
+from typing import Optional
+
+import pandas as pd
+
+from cells import safe_float, safe_text
+
+
+ITEM_COLUMNS = ["order_id", "line_no", "serial", "status", "labor_cost", "parts_cost"]
+# ordinea în care avansează o imprimantă prin service
+ITEM_STATUSES = ["Received", "In Progress", "Ready for Pickup", "Completed"]
+
+
+class LineItem:
+    __slots__ = ("line_no", "serial", "status", "labor_cost", "parts_cost")
+
+    def __init__(self, line_no: int, serial: str = "", status: str = "Received",
+                 labor_cost: float = 0.0, parts_cost: float = 0.0):
+        self.line_no = line_no
+        self.serial = serial
+        self.status = status if status in ITEM_STATUSES else "Received"
+        self.labor_cost = labor_cost
+        self.parts_cost = parts_cost
+
+    @property
+    def total(self) -> float:
+        return self.labor_cost + self.parts_cost
+
+    @classmethod
+    def from_row(cls, rec: dict) -> "LineItem":
+        return cls(
+            int(safe_float(rec.get("line_no"))),
+            safe_text(rec.get("serial")).strip(),
+            safe_text(rec.get("status")) or "Received",
+            safe_float(rec.get("labor_cost")),
+            safe_float(rec.get("parts_cost")),
+        )
+
+    def to_row(self, order_id: str) -> dict:
+        return {
+            "order_id": order_id,
+            "line_no": self.line_no,
+            "serial": self.serial,
+            "status": self.status,
+            "labor_cost": self.labor_cost,
+            "parts_cost": self.parts_cost,
+        }
+
+
+class LineItemIndex:
+    def __init__(self):
+        self._items = {}     # order_id → [LineItem] ordonate după line_no
+        self._totals = {}    # order_id → (manoperă, piese)
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def load(self, df: Optional[pd.DataFrame]):
+        """Build the index from the Order_Items worksheet (once per process)."""
+        with self._lock:
+            self._items.clear()
+            self._totals.clear()
+            if df is not None and not df.empty and "order_id" in df.columns:
+                grouped = {}
+                cols = [c for c in ITEM_COLUMNS if c in df.columns]
+                for rec in df[cols].to_dict("records"):
+                    order_id = safe_text(rec.get("order_id"))
+                    if order_id:
+                        grouped.setdefault(order_id, []).append(LineItem.from_row(rec))
+                for order_id, items in grouped.items():
+                    self._set(order_id, items)
+            self.loaded = True
+
+    def set_order(self, order_id: str, items: list):
+        with self._lock:
+            self._set(order_id, items)
+
+    def remove_order(self, order_id: str):
+        with self._lock:
+            self._items.pop(order_id, None)
+            self._totals.pop(order_id, None)
+
+    def _set(self, order_id: str, items: list):
+        if not items:
+            self._items.pop(order_id, None)
+            self._totals.pop(order_id, None)
+            return
+        items = sorted(items, key=lambda it: it.line_no)
+        self._items[order_id] = items
+        self._totals[order_id] = (
+            round(sum(it.labor_cost for it in items), 2),
+            round(sum(it.parts_cost for it in items), 2),
+        )
+
+    def has_items(self, order_id: str) -> bool:
+        return order_id in self._items
+
+    def totals(self, order_id: str) -> Optional[tuple]:
+        """(labor_cost, parts_cost) summed over the order's items, None if it has none."""
+        return self._totals.get(order_id)
+
+    def items_for(self, order_id: str, printers: list) -> list:
+        """
+        One LineItem per printer, aligned by line number and serial; printers
+        without a stored item get a fresh one.
+        """
+        with self._lock:
+            stored = list(self._items.get(order_id, ()))
+        by_line = {it.line_no: it for it in stored}
+        by_serial = {it.serial: it for it in stored if it.serial}
+        aligned = []
+        for line_no, p in enumerate(printers):
+            serial = safe_text(p.get("serial")).strip()
+            item = by_line.get(line_no)
+            if item is None or (serial and item.serial and item.serial != serial):
+                item = by_serial.get(serial) if serial else None
+            if item is None:
+                item = LineItem(line_no, serial)
+            aligned.append(LineItem(line_no, serial, item.status, item.labor_cost, item.parts_cost))
+        return aligned
+
+
+def rollup_status(items: list) -> Optional[str]:
+    """The order is only as far along as its least advanced printer."""
+    if not items:
+        return None
+    return min((it.status for it in items), key=ITEM_STATUSES.index)
@@ -0,0 +1,287 @@
+"""
+Versioned schema migrations of the worksheets, applied chunk by chunk.
+
+A worksheet's schema is its key column, the columns of a new sheet and an
+ordered list of migrations. The version each worksheet is at is kept in
+the branch's Schema worksheet, one row per worksheet, so a start only
+runs the migrations a sheet has not had yet:
+
+    worksheet        version  migrated_at          rows
+    Orders           2        2024-05-02T08:00:11  48210
+    Orders_Archive   2        2024-05-02T08:00:14  120554
+
+A migration is a function of a chunk of rows (CHUNK_ROWS at a time). All
+pending migrations run on one chunk before the next chunk is cut, so only
+the sheet as read plus one chunk in flight are in memory, and the writer
+gets the migrated chunks one by one:
+
+    RangeWriter   writes each changed chunk into its own row range (the
+                  first one with the header): no upload is bigger than a
+                  chunk, and chunks a migration left as they were are not
+                  uploaded at all
+    SheetWriter   for connections that can only replace a whole sheet:
+                  collects the chunks and writes once, if anything changed
+
+Before a chunk goes to the writer, every migration is checked against the
+properties the engine relies on; a violation raises MigrationError:
+
+    rows      same number of rows, key column unchanged and in order
+    columns   exactly the declared columns (adds appended, drops removed)
+    idempotent  migrating the migrated chunk changes nothing
+    row-local   migrating two halves of the chunk gives the same rows
+
+(the last two on the first chunk only). Idempotence is what makes a
+migration that stops half-way safe: the version is only recorded after
+the last chunk, so the next start migrates again, and the chunks already
+written come out unchanged.
+
+That holds in row ranges only while the existing columns keep their
+places. RangeWriter resizes the sheet and writes the new header with the
+first chunk, so if a later chunk fails, the rows not written yet sit under
+the new header: fine when columns were only appended (their new cells are
+empty until the rerun fills them), wrong when a column was dropped (every
+cell after it would shift). A migration that drops columns is therefore
+refused in row ranges (MigrationError before anything is written); it
+goes through SheetWriter, whose single write either happens or not.
+"""
+from datetime import datetime
+from typing import Callable, Optional
+
+import pandas as pd
+
+
+CHUNK_ROWS = 5000
+SCHEMA_COLUMNS = ["worksheet", "version", "migrated_at", "rows"]
+
+
+class MigrationError(Exception):
+    pass
+
+
+class Migration:
+    __slots__ = ("version", "name", "apply", "adds", "drops")
+
+    def __init__(self, version: int, name: str, apply: Callable, adds: tuple = (), drops: tuple = ()):
+        self.version = version
+        self.name = name
+        self.apply = apply          # chunk → chunk migrat (nu modifică chunk-ul primit)
+        self.adds = tuple(adds)
+        self.drops = tuple(drops)
+
+    def columns_after(self, columns: list) -> list:
+        kept = [c for c in columns if c not in self.drops]
+        return kept + [c for c in self.adds if c not in kept]
+
+    def __repr__(self) -> str:
+        return f"v{self.version} {self.name}"
+
+
+class SheetSchema:
+    __slots__ = ("key", "columns", "migrations")
+
+    def __init__(self, key: str, columns: list, migrations: list):
+        versions = [m.version for m in migrations]
+        if versions != sorted(set(versions)) or (versions and versions[0] < 1):
+            raise ValueError("migration versions must be unique, ascending and start at 1 or above")
+        self.key = key
+        self.columns = list(columns)        # o foaie nouă pornește direct la ultima versiune
+        self.migrations = list(migrations)
+
+    @property
+    def version(self) -> int:
+        return self.migrations[-1].version if self.migrations else 0
+
+    def pending(self, version: int) -> list:
+        return [m for m in self.migrations if m.version > version]
+
+
+# ============================================================================
+# PROPERTIES
+# ============================================================================
+def _check_shape(step: Migration, before: pd.DataFrame, after: pd.DataFrame, key: str):
+    if not isinstance(after, pd.DataFrame):
+        raise MigrationError(f"{step!r} returned {type(after).__name__}, not a DataFrame")
+    if len(after) != len(before):
+        raise MigrationError(f"{step!r} changed the number of rows ({len(before)} → {len(after)})")
+    expected = step.columns_after(list(before.columns))
+    if list(after.columns) != expected:
+        raise MigrationError(f"{step!r} returned columns {list(after.columns)}, expected {expected}")
+    if key in before.columns and key not in step.drops and not after[key].equals(before[key]):
+        raise MigrationError(f"{step!r} changed or reordered the key column '{key}'")
+
+
+def _check_laws(step: Migration, before: pd.DataFrame, after: pd.DataFrame):
+    if not step.apply(after).equals(after):
+        raise MigrationError(f"{step!r} is not idempotent: migrating migrated rows changes them")
+    if len(before) > 1:
+        half = len(before) // 2
+        split = pd.concat([step.apply(before.iloc[:half]), step.apply(before.iloc[half:])])
+        if not split.equals(after):
+            raise MigrationError(f"{step!r} is not row-local: the result depends on how the rows are chunked")
+
+
+def migrate_chunk(steps: list, chunk: pd.DataFrame, key: str, check_laws: bool = False) -> pd.DataFrame:
+    """Run the steps in order on one chunk, checking each against the properties."""
+    for step in steps:
+        migrated = step.apply(chunk)
+        _check_shape(step, chunk, migrated, key)
+        if check_laws:
+            _check_laws(step, chunk, migrated)
+        chunk = migrated
+    return chunk
+
+
+# ============================================================================
+# WRITERS
+# ============================================================================
+class SheetWriter:
+    """
+    For connections that only replace whole sheets: collects the migrated
+    chunks and calls write(frame) → bool once at the end, only if a chunk
+    changed. Unchanged chunks are views of the sheet as read.
+    """
+
+    in_place = False
+
+    def __init__(self, write: Callable):
+        self._write = write
+        self._chunks = []
+        self._dirty = False
+
+    def begin(self, rows: int, columns: list, reshaped: bool):
+        self._dirty = reshaped
+
+    def write(self, start: int, chunk: pd.DataFrame, changed: bool):
+        self._chunks.append(chunk)
+        self._dirty = self._dirty or changed
+
+    def finish(self) -> int:
+        chunks, self._chunks = self._chunks, []
+        if not self._dirty:
+            return 0
+        frame = pd.concat(chunks)
+        del chunks
+        if not self._write(frame):
+            raise MigrationError("the migrated sheet could not be written")
+        return len(frame)
+
+
+class RangeWriter:
+    """
+    Row-range writes through `rows`, an object with resize(worksheet, rows,
+    columns) and write_rows(worksheet, start, frame, header): start is the
+    0-based data row, the header (when asked for) goes on the line above it.
+    Only for migrations that keep the existing columns in place.
+    """
+
+    in_place = True
+
+    def __init__(self, rows, worksheet: str):
+        self._rows = rows
+        self.worksheet = worksheet
+        self._reshaped = False
+        self.rows_written = 0
+
+    def begin(self, rows: int, columns: list, reshaped: bool):
+        self._reshaped = reshaped
+        if reshaped:
+            self._rows.resize(self.worksheet, rows, len(columns))
+
+    def write(self, start: int, chunk: pd.DataFrame, changed: bool):
+        if changed or self._reshaped:
+            self._rows.write_rows(self.worksheet, start, chunk, header=start == 0 and self._reshaped)
+            self.rows_written += len(chunk)
+
+    def finish(self) -> int:
+        return self.rows_written
+
+
+class GSpreadRows:
+    """resize / write_rows for a service-account GSheetsConnection, on the gspread worksheet underneath."""
+
+    def __init__(self, select: Callable):
+        self._select = select
+        self._sheets = {}
+
+    @classmethod
+    def for_connection(cls, conn):
+        """The connection itself if it writes row ranges, an adapter over its gspread client, or None."""
+        if hasattr(conn, "write_rows") and hasattr(conn, "resize"):
+            return conn
+        # GSheetsConnection nu expune scrieri pe intervale; clientul service-account are foaia gspread
+        select = getattr(getattr(conn, "client", None), "_select_worksheet", None)
+        return cls(select) if callable(select) else None
+
+    def _sheet(self, worksheet: str):
+        if worksheet not in self._sheets:
+            self._sheets[worksheet] = self._select(worksheet=worksheet)
+        return self._sheets[worksheet]
+
+    def resize(self, worksheet: str, rows: int, columns: int):
+        self._sheet(worksheet).resize(rows=rows + 1, cols=columns)
+
+    def write_rows(self, worksheet: str, start: int, data: pd.DataFrame, header: bool = False):
+        from gspread_dataframe import set_with_dataframe
+
+        row = start + 1 if header else start + 2
+        set_with_dataframe(self._sheet(worksheet), data, row=row, include_column_header=header, resize=False)
+
+
+# ============================================================================
+# ENGINE
+# ============================================================================
+def migrate_frame(df: pd.DataFrame, steps: list, writer, key: str, chunk_rows: int = CHUNK_ROWS) -> int:
+    """
+    Migrate `df` (the sheet as read) chunk by chunk through `steps` into
+    `writer`; returns the rows the writer wrote. Raises MigrationError when
+    a step breaks a property, before the chunk that broke it is written,
+    and when an in-place writer would have to move existing columns.
+    """
+    if not steps:
+        return 0
+    chunk_rows = max(1, chunk_rows)
+    total = len(df)
+    columns = list(df.columns)
+    for step in steps:
+        columns = step.columns_after(columns)
+    reshaped = columns != list(df.columns)
+    if writer.in_place and columns[:len(df.columns)] != list(df.columns):
+        raise MigrationError(
+            f"{steps!r} move existing columns; a stop half-way would leave rows under the wrong header, "
+            "so they cannot be migrated in row ranges"
+        )
+
+    started = False
+    for start in range(0, max(total, 1), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        migrated = migrate_chunk(steps, chunk, key, check_laws=start == 0)
+        if not started:
+            writer.begin(total, columns, reshaped)
+            started = True
+        writer.write(start, migrated, changed=reshaped or not migrated.equals(chunk))
+    return writer.finish()
+
+
+def read_versions(df: Optional[pd.DataFrame]) -> dict:
+    """worksheet → version from the Schema worksheet (empty if it is missing or unreadable)."""
+    if df is None or df.empty or not {"worksheet", "version"} <= set(df.columns):
+        return {}
+    versions = {}
+    for worksheet, version in zip(df["worksheet"], df["version"]):
+        try:
+            versions[str(worksheet)] = int(float(version))
+        except (TypeError, ValueError):
+            continue
+    return versions
+
+
+def with_version(df: Optional[pd.DataFrame], worksheet: str, version: Optional[int], rows: int = 0) -> pd.DataFrame:
+    """The Schema frame with the row of `worksheet` set to `version` (removed if version is None)."""
+    if df is None or df.empty or "worksheet" not in df.columns:
+        df = pd.DataFrame(columns=SCHEMA_COLUMNS)
+    df = df[df["worksheet"].astype(str) != worksheet]
+    if version is not None:
+        row = pd.DataFrame([[worksheet, version, datetime.now().isoformat(timespec="seconds"), rows]],
+                           columns=SCHEMA_COLUMNS)
+        df = pd.concat([df, row], ignore_index=True) if not df.empty else row
+    return df.reset_index(drop=True)
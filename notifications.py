@@ -0,0 +1,412 @@
+"""
+Customer notifications through a transactional outbox.
+
+A status change that should reach the customer (e.g. "Ready for Pickup")
+only inserts a row into a local SQLite outbox, right after the order write
+succeeds. That takes milliseconds and never touches the network, so UI
+saves do not wait on SMTP or an SMS gateway.
+
+A small pool of daemon worker threads drains the outbox:
+
+- rows are claimed in batches per channel; one SMTP session sends a batch,
+- every channel has a token-bucket rate limit,
+- failures are retried with exponential backoff up to max_attempts, then
+  left as "failed" for a manual retry from the admin panel,
+- a dedupe key per (order, event, channel, transition) makes queueing
+  the same status change twice a no-op; the transition (when the status
+  changed) keeps an order that reaches a status again, or a reused order
+  id, from being taken for one already notified,
+- a claimed row is leased to its worker for lease_seconds; only rows
+  whose lease ran out (their process died mid-send) are claimed again,
+  so several processes can share one outbox.
+
+Attachments (the completion receipt) are rendered by the worker from the
+order snapshot stored in the row, not during the save.
+"""
+import json
+import smtplib
+import sqlite3
+import threading
+import time
+import urllib.request
+from email.message import EmailMessage
+from pathlib import Path
+from typing import Callable, Optional
+
+
+STATUS_PENDING = "pending"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+CHANNEL_EMAIL = "email"
+CHANNEL_SMS = "sms"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dedupe_key TEXT UNIQUE,
+    order_id TEXT NOT NULL,
+    event TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    subject TEXT,
+    body TEXT,
+    payload TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    lease_until REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, channel, next_attempt_at);
+"""
+
+
+class Notification:
+    __slots__ = ("id", "order_id", "event", "channel", "recipient", "subject", "body", "payload", "attempts")
+
+    def __init__(self, row: sqlite3.Row):
+        self.id = row["id"]
+        self.order_id = row["order_id"]
+        self.event = row["event"]
+        self.channel = row["channel"]
+        self.recipient = row["recipient"]
+        self.subject = row["subject"] or ""
+        self.body = row["body"] or ""
+        self.payload = json.loads(row["payload"]) if row["payload"] else {}
+        self.attempts = row["attempts"]
+
+
+class Outbox:
+    """SQLite-backed queue; safe to share between sessions, workers and processes."""
+
+    def __init__(self, path, lease_seconds: float = 300.0):
+        self.path = str(path)
+        self.lease_seconds = lease_seconds
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        columns = {r["name"] for r in self._db.execute("PRAGMA table_info(outbox)")}
+        if "lease_until" not in columns:
+            # outbox creat înainte de lease-uri
+            self._db.execute("ALTER TABLE outbox ADD COLUMN lease_until REAL")
+        self._lock = threading.Lock()
+
+    def enqueue(self, order_id: str, event: str, channel: str, recipient: str,
+                subject: str = "", body: str = "", payload: Optional[dict] = None,
+                transition: str = "") -> bool:
+        """
+        Queue one message; False if the same (order, event, channel,
+        transition) is already queued or sent.
+        """
+        now = time.time()
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT OR IGNORE INTO outbox (dedupe_key, order_id, event, channel, recipient, subject, body,"
+                " payload, status, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (f"{order_id}|{event}|{channel}|{transition}", order_id, event, channel, recipient, subject, body,
+                 json.dumps(payload or {}, ensure_ascii=False, default=str), STATUS_PENDING, now, now),
+            )
+            return cur.rowcount == 1
+
+    def claim(self, channel: str, limit: int, now: Optional[float] = None) -> list:
+        """
+        Lease up to `limit` due messages of a channel (status sending) and
+        return them, attempts counting this one. Due: pending and past
+        next_attempt_at, or sending with a lease that ran out.
+        """
+        now = now or time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                # lease NULL: rânduri rămase în sending dinainte de lease-uri
+                rows = self._db.execute(
+                    "SELECT * FROM outbox WHERE channel = ? AND ("
+                    "(status = ? AND next_attempt_at <= ?) OR (status = ? AND COALESCE(lease_until, 0) <= ?))"
+                    " ORDER BY next_attempt_at LIMIT ?",
+                    (channel, STATUS_PENDING, now, STATUS_SENDING, now, limit),
+                ).fetchall()
+                if rows:
+                    self._db.executemany(
+                        "UPDATE outbox SET status = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                        [(STATUS_SENDING, now + self.lease_seconds, r["id"]) for r in rows],
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        notes = [Notification(r) for r in rows]
+        for note in notes:
+            note.attempts += 1      # rândul citit e dinaintea UPDATE-ului
+        return notes
+
+    def mark_sent(self, ids: list):
+        if not ids:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "UPDATE outbox SET status = ?, sent_at = ?, last_error = NULL WHERE id = ?",
+                [(STATUS_SENT, now, i) for i in ids],
+            )
+
+    def mark_failed(self, note: Notification, error: str, retry_at: Optional[float]):
+        """retry_at=None gives up (status failed); otherwise the message goes back in the queue."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE outbox SET status = ?, last_error = ?, next_attempt_at = ? WHERE id = ?",
+                (STATUS_PENDING if retry_at is not None else STATUS_FAILED, error[:500],
+                 retry_at if retry_at is not None else time.time(), note.id),
+            )
+
+    def retry_failed(self) -> int:
+        with self._lock:
+            cur = self._db.execute(
+                "UPDATE outbox SET status = ?, attempts = 0, next_attempt_at = ? WHERE status = ?",
+                (STATUS_PENDING, time.time(), STATUS_FAILED),
+            )
+            return cur.rowcount
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) AS n FROM outbox GROUP BY status").fetchall()
+        return {r["status"]: r["n"] for r in rows}
+
+    def recent(self, limit: int = 20) -> list:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, order_id, event, channel, recipient, status, attempts, last_error,"
+                " datetime(created_at, 'unixepoch', 'localtime') AS created,"
+                " datetime(sent_at, 'unixepoch', 'localtime') AS sent"
+                " FROM outbox ORDER BY id DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+
+class RateLimiter:
+    """Token bucket: `rate_per_minute` sends, bursts up to `burst`."""
+
+    def __init__(self, rate_per_minute: float, burst: Optional[int] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst or max(1, int(rate_per_minute // 6)))
+        self._tokens = self.capacity
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, n: int = 1, stop: Optional[threading.Event] = None) -> bool:
+        """Block until n tokens are available; False if stop was set while waiting."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                if self._tokens >= n:
+                    self._tokens -= n
+                    return True
+                wait = (n - self._tokens) / self.rate if self.rate > 0 else 1.0
+            if stop is not None:
+                if stop.wait(min(wait, 1.0)):
+                    return False
+            else:
+                time.sleep(min(wait, 1.0))
+
+    def take_up_to(self, n: int) -> int:
+        """Take as many of n tokens as are available right now, without waiting."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            taken = min(n, int(self._tokens))
+            self._tokens -= taken
+            return taken
+
+    def refund(self, n: int):
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + n)
+
+
+class SmtpSender:
+    """Sends a batch of e-mails over one SMTP session."""
+
+    channel = CHANNEL_EMAIL
+
+    def __init__(self, host: str, port: int = 587, username: str = "", password: str = "",
+                 sender: str = "", starttls: bool = True, timeout: float = 20.0,
+                 attachment: Optional[Callable[[Notification], Optional[tuple]]] = None):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender or username
+        self.starttls = starttls
+        self.timeout = timeout
+        self.attachment = attachment
+
+    def build(self, note: Notification) -> EmailMessage:
+        msg = EmailMessage()
+        msg["From"] = self.sender
+        msg["To"] = note.recipient
+        msg["Subject"] = note.subject
+        msg.set_content(note.body)
+        if self.attachment is not None:
+            att = self.attachment(note)
+            if att:
+                filename, data = att
+                msg.add_attachment(data, maintype="application", subtype="pdf", filename=filename)
+        return msg
+
+    def send_batch(self, notes: list) -> dict:
+        """
+        Returns {id: error or None}. Failing to connect or log in fails the
+        whole batch (raises); after that every note gets its own result: a
+        message that cannot be built or is refused fails alone, and if the
+        session drops, the notes not sent yet fail while the ones already
+        sent stay sent.
+        """
+        results = {}
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            for i, note in enumerate(notes):
+                try:
+                    msg = self.build(note)
+                except Exception as e:
+                    results[note.id] = f"{type(e).__name__}: {e}"
+                    continue
+                try:
+                    smtp.send_message(msg)
+                    results[note.id] = None
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused,
+                        smtplib.SMTPDataError, ValueError) as e:
+                    results[note.id] = str(e)
+                except (smtplib.SMTPException, OSError) as e:
+                    # sesiunea s-a rupt: restul lotului nu mai pleacă
+                    error = f"{type(e).__name__}: {e}"
+                    for rest in notes[i:]:
+                        results[rest.id] = error
+                    break
+                except Exception as e:
+                    results[note.id] = f"{type(e).__name__}: {e}"
+        finally:
+            try:
+                smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                smtp.close()
+        return results
+
+
+class HttpSmsSender:
+    """
+    SMS through an HTTP gateway: POST JSON {"to", "from", "text"} with a
+    bearer token (the shape most Romanian/EU gateways accept).
+    """
+
+    channel = CHANNEL_SMS
+
+    def __init__(self, url: str, token: str = "", sender: str = "", timeout: float = 10.0):
+        self.url = url
+        self.token = token
+        self.sender = sender
+        self.timeout = timeout
+
+    def send_batch(self, notes: list) -> dict:
+        results = {}
+        for note in notes:
+            data = json.dumps({"to": note.recipient, "from": self.sender, "text": note.body}).encode()
+            req = urllib.request.Request(self.url, data=data, method="POST",
+                                         headers={"Content-Type": "application/json"})
+            if self.token:
+                req.add_header("Authorization", f"Bearer {self.token}")
+            try:
+                with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                    results[note.id] = None if 200 <= resp.status < 300 else f"HTTP {resp.status}"
+            except Exception as e:
+                results[note.id] = str(e)
+        return results
+
+
+class NotificationWorker:
+    """Pool of daemon threads draining the outbox, one rate limiter per channel."""
+
+    def __init__(self, outbox: Outbox, senders: list, workers: int = 2, batch_size: int = 10,
+                 rate_per_minute: Optional[dict] = None, max_attempts: int = 5,
+                 backoff_seconds: float = 30.0, poll_interval: float = 5.0):
+        self.outbox = outbox
+        self.senders = {s.channel: s for s in senders}
+        self.workers = workers
+        self.batch_size = batch_size
+        rates = rate_per_minute or {}
+        self.limiters = {ch: RateLimiter(rates.get(ch, 30)) for ch in self.senders}
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self._threads or not self.senders:
+            return
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"notify-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def wake(self):
+        """Called after enqueue so new messages go out without waiting for the next poll."""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            worked = False
+            for channel, sender in self.senders.items():
+                if self._stop.is_set():
+                    return
+                worked |= self.drain_once(channel, sender)
+            if not worked:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def drain_once(self, channel: str, sender=None) -> bool:
+        """Send one batch for a channel; returns True if anything was claimed."""
+        sender = sender or self.senders[channel]
+        limiter = self.limiters[channel]
+        if not limiter.acquire(1, self._stop):
+            return False
+        # lotul e limitat la câte tokenuri sunt disponibile acum; restul se returnează
+        tokens = 1 + limiter.take_up_to(self.batch_size - 1)
+        batch = self.outbox.claim(channel, tokens)
+        limiter.refund(tokens - len(batch))
+        if not batch:
+            return False
+        try:
+            results = sender.send_batch(batch)
+        except Exception as e:
+            results = {note.id: f"{type(e).__name__}: {e}" for note in batch}
+        self.outbox.mark_sent([i for i, err in results.items() if err is None])
+        for note in batch:
+            err = results.get(note.id, "no result")
+            if err is not None:
+                self.outbox.mark_failed(note, err, self._retry_at(note))
+        return True
+
+    def _retry_at(self, note: Notification) -> Optional[float]:
+        if note.attempts >= self.max_attempts:
+            return None
+        return time.time() + self.backoff_seconds * (2 ** (note.attempts - 1))
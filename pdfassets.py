@@ -0,0 +1,162 @@
+"""
+Fonts and images shared by the receipt PDFs.
+
+Base-14 Helvetica has no ș/ț/ă, so receipts used to fold every string to
+ASCII. With a TrueType font (DejaVu Sans unless secrets pdf.font /
+pdf.font_bold point elsewhere) the text keeps its diacritics; reportlab
+embeds only the glyphs a document actually uses (a subset), so the font
+costs a few KB per PDF. Without usable font files the receipts fall back
+to Helvetica + fold_text, as before.
+
+The logo is decoded, flattened onto white and scaled to print resolution
+once per file (LRU). Every receipt reuses that ImageReader, and both A5
+halves of a page point to the same image XObject.
+
+Binary streams (images, embedded fonts, page contents) are written as
+plain Flate, without the ASCII85 layer reportlab adds by default (~25%
+smaller). reportlab has no per-canvas option for it, only the
+process-wide rl_config.useA85, read while images are drawn and while the
+document is saved. flate_streams() turns it off for the duration of one
+PDF build (drawing and save) and restores it when the last build running
+in the process ends, so importing this module changes nothing for other
+reportlab users.
+"""
+import io
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image
+from reportlab import rl_config
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFError, TTFont
+
+from textnorm import fold_text
+
+FONT_DIRS = (
+    Path("fonts"),
+    Path("/usr/share/fonts/truetype/dejavu"),
+    Path("/usr/share/fonts/dejavu"),
+    Path("/usr/share/fonts/TTF"),
+    Path("/Library/Fonts"),
+    Path("C:/Windows/Fonts"),
+)
+DEFAULT_FONT_FILES = ("DejaVuSans.ttf", "DejaVuSans-Bold.ttf")
+REQUIRED_GLYPHS = "ăâîșțĂÂÎȘȚ"
+
+
+class ReceiptFonts:
+    """Font names for the receipts and how their text must be prepared."""
+    __slots__ = ("regular", "bold", "unicode")
+
+    def __init__(self, regular: str, bold: str, unicode: bool):
+        self.regular = regular
+        self.bold = bold
+        self.unicode = unicode
+
+    def text(self, value) -> str:
+        if value is None or (isinstance(value, float) and value != value):
+            return ""
+        return str(value) if self.unicode else fold_text(value)
+
+
+BASE14 = ReceiptFonts("Helvetica", "Helvetica-Bold", unicode=False)
+
+
+USE_A85 = 0                 # rl_config.useA85 în timpul flate_streams() (benchmark-ul îl pune pe 1)
+_a85_lock = threading.Lock()
+_a85_builds = 0
+_a85_saved = None
+
+
+@contextmanager
+def flate_streams():
+    """
+    Build a PDF without ASCII85 stream filters. Works as a decorator too;
+    the whole build (canvas, drawing, save) must run inside it.
+    """
+    global _a85_builds, _a85_saved
+    with _a85_lock:
+        # setarea e globală: o restaurăm doar după ultimul PDF în lucru (sesiuni pe alte thread-uri)
+        if _a85_builds == 0:
+            _a85_saved = rl_config.useA85
+            rl_config.useA85 = USE_A85
+        _a85_builds += 1
+    try:
+        yield
+    finally:
+        with _a85_lock:
+            _a85_builds -= 1
+            if _a85_builds == 0:
+                rl_config.useA85 = _a85_saved
+
+
+def _find_font(name: str) -> Optional[Path]:
+    path = Path(name)
+    if path.is_absolute() or path.parent != Path("."):
+        return path if path.is_file() else None
+    for folder in FONT_DIRS:
+        if (folder / name).is_file():
+            return folder / name
+    return None
+
+
+@lru_cache(maxsize=8)
+def load_fonts(regular: str = DEFAULT_FONT_FILES[0], bold: str = DEFAULT_FONT_FILES[1]) -> ReceiptFonts:
+    """
+    Register a TrueType regular/bold pair (file names are looked up in
+    FONT_DIRS) and return it; BASE14 if a file is missing, unreadable or
+    lacks the Romanian letters.
+    """
+    names = []
+    for file_name in (regular, bold):
+        path = _find_font(file_name)
+        if path is None:
+            return BASE14
+        font_name = f"Receipt-{path.stem}"
+        if font_name not in pdfmetrics.getRegisteredFontNames():
+            try:
+                font = TTFont(font_name, str(path))
+            except (TTFError, OSError):
+                return BASE14
+            if any(ord(ch) not in font.face.charToGlyph for ch in REQUIRED_GLYPHS):
+                return BASE14
+            pdfmetrics.registerFont(font)
+        names.append(font_name)
+    return ReceiptFonts(names[0], names[1], unicode=True)
+
+
+class Logo:
+    __slots__ = ("image", "width", "height", "mask")
+
+    def __init__(self, image: ImageReader, width: float, height: float, mask):
+        self.image = image
+        self.width = width        # în puncte, încadrat în caseta logo-ului
+        self.height = height
+        self.mask = mask
+
+
+@lru_cache(maxsize=16)
+def prepared_logo(data: bytes, box: tuple = (40 * mm, 25 * mm), dpi: int = 300) -> Logo:
+    """
+    The logo fitted into `box` (points). With dpi > 0 it is flattened onto
+    white and resampled to at most `dpi` at that size, so the PDF carries
+    one small RGB image instead of the full-size original and its alpha
+    mask; dpi = 0 keeps the original file. Cached per file content (LRU).
+    """
+    img = Image.open(io.BytesIO(data))
+    scale = min(box[0] / img.width, box[1] / img.height)
+    width, height = img.width * scale, img.height * scale
+    if dpi <= 0:
+        return Logo(ImageReader(io.BytesIO(data)), width, height, "auto")
+    img = img.convert("RGBA")
+    flat = Image.new("RGB", img.size, "white")
+    flat.paste(img, mask=img.getchannel("A"))
+    pixels = (round(width / 72 * dpi), round(height / 72 * dpi))
+    if pixels[0] < flat.width:
+        flat = flat.resize(pixels, Image.LANCZOS)
+    return Logo(ImageReader(flat), width, height, None)
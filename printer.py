@@ -3,7 +3,10 @@ import pandas as pd
 from datetime import datetime, date
 import io
 import hashlib
-import math
+import sys
+import threading
+from contextlib import contextmanager
+from functools import wraps
 from pathlib import Path
 from streamlit_gsheets import GSheetsConnection
 
@@ -11,11 +14,58 @@ from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
 from reportlab.pdfgen import canvas
 from reportlab.lib import colors
-from reportlab.lib.utils import ImageReader
-from PIL import Image
+import numpy as np
 import json  # For multiple printers JSON
 from typing import Optional
 
+from attachments import ATTACHMENT_COLUMNS, DOCUMENT_TYPES, IMAGE_TYPES, Attachment, AttachmentIndex, BlobStore
+from audit import ACTION_CREATE, ACTION_DELETE, ACTION_UPDATE, AuditLog, diff_fields
+from backup import SnapshotStore
+from branches import (
+    BRANCH_COLUMN,
+    DEFAULT_BRANCH,
+    MAIN_CODE,
+    Branch,
+    branch_for_order,
+    fan_out,
+    merge_branch_frames,
+    parse_branches,
+)
+from cells import safe_float, safe_text
+from clients import ClientRegistry, client_id_for_phone, client_ids_for_phones, normalize_phone
+from equipment import EquipmentRegistry
+from filelocks import FileLock
+from inventory import KIND_RECEIVE, Inventory, normalize_sku, strip_stock_lines
+from labels import DEFAULT_LAYOUT, LABEL_LAYOUTS, labels_for_orders, render_labels
+from lineitems import ITEM_COLUMNS, ITEM_STATUSES, LineItem, LineItemIndex, rollup_status
+from migrations import (
+    CHUNK_ROWS,
+    GSpreadRows,
+    Migration,
+    RangeWriter,
+    SheetSchema,
+    SheetWriter,
+    migrate_frame,
+    read_versions,
+    with_version,
+)
+from notifications import (
+    CHANNEL_EMAIL,
+    CHANNEL_SMS,
+    HttpSmsSender,
+    NotificationWorker,
+    Outbox,
+    SmtpSender,
+)
+from pdfassets import BASE14, DEFAULT_FONT_FILES, Logo, ReceiptFonts, flate_streams, load_fonts, prepared_logo
+from qrcodes import draw_order_qr, parse_order_code
+from sessionstate import DEFAULT_CAPACITY, OrderStateLRU, session_state_report
+from sheetloader import DEFAULT_TIMEOUT, DEFAULT_WORKERS, SheetSnapshot, is_missing_worksheet, load_sheets
+from scheduler import DEFAULT_SLA_DAYS, DEFAULT_WARRANTY_SLA_DAYS, WorkQueue
+from textnorm import fold_frame, fold_text, search_key, search_key_series
+from tracing import TraceBuffer, end_trace, span, start_trace, traced
+from warmcache import WarmCache
+
 
 # ============================================================================
 # APP CONFIG
@@ -109,39 +159,8 @@ def check_password() -> bool:
 # UTILITY FUNCTIONS
 # ============================================================================
 def remove_diacritics(text):
-    if not isinstance(text, str):
-        return text
-    diacritics_map = {
-        "ă": "a", "Ă": "A", "â": "a", "Â": "A",
-        "î": "i", "Î": "I", "ș": "s", "Ș": "S",
-        "ț": "t", "Ț": "T",
-    }
-    for d, r in diacritics_map.items():
-        text = text.replace(d, r)
-    return text
-
-
-def safe_text(value: object) -> str:
-    """Transformă None / NaN în string gol, altfel în string normal."""
-    if value is None:
-        return ""
-    if isinstance(value, float) and math.isnan(value):
-        return ""
-    return str(value)
-
-
-def safe_float(value: object, default: float = 0.0) -> float:
-    """Transformă None / NaN / string gol în 0 (sau default)."""
-    try:
-        if value is None:
-            return default
-        if isinstance(value, float) and math.isnan(value):
-            return default
-        if isinstance(value, str) and value.strip() == "":
-            return default
-        return float(value)
-    except Exception:
-        return default
+    """Text sigur pentru Helvetica (ASCII); vezi textnorm.fold_text."""
+    return fold_text(text)
 
 
 def load_printers_from_order(order: dict):
@@ -182,6 +201,198 @@ def load_printers_from_order(order: dict):
     return cleaned
 
 
+# ============================================================================
+# ORDER DATA MODEL
+# ============================================================================
+ORDER_COLUMNS = [
+    "order_id", "client_name", "client_phone", "client_email",
+    "printer_brand", "printer_model", "printer_serial",
+    "printers_json",
+    "issue_description", "accessories", "notes",
+    "date_received", "date_pickup_scheduled", "date_completed", "date_picked_up",
+    "status", "technician", "repair_details", "parts_used",
+    "labor_cost", "parts_cost", "total_cost",
+    "client_id",
+]
+# Coloane cu puține valori distincte → category (un cod int8/int16 per rând)
+CATEGORICAL_COLUMNS = ["status", "technician", "printer_brand", "printer_model"]
+# Alte coloane text devin category doar dacă se repetă suficient
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+COST_COLUMNS = ["labor_cost", "parts_cost", "total_cost"]
+
+
+def compact_orders_df(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Build the display/read-only form of the Orders frame column by column:
+    empty cells become "", costs become float64, low-cardinality columns
+    (known ones, or any text column repeating enough) become categoricals
+    and the remaining strings are interned.
+    Never write this frame back to Sheets — writes always use the raw read.
+    """
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        if col in COST_COLUMNS:
+            out[col] = pd.to_numeric(s, errors="coerce").fillna(0.0).astype("float64")
+            continue
+        s = s.fillna("")
+        if col in CATEGORICAL_COLUMNS or (
+            col != "order_id" and s.nunique() <= len(s) * CATEGORY_MAX_UNIQUE_RATIO
+        ):
+            out[col] = s.astype(str).astype("category")
+        elif s.dtype == object:
+            out[col] = pd.Series(
+                [sys.intern(v) if isinstance(v, str) else v for v in s.tolist()],
+                index=s.index,
+                dtype=object,
+            )
+        else:
+            out[col] = s
+    return pd.DataFrame(out, index=df.index)
+
+
+SEARCH_COLUMNS = ["order_id", "client_name", "client_phone", "client_email", "printer_serial", "printers_json"]
+
+
+def filter_orders(df: pd.DataFrame, query: str) -> pd.DataFrame:
+    """Rows where any search column contains query (case/diacritic insensitive)."""
+    needle = search_key(query.strip())
+    if not needle or df.empty:
+        return df
+    mask = np.zeros(len(df), dtype=bool)
+    for col in SEARCH_COLUMNS:
+        if col in df.columns:
+            mask |= search_key_series(df[col]).str.contains(needle, regex=False).to_numpy(dtype=bool)
+    return df[mask]
+
+
+def _frame_bytes(df: pd.DataFrame) -> int:
+    """
+    Like memory_usage(deep=True), but each distinct Python object in an
+    object column is counted once — otherwise interned strings look as
+    expensive as copies.
+    """
+    total = int(df.index.memory_usage())
+    for col in df.columns:
+        s = df[col]
+        if s.dtype == object:
+            values = s.tolist()
+            unique = {id(v): v for v in values}
+            total += 8 * len(values) + sum(sys.getsizeof(v) for v in unique.values())
+        else:
+            total += int(s.memory_usage(index=False, deep=True))
+    return total
+
+
+def orders_memory_report(raw_df: pd.DataFrame) -> dict:
+    """Memory usage (bytes per 10k orders) of the raw vs. compact frame."""
+    rows = len(raw_df)
+    if rows == 0:
+        return {"rows": 0, "raw_per_10k": 0, "compact_per_10k": 0}
+    raw_bytes = _frame_bytes(raw_df)
+    compact_bytes = _frame_bytes(compact_orders_df(raw_df))
+    return {
+        "rows": rows,
+        "raw_per_10k": raw_bytes * 10_000 // rows,
+        "compact_per_10k": compact_bytes * 10_000 // rows,
+    }
+
+
+_MISSING = object()
+
+
+class OrderRecord:
+    """
+    O singură comandă, cu __slots__ în loc de dict (pentru accesul pe un rând).
+    Suportă .get() / [] ca un dict, deci merge direct în generatoarele PDF.
+    """
+    __slots__ = tuple(ORDER_COLUMNS) + ("extra",)
+    _FIELDS = frozenset(ORDER_COLUMNS)
+
+    def __init__(self, values: dict):
+        self.extra = {}
+        for key, value in values.items():
+            if key in self._FIELDS:
+                setattr(self, key, value)
+            else:
+                self.extra[key] = value
+
+    @classmethod
+    def from_df(cls, df: Optional[pd.DataFrame], order_id: str) -> Optional["OrderRecord"]:
+        """Locate order_id without materializing a row Series (no dtype upcast)."""
+        if df is None or df.empty or "order_id" not in df.columns:
+            return None
+        hits = np.flatnonzero(df["order_id"].to_numpy() == order_id)
+        if len(hits) == 0:
+            return None
+        pos = int(hits[0])
+        return cls({col: df[col].iat[pos] for col in df.columns})
+
+    def get(self, key, default=None):
+        if key in self._FIELDS:
+            return getattr(self, key, default)
+        return self.extra.get(key, default)
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def to_dict(self) -> dict:
+        out = {k: getattr(self, k) for k in ORDER_COLUMNS if hasattr(self, k)}
+        out.update(self.extra)
+        return out
+
+
+# ============================================================================
+# SCHEMA MIGRATIONS
+# ============================================================================
+def _with_column(chunk: pd.DataFrame, column: str) -> pd.DataFrame:
+    """The chunk with an empty text column appended if it has none (object, like a raw read)."""
+    if column in chunk.columns:
+        return chunk
+    return chunk.assign(**{column: pd.Series("", index=chunk.index, dtype=object)})
+
+
+def _add_printers_json(chunk: pd.DataFrame) -> pd.DataFrame:
+    return _with_column(chunk, "printers_json")
+
+
+def _link_client_ids(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Every order gets the client id derived from its phone."""
+    out = _with_column(chunk, "client_id")
+    if "client_phone" not in out.columns:
+        return out
+    unlinked = out["client_id"].isna() | (out["client_id"] == "")
+    if not unlinked.any():
+        return out
+    ids = client_ids_for_phones(out.loc[unlinked, "client_phone"])
+    if not (ids != "").any():
+        return out
+    out = out.copy()
+    out.loc[unlinked, "client_id"] = ids
+    return out
+
+
+# Foile de comenzi (Orders și arhiva) au aceeași schemă; o migrare nouă = un pas nou la final
+ORDER_SCHEMA = SheetSchema("order_id", ORDER_COLUMNS, [
+    Migration(1, "multiple printers per order", _add_printers_json, adds=("printers_json",)),
+    Migration(2, "link orders to clients", _link_client_ids, adds=("client_id",)),
+])
+
+
+def get_migration_settings() -> dict:
+    """secrets: migrations.chunk_rows (rows migrated and uploaded at a time)."""
+    try:
+        return dict(st.secrets.get("migrations", {}))
+    except Exception:
+        return {}
+
+
 # ============================================================================
 # GOOGLE SHEETS CONNECTION
 # ============================================================================
@@ -196,15 +407,69 @@ def get_sheets_connection():
         return None
 
 
-def generate_initial_receipt_pdf(order, company_info, logo_image=None):
-    """Generate A4 PDF with TWO identical A5 receipts (top + bottom)."""
+def get_loader_settings() -> dict:
+    """secrets: loader.timeout (seconds per startup read), loader.workers."""
+    try:
+        return dict(st.secrets.get("loader", {}))
+    except Exception:
+        return {}
+
+
+def get_pdf_settings() -> dict:
+    """secrets: pdf.fonts ("embedded" | "base14"), pdf.font / pdf.font_bold (.ttf), pdf.logo_dpi (0 = original logo)."""
+    try:
+        return dict(st.secrets.get("pdf", {}))
+    except Exception:
+        return {}
+
+
+def get_receipt_fonts() -> ReceiptFonts:
+    cfg = get_pdf_settings()
+    if cfg.get("fonts", "embedded") == "base14":
+        return BASE14
+    return load_fonts(cfg.get("font", DEFAULT_FONT_FILES[0]), cfg.get("font_bold", DEFAULT_FONT_FILES[1]))
+
+
+def receipt_logo(logo_image, dpi=None) -> Optional[Logo]:
+    """The prepared (cached) logo for a BytesIO with the logo file, None if there is none or it is unreadable."""
+    if not logo_image:
+        return None
+    if dpi is None:
+        dpi = int(get_pdf_settings().get("logo_dpi", 300))
+    try:
+        return prepared_logo(logo_image.getvalue(), dpi=dpi)
+    except Exception:
+        return None
+
+
+def draw_receipt_logo(c, logo: Optional[Logo], x: float, y: float, font_bold: str):
+    if logo is not None:
+        c.drawImage(logo.image, x, y, width=logo.width, height=logo.height, preserveAspectRatio=True, mask=logo.mask)
+        return
+    c.setFillColor(colors.HexColor('#f0f0f0'))
+    c.rect(x, y, 40 * mm, 25 * mm, fill=1, stroke=1)
+    c.setFillColor(colors.black)
+    c.setFont(font_bold, 10)
+    c.drawCentredString(x + 20 * mm, y + 12.5 * mm, "[LOGO]")
+
+
+@traced("pdf.initial_receipt")
+@flate_streams()
+def generate_initial_receipt_pdf(order, company_info, logo_image=None, equipment=None, fonts=None, logo_dpi=None):
+    """
+    Generate A4 PDF with TWO identical A5 receipts (top + bottom).
+    With an EquipmentRegistry, printers seen before get a "[Revenire: ...]" note.
+    """
     buffer = io.BytesIO()
 
     width = 210 * mm           # A4 width
     a5_height = 148.5 * mm     # A5 height
     total_height = 2 * a5_height
 
-    c = canvas.Canvas(buffer, pagesize=(width, total_height))
+    c = canvas.Canvas(buffer, pagesize=(width, total_height), pageCompression=1)
+    fonts = fonts or get_receipt_fonts()
+    font, font_bold, txt = fonts.regular, fonts.bold, fonts.text
+    logo = receipt_logo(logo_image, logo_dpi)
 
     def draw_half(offset_y: float):
         """
@@ -220,11 +485,11 @@ def generate_initial_receipt_pdf(order, company_info, logo_image=None):
         y_pos = header_y_start
 
         # Company info - left side
-        c.setFont("Helvetica-Bold", 9)
-        c.drawString(x_business, y_pos, remove_diacritics(company_info.get('company_name', '')))
+        c.setFont(font_bold, 9)
+        c.drawString(x_business, y_pos, txt(company_info.get('company_name', '')))
         y_pos -= 3.5 * mm
-        c.setFont("Helvetica", 7)
-        c.drawString(x_business, y_pos, remove_diacritics(company_info.get('company_address', '')))
+        c.setFont(font, 7)
+        c.drawString(x_business, y_pos, txt(company_info.get('company_address', '')))
         y_pos -= 3 * mm
         c.drawString(x_business, y_pos, f"CUI: {company_info.get('cui', '')}")
         y_pos -= 3 * mm
@@ -238,76 +503,47 @@ def generate_initial_receipt_pdf(order, company_info, logo_image=None):
         logo_x = 85 * mm
         logo_y = header_y_start - 20 * mm
 
-        if logo_image:
-            try:
-                logo_image.seek(0)
-                img = Image.open(logo_image)
-
-                target_width_mm = 40
-                aspect_ratio = img.height / img.width
-                target_height_mm = target_width_mm * aspect_ratio
-
-                if target_height_mm > 25:
-                    target_height_mm = 25
-                    target_width_mm = target_height_mm / aspect_ratio
-
-                logo_image.seek(0)
-                c.drawImage(
-                    ImageReader(logo_image),
-                    logo_x,
-                    logo_y,
-                    width=target_width_mm * mm,
-                    height=target_height_mm * mm,
-                    preserveAspectRatio=True,
-                    mask='auto'
-                )
-            except Exception:
-                c.setFillColor(colors.HexColor('#f0f0f0'))
-                c.rect(logo_x, logo_y, 40 * mm, 25 * mm, fill=1, stroke=1)
-                c.setFillColor(colors.black)
-                c.setFont("Helvetica-Bold", 10)
-                c.drawCentredString(logo_x + 20 * mm, logo_y + 12.5 * mm, "[LOGO]")
-        else:
-            c.setFillColor(colors.HexColor('#f0f0f0'))
-            c.rect(logo_x, logo_y, 40 * mm, 25 * mm, fill=1, stroke=1)
-            c.setFillColor(colors.black)
-            c.setFont("Helvetica-Bold", 10)
-            c.drawCentredString(logo_x + 20 * mm, logo_y + 12.5 * mm, "[LOGO]")
+        draw_receipt_logo(c, logo, logo_x, logo_y, font_bold)
 
         # Client info - right side
         c.setFillColor(colors.black)
         x_client = 155 * mm
         y_pos = header_y_start
-        c.setFont("Helvetica-Bold", 8)
+        c.setFont(font_bold, 8)
         c.drawString(x_client, y_pos, "CLIENT")
         y_pos -= 3.5 * mm
-        c.setFont("Helvetica", 7)
-        c.drawString(x_client, y_pos, f"Nume: {remove_diacritics(safe_text(order.get('client_name', '')))}")
+        c.setFont(font, 7)
+        c.drawString(x_client, y_pos, f"Nume: {txt(safe_text(order.get('client_name', '')))}")
         y_pos -= 3 * mm
         c.drawString(x_client, y_pos, f"Tel: {safe_text(order.get('client_phone', ''))}")
 
+        # QR cu numărul comenzii (se scanează la revenirea clientului)
+        qr_order_id = safe_text(order.get("order_id", ""))
+        if qr_order_id:
+            draw_order_qr(c, qr_order_id, 182 * mm, top - 37 * mm, 18 * mm)
+
         # Title
         title_y = top - 38 * mm
-        c.setFont("Helvetica-Bold", 12)
+        c.setFont(font_bold, 12)
         c.drawCentredString(105 * mm, title_y, "DOVADA PREDARE ECHIPAMENT IN SERVICE")
-        c.setFont("Helvetica-Bold", 10)
+        c.setFont(font_bold, 10)
         c.setFillColor(colors.HexColor('#E5283A'))
         c.drawCentredString(105 * mm, title_y - 6 * mm, f"Nr. Comanda: {safe_text(order.get('order_id', ''))}")
         c.setFillColor(colors.black)
 
         # Equipment details (MULTIPLE PRINTERS)
         y_pos = top - 50 * mm
-        c.setFont("Helvetica-Bold", 9)
+        c.setFont(font_bold, 9)
         c.drawString(10 * mm, y_pos, "DETALII ECHIPAMENT:")
         y_pos -= 5 * mm
-        c.setFont("Helvetica", 8)
+        c.setFont(font, 8)
 
         printers = load_printers_from_order(order)
 
         if printers:
             for idx, p in enumerate(printers, start=1):
-                brand = remove_diacritics(safe_text(p.get("brand", "")))
-                model = remove_diacritics(safe_text(p.get("model", "")))
+                brand = txt(safe_text(p.get("brand", "")))
+                model = txt(safe_text(p.get("model", "")))
                 serial = safe_text(p.get("serial", ""))
                 warranty = p.get("warranty", False)
                 
@@ -319,11 +555,17 @@ def generate_initial_receipt_pdf(order, company_info, logo_image=None):
                     line += " [Sub Garantie]"
                 else:
                     line += " [Fara Garantie]"
+
+                if equipment is not None and serial:
+                    eq = equipment.get(serial)
+                    previous = eq.visits_before(safe_text(order.get("order_id"))) if eq else []
+                    if previous:
+                        line += f" [Revenire: {previous[0].order_id}, {previous[0].date_received}]"
                 c.drawString(10 * mm, y_pos, line)
                 y_pos -= 4 * mm
         else:
             # fallback daca totusi nu exista nicio imprimanta
-            printer_info = f"{remove_diacritics(safe_text(order.get('printer_brand', '')))} {remove_diacritics(safe_text(order.get('printer_model', '')))}"
+            printer_info = f"{txt(safe_text(order.get('printer_brand', '')))} {txt(safe_text(order.get('printer_model', '')))}"
             c.drawString(10 * mm, y_pos, f"Imprimanta: {printer_info}")
             y_pos -= 4 * mm
             serial = safe_text(order.get('printer_serial', ''))
@@ -337,24 +579,24 @@ def generate_initial_receipt_pdf(order, company_info, logo_image=None):
 
         accessories = safe_text(order.get('accessories', ''))
         if accessories and accessories.strip():
-            c.drawString(10 * mm, y_pos, f"Accesorii: {remove_diacritics(accessories)}")
+            c.drawString(10 * mm, y_pos, f"Accesorii: {txt(accessories)}")
             y_pos -= 4 * mm
 
         # Issue description
         y_pos -= 2 * mm
-        c.setFont("Helvetica-Bold", 9)
+        c.setFont(font_bold, 9)
         c.drawString(10 * mm, y_pos, "PROBLEMA RAPORTATA:")
         y_pos -= 4 * mm
-        c.setFont("Helvetica", 8)
+        c.setFont(font, 8)
 
-        issue_text = remove_diacritics(safe_text(order.get('issue_description', '')))
+        issue_text = txt(safe_text(order.get('issue_description', '')))
         text_object = c.beginText(10 * mm, y_pos)
-        text_object.setFont("Helvetica", 8)
+        text_object.setFont(font, 8)
         words = issue_text.split()
         line = ""
         for word in words:
             test_line = line + word + " "
-            if c.stringWidth(test_line, "Helvetica", 8) < 190 * mm:
+            if c.stringWidth(test_line, font, 8) < 190 * mm:
                 line = test_line
             else:
                 text_object.textLine(line)
@@ -368,34 +610,34 @@ def generate_initial_receipt_pdf(order, company_info, logo_image=None):
         sig_height = 18 * mm
 
         c.rect(10 * mm, sig_y, 85 * mm, sig_height)
-        c.setFont("Helvetica-Bold", 8)
+        c.setFont(font_bold, 8)
         c.drawString(12 * mm, sig_y + sig_height - 3 * mm, "OPERATOR SERVICE")
-        c.setFont("Helvetica", 7)
+        c.setFont(font, 7)
         c.drawString(12 * mm, sig_y + 2 * mm, "Semnatura")
 
         c.rect(115 * mm, sig_y, 85 * mm, sig_height)
-        c.setFont("Helvetica-Bold", 8)
+        c.setFont(font_bold, 8)
         c.drawString(117 * mm, sig_y + sig_height - 3 * mm, "CLIENT")
-        c.setFont("Helvetica", 7)
+        c.setFont(font, 7)
         c.drawString(117 * mm, sig_y + sig_height - 7 * mm, "Am luat la cunostinta")
         c.drawString(117 * mm, sig_y + 2 * mm, "Semnatura")
 
         # more info (footer text for aceasta jumatate A5)
-        c.setFont("Helvetica-Bold", 7)
+        c.setFont(font_bold, 7)
         c.drawCentredString(105 * mm, offset_y + 18 * mm,
                             "Avand in vedere ca dispozitivele din prezenta fisa nu au putut fi testate in momentul preluarii lor, acestea sunt considerate ca fiind nefunctionale.")
-        c.setFont("Helvetica", 7)
+        c.setFont(font, 7)
         c.drawCentredString(105 * mm, offset_y + 15 * mm,
                             "Aveti obligatia ca, la finalizarea reparatiei echipamentului aflat in service, sa va prezentati in termen de 30 de zile de la data anuntarii de catre")
-        c.setFont("Helvetica", 7)
+        c.setFont(font, 7)
         c.drawCentredString(105 * mm, offset_y + 12 * mm,
                             "reprezentantul SC PRINTHEAD COMPLETE SOLUTIONS SRL pentru a ridica echipamentul.In cazul neridicarii echipamentului")
-        c.setFont("Helvetica", 7)
+        c.setFont(font, 7)
         c.drawCentredString(105 * mm, offset_y + 9 * mm,
                             "in intervalul specificat mai sus, ne rezervam dreptul de valorificare a acestuia")
 
         # Footer
-        c.setFont("Helvetica", 6)
+        c.setFont(font, 6)
         c.drawCentredString(105 * mm, offset_y + 3 * mm,
                             "Acest document constituie dovada predarii echipamentului in service.")
         c.setDash(3, 3)
@@ -413,15 +655,23 @@ def generate_initial_receipt_pdf(order, company_info, logo_image=None):
 
 
 
-def generate_completion_receipt_pdf(order, company_info, logo_image=None):
-    """Generate A4 PDF with TWO identical A5 completion receipts (top + bottom)."""
+@traced("pdf.completion_receipt")
+@flate_streams()
+def generate_completion_receipt_pdf(order, company_info, logo_image=None, items=None, fonts=None, logo_dpi=None):
+    """
+    Generate A4 PDF with TWO identical A5 completion receipts (top + bottom).
+    With per-printer line items (multi-printer orders), costs are also listed per printer.
+    """
     buffer = io.BytesIO()
 
     width = 210 * mm           # A4 width
     a5_height = 148.5 * mm     # A5 height
     total_height = 2 * a5_height
 
-    c = canvas.Canvas(buffer, pagesize=(width, total_height))
+    c = canvas.Canvas(buffer, pagesize=(width, total_height), pageCompression=1)
+    fonts = fonts or get_receipt_fonts()
+    font, font_bold, txt = fonts.regular, fonts.bold, fonts.text
+    logo = receipt_logo(logo_image, logo_dpi)
     SHIFT_BOXES = -15 * mm
     
 
@@ -437,11 +687,11 @@ def generate_completion_receipt_pdf(order, company_info, logo_image=None):
         y_pos = header_y_start
 
         # Company info - left side
-        c.setFont("Helvetica-Bold", 9)
-        c.drawString(x_business, y_pos, remove_diacritics(company_info.get('company_name', '')))
+        c.setFont(font_bold, 9)
+        c.drawString(x_business, y_pos, txt(company_info.get('company_name', '')))
         y_pos -= 3.5 * mm
-        c.setFont("Helvetica", 7)
-        c.drawString(x_business, y_pos, remove_diacritics(company_info.get('company_address', '')))
+        c.setFont(font, 7)
+        c.drawString(x_business, y_pos, txt(company_info.get('company_address', '')))
         y_pos -= 3 * mm
         c.drawString(x_business, y_pos, f"CUI: {company_info.get('cui', '')}")
         y_pos -= 3 * mm
@@ -455,59 +705,30 @@ def generate_completion_receipt_pdf(order, company_info, logo_image=None):
         logo_x = 85 * mm
         logo_y = header_y_start - 20 * mm
 
-        if logo_image:
-            try:
-                logo_image.seek(0)
-                img = Image.open(logo_image)
-
-                target_width_mm = 40
-                aspect_ratio = img.height / img.width
-                target_height_mm = target_width_mm * aspect_ratio
-
-                if target_height_mm > 25:
-                    target_height_mm = 25
-                    target_width_mm = target_height_mm / aspect_ratio
-
-                logo_image.seek(0)
-                c.drawImage(
-                    ImageReader(logo_image),
-                    logo_x,
-                    logo_y,
-                    width=target_width_mm * mm,
-                    height=target_height_mm * mm,
-                    preserveAspectRatio=True,
-                    mask='auto'
-                )
-            except Exception:
-                c.setFillColor(colors.HexColor('#f0f0f0'))
-                c.rect(logo_x, logo_y, 40 * mm, 25 * mm, fill=1, stroke=1)
-                c.setFillColor(colors.black)
-                c.setFont("Helvetica-Bold", 10)
-                c.drawCentredString(logo_x + 20 * mm, logo_y + 12.5 * mm, "[LOGO]")
-        else:
-            c.setFillColor(colors.HexColor('#f0f0f0'))
-            c.rect(logo_x, logo_y, 40 * mm, 25 * mm, fill=1, stroke=1)
-            c.setFillColor(colors.black)
-            c.setFont("Helvetica-Bold", 10)
-            c.drawCentredString(logo_x + 20 * mm, logo_y + 12.5 * mm, "[LOGO]")
+        draw_receipt_logo(c, logo, logo_x, logo_y, font_bold)
 
         # Client info - right side
         c.setFillColor(colors.black)
         x_client = 155 * mm
         y_pos = header_y_start
-        c.setFont("Helvetica-Bold", 8)
+        c.setFont(font_bold, 8)
         c.drawString(x_client, y_pos, "CLIENT")
         y_pos -= 3.5 * mm
-        c.setFont("Helvetica", 7)
-        c.drawString(x_client, y_pos, f"Nume: {remove_diacritics(safe_text(order.get('client_name', '')))}")
+        c.setFont(font, 7)
+        c.drawString(x_client, y_pos, f"Nume: {txt(safe_text(order.get('client_name', '')))}")
         y_pos -= 3 * mm
         c.drawString(x_client, y_pos, f"Tel: {safe_text(order.get('client_phone', ''))}")
 
+        # QR cu numărul comenzii (se scanează la revenirea clientului)
+        qr_order_id = safe_text(order.get("order_id", ""))
+        if qr_order_id:
+            draw_order_qr(c, qr_order_id, 182 * mm, top - 37 * mm, 18 * mm)
+
         # Title
         title_y = top - 38 * mm
-        c.setFont("Helvetica-Bold", 12)
+        c.setFont(font_bold, 12)
         c.drawCentredString(105 * mm, title_y, "DOVADA RIDICARE ECHIPAMENT DIN SERVICE")
-        c.setFont("Helvetica-Bold", 10)
+        c.setFont(font_bold, 10)
         c.setFillColor(colors.HexColor('#00aa00'))
         c.drawCentredString(105 * mm, title_y - 6 * mm, f"Nr. Comanda: {safe_text(order.get('order_id', ''))}")
         c.setFillColor(colors.black)
@@ -519,16 +740,16 @@ def generate_completion_receipt_pdf(order, company_info, logo_image=None):
         # LEFT COLUMN - Equipment details (MULTIPLE PRINTERS)
         x_left = 10 * mm
         y_pos = y_start
-        c.setFont("Helvetica-Bold", 9)
+        c.setFont(font_bold, 9)
         c.drawString(x_left, y_pos, "DETALII ECHIPAMENT:")
         y_pos -= 5 * mm
-        c.setFont("Helvetica", 8)
+        c.setFont(font, 8)
 
         printers = load_printers_from_order(order)
         if printers:
             for idx, p in enumerate(printers, start=1):
-                brand = remove_diacritics(safe_text(p.get("brand", "")))
-                model = remove_diacritics(safe_text(p.get("model", "")))
+                brand = txt(safe_text(p.get("brand", "")))
+                model = txt(safe_text(p.get("model", "")))
                 serial = safe_text(p.get("serial", ""))
 
                 line = f"{idx}. {brand} {model}"
@@ -538,7 +759,7 @@ def generate_completion_receipt_pdf(order, company_info, logo_image=None):
                 c.drawString(x_left, y_pos, line)
                 y_pos -= 4 * mm
         else:
-            printer_info = f"{remove_diacritics(safe_text(order.get('printer_brand', '')))} {remove_diacritics(safe_text(order.get('printer_model', '')))}"
+            printer_info = f"{txt(safe_text(order.get('printer_brand', '')))} {txt(safe_text(order.get('printer_model', '')))}"
             c.drawString(x_left, y_pos, f"Imprimanta: {printer_info}")
             y_pos -= 4 * mm
             serial = safe_text(order.get('printer_serial', ''))
@@ -553,24 +774,24 @@ def generate_completion_receipt_pdf(order, company_info, logo_image=None):
         accessories = safe_text(order.get('accessories', ''))
         if accessories and accessories.strip():
             y_pos -= 4 * mm
-            c.drawString(x_left, y_pos, f"Accesorii: {remove_diacritics(accessories)}")
+            c.drawString(x_left, y_pos, f"Accesorii: {txt(accessories)}")
 
         # MIDDLE COLUMN - Repairs
         x_middle = 73 * mm
         y_pos = y_start
-        c.setFont("Helvetica-Bold", 9)
+        c.setFont(font_bold, 9)
         c.drawString(x_middle, y_pos, "REPARATII EFECTUATE:")
         y_pos -= 3.5 * mm
-        c.setFont("Helvetica", 8)
+        c.setFont(font, 8)
 
-        repair_text = remove_diacritics(safe_text(order.get('repair_details', 'N/A')))
+        repair_text = txt(safe_text(order.get('repair_details', 'N/A')))
         words = repair_text.split()
         line = ""
         line_count = 0
         max_lines = 5
         for word in words:
             test_line = line + word + " "
-            if c.stringWidth(test_line, "Helvetica", 7) < (col_width - 18 * mm):
+            if c.stringWidth(test_line, font, 7) < (col_width - 18 * mm):
                 line = test_line
             else:
                 if line_count < max_lines:
@@ -586,19 +807,19 @@ def generate_completion_receipt_pdf(order, company_info, logo_image=None):
         # RIGHT COLUMN - Parts used
         x_right = 136 * mm
         y_pos = y_start
-        c.setFont("Helvetica-Bold", 9)
+        c.setFont(font_bold, 9)
         c.drawString(x_right, y_pos, "PIESE UTILIZATE:")
         y_pos -= 3.5 * mm
-        c.setFont("Helvetica", 8)
+        c.setFont(font, 8)
 
-        parts_text = remove_diacritics(safe_text(order.get('parts_used', 'N/A')))
+        parts_text = txt(safe_text(order.get('parts_used', 'N/A')))
         words = parts_text.split()
         line = ""
         line_count = 0
         max_lines = 5
         for word in words:
             test_line = line + word + " "
-            if c.stringWidth(test_line, "Helvetica", 7) < (col_width - 2 * mm):
+            if c.stringWidth(test_line, font, 7) < (col_width - 2 * mm):
                 line = test_line
             else:
                 if line_count < max_lines:
@@ -615,7 +836,7 @@ def generate_completion_receipt_pdf(order, company_info, logo_image=None):
         # COST TABLE (shifted down 15mm)
         # ------------------------------
         y_cost = top - 78 * mm + SHIFT_BOXES
-        c.setFont("Helvetica-Bold", 9)
+        c.setFont(font_bold, 9)
         c.drawString(10 * mm, y_cost, "COSTURI:")
         y_cost -= 4 * mm
 
@@ -628,14 +849,14 @@ def generate_completion_receipt_pdf(order, company_info, logo_image=None):
         c.setFillColor(colors.HexColor('#e0e0e0'))
         c.rect(table_x, y_cost - row_height, table_width, row_height, fill=1)
         c.setFillColor(colors.black)
-        c.setFont("Helvetica-Bold", 8)
+        c.setFont(font_bold, 8)
         c.drawString(table_x + 2 * mm, y_cost - row_height + 1.5 * mm, "Descriere")
         c.drawString(table_x + table_width - 22 * mm, y_cost - row_height + 1.5 * mm, "Suma (RON)")
         c.line(table_x, y_cost - row_height, table_x + table_width, y_cost - row_height)
 
         y_cost -= row_height
 
-        c.setFont("Helvetica", 8)
+        c.setFont(font, 8)
         c.drawString(table_x + 2 * mm, y_cost - row_height + 1.5 * mm, "Manopera")
         labor = safe_float(order.get('labor_cost', 0))
         c.drawString(table_x + table_width - 22 * mm, y_cost - row_height + 1.5 * mm, f"{labor:.2f}")
@@ -651,11 +872,60 @@ def generate_completion_receipt_pdf(order, company_info, logo_image=None):
         c.setFillColor(colors.HexColor('#f0f0f0'))
         c.rect(table_x, y_cost - row_height, table_width, row_height, fill=1)
         c.setFillColor(colors.black)
-        c.setFont("Helvetica-Bold", 9)
+        c.setFont(font_bold, 9)
         c.drawString(table_x + 2 * mm, y_cost - row_height + 1.5 * mm, "TOTAL")
         total = safe_float(order.get('total_cost', labor + parts))
         c.drawString(table_x + table_width - 22 * mm, y_cost - row_height + 1.5 * mm, f"{total:.2f}")
 
+        # ------------------------------
+        # COST PER PRINTER (multi-printer orders)
+        # ------------------------------
+        if items and len(items) > 1:
+            printers = load_printers_from_order(order)
+            items_x = 90 * mm
+            items_width = 110 * mm
+            y_items = top - 78 * mm + SHIFT_BOXES
+            c.setFont(font_bold, 9)
+            c.drawString(items_x, y_items, "COST PE ECHIPAMENT:")
+            y_items -= 4 * mm
+
+            max_rows = 4
+            shown = items[:max_rows] if len(items) <= max_rows else items[:max_rows - 1]
+            n_rows = len(shown) + 1 + (1 if len(shown) < len(items) else 0)
+            c.rect(items_x, y_items - n_rows * row_height, items_width, n_rows * row_height)
+
+            c.setFillColor(colors.HexColor('#e0e0e0'))
+            c.rect(items_x, y_items - row_height, items_width, row_height, fill=1)
+            c.setFillColor(colors.black)
+            c.setFont(font_bold, 8)
+            c.drawString(items_x + 2 * mm, y_items - row_height + 1.5 * mm, "Echipament")
+            c.drawRightString(items_x + 78 * mm, y_items - row_height + 1.5 * mm, "Manopera")
+            c.drawRightString(items_x + 94 * mm, y_items - row_height + 1.5 * mm, "Piese")
+            c.drawRightString(items_x + items_width - 2 * mm, y_items - row_height + 1.5 * mm, "Total")
+            y_items -= row_height
+
+            c.setFont(font, 7)
+            for item in shown:
+                p = printers[item.line_no] if item.line_no < len(printers) else {}
+                label = f"{item.line_no + 1}. {safe_text(p.get('brand', ''))} {safe_text(p.get('model', ''))}".strip()
+                if item.serial:
+                    label += f" (SN: {item.serial})"
+                label = txt(label)
+                while label and c.stringWidth(label, font, 7) > 60 * mm:
+                    label = label[:-1]
+                c.line(items_x, y_items, items_x + items_width, y_items)
+                c.drawString(items_x + 2 * mm, y_items - row_height + 1.5 * mm, label)
+                c.drawRightString(items_x + 78 * mm, y_items - row_height + 1.5 * mm, f"{item.labor_cost:.2f}")
+                c.drawRightString(items_x + 94 * mm, y_items - row_height + 1.5 * mm, f"{item.parts_cost:.2f}")
+                c.drawRightString(items_x + items_width - 2 * mm, y_items - row_height + 1.5 * mm, f"{item.total:.2f}")
+                y_items -= row_height
+            if len(shown) < len(items):
+                rest = items[len(shown):]
+                c.line(items_x, y_items, items_x + items_width, y_items)
+                c.drawString(items_x + 2 * mm, y_items - row_height + 1.5 * mm, f"+ {len(rest)} echipamente")
+                c.drawRightString(items_x + items_width - 2 * mm, y_items - row_height + 1.5 * mm,
+                                  f"{sum(it.total for it in rest):.2f}")
+
         # ------------------------------
         # SIGNATURE BOXES (shifted down)
         # ------------------------------
@@ -663,20 +933,20 @@ def generate_completion_receipt_pdf(order, company_info, logo_image=None):
         sig_height = 18 * mm
 
         c.rect(10 * mm, sig_y, 85 * mm, sig_height)
-        c.setFont("Helvetica-Bold", 8)
+        c.setFont(font_bold, 8)
         c.drawString(12 * mm, sig_y + sig_height - 3 * mm, "OPERATOR SERVICE")
-        c.setFont("Helvetica", 7)
+        c.setFont(font, 7)
         c.drawString(12 * mm, sig_y + 2 * mm, "Semnatura")
 
         c.rect(115 * mm, sig_y, 85 * mm, sig_height)
-        c.setFont("Helvetica-Bold", 8)
+        c.setFont(font_bold, 8)
         c.drawString(117 * mm, sig_y + sig_height - 3 * mm, "CLIENT")
-        c.setFont("Helvetica", 7)
+        c.setFont(font, 7)
         c.drawString(117 * mm, sig_y + sig_height - 7 * mm, "Am luat la cunostinta")
         c.drawString(117 * mm, sig_y + 2 * mm, "Semnatura")
 
         # footer unchanged
-        c.setFont("Helvetica", 6)
+        c.setFont(font, 6)
         c.drawCentredString(105 * mm, offset_y + 3 * mm,
                             "Acest document constituie dovada ridicarii echipamentului din service.")
         c.setDash(3, 3)
@@ -692,403 +962,2357 @@ def generate_completion_receipt_pdf(order, company_info, logo_image=None):
 
 
 # ============================================================================
-# CRM CLASS - GOOGLE SHEETS BACKEND
+# CLIENT REGISTRY
 # ============================================================================
-class PrinterServiceCRM:
-    def __init__(self, conn: GSheetsConnection):
-        self.conn = conn
-        self.worksheet = "Orders"
-        self.next_order_id = 1
-        self._init_sheet()
-
-    def _read_df(self, raw: bool = True, ttl: int = 0) -> Optional[pd.DataFrame]:
-        """Read Google Sheets into DataFrame safely."""
-        try:
-            df = self.conn.read(
-                worksheet=self.worksheet,
-                ttl=ttl
-            )
-            if df is None:
-                return None
-            if raw:
-                return df
-            return df.fillna("")
-        except Exception as e:
-            st.sidebar.error(f"❌ Error reading Google Sheets: {e}")
-            return None
-
-    def _write_df(self, df: pd.DataFrame, allow_empty: bool = False) -> bool:
-        """Write entire DataFrame to Sheets. Prevents accidental data loss."""
-        try:
-            if df is None:
-                st.sidebar.error("❌ Tried to write None DataFrame to Sheets.")
-                return False
-            if df.empty and not allow_empty:
-                st.sidebar.error("⚠️ Refusing to write empty DataFrame to prevent data loss.")
-                return False
-            self.conn.update(worksheet=self.worksheet, data=df)
-            st.sidebar.success("💾 Saved to Google Sheets!")
-            return True
-        except Exception as e:
-            st.sidebar.error(f"❌ Error saving to Google Sheets: {e}")
-            return False
+@st.cache_resource
+def get_client_registry(branch: str) -> ClientRegistry:
+    """Registru de clienți comun tuturor sesiunilor (construit incremental)."""
+    return ClientRegistry()
+
+
+def sync_client_registry(crm, df_live: pd.DataFrame) -> ClientRegistry:
+    """Ingest orders not seen yet; the archive tier is read only once per process."""
+    registry = get_client_registry(crm.branch.code)
+    if not registry.history_loaded:
+        registry.sync(crm._read_archive_df())
+        registry.history_loaded = True
+    registry.sync(df_live)
+    return registry
+
+
+def prefill_client(phone: str, branch: str = MAIN_CODE):
+    """Callback: copy a registered client into the New Order form fields."""
+    client = get_client_registry(branch).get(phone)
+    if client is None:
+        return
+    st.session_state["new_client_name"] = client.name
+    st.session_state["new_client_phone"] = client.phone
+    st.session_state["new_client_email"] = client.email
+
+
+def render_client_autocomplete(registry: ClientRegistry, branch: str = MAIN_CODE):
+    """Returning-client lookup shown above the New Order form."""
+    col_q, col_pick, col_btn = st.columns([1.2, 1.6, 0.6])
+    with col_q:
+        query = st.text_input(
+            "🔎 Returning client",
+            key="client_lookup",
+            placeholder="Phone or name",
+        )
+    matches = registry.search(query, limit=8) if query.strip() else []
+    if not matches:
+        if query.strip():
+            col_pick.caption("No registered client matches.")
+        return
+    with col_pick:
+        phone = st.selectbox(
+            "Matches",
+            [c.phone for c in matches],
+            format_func=lambda p: next(c.label for c in matches if c.phone == p),
+            key="client_lookup_choice",
+        )
+    with col_btn:
+        st.write("")
+        st.button(
+            "Use client",
+            key="client_lookup_use",
+            on_click=prefill_client,
+            args=(phone, branch),
+            use_container_width=True,
+        )
+    client = registry.get(phone)
+    if client is not None:
+        st.caption(f"{client.client_id} · {len(client.order_ids)} previous orders · last on {client.last_order_date or '-'}")
 
-    def _compute_next_order_id(self) -> int:
-        """Compute next available order ID with fill-the-gap logic."""
-        df = self._read_df(raw=True, ttl=0)
-        if df is None or df.empty or "order_id" not in df.columns:
-            return 1
 
-        existing = []
-        for oid in df["order_id"]:
-            try:
-                if isinstance(oid, str) and oid.startswith("SRV-"):
-                    num = int(oid.split("-")[1])
-                    existing.append(num)
-            except Exception:
-                continue
+# ============================================================================
+# EQUIPMENT REGISTRY
+# ============================================================================
+@st.cache_resource
+def get_equipment_registry(branch: str) -> EquipmentRegistry:
+    """Registru de echipamente (după serie și brand/model), comun tuturor sesiunilor."""
+    return EquipmentRegistry()
 
-        if not existing:
-            return 1
 
-        existing_sorted = sorted(existing)
-        missing = None
-        for i in range(1, existing_sorted[-1] + 1):
-            if i not in existing_sorted:
-                missing = i
-                break
+def sync_equipment_registry(crm, df_live: pd.DataFrame) -> EquipmentRegistry:
+    """Ingest orders not seen yet; the archive tier is read only once per process."""
+    registry = get_equipment_registry(crm.branch.code)
+    if not registry.history_loaded:
+        registry.sync(crm._read_archive_df(), load_printers_from_order)
+        registry.history_loaded = True
+    registry.sync(df_live, load_printers_from_order)
+    return registry
 
-        return missing if missing else existing_sorted[-1] + 1
 
-    def _init_sheet(self):
-        """Ensure headers exist and compute next_order_id with fill-the-gap logic."""
-        df = self._read_df(raw=True, ttl=0)
+def serial_history_note(serial: str, order_id: str = "", branch: str = MAIN_CODE) -> str:
+    """Short UI note for a serial that was already in service ("" if first visit)."""
+    eq = get_equipment_registry(branch).get(serial)
+    if eq is None:
+        return ""
+    previous = eq.visits_before(order_id)
+    if not previous:
+        return ""
+    note = f"🔁 {len(previous)} previous visit(s) · last {previous[0].order_id} ({previous[0].date_received or '-'})"
+    if eq.is_repeat_failure(order_id):
+        note = "⚠️ Repeat failure · " + note
+    return note
 
-        # CASE 1 — Sheet is missing or fully empty → create new sheet
-        if df is None or df.empty:
-            columns = [
-                "order_id", "client_name", "client_phone", "client_email",
-                "printer_brand", "printer_model", "printer_serial",
-                "printers_json",
-                "issue_description", "accessories", "notes",
-                "date_received", "date_pickup_scheduled", "date_completed", "date_picked_up",
-                "status", "technician", "repair_details", "parts_used",
-                "labor_cost", "parts_cost", "total_cost",
-            ]
-            df = pd.DataFrame(columns=columns)
-            self._write_df(df, allow_empty=False)
-            self.next_order_id = 1
-            return
 
-        # CASE 2 — Sheet exists but order_id column is missing → recreate sheet header
-        if "order_id" not in df.columns:
-            columns = [
-                "order_id", "client_name", "client_phone", "client_email",
-                "printer_brand", "printer_model", "printer_serial",
-                "printers_json",
-                "issue_description", "accessories", "notes",
-                "date_received", "date_pickup_scheduled", "date_completed", "date_picked_up",
-                "status", "technician", "repair_details", "parts_used",
-                "labor_cost", "parts_cost", "total_cost",
-            ]
-            new_df = pd.DataFrame(columns=columns)
-            self._write_df(new_df, allow_empty=False)
-            self.next_order_id = 1
-            return
+# ============================================================================
+# WORK QUEUE / SLA
+# ============================================================================
+@st.cache_resource
+def get_work_queue(branch: str) -> WorkQueue:
+    """Cozile de lucru ale tehnicienilor (secrets: sla.days, sla.warranty_days)."""
+    try:
+        sla = st.secrets.get("sla", {})
+        return WorkQueue(
+            sla_days=int(sla.get("days", DEFAULT_SLA_DAYS)),
+            warranty_sla_days=int(sla.get("warranty_days", DEFAULT_WARRANTY_SLA_DAYS)),
+        )
+    except Exception:
+        return WorkQueue()
 
-        # CASE 3 — Ensure printers_json exists
-        if "printers_json" not in df.columns:
-            df["printers_json"] = ""
-            self._write_df(df, allow_empty=False)
 
-        # CASE 4 — Compute next order ID
-        self.next_order_id = self._compute_next_order_id()
+def sync_work_queue(crm, df_live: pd.DataFrame) -> WorkQueue:
+    """
+    Ingest new orders and the ones changed outside this process, drop the
+    ones gone from the sheet (archived orders are completed, so only live ones matter).
+    """
+    queue = get_work_queue(crm.branch.code)
+    queue.sync(df_live, load_printers_from_order)
+    return queue
 
-    def create_service_order(
-        self,
-        client_name,
-        client_phone,
-        client_email,
-        printers_list,
-        issue_description,
-        accessories,
-        notes,
-        date_received,
-        date_pickup
-    ):
-        # Recalculate next_order_id from current sheet state
-        next_id = self._compute_next_order_id()
-        order_id = f"SRV-{next_id:05d}"
 
-        # First printer for legacy columns
-        first_brand = ""
-        first_model = ""
-        first_serial = ""
+# ============================================================================
+# PARTS INVENTORY
+# ============================================================================
+@st.cache_resource
+def get_inventory(branch: str) -> Inventory:
+    """Catalog de piese + totaluri de stoc, comune tuturor sesiunilor."""
+    return Inventory()
 
-        if printers_list:
-            first_brand = safe_text(printers_list[0].get("brand", ""))
-            first_model = safe_text(printers_list[0].get("model", ""))
-            first_serial = safe_text(printers_list[0].get("serial", ""))
 
-        printers_json = json.dumps(printers_list, ensure_ascii=False)
+def sync_inventory(crm) -> Inventory:
+    """
+    The Parts and Stock_Ledger worksheets are read once per process; later
+    movements are applied incrementally, and every ledger write first
+    catches up with rows other processes appended (catch_up_ledger). A
+    failed read leaves the inventory unloaded, so the next rerun reads again.
+    """
+    inventory = get_inventory(crm.branch.code)
+    if not inventory.loaded:
+        parts, ledger = crm.read_parts_df(), crm.read_ledger_df()
+        if parts is not None and ledger is not None:
+            inventory.load(parts, ledger)
+    return inventory
+
+
+def render_inventory_panel(crm):
+    """Sidebar panel: add/edit catalog parts and receive stock."""
+    inventory = get_inventory(crm.branch.code)
+    with st.sidebar.expander("📦 Parts & Stock", expanded=False):
+        with st.form("part_form", clear_on_submit=True):
+            st.markdown("**Add / edit part**")
+            sku = st.text_input("SKU", key="part_sku")
+            name = st.text_input("Name", key="part_name")
+            price = st.number_input("Unit price (RON)", min_value=0.0, step=5.0, key="part_price")
+            reorder = st.number_input("Reorder level", min_value=0, step=1, key="part_reorder")
+            if st.form_submit_button("💾 Save part"):
+                if not sku.strip():
+                    st.error("SKU is required.")
+                elif crm.save_part(sku, name, price, reorder):
+                    st.success(f"✅ {sku.strip().upper()} saved")
+
+        if not len(inventory):
+            st.caption("No parts in the catalog yet.")
+            return
 
-        def to_date_str(d):
-            if isinstance(d, date):
-                return d.strftime("%Y-%m-%d")
-            if isinstance(d, str) and d.strip():
-                return d
-            return ""
+        with st.form("receive_form", clear_on_submit=True):
+            st.markdown("**Receive stock**")
+            skus = [p.sku for p in inventory.parts()]
+            sku = st.selectbox("Part", skus, format_func=lambda s: inventory.get(s).label, key="receive_sku")
+            qty = st.number_input("Quantity", min_value=1, step=1, key="receive_qty")
+            note = st.text_input("Note (supplier, invoice)", key="receive_note")
+            if st.form_submit_button("📥 Receive"):
+                if crm.receive_stock(sku, int(qty), note):
+                    st.success(f"✅ +{int(qty)} {sku}")
 
-        new_order = pd.DataFrame([{
-            "order_id": order_id,
-            "client_name": client_name,
-            "client_phone": client_phone,
-            "client_email": client_email,
-            "printer_brand": first_brand,
-            "printer_model": first_model,
-            "printer_serial": first_serial,
-            "printers_json": printers_json,
-            "issue_description": issue_description,
-            "accessories": accessories,
-            "notes": notes,
-            "date_received": to_date_str(date_received),
-            "date_pickup_scheduled": to_date_str(date_pickup),
-            "date_completed": "",
-            "date_picked_up": "",
-            "status": "Received",
-            "technician": "",
-            "repair_details": "",
-            "parts_used": "",
-            "labor_cost": 0.0,
-            "parts_cost": 0.0,
-            "total_cost": 0.0,
-        }])
+        low = inventory.low_stock()
+        if not low.empty:
+            st.warning(f"⚠️ {len(low)} part(s) at or below reorder level")
+        st.dataframe(inventory.stock_df(), hide_index=True, use_container_width=True)
 
-        df = self._read_df(raw=True, ttl=0)
-        updated_df = pd.concat([df, new_order], ignore_index=True) if df is not None and not df.empty else new_order
 
-        if self._write_df(updated_df):
-            return order_id
-        return None
+# ============================================================================
+# PER-PRINTER LINE ITEMS
+# ============================================================================
+@st.cache_resource
+def get_line_items(branch: str) -> LineItemIndex:
+    """Poziții pe imprimantă (status + costuri), comune tuturor sesiunilor."""
+    return LineItemIndex()
 
-    def list_orders_df(self) -> pd.DataFrame:
-        df = self._read_df(raw=False, ttl=60)
-        return df if df is not None else pd.DataFrame()
 
-    def update_order(self, order_id: str, **kwargs) -> bool:
-        """Update ONLY the matching row, write back entire DataFrame."""
-        df = self._read_df(raw=True, ttl=0)
-        if df is None or df.empty or "order_id" not in df.columns:
-            st.sidebar.error("❌ Cannot update: no data found in Google Sheets.")
-            return False
+def sync_line_items(crm) -> LineItemIndex:
+    """
+    The Order_Items worksheet is read once per process; later edits update
+    the index directly. After a failed read the next rerun reads again.
+    """
+    index = get_line_items(crm.branch.code)
+    if not index.loaded:
+        df = crm.read_items_df()
+        if df is not None:
+            index.load(df)
+    return index
 
-        mask = df["order_id"] == order_id
-        if not mask.any():
-            st.sidebar.error(f"❌ Order {order_id} not found in sheet.")
-            return False
 
-        for key, value in kwargs.items():
-            if key in df.columns:
-                df.loc[mask, key] = value
+# ============================================================================
+# ATTACHMENTS
+# ============================================================================
+def get_attachment_settings() -> dict:
+    """secrets: attachments.path, attachments.max_mb, attachments.thumb_px, attachments.workers."""
+    try:
+        return dict(st.secrets.get("attachments", {}))
+    except Exception:
+        return {}
 
-        if "labor_cost" in df.columns and "parts_cost" in df.columns:
-            labor = pd.to_numeric(df.loc[mask, "labor_cost"], errors="coerce").fillna(0)
-            parts = pd.to_numeric(df.loc[mask, "parts_cost"], errors="coerce").fillna(0)
-            df.loc[mask, "total_cost"] = labor + parts
 
-        return self._write_df(df)
+@st.cache_resource
+def get_blob_store() -> BlobStore:
+    """
+    Fișierele atașate (content-addressed) + pool-ul de thumbnails, comune
+    tuturor sesiunilor și tuturor filialelor (vezi blobs_in_use).
+    """
+    cfg = get_attachment_settings()
+    return BlobStore(
+        cfg.get("path", ".attachments"),
+        workers=int(cfg.get("workers", 2)),
+        thumb_px=int(cfg.get("thumb_px", 320)),
+    )
 
-    def delete_order(self, order_id: str) -> bool:
-        """Delete an order from the sheet."""
-        df = self._read_df(raw=True, ttl=0)
-        if df is None or df.empty or "order_id" not in df.columns:
-            st.sidebar.error("❌ Cannot delete: no data found in Google Sheets.")
-            return False
 
-        mask = df["order_id"] == order_id
-        if not mask.any():
-            st.sidebar.error(f"❌ Order {order_id} not found in sheet.")
-            return False
+@st.cache_resource
+def get_attachment_index(branch: str) -> AttachmentIndex:
+    return AttachmentIndex()
 
-        df_deleted = df[~mask]
-        # Allow writing even if the sheet becomes empty after deletion
-        return self._write_df(df_deleted, allow_empty=True)
 
+def blobs_in_use(crm, digests: list) -> set:
+    """
+    The blobs of `digests` another branch still refers to. The blob store is
+    shared by all branches while each AttachmentIndex counts only its own
+    branch's references, so a blob orphaned in one branch is checked against
+    every other branch's index (loaded here if needed) before it is removed.
+    If a branch's references cannot be read, all the blobs count as in use.
+    """
+    in_use = set()
+    for branch in get_branches().values():
+        if branch.code == crm.branch.code or len(in_use) == len(digests):
+            continue
+        index = get_attachment_index(branch.code)
+        if not index.loaded:
+            df = crm._read_existing(branch.worksheet("Order_Attachments"), "attachment_id")
+            if df is None:
+                return set(digests)
+            index.load(df)
+        in_use.update(d for d in digests if index.refers_to(d))
+    return in_use
+
+
+def sync_attachments(crm) -> AttachmentIndex:
+    """
+    The Order_Attachments worksheet is read once per process; later uploads
+    update the index directly. After a failed read the next rerun reads again.
+    """
+    index = get_attachment_index(crm.branch.code)
+    if not index.loaded:
+        df = crm.read_attachments_df()
+        if df is not None:
+            index.load(df)
+    return index
+
+
+def attachment_scope(line_no: Optional[int], printers: list) -> str:
+    if line_no is None:
+        return "Whole order"
+    p = printers[line_no] if line_no < len(printers) else {}
+    return f"#{line_no + 1} {safe_text(p.get('brand'))} {safe_text(p.get('model'))}".strip()
+
+
+def render_attachments(crm, order_id: str, printers: list):
+    """Update tab: upload files to the order or one printer; thumbnails + lazy downloads."""
+    index = get_attachment_index(crm.branch.code)
+    store = get_blob_store()
+    with st.expander(f"📎 Attachments ({index.count(order_id)})", expanded=False):
+        col_up, col_for = st.columns([2, 1])
+        uploads = col_up.file_uploader(
+            "Photos / documents",
+            type=list(IMAGE_TYPES + DOCUMENT_TYPES),
+            accept_multiple_files=True,
+            key=f"att_upload_{order_id}",
+        )
+        scopes = [None] + list(range(len(printers)))
+        line_no = col_for.selectbox(
+            "Attach to",
+            scopes,
+            format_func=lambda n: attachment_scope(n, printers),
+            key=f"att_scope_{order_id}",
+        )
+        if uploads and col_for.button("📎 Upload", key=f"att_save_{order_id}", use_container_width=True):
+            files = [(f.name, f.type or "", f.getvalue()) for f in uploads]
+            added = crm.add_attachments(order_id, files, line_no)
+            if added is not None:
+                st.success(f"✅ {len(added)} file(s) attached")
+                st.rerun()
+
+        attachments = index.for_order(order_id)
+        if not attachments:
+            st.caption("No attachments yet.")
+            return
+        cols = st.columns(4)
+        for i, att in enumerate(attachments):
+            with cols[i % 4]:
+                thumb = store.thumbnail(att.sha256) if att.is_image else None
+                if thumb:
+                    st.image(thumb, use_container_width=True)
+                elif att.is_image and store.has_preview(att.sha256):
+                    st.caption("⏳ Preparing preview...")
+                else:
+                    st.markdown("📄")
+                st.caption(f"{att.file_name} · {attachment_scope(att.line_no, printers)} · {att.size / 1024:.0f} KB")
+                # fișierul întreg se citește doar la click
+                st.download_button(
+                    "⬇️ Download",
+                    lambda digest=att.sha256: store.read(digest) or b"",
+                    att.file_name,
+                    att.mime or "application/octet-stream",
+                    key=f"att_dl_{att.attachment_id}",
+                    use_container_width=True,
+                )
+                if st.button("🗑 Remove", key=f"att_del_{att.attachment_id}", use_container_width=True):
+                    if crm.delete_attachments(order_id, {att.attachment_id}):
+                        st.rerun()
+
+
+# ============================================================================
+# CUSTOMER NOTIFICATIONS
+# ============================================================================
+# status → eveniment pentru care clientul primește e-mail/SMS
+NOTIFY_STATUSES = {"Ready for Pickup": "ready_for_pickup"}
+
+
+def get_notification_settings() -> dict:
+    try:
+        return dict(st.secrets.get("notifications", {}))
+    except Exception:
+        return {}
+
+
+def render_notification_receipt(note) -> Optional[tuple]:
+    """Runs in a worker thread: completion receipt from the order snapshot stored in the outbox."""
+    order = note.payload.get("order")
+    if not order:
+        return None
+    logo_path = Path("logo.png")
+    logo = io.BytesIO(logo_path.read_bytes()) if logo_path.exists() else None
+    items = [LineItem.from_row(r) for r in note.payload.get("items", [])] or None
+    pdf = generate_completion_receipt_pdf(order, note.payload.get("company_info", {}), logo, items=items)
+    return f"Completion_{note.order_id}.pdf", pdf.getvalue()
+
+
+@st.cache_resource
+def get_notifier() -> Optional[NotificationWorker]:
+    """Outbox + worker pool shared by all sessions; None if no channel is configured."""
+    cfg = get_notification_settings()
+    senders, rates = [], {}
+    email_cfg = dict(cfg.get("email", {}))
+    if email_cfg.get("host"):
+        senders.append(SmtpSender(
+            host=email_cfg["host"],
+            port=int(email_cfg.get("port", 587)),
+            username=email_cfg.get("username", ""),
+            password=email_cfg.get("password", ""),
+            sender=email_cfg.get("sender", ""),
+            starttls=bool(email_cfg.get("starttls", True)),
+            attachment=render_notification_receipt,
+        ))
+        rates[CHANNEL_EMAIL] = float(email_cfg.get("rate_per_minute", 30))
+    sms_cfg = dict(cfg.get("sms", {}))
+    if sms_cfg.get("url"):
+        senders.append(HttpSmsSender(sms_cfg["url"], sms_cfg.get("token", ""), sms_cfg.get("sender", "")))
+        rates[CHANNEL_SMS] = float(sms_cfg.get("rate_per_minute", 10))
+    if not senders:
+        return None
+    worker = NotificationWorker(
+        Outbox(cfg.get("outbox_path", ".outbox/outbox.db"), lease_seconds=float(cfg.get("lease_seconds", 300))),
+        senders,
+        workers=int(cfg.get("workers", 2)),
+        batch_size=int(cfg.get("batch_size", 10)),
+        rate_per_minute=rates,
+        max_attempts=int(cfg.get("max_attempts", 5)),
+    )
+    worker.start()
+    return worker
+
+
+def enqueue_status_notifications(order: OrderRecord, status: str, company_info: dict, branch: str = MAIN_CODE) -> int:
+    """
+    Queue the customer messages for a status change (called after the order
+    write succeeded). Only writes to the local outbox; returns how many were queued.
+    The time of the change tells this transition apart from an earlier one of
+    the same order (or of an order that had the same id).
+    """
+    event = NOTIFY_STATUSES.get(status)
+    worker = get_notifier() if event else None
+    if worker is None:
+        return 0
+    order_id = safe_text(order.get("order_id"))
+    transition = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+    client_name = safe_text(order.get("client_name")).strip()
+    total = safe_float(order.get("total_cost"))
+    company_name = company_info.get("company_name", "")
+    company_phone = company_info.get("phone", "")
+    line_items = get_line_items(branch)
+    payload = {
+        "order": order.to_dict(),
+        "company_info": dict(company_info),
+        "items": [
+            it.to_row(order_id)
+            for it in line_items.items_for(order_id, load_printers_from_order(order))
+        ] if line_items.has_items(order_id) else [],
+    }
+    queued = 0
+    email = safe_text(order.get("client_email")).strip()
+    if CHANNEL_EMAIL in worker.senders and "@" in email:
+        queued += worker.outbox.enqueue(
+            order_id, event, CHANNEL_EMAIL, email,
+            subject=f"Comanda {order_id} este gata de ridicare",
+            body=(
+                f"Buna ziua {client_name},\n\n"
+                f"Echipamentul predat in service (comanda {order_id}) este gata de ridicare.\n"
+                f"Total de plata: {total:.2f} RON.\n"
+                f"Atasat gasiti dovada de ridicare.\n\n"
+                f"Contact: {company_phone}\n{company_name}"
+            ),
+            payload=payload,
+            transition=transition,
+        )
+    phone = normalize_phone(order.get("client_phone"))
+    if CHANNEL_SMS in worker.senders and phone:
+        queued += worker.outbox.enqueue(
+            order_id, event, CHANNEL_SMS, phone,
+            body=fold_text(
+                f"{company_name}: comanda {order_id} este gata de ridicare. "
+                f"Total {total:.2f} RON. Tel: {company_phone}"
+            ),
+            transition=transition,
+        )
+    if queued:
+        worker.wake()
+    return queued
+
+
+def render_notifications_panel():
+    """Admin panel: outbox status and manual retry of failed messages."""
+    with st.sidebar.expander("📨 Notifications", expanded=False):
+        worker = get_notifier()
+        if worker is None:
+            st.caption("No channel configured (secrets: notifications.email / notifications.sms).")
+            return
+        st.caption(f"Channels: {', '.join(worker.senders)} · outbox: {worker.outbox.path}")
+        counts = worker.outbox.counts()
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Pending", counts.get("pending", 0) + counts.get("sending", 0))
+        col2.metric("Sent", counts.get("sent", 0))
+        col3.metric("Failed", counts.get("failed", 0))
+        if counts.get("failed") and st.button("🔁 Retry failed", key="notify_retry_failed"):
+            worker.outbox.retry_failed()
+            worker.wake()
+            st.rerun()
+        recent = worker.outbox.recent(20)
+        if recent:
+            st.dataframe(pd.DataFrame(recent), hide_index=True, use_container_width=True)
+
+
+# ============================================================================
+# AUDIT LOG
+# ============================================================================
+@st.cache_resource
+def get_audit_log() -> AuditLog:
+    """Jurnalul de modificări (secrets: audit.path), comun tuturor sesiunilor."""
+    try:
+        cfg = dict(st.secrets.get("audit", {}))
+    except Exception:
+        cfg = {}
+    return AuditLog(cfg.get("path", ".audit"), block_records=int(cfg.get("block_records", 256)))
+
+
+def record_audit(action: str, order_id: str, old: Optional[dict], new: Optional[dict]):
+    """Field-level diff of one order change; a failing audit write never undoes the order write."""
+    try:
+        get_audit_log().record(
+            action, order_id, diff_fields(old, new), user=st.session_state.get("username", "")
+        )
+    except Exception as e:
+        st.sidebar.warning(f"⚠️ Audit log not written: {e}")
+
+
+# ============================================================================
+# WARM CACHE
+# ============================================================================
+@st.cache_resource
+def get_warm_cache() -> Optional[WarmCache]:
+    """Last known Orders/archive on local disk for fast cold starts (secrets: warm_cache.path, warm_cache.enabled)."""
+    try:
+        cfg = dict(st.secrets.get("warm_cache", {}))
+    except Exception:
+        cfg = {}
+    if not cfg.get("enabled", True):
+        return None
+    try:
+        return WarmCache(cfg.get("path", ".warmcache"))
+    except OSError as e:
+        st.sidebar.warning(f"⚠️ Warm cache disabled: {e}")
+        return None
+
+
+# ============================================================================
+# WRITE LOCK
+# ============================================================================
+@st.cache_resource
+def get_write_lock(branch: str) -> FileLock:
+    """
+    Lacătul de scriere al filialei (secrets: locks.path), comun sesiunilor
+    și proceselor de pe aceeași mașină (app, batch, workerii API-ului).
+    """
+    try:
+        cfg = dict(st.secrets.get("locks", {}))
+    except Exception:
+        cfg = {}
+    return FileLock(Path(cfg.get("path", ".locks")) / f"{branch}.lock")
+
+
+def holds_write_lock(method):
+    """
+    CRM method that reads a worksheet, changes it and writes it back whole:
+    runs under the branch's write lock, so no other session or process
+    writes the sheet between its read and its write.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.write_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+# ============================================================================
+# INDEX MAINTENANCE
+# ============================================================================
+def on_orders_written(rows: pd.DataFrame, branch: str = MAIN_CODE):
+    """Keep the in-process indexes of the branch in step with rows its CRM just wrote."""
+    get_client_registry(branch).refresh(rows)
+    get_equipment_registry(branch).refresh(rows, load_printers_from_order)
+    get_work_queue(branch).refresh(rows, load_printers_from_order)
+
+
+def on_order_deleted(order_id: str, branch: str = MAIN_CODE):
+    get_client_registry(branch).remove_order(order_id)
+    get_equipment_registry(branch).remove_order(order_id)
+    get_work_queue(branch).remove_order(order_id)
+
+
+# ============================================================================
+# CRM CLASS - GOOGLE SHEETS BACKEND
+# ============================================================================
+class PrinterServiceCRM:
+    def __init__(
+        self,
+        conn: GSheetsConnection,
+        archive_worksheet: Optional[str] = None,
+        parts_worksheet: Optional[str] = None,
+        ledger_worksheet: Optional[str] = None,
+        items_worksheet: Optional[str] = None,
+        attachments_worksheet: Optional[str] = None,
+        warm_cache: Optional[WarmCache] = None,
+        branch: Branch = DEFAULT_BRANCH,
+        schema_worksheet: Optional[str] = None,
+    ):
+        self.conn = conn
+        # fiecare filială are foile ei (Orders_CLJ, ...) și prefixul ei de comandă
+        self.branch = branch
+        self.order_prefix = branch.prefix
+        self.worksheet = branch.worksheet("Orders")
+        self.archive_worksheet = archive_worksheet or branch.worksheet("Orders_Archive")
+        self.parts_worksheet = parts_worksheet or branch.worksheet("Parts")
+        self.ledger_worksheet = ledger_worksheet or branch.worksheet("Stock_Ledger")
+        self.items_worksheet = items_worksheet or branch.worksheet("Order_Items")
+        self.attachments_worksheet = attachments_worksheet or branch.worksheet("Order_Attachments")
+        # versiunea de schemă a fiecărei foi (vezi migrations)
+        self.schema_worksheet = schema_worksheet or branch.worksheet("Schema")
+        self.write_lock = get_write_lock(branch.code)
+        self.next_order_id = 1
+        self.warm_cache = warm_cache
+        # worksheet → cadrul salvat local, servit până termină sincronizarea din fundal
+        self._warm = None
+        self.warm_saved_at = ""
+        # citirile deja făcute în paralel la pornire (vezi reading_from)
+        self._snapshot = None
+        # citirile din fundal s-au terminat; _init_pending: au găsit scrieri de făcut (antet, migrări)
+        self._synced = threading.Event()
+        self._init_pending = False
+        if warm_cache is not None and self._start_warm():
+            threading.Thread(target=self._reconcile, name="crm-warm-sync", daemon=True).start()
+        else:
+            self._init_sheet()
+            if warm_cache is not None:
+                warm_cache.save_later(self.worksheet, self._read_df(raw=True, ttl=60, quiet=True))
+
+    # ------------------------------------------------------------------ warm cache
+    def _start_warm(self) -> bool:
+        """Serve the locally cached Orders (and archive) until the background sync is done."""
+        cached = self.warm_cache.load(self.worksheet)
+        if cached is None:
+            return False
+        frames = {self.worksheet: cached[0]}
+        archived = self.warm_cache.load(self.archive_worksheet)
+        if archived is not None:
+            frames[self.archive_worksheet] = archived[0]
+        self._warm = frames
+        self.warm_saved_at = cached[1]
+        return True
+
+    @property
+    def serving_warm(self) -> bool:
+        return self._warm is not None
+
+    def _reconcile(self):
+        """
+        Background thread: the reads of a cold start, nothing else. It has no
+        ScriptRunContext (st.sidebar would be lost) and must not write sheets
+        the sessions write, so if the sheets need a header or migrations it
+        only says so; finish_warm_start() does that work on the script thread.
+        """
+        try:
+            df = self._read_df(raw=True, ttl=0, quiet=True)
+            schema_df = self._read_df(raw=True, ttl=0, worksheet=self.schema_worksheet, quiet=True)
+            versions = read_versions(schema_df)
+            if df is None or df.empty or "order_id" not in df.columns or ORDER_SCHEMA.pending(
+                    versions.get(self.worksheet, 0)):
+                self._init_pending = True
+                return
+            behind = versions.get(self.archive_worksheet, 0) < ORDER_SCHEMA.version
+            if behind and self._read_archive_df(ttl=0, warm=False) is not None:
+                self._init_pending = True
+                return
+            self.warm_cache.save(self.worksheet, df)
+            self.warm_cache.save(self.archive_worksheet, self._read_archive_df(warm=False))
+            # citirea cu TTL încălzește și cache-ul conexiunii, ca prima randare după sincronizare să nu aștepte
+            self._read_df(raw=True, ttl=60, quiet=True, warm=False)
+        except Exception:
+            self._init_pending = True
+        finally:
+            self._synced.set()
+
+    def finish_warm_start(self) -> bool:
+        """
+        Called by every rerun while serving the warm cache. Once the background
+        reads are done: the header/migration writes they asked for run here,
+        on the script thread and under the write lock (errors show in this
+        rerun's sidebar), then the cached frames are dropped. True once in sync.
+        """
+        if self._warm is None:
+            return True
+        if not self._synced.is_set():
+            return False
+        with self.write_lock:
+            if self._warm is None:
+                return True
+            if self._init_pending:
+                self._init_sheet()
+                self.warm_cache.save_later(self.worksheet, self._read_df(raw=True, ttl=60, quiet=True, warm=False))
+                self.warm_cache.save_later(self.archive_worksheet, self._read_archive_df(warm=False))
+                self._init_pending = False
+            self._warm = None
+        return True
+
+    # ------------------------------------------------------------------ reads
+    def _fetch(self, worksheet: str, ttl: int = 0, warm: bool = True) -> Optional[pd.DataFrame]:
+        """One worksheet as the connection returns it; raises on Sheets errors."""
+        frames = self._warm
+        if warm and ttl and frames is not None and worksheet in frames:
+            return frames[worksheet].copy()
+        with span("sheets.read", worksheet=worksheet, ttl=ttl):
+            return self.conn.read(
+                worksheet=worksheet,
+                ttl=ttl
+            )
+
+    def load_snapshot(self, requests: dict, timeout: Optional[float] = DEFAULT_TIMEOUT,
+                      workers: int = DEFAULT_WORKERS) -> SheetSnapshot:
+        """Read several worksheets (worksheet → ttl) side by side; see sheetloader."""
+        return load_sheets(self._fetch, requests, timeout=timeout, workers=workers)
+
+    @contextmanager
+    def reading_from(self, snapshot: Optional[SheetSnapshot]):
+        """
+        Within the block, reads of a worksheet the snapshot holds (same ttl)
+        are served from it instead of going to Sheets again. Only for
+        building indexes: nothing inside the block may write.
+        """
+        self._snapshot = snapshot
+        try:
+            yield self
+        finally:
+            self._snapshot = None
+
+    def _read_df(
+        self,
+        raw: bool = True,
+        ttl: int = 0,
+        worksheet: Optional[str] = None,
+        quiet: bool = False,
+        warm: bool = True,
+    ) -> Optional[pd.DataFrame]:
+        """
+        Read Google Sheets into DataFrame safely. Reads with a TTL may come
+        from the warm cache, reads inside reading_from() from the snapshot.
+        """
+        try:
+            df = self._read_raw(worksheet or self.worksheet, ttl, warm)
+            if df is None:
+                return None
+            if raw:
+                return df
+            return compact_orders_df(df)
+        except Exception as e:
+            if not quiet:
+                st.sidebar.error(f"❌ Error reading Google Sheets: {e}")
+            return None
+
+    def _read_raw(self, worksheet: str, ttl: int = 0, warm: bool = True) -> Optional[pd.DataFrame]:
+        """One worksheet, from the snapshot if it holds it; raises on Sheets errors."""
+        snapshot = self._snapshot
+        read = snapshot.get(worksheet) if snapshot is not None else None
+        if read is not None and warm and read.ttl == ttl and not read.timed_out:
+            if read.error:
+                raise RuntimeError(read.error)
+            return None if read.df is None else read.df.copy(deep=False)
+        return self._fetch(worksheet, ttl, warm)
+
+    def _read_existing(self, worksheet: str, key: str, ttl: int = 0, warm: bool = True) -> Optional[pd.DataFrame]:
+        """
+        A worksheet a write is about to replace, or an index is built from:
+        an empty frame if it does not exist yet (or has no `key` column),
+        None if it could not be read. A failed read is never taken for an
+        empty worksheet, so the caller can refuse to write over it.
+        """
+        try:
+            df = self._read_raw(worksheet, ttl, warm)
+        except Exception as e:
+            if not is_missing_worksheet(e):
+                st.sidebar.error(f"❌ Error reading {worksheet}: {e}")
+                return None
+            df = None
+        if df is None or df.empty or key not in df.columns:
+            return pd.DataFrame()
+        return df
+
+    def _write_df(self, df: pd.DataFrame, allow_empty: bool = False, worksheet: Optional[str] = None) -> bool:
+        """Write entire DataFrame to Sheets. Prevents accidental data loss."""
+        worksheet = worksheet or self.worksheet
+        try:
+            if df is None:
+                st.sidebar.error("❌ Tried to write None DataFrame to Sheets.")
+                return False
+            if df.empty and not allow_empty:
+                st.sidebar.error("⚠️ Refusing to write empty DataFrame to prevent data loss.")
+                return False
+            with span("sheets.write", worksheet=worksheet, rows=len(df)):
+                self.conn.update(worksheet=worksheet, data=df)
+            if self.warm_cache is not None and worksheet in (self.worksheet, self.archive_worksheet):
+                self.warm_cache.save_later(worksheet, df)
+            st.sidebar.success("💾 Saved to Google Sheets!")
+            return True
+        except Exception as e:
+            st.sidebar.error(f"❌ Error saving to Google Sheets: {e}")
+            return False
+
+    def _read_archive_df(self, ttl: int = 600, warm: bool = True) -> Optional[pd.DataFrame]:
+        """Read the archive tier (None if the worksheet does not exist yet)."""
+        df = self._read_df(raw=True, ttl=ttl, worksheet=self.archive_worksheet, quiet=True, warm=warm)
+        if df is None or df.empty or "order_id" not in df.columns:
+            return None
+        return df
+
+    def _order_numbers(self, order_ids) -> list:
+        numbers = []
+        for oid in order_ids:
+            try:
+                if isinstance(oid, str) and oid.startswith(self.order_prefix):
+                    numbers.append(int(oid[len(self.order_prefix):]))
+            except Exception:
+                continue
+        return numbers
+
+    @traced("crm.compute_next_order_id")
+    def _compute_next_order_id(self) -> int:
+        """
+        Compute next available order ID with fill-the-gap logic.
+        Archived orders still own their numbers, so they are never reused.
+        """
+        existing = []
+        df = self._read_df(raw=True, ttl=0)
+        if df is not None and not df.empty and "order_id" in df.columns:
+            existing.extend(self._order_numbers(df["order_id"]))
+        # Arhiva se schimbă rar → citire din cache (archive_completed_orders golește cache-ul);
+        # niciodată din warm cache: o arhivă veche ar putea refolosi numere
+        archived = self._read_archive_df(warm=False)
+        if archived is not None:
+            existing.extend(self._order_numbers(archived["order_id"]))
+
+        if not existing:
+            return 1
+
+        existing_set = set(existing)
+        highest = max(existing_set)
+        missing = None
+        for i in range(1, highest + 1):
+            if i not in existing_set:
+                missing = i
+                break
+
+        return missing if missing else highest + 1
+
+    @holds_write_lock
+    def _init_sheet(self):
+        """Bring the order sheets to the current schema and compute next_order_id with fill-the-gap logic."""
+        df = self._read_df(raw=True, ttl=0)
+        schema_df = self._read_df(raw=True, ttl=0, worksheet=self.schema_worksheet, quiet=True)
+        versions = read_versions(schema_df)
+
+        # CASE 1/2 — Sheet missing, empty or without an order_id header → new sheet at the current schema
+        if df is None or df.empty or "order_id" not in df.columns:
+            if self._write_df(pd.DataFrame(columns=ORDER_COLUMNS), allow_empty=False):
+                self._record_schema_version(schema_df, self.worksheet, ORDER_SCHEMA.version, 0)
+            self.next_order_id = 1
+            return
+
+        # CASE 3 — Pending migrations of the live sheet, then of the archive (only read if behind)
+        schema_df = self._migrate(self.worksheet, df, versions, schema_df)
+        del df
+        if versions.get(self.archive_worksheet, 0) < ORDER_SCHEMA.version:
+            archived = self._read_archive_df(ttl=0, warm=False)
+            if archived is not None:
+                self._migrate(self.archive_worksheet, archived, versions, schema_df)
+
+        # CASE 4 — Compute next order ID
+        self.next_order_id = self._compute_next_order_id()
+
+    # ------------------------------------------------------------------ schema
+    def _migrate(self, worksheet: str, df: pd.DataFrame, versions: dict,
+                 schema_df: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+        """
+        Run the order migrations the worksheet has not had yet, chunk by
+        chunk, and record its new version; returns the Schema frame as it
+        is now. In row ranges where the connection can write them and no
+        step drops a column, otherwise one write of the whole sheet.
+        """
+        steps = ORDER_SCHEMA.pending(versions.get(worksheet, 0))
+        if not steps:
+            return schema_df
+        rows = GSpreadRows.for_connection(self.conn)
+        if rows is not None and not any(step.drops for step in steps):
+            writer = RangeWriter(rows, worksheet)
+        else:
+            writer = SheetWriter(lambda frame: self._write_df(frame, worksheet=worksheet))
+        chunk_rows = int(get_migration_settings().get("chunk_rows", CHUNK_ROWS))
+        try:
+            with span("crm.migrate", worksheet=worksheet, steps=len(steps), rows=len(df)):
+                written = migrate_frame(df, steps, writer, ORDER_SCHEMA.key, chunk_rows)
+        except Exception as e:
+            # versiunea rămâne cea veche: la următoarea pornire migrarea se reia (pașii sunt idempotenți)
+            st.sidebar.error(f"❌ Migration of {worksheet} to v{steps[-1].version} failed: {e}")
+            return schema_df
+        if written and isinstance(writer, RangeWriter):
+            st.sidebar.success(f"💾 {worksheet} migrated to v{steps[-1].version} ({written} rows)")
+        versions[worksheet] = steps[-1].version
+        return self._record_schema_version(schema_df, worksheet, steps[-1].version, len(df))
+
+    def _record_schema_version(self, schema_df: Optional[pd.DataFrame], worksheet: str,
+                               version: Optional[int], rows: int = 0) -> Optional[pd.DataFrame]:
+        """Write the worksheet's version to the Schema worksheet (None forgets it); never raises."""
+        updated = with_version(schema_df, worksheet, version, rows)
+        try:
+            with span("sheets.write", worksheet=self.schema_worksheet, rows=len(updated)):
+                try:
+                    self.conn.update(worksheet=self.schema_worksheet, data=updated)
+                except Exception:
+                    # foaia Schema nu există încă
+                    if not hasattr(self.conn, "create"):
+                        raise
+                    self.conn.create(worksheet=self.schema_worksheet, data=updated)
+            return updated
+        except Exception as e:
+            st.sidebar.warning(f"⚠️ Schema version of {worksheet} not recorded ({e}); checked again on the next start")
+            return schema_df
+
+    def forget_schema_version(self, worksheet: str):
+        """After a restore: the sheet may be at an older schema, so the next start migrates it again."""
+        schema_df = self._read_df(raw=True, ttl=0, worksheet=self.schema_worksheet, quiet=True)
+        if worksheet in read_versions(schema_df):
+            self._record_schema_version(schema_df, worksheet, None)
+
+    @holds_write_lock
+    def create_service_order(
+        self,
+        client_name,
+        client_phone,
+        client_email,
+        printers_list,
+        issue_description,
+        accessories,
+        notes,
+        date_received,
+        date_pickup
+    ):
+        # Recalculate next_order_id from current sheet state
+        next_id = self._compute_next_order_id()
+        order_id = f"{self.order_prefix}{next_id:05d}"
+
+        # First printer for legacy columns
+        first_brand = ""
+        first_model = ""
+        first_serial = ""
+
+        if printers_list:
+            first_brand = safe_text(printers_list[0].get("brand", ""))
+            first_model = safe_text(printers_list[0].get("model", ""))
+            first_serial = safe_text(printers_list[0].get("serial", ""))
+
+        printers_json = json.dumps(printers_list, ensure_ascii=False)
+
+        def to_date_str(d):
+            if isinstance(d, date):
+                return d.strftime("%Y-%m-%d")
+            if isinstance(d, str) and d.strip():
+                return d
+            return ""
+
+        new_order = pd.DataFrame([{
+            "order_id": order_id,
+            "client_name": client_name,
+            "client_phone": client_phone,
+            "client_email": client_email,
+            "printer_brand": first_brand,
+            "printer_model": first_model,
+            "printer_serial": first_serial,
+            "printers_json": printers_json,
+            "issue_description": issue_description,
+            "accessories": accessories,
+            "notes": notes,
+            "date_received": to_date_str(date_received),
+            "date_pickup_scheduled": to_date_str(date_pickup),
+            "date_completed": "",
+            "date_picked_up": "",
+            "status": "Received",
+            "technician": "",
+            "repair_details": "",
+            "parts_used": "",
+            "labor_cost": 0.0,
+            "parts_cost": 0.0,
+            "total_cost": 0.0,
+            "client_id": client_id_for_phone(client_phone),
+        }])
+
+        df = self._read_df(raw=True, ttl=0)
+        updated_df = pd.concat([df, new_order], ignore_index=True) if df is not None and not df.empty else new_order
+
+        if self._write_df(updated_df):
+            on_orders_written(new_order, self.branch.code)
+            record_audit(ACTION_CREATE, order_id, None, new_order.iloc[0].to_dict())
+            return order_id
+        return None
+
+    @traced("crm.list_orders_df")
+    def list_orders_df(self, include_archive: bool = False) -> pd.DataFrame:
+        if not include_archive:
+            df = self._read_df(raw=False, ttl=60)
+            return df if df is not None else pd.DataFrame()
+
+        live = self._read_df(raw=True, ttl=60)
+        archived = self._read_archive_df()
+        frames = [f for f in (live, archived) if f is not None and not f.empty]
+        if not frames:
+            return pd.DataFrame()
+        return compact_orders_df(pd.concat(frames, ignore_index=True))
+
+    def _locate_order(self, order_id: str):
+        """
+        Find the tier holding order_id: returns (df, mask, worksheet) from the
+        live sheet, or from the archive if it is not live. (None, None, None) if missing.
+        """
+        df = self._read_df(raw=True, ttl=0)
+        if df is not None and not df.empty and "order_id" in df.columns:
+            mask = df["order_id"] == order_id
+            if mask.any():
+                return df, mask, self.worksheet
+        archived = self._read_archive_df(ttl=0)
+        if archived is not None:
+            mask = archived["order_id"] == order_id
+            if mask.any():
+                return archived, mask, self.archive_worksheet
+        return None, None, None
+
+    def get_order(self, order_id: str) -> Optional[OrderRecord]:
+        """Single order from either tier."""
+        df, mask, _ = self._locate_order(order_id)
+        if df is None:
+            return None
+        return OrderRecord.from_df(df[mask], order_id)
+
+    @holds_write_lock
+    def update_order(self, order_id: str, **kwargs) -> bool:
+        """Update ONLY the matching row, write back entire DataFrame (live or archive tier)."""
+        df, mask, worksheet = self._locate_order(order_id)
+        if df is None:
+            st.sidebar.error(f"❌ Order {order_id} not found in sheet.")
+            return False
+        old_row = df.loc[mask].iloc[0].to_dict()
+        old_status = safe_text(old_row.get("status"))
+
+        for key, value in kwargs.items():
+            if key in df.columns:
+                df.loc[mask, key] = value
+
+        if "labor_cost" in df.columns and "parts_cost" in df.columns:
+            labor = pd.to_numeric(df.loc[mask, "labor_cost"], errors="coerce").fillna(0)
+            parts = pd.to_numeric(df.loc[mask, "parts_cost"], errors="coerce").fillna(0)
+            df.loc[mask, "total_cost"] = labor + parts
+
+        if not self._write_df(df, worksheet=worksheet):
+            return False
+        on_orders_written(df[mask], self.branch.code)
+        record_audit(ACTION_UPDATE, order_id, old_row, df.loc[mask].iloc[0].to_dict())
+        new_status = kwargs.get("status")
+        if new_status and new_status != old_status:
+            enqueue_status_notifications(
+                OrderRecord.from_df(df[mask], order_id), new_status, st.session_state.get("company_info", {}),
+                self.branch.code,
+            )
+        return True
+
+    @holds_write_lock
+    def delete_order(self, order_id: str) -> bool:
+        """Delete an order from the sheet (live or archive tier)."""
+        df, mask, worksheet = self._locate_order(order_id)
+        if df is None:
+            st.sidebar.error(f"❌ Order {order_id} not found in sheet.")
+            return False
+
+        df_deleted = df[~mask]
+        # Allow writing even if the sheet becomes empty after deletion
+        if not self._write_df(df_deleted, allow_empty=True, worksheet=worksheet):
+            return False
+        on_order_deleted(order_id, self.branch.code)
+        record_audit(ACTION_DELETE, order_id, df.loc[mask].iloc[0].to_dict(), None)
+        if get_inventory(self.branch.code).order_parts(order_id):
+            # piesele comenzii șterse se întorc pe stoc
+            self.set_order_parts(order_id, {})
+        if get_line_items(self.branch.code).has_items(order_id):
+            self.save_order_items(order_id, [])
+        if get_attachment_index(self.branch.code).count(order_id):
+            self.delete_attachments(order_id)
+        return True
+
+    @holds_write_lock
+    def commit_bulk(self, old_df: pd.DataFrame, new_df: pd.DataFrame, changed: pd.Series) -> bool:
+        """
+        Write a live-sheet frame changed by a bulk operation in ONE Sheets write,
+        then update the indexes, audit every changed row and queue the customer
+        notifications of the status changes (as update_order does).
+        """
+        if not changed.any():
+            return True
+        if not self._write_df(new_df):
+            return False
+        rows = new_df[changed]
+        on_orders_written(rows, self.branch.code)
+        company_info = st.session_state.get("company_info", {})
+        for old, new in zip(old_df[changed].to_dict("records"), rows.to_dict("records")):
+            record_audit(ACTION_UPDATE, safe_text(new.get("order_id")), old, new)
+            new_status = safe_text(new.get("status"))
+            if new_status and new_status != safe_text(old.get("status")):
+                enqueue_status_notifications(OrderRecord(new), new_status, company_info, self.branch.code)
+        return True
+
+    # ------------------------------------------------------------------ parts
+    def read_parts_df(self, ttl: int = 0) -> Optional[pd.DataFrame]:
+        """Parts catalog (empty if the worksheet does not exist yet, None if the read failed)."""
+        return self._read_existing(self.parts_worksheet, "sku", ttl)
+
+    def read_ledger_df(self, ttl: int = 0) -> Optional[pd.DataFrame]:
+        """Stock movements (empty if the worksheet does not exist yet, None if the read failed)."""
+        return self._read_existing(self.ledger_worksheet, "sku", ttl)
+
+    @holds_write_lock
+    def save_part(self, sku: str, name: str, unit_price: float, reorder_level: int) -> bool:
+        """Add or replace a catalog row, then update the in-memory catalog."""
+        sku = normalize_sku(sku)
+        if not sku:
+            return False
+        name = safe_text(name).strip() or sku
+        row = pd.DataFrame([{
+            "sku": sku,
+            "name": name,
+            "unit_price": float(unit_price),
+            "reorder_level": int(reorder_level),
+        }])
+        df = self.read_parts_df()
+        if df is None:
+            return False
+        if not df.empty:
+            df = pd.concat([df[df["sku"].map(normalize_sku) != sku], row], ignore_index=True)
+        else:
+            df = row
+        if not self._write_df(df, worksheet=self.parts_worksheet):
+            return False
+        get_inventory(self.branch.code).upsert_part(sku, name, unit_price, reorder_level)
+        return True
+
+    def catch_up_ledger(self) -> Optional[pd.DataFrame]:
+        """
+        Read the ledger and apply to the running totals the rows other
+        processes (API, batch) appended since this one last saw it. Call it
+        under the write lock before computing movements from the totals.
+        Returns the ledger (None if the read failed).
+        """
+        df = self.read_ledger_df()
+        if df is not None:
+            get_inventory(self.branch.code).catch_up(df)
+        return df
+
+    @holds_write_lock
+    def append_ledger(self, entries: list) -> bool:
+        """Append stock movements to the ledger worksheet and to the running totals."""
+        if not entries:
+            return True
+        new_rows = pd.DataFrame(entries)
+        df = self.catch_up_ledger()
+        if df is None:
+            return False
+        df = pd.concat([df, new_rows], ignore_index=True) if not df.empty else new_rows
+        if not self._write_df(df, worksheet=self.ledger_worksheet):
+            return False
+        get_inventory(self.branch.code).apply(entries)
+        return True
+
+    def receive_stock(self, sku: str, qty: int, note: str = "") -> bool:
+        part = get_inventory(self.branch.code).get(sku)
+        return self.append_ledger([{
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "sku": part.sku if part else sku,
+            "qty_delta": int(qty),
+            "unit_price": part.unit_price if part else 0.0,
+            "order_id": "",
+            "kind": KIND_RECEIVE,
+            "note": note,
+        }])
+
+    def order_parts_entries(self, order_id: str, wanted: dict) -> Optional[list]:
+        """
+        The ledger entries that set the order's stock parts to `wanted`
+        ({sku: quantity}), computed from the caught-up ledger (None if it
+        could not be read). Hold the write lock until they are appended.
+        """
+        if self.catch_up_ledger() is None:
+            return None
+        return get_inventory(self.branch.code).entries_for_order(order_id, wanted)
+
+    @holds_write_lock
+    def set_order_parts(self, order_id: str, wanted: dict) -> Optional[float]:
+        """
+        Record the stock parts used on an order ({sku: quantity}); only the
+        difference from what the order already has goes into the ledger.
+        Returns the order's stock parts cost, or None if the ledger write failed.
+        """
+        entries = self.order_parts_entries(order_id, wanted)
+        if entries is None or not self.append_ledger(entries):
+            return None
+        return get_inventory(self.branch.code).order_cost(order_id)
+
+    # ------------------------------------------------------------------ line items
+    def read_items_df(self, ttl: int = 0) -> Optional[pd.DataFrame]:
+        """Per-printer line items (empty if the worksheet does not exist yet, None if the read failed)."""
+        return self._read_existing(self.items_worksheet, "order_id", ttl)
+
+    @holds_write_lock
+    def save_order_items(self, order_id: str, items: list) -> bool:
+        """Replace the order's rows in the child worksheet (an empty list removes them)."""
+        df = self.read_items_df()
+        if df is None:
+            return False
+        rows = pd.DataFrame([it.to_row(order_id) for it in items], columns=ITEM_COLUMNS)
+        if not df.empty:
+            df = pd.concat([df[df["order_id"] != order_id], rows], ignore_index=True)
+        else:
+            df = rows
+        if not self._write_df(df, allow_empty=True, worksheet=self.items_worksheet):
+            return False
+        get_line_items(self.branch.code).set_order(order_id, items)
+        return True
+
+    # ------------------------------------------------------------------ attachments
+    def read_attachments_df(self, ttl: int = 0) -> Optional[pd.DataFrame]:
+        """Attachment references (empty if the worksheet does not exist yet, None if the read failed)."""
+        return self._read_existing(self.attachments_worksheet, "attachment_id", ttl)
+
+    @holds_write_lock
+    def add_attachments(self, order_id: str, files: list, line_no: Optional[int] = None) -> Optional[list]:
+        """
+        Store (file name, mime, bytes) files in the blob store and append one
+        reference row each. Returns the new Attachments, None on failure.
+        """
+        max_bytes = float(get_attachment_settings().get("max_mb", 20)) * 1024 * 1024
+        too_big = [name for name, _, data in files if len(data) > max_bytes]
+        if too_big:
+            st.sidebar.error(f"❌ Too large (max {max_bytes / 1024 / 1024:.0f} MB): {', '.join(too_big)}")
+            return None
+        df = self.read_attachments_df()
+        if df is None:
+            return None
+        store = get_blob_store()
+        user = st.session_state.get("username", "")
+        added = []
+        for name, mime, data in files:
+            digest, _ = store.put(data, image=mime.startswith("image/"))
+            added.append(Attachment.new(order_id, line_no, digest, name, mime, len(data), user))
+        rows = pd.DataFrame([a.to_row() for a in added], columns=ATTACHMENT_COLUMNS)
+        df = rows if df.empty else pd.concat([df, rows], ignore_index=True)
+        if not self._write_df(df, worksheet=self.attachments_worksheet):
+            return None
+        get_attachment_index(self.branch.code).add(added)
+        return added
+
+    @holds_write_lock
+    def delete_attachments(self, order_id: str, attachment_ids: Optional[set] = None) -> bool:
+        """
+        Remove the given attachments of an order (all of them if ids is None);
+        blobs no branch refers to any more are deleted.
+        """
+        df = self.read_attachments_df()
+        if df is None:
+            return False
+        if df.empty:
+            return True
+        ids = df["attachment_id"].astype(str)
+        mask = df["order_id"].astype(str) == order_id
+        if attachment_ids is not None:
+            mask &= ids.isin(attachment_ids)
+        if not mask.any():
+            return True
+        if not self._write_df(df[~mask], allow_empty=True, worksheet=self.attachments_worksheet):
+            return False
+        store = get_blob_store()
+        orphaned = get_attachment_index(self.branch.code).remove(set(ids[mask]))
+        shared = blobs_in_use(self, orphaned) if orphaned else set()
+        for digest in orphaned:
+            if digest not in shared:
+                store.remove(digest)
+        return True
+
+    def archivable_mask(self, df: pd.DataFrame, min_age_days: int, today: Optional[date] = None) -> pd.Series:
+        """
+        Completed orders older than min_age_days. Age is counted from the pickup
+        date, falling back to date_completed, then date_received.
+        """
+        if df is None or df.empty or "status" not in df.columns:
+            return pd.Series(False, index=df.index if df is not None else None, dtype=bool)
+        ref = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+        for col in ("date_picked_up", "date_completed", "date_received"):
+            if col in df.columns:
+                ref = ref.fillna(pd.to_datetime(df[col], errors="coerce", format="%Y-%m-%d"))
+        cutoff = pd.Timestamp(today or date.today()) - pd.Timedelta(days=min_age_days)
+        return (df["status"] == "Completed") & ref.notna() & (ref < cutoff)
+
+    @holds_write_lock
+    def archive_completed_orders(self, min_age_days: int, today: Optional[date] = None) -> int:
+        """
+        Move old completed orders from the live sheet to the archive worksheet.
+        The archive is written first, so a failed write can only duplicate
+        rows; if the archive cannot be read, nothing is written (writing
+        back only the moved rows would replace it).
+        Returns the number of archived orders (0 if nothing to do, -1 on error).
+        """
+        df = self._read_df(raw=True, ttl=0)
+        if df is None or df.empty or "order_id" not in df.columns:
+            return 0
+        mask = self.archivable_mask(df, min_age_days, today)
+        if not mask.any():
+            return 0
+
+        archived = self._read_existing(self.archive_worksheet, "order_id", ttl=0, warm=False)
+        if archived is None:
+            return -1
+        moving = df[mask]
+        if not archived.empty:
+            combined = pd.concat([archived, moving], ignore_index=True)
+            combined = combined.drop_duplicates(subset="order_id", keep="last")
+        else:
+            combined = moving.reset_index(drop=True)
+
+        if not self._write_df(combined, worksheet=self.archive_worksheet):
+            return -1
+        if not self._write_df(df[~mask], allow_empty=True):
+            return -1
+        # Alte sesiuni citesc arhiva din cache (ttl) → forțăm recitirea
+        st.cache_data.clear()
+        return int(mask.sum())
+
+
+
+# ============================================================================
+# BRANCHES
+# ============================================================================
+@st.cache_resource
+def get_branches() -> dict:
+    """code → Branch from secrets [branches]; a single "main" branch (Orders, SRV-) without it."""
+    try:
+        cfg = {code: dict(spec) for code, spec in st.secrets.get("branches", {}).items()}
+    except Exception:
+        cfg = {}
+    try:
+        return parse_branches(cfg)
+    except ValueError as e:
+        st.sidebar.error(f"❌ Branch configuration: {e}")
+        return parse_branches(None)
+
+
+def current_branch() -> Branch:
+    branches = get_branches()
+    return branches.get(st.session_state.get("branch"), next(iter(branches.values())))
+
+
+def order_branch(order_id: str) -> str:
+    """Code of the branch that owns an order id (by its prefix); main for an unknown prefix."""
+    branch = branch_for_order(order_id, get_branches())
+    return branch.code if branch is not None else MAIN_CODE
+
+
+def branch_crm(conn, code: str) -> PrinterServiceCRM:
+    """The session's CRM for one branch, created on first use; it reads and writes only that branch's shard."""
+    crms = st.session_state.setdefault("branch_crms", {})
+    if code not in crms:
+        crms[code] = PrinterServiceCRM(conn, warm_cache=get_warm_cache(), branch=get_branches()[code])
+    return crms[code]
+
+
+def reset_order_selection():
+    """The open order belongs to the previous branch: forget it (callback)."""
+    for key in ("selected_order_for_update", "previous_selected_order", "update_order_select"):
+        st.session_state.pop(key, None)
+
+
+def render_branch_selector():
+    branches = get_branches()
+    if len(branches) < 2:
+        return
+    st.selectbox(
+        "🏢 Branch",
+        list(branches),
+        format_func=lambda code: branches[code].label,
+        key="branch",
+        on_change=reset_order_selection,
+    )
+
+
+@traced("crm.list_all_branches")
+def list_all_branches_df(conn, include_archive: bool = False) -> pd.DataFrame:
+    """
+    Orders of every branch, read in parallel (one worker per shard) and
+    merged with a "branch" column. The CRMs are created here, on the script
+    thread; the workers only read.
+    """
+    crms = [branch_crm(conn, code) for code in get_branches()]
+    frames = fan_out(lambda crm: crm.list_orders_df(include_archive=include_archive), crms)
+    return merge_branch_frames({crm.branch.code: df for crm, df in zip(crms, frames)})
+
+
+# ============================================================================
+# STARTUP LOAD
+# ============================================================================
+def startup_reads(crm) -> dict:
+    """
+    worksheet → ttl of the reads a rerun needs: the live orders always, the
+    archive and child worksheets only until the branch's indexes are loaded.
+    The ttls are the ones the sync_* functions read with.
+    """
+    code = crm.branch.code
+    reads = {crm.worksheet: 60}
+    if not (get_client_registry(code).history_loaded and get_equipment_registry(code).history_loaded):
+        reads[crm.archive_worksheet] = 600
+    if not get_inventory(code).loaded:
+        reads[crm.parts_worksheet] = 0
+        reads[crm.ledger_worksheet] = 0
+    if not get_line_items(code).loaded:
+        reads[crm.items_worksheet] = 0
+    if not get_attachment_index(code).loaded:
+        reads[crm.attachments_worksheet] = 0
+    return reads
+
+
+@traced("crm.load_startup")
+def load_indexes(crm, timeout: Optional[float] = None, workers: Optional[int] = None) -> tuple:
+    """
+    Read what the indexes still need in parallel, then build them from that
+    one snapshot. An index whose worksheet timed out is skipped and tried
+    again on the next rerun. timeout/workers default to the loader secrets
+    (timeout 0 = wait for every read). Returns (live orders, snapshot).
+    """
+    cfg = get_loader_settings()
+    if timeout is None:
+        timeout = float(cfg.get("timeout", DEFAULT_TIMEOUT))
+    snapshot = crm.load_snapshot(
+        startup_reads(crm),
+        timeout=timeout or None,
+        workers=workers or int(cfg.get("workers", DEFAULT_WORKERS)),
+    )
+    with crm.reading_from(snapshot):
+        df_live = crm.list_orders_df()
+        if snapshot.usable(crm.archive_worksheet):
+            sync_client_registry(crm, df_live)
+            sync_equipment_registry(crm, df_live)
+        if snapshot.usable(crm.parts_worksheet, crm.ledger_worksheet):
+            sync_inventory(crm)
+        if snapshot.usable(crm.items_worksheet):
+            sync_line_items(crm)
+        if snapshot.usable(crm.attachments_worksheet):
+            sync_attachments(crm)
+    return df_live, snapshot
+
+
+# ============================================================================
+# PERFORMANCE TRACING
+# ============================================================================
+TAB_SPAN_NAMES = ["tab.new_order", "tab.all_orders", "tab.update_order", "tab.reports", "tab.work_queue"]
+
+
+def get_trace_sample_rate() -> float:
+    """Fracțiunea de rerun-uri trasate (secrets: tracing.sample_rate, implicit 0)."""
+    try:
+        return float(st.secrets.get("tracing", {}).get("sample_rate", 0.0))
+    except Exception:
+        return 0.0
+
+
+def get_trace_buffer() -> TraceBuffer:
+    if "trace_buffer" not in st.session_state:
+        st.session_state["trace_buffer"] = TraceBuffer(maxlen=50)
+    return st.session_state["trace_buffer"]
+
+
+def render_performance_panel():
+    """Admin sidebar panel with timings of the last traced reruns."""
+    buffer = get_trace_buffer()
+    with st.expander("⏱️ Performance", expanded=False):
+        st.checkbox(
+            "Trace this session",
+            key="trace_this_session",
+            help="Trace every rerun of this session, regardless of the sample rate.",
+        )
+        st.caption(f"Sample rate: {get_trace_sample_rate():.0%} of reruns")
+
+        if st.button("🧮 Measure order memory", key="measure_memory_btn") and "crm" in st.session_state:
+            raw_df = st.session_state["crm"]._read_df(raw=True, ttl=60)
+            if raw_df is not None:
+                report = orders_memory_report(raw_df)
+                st.caption(
+                    f"{report['rows']} orders · per 10k orders: "
+                    f"raw {report['raw_per_10k'] / 1e6:.1f} MB → compact {report['compact_per_10k'] / 1e6:.1f} MB"
+                )
+
+        last = buffer.last()
+        if last is None:
+            st.info("No traced reruns yet.")
+            return
+
+        st.metric("⏱️ Last rerun", f"{last.duration_ms:.0f} ms")
+        rows = [
+            {"span": name, "calls": v["calls"], "total_ms": round(v["total_ms"], 1)}
+            for name, v in last.summary().items()
+        ]
+        if rows:
+            st.dataframe(
+                pd.DataFrame(rows).sort_values("total_ms", ascending=False),
+                hide_index=True,
+                use_container_width=True,
+            )
+        if len(buffer.traces) > 1:
+            st.line_chart(pd.Series([t.duration_ms for t in buffer.traces], name="rerun_ms"))
+
+        st.download_button(
+            "📥 Export JSON",
+            buffer.to_json(),
+            "crm_traces.json",
+            "application/json",
+            key="dl_traces_json",
+            use_container_width=True,
+        )
+        st.download_button(
+            "📥 Export OTLP",
+            buffer.to_otlp_json(),
+            "crm_traces_otlp.json",
+            "application/json",
+            key="dl_traces_otlp",
+            use_container_width=True,
+        )
+        if st.button("🧹 Clear traces", key="clear_traces_btn"):
+            buffer.clear()
+            st.rerun()
+
+
+# ============================================================================
+# SESSION STATE
+# ============================================================================
+def get_order_state() -> OrderStateLRU:
+    """Per-order keys of this session, LRU over the last session.keep_orders orders (secrets)."""
+    try:
+        capacity = int(st.secrets.get("session", {}).get("keep_orders", DEFAULT_CAPACITY))
+    except Exception:
+        capacity = DEFAULT_CAPACITY
+    return OrderStateLRU(st.session_state, capacity)
+
+
+def render_session_panel():
+    """Admin sidebar panel: what this session keeps in st.session_state."""
+    with st.expander("🧠 Session memory", expanded=False):
+        report = session_state_report(st.session_state)
+        order_state = get_order_state()
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Keys", len(report))
+        col2.metric("Approx.", f"{report['bytes'].sum() / 1e6:.2f} MB")
+        col3.metric("Orders", f"{len(order_state.orders)}/{order_state.capacity}")
+        per_order = report[report["order"] != ""].groupby("order")["bytes"].agg(["count", "sum"])
+        if not per_order.empty:
+            st.caption("Per-order state: " + " · ".join(
+                f"{oid} {int(row['count'])} keys / {row['sum'] / 1024:.0f} KB" for oid, row in per_order.iterrows()
+            ))
+        st.dataframe(report.head(15), hide_index=True, use_container_width=True)
+        # comanda deschisă acum în Update (selectbox-ul, nu doar ultima aleasă din All Orders)
+        current = st.session_state.get("update_order_select") or st.session_state.get("selected_order_for_update") or ""
+        if st.button("🧹 Free other orders' state", key="session_evict_btn"):
+            removed = order_state.evict_all_but(current)
+            st.success(f"✅ {removed} keys removed")
+
+
+# ============================================================================
+# ARCHIVE
+# ============================================================================
+def get_archive_min_age_days() -> int:
+    """Vârsta minimă (zile) a comenzilor finalizate arhivate (secrets: archive.min_age_days)."""
+    try:
+        return int(st.secrets.get("archive", {}).get("min_age_days", 365))
+    except Exception:
+        return 365
+
+
+def render_archive_panel():
+    """Admin sidebar panel: move old completed orders to the archive worksheet."""
+    crm = st.session_state.get("crm")
+    if crm is None:
+        return
+    with st.expander("🗄️ Archive", expanded=False):
+        min_age = st.number_input(
+            "Archive completed orders older than (days)",
+            min_value=0,
+            value=get_archive_min_age_days(),
+            step=30,
+            key="archive_min_age_days",
+        )
+        st.caption(f"Archive worksheet: {crm.archive_worksheet}")
+        if st.button("🗄️ Archive now", key="archive_now_btn", use_container_width=True):
+            moved = crm.archive_completed_orders(int(min_age))
+            if moved > 0:
+                st.success(f"✅ {moved} orders moved to the archive.")
+            elif moved == 0:
+                st.info("Nothing to archive.")
 
 
 # ============================================================================
-# MAIN APP
+# BACKUPS
 # ============================================================================
-def main():
-    if not check_password():
-        st.stop()
+def get_backup_settings() -> dict:
+    try:
+        return dict(st.secrets.get("backup", {}))
+    except Exception:
+        return {}
 
-    st.title("🖨️ Printer Service CRM")
-    st.markdown("### Professional Printer Service Management System")
 
-    if "company_info" not in st.session_state:
-        try:
-            st.session_state["company_info"] = dict(st.secrets.get("company_info", {}))
-        except Exception:
-            st.session_state["company_info"] = {
-                "company_name": "Company Name",
-                "company_address": "Address",
-                "cui": "CUI",
-                "reg_com": "Reg.Com",
-                "phone": "Phone",
-                "email": "Email",
-            }
+@st.cache_resource
+def get_snapshot_store() -> SnapshotStore:
+    """Snapshot-uri Parquet (secrets: backup.path), comune tuturor sesiunilor."""
+    return SnapshotStore(get_backup_settings().get("path", ".backups"))
 
-    # Sidebar
-    with st.sidebar:
-        st.header("⚙️ Configuration")
-        st.success(f"👤 {st.session_state.get('username', 'User')}")
 
-        if st.button("🚪 Logout", key="logout_btn"):
-            st.session_state["authenticated"] = False
-            st.rerun()
+BACKUP_WORKSHEETS = (
+    "Orders", "Orders_Archive", "Parts", "Stock_Ledger", "Order_Items", "Order_Attachments", "Schema",
+)
 
-        st.divider()
 
-        with st.expander("🖼️ Company Logo", expanded=False):
-            if st.session_state.get("logo_image"):
-                st.image(st.session_state["logo_image"], width=150)
-                st.success("✅ Logo loaded from repository")
-            else:
-                st.warning("⚠️ Logo not found")
-                st.info("Add 'logo.png' to 'assets/' folder in your GitHub repo")
+def crm_worksheets(crm) -> list:
+    return [
+        crm.worksheet, crm.archive_worksheet, crm.parts_worksheet, crm.ledger_worksheet, crm.items_worksheet,
+        crm.attachments_worksheet, crm.schema_worksheet,
+    ]
+
+
+def backup_worksheets(crm) -> list:
+    """The CRM's worksheets plus the shards of every other branch: one snapshot covers all branches."""
+    others = [
+        branch.worksheet(base)
+        for branch in get_branches().values() if branch.code != crm.branch.code
+        for base in BACKUP_WORKSHEETS
+    ]
+    return crm_worksheets(crm) + others
+
+
+def worksheet_owner(crm, worksheet: str) -> PrinterServiceCRM:
+    """The session's CRM of the branch whose shard `worksheet` is (crm itself for its own worksheets)."""
+    if worksheet in crm_worksheets(crm):
+        return crm
+    for branch in get_branches().values():
+        if branch.code != crm.branch.code and worksheet in {branch.worksheet(b) for b in BACKUP_WORKSHEETS}:
+            return branch_crm(crm.conn, branch.code)
+    return crm
+
+
+def take_snapshot(crm, label: str = "") -> dict:
+    """Snapshot every CRM worksheet that exists (read in parallel), then apply the retention (backup.keep)."""
+    store = get_snapshot_store()
+    names = backup_worksheets(crm)
+    frames = fan_out(lambda name: crm._read_df(raw=True, ttl=0, worksheet=name, quiet=True), names)
+    sheets = {name: df for name, df in zip(names, frames) if df is not None}
+    manifest = store.snapshot(sheets, label=label)
+    store.prune(int(get_backup_settings().get("keep", 30)))
+    return manifest
+
+
+def maybe_snapshot(crm):
+    """Scheduled snapshot: taken on the first rerun after backup.interval_hours (default 24)."""
+    store = get_snapshot_store()
+    interval = float(get_backup_settings().get("interval_hours", 24))
+    if interval <= 0:
+        return
+    last = store.last_snapshot_at
+    if last is None or (datetime.now() - last).total_seconds() >= interval * 3600:
+        try:
+            take_snapshot(crm, label="scheduled")
+        except Exception as e:
+            st.sidebar.warning(f"⚠️ Scheduled backup failed: {e}")
 
-        with st.expander("🏢 Company Details", expanded=False):
-            ci = st.session_state["company_info"]
-            ci["company_name"] = st.text_input("Company Name", value=ci["company_name"], key="company_name_input")
-            ci["company_address"] = st.text_input("Address", value=ci["company_address"], key="company_address_input")
-            ci["cui"] = st.text_input("CUI", value=ci["cui"], key="company_cui_input")
-            ci["reg_com"] = st.text_input("Reg.Com", value=ci["reg_com"], key="company_regcom_input")
-            ci["phone"] = st.text_input("Phone", value=ci["phone"], key="company_phone_input")
-            ci["email"] = st.text_input("Email", value=ci["email"], key="company_email_input")
 
-        conn = get_sheets_connection()
-        with st.expander("📊 Google Sheets", expanded=False):
-            if conn:
-                st.success("✅ Connected to Google Sheets!")
+def restore_snapshot(crm, snap_id: str, worksheet: str) -> int:
+    """
+    Rebuild one worksheet from a snapshot. The current state is snapshotted
+    first, so a restore can itself be undone. The whole restore holds the
+    write lock of the branch that owns the worksheet (a snapshot has every
+    branch's shards), and that branch's Schema sheet forgets its version.
+    Returns rows written (-1 on error).
+    """
+    store = get_snapshot_store()
+    df = store.restore(snap_id, worksheet)
+    if df is None:
+        return -1
+    owner = worksheet_owner(crm, worksheet)
+    with owner.write_lock:
+        take_snapshot(crm, label=f"before restore of {snap_id}")
+        if not owner._write_df(df, allow_empty=True, worksheet=worksheet):
+            return -1
+        owner.forget_schema_version(worksheet)
+    # indexurile din memorie au fost construite din datele vechi
+    st.cache_data.clear()
+    for index in (get_client_registry, get_equipment_registry, get_work_queue, get_inventory, get_line_items,
+                  get_attachment_index):
+        index.clear()
+    return len(df)
+
+
+def render_backup_panel(crm):
+    """Admin panel: snapshot now, list snapshots, point-in-time restore."""
+    with st.sidebar.expander("💾 Backups", expanded=False):
+        store = get_snapshot_store()
+        if st.button("📸 Snapshot now", key="backup_snapshot_now"):
+            with st.spinner("Taking snapshot..."):
+                manifest = take_snapshot(crm, label="manual")
+            st.success(f"✅ {manifest['id']} ({manifest['new_chunks']} new chunks)")
+
+        snapshots = store.list()
+        if not snapshots:
+            st.caption("No snapshots yet.")
+            return
+        st.caption(f"{len(snapshots)} snapshots · {store.size_bytes() / 1e6:.1f} MB")
+        labels = {
+            m["id"]: f"{m['created'].replace('T', ' ')} · {m.get('label', '')} · "
+                     f"{m['sheets'].get(crm.worksheet, {}).get('rows', 0)} orders"
+            for m in snapshots
+        }
+        snap_id = st.selectbox("Snapshot", list(labels), format_func=labels.get, key="backup_snapshot_id")
+        sheets = list(store.get(snap_id)["sheets"])
+        worksheet = st.selectbox("Worksheet", sheets, key="backup_restore_sheet")
+        confirm = st.checkbox(f"Overwrite '{worksheet}' with this snapshot", key="backup_restore_confirm")
+        if st.button("♻️ Restore", key="backup_restore_btn", disabled=not confirm):
+            with st.spinner("Restoring..."):
+                rows = restore_snapshot(crm, snap_id, worksheet)
+            if rows >= 0:
+                st.success(f"✅ Restored {rows} rows into {worksheet}")
             else:
-                st.error("❌ Not connected to Google Sheets")
+                st.error("❌ Restore failed")
 
-    conn = get_sheets_connection()
-    if not conn:
-        st.error("Cannot connect to Google Sheets. Check secrets configuration.")
-        st.stop()
 
-    if "crm" not in st.session_state:
-        st.session_state["crm"] = PrinterServiceCRM(conn)
+# ============================================================================
+# EQUIPMENT LABELS
+# ============================================================================
+LABEL_FORMATS = {
+    "PDF (sheet)": ("pdf", None),
+    "PDF (roll)": ("pdf", "roll-62x29"),
+    "ZPL (Zebra)": ("zpl", None),
+    "ESC/POS": ("escpos", None),
+}
 
-    crm = st.session_state["crm"]
-    df_all_orders = crm.list_orders_df()
 
-    # Tab navigation
-    tab_titles = ["📥 New Order", "📋 All Orders", "✏️ Update Order", "📊 Reports"]
+def get_label_settings() -> dict:
+    """secrets: labels.layout (a4-3x8 | roll-62x29), labels.zpl_dpi, labels.zpl_width_mm, labels.zpl_height_mm."""
+    try:
+        cfg = dict(st.secrets.get("labels", {}))
+    except Exception:
+        cfg = {}
+    layout = cfg.get("layout", DEFAULT_LAYOUT)
+    return {
+        "layout": layout if layout in LABEL_LAYOUTS else DEFAULT_LAYOUT,
+        "zpl": {
+            "dpi": int(cfg.get("zpl_dpi", 203)),
+            "width_mm": float(cfg.get("zpl_width_mm", 50)),
+            "height_mm": float(cfg.get("zpl_height_mm", 25)),
+        },
+    }
 
-    cols = st.columns(4)
-    for idx, (col, title) in enumerate(zip(cols, tab_titles)):
-        with col:
-            if st.button(
-                title,
-                key=f"tab_btn_{idx}",
+
+def render_order_labels(orders, fmt: str = "pdf", layout: Optional[str] = None) -> tuple:
+    """(bytes, suffix, mime, label count) for the printers of `orders` (rows as dicts)."""
+    settings = get_label_settings()
+    labels = labels_for_orders(orders, load_printers_from_order)
+    data, suffix, mime = render_labels(
+        labels, fmt, layout or settings["layout"], **(settings["zpl"] if fmt == "zpl" else {})
+    )
+    return data, suffix, mime, len(labels)
+
+
+def render_day_labels_panel(df: pd.DataFrame):
+    """All Orders: labels for every order received on one day, as PDF or raw printer data."""
+    with st.expander("🏷️ Equipment labels for a day", expanded=False):
+        col1, col2 = st.columns(2)
+        day = col1.date_input("Received on", value=date.today(), key="labels_day")
+        fmt_name = col2.selectbox("Format", list(LABEL_FORMATS), key="labels_format")
+        day_orders = df[df["date_received"].astype(str).str[:10] == day.isoformat()]
+        if day_orders.empty:
+            st.caption("No orders received on this day.")
+            return
+        fmt, layout = LABEL_FORMATS[fmt_name]
+        data, suffix, mime, count = render_order_labels(day_orders.to_dict("records"), fmt, layout)
+        st.caption(f"{len(day_orders)} orders · {count} labels")
+        st.download_button(
+            "🏷️ Download labels",
+            data,
+            f"labels_{day.isoformat()}.{suffix}",
+            mime,
+            key="dl_day_labels",
+            use_container_width=True,
+        )
+
+
+# ============================================================================
+# TAB RENDERERS
+# ============================================================================
+def render_new_order_tab(crm: PrinterServiceCRM):
+    """TAB 0: NEW ORDER"""
+    # dacă vii din alt tab, resetează starea de "ultimul order"
+    if st.session_state.get("last_tab") != 0:
+        st.session_state["last_created_order"] = None
+        st.session_state["pdf_downloaded"] = False
+
+    st.header("Create New Service Order")
+
+    if not st.session_state["last_created_order"] or st.session_state["pdf_downloaded"]:
+        # Ensure temp_printers exists
+        if "temp_printers" not in st.session_state or not st.session_state["temp_printers"]:
+            st.session_state["temp_printers"] = [{"brand": "", "model": "", "serial": ""}]
+
+        render_client_autocomplete(get_client_registry(crm.branch.code), crm.branch.code)
+
+        with st.form(key="new_order_form", clear_on_submit=False):
+            col1, col2 = st.columns(2)
+            with col1:
+                st.subheader("Client Information")
+                client_name = st.text_input("Name *", key="new_client_name")
+                client_phone = st.text_input("Phone *", key="new_client_phone")
+                client_email = st.text_input("Email", key="new_client_email")
+            with col2:
+                st.subheader("Order Dates")
+                date_received = st.date_input("Date Received *", value=date.today(), key="new_date_received")
+                # dacă vrei, poți pune aici value=date.today() în loc de None
+                date_pickup = st.date_input("Scheduled Pickup (optional)", value=None, key="new_date_pickup")
+
+            st.subheader("Printers in This Order")
+
+            printers_list = st.session_state["temp_printers"]
+            remove_flags = []
+
+            # Draw each printer row
+            for i, p in enumerate(printers_list):
+                st.markdown(f"**Printer #{i+1}**")
+                colA, colB, colC, colD, colE = st.columns([1.2, 1.2, 1.2, 0.8, 0.6])
+                with colA:
+                    p["brand"] = st.text_input(f"Brand #{i+1} *", value=p["brand"], key=f"new_printer_brand_{i}")
+                with colB:
+                    p["model"] = st.text_input(f"Model #{i+1} *", value=p["model"], key=f"new_printer_model_{i}")
+                with colC:
+                    p["serial"] = st.text_input(f"Serial #{i+1}", value=p["serial"], key=f"new_printer_serial_{i}")
+                    note = serial_history_note(p["serial"], branch=crm.branch.code) if p["serial"] else ""
+                    if note:
+                        st.caption(note)
+                with colD:
+                    # NOU: Checkbox Warranty
+                    initial_warranty = p.get("warranty", False)
+                    p["warranty"] = st.checkbox(
+                        "Warranty",
+                        value=initial_warranty,
+                        key=f"new_printer_warranty_{i}",
+                        help="Check this box if the printer is received under warranty."
+                    )
+                with colE:
+                    remove_flags.append(
+                        st.checkbox("Remove", key=f"new_printer_remove_{i}")
+                    )
+
+            issue_description = st.text_area("Issue Description *", height=100, key="new_issue_description")
+            accessories = st.text_input("Accessories (cables, cartridges, etc.)", key="new_accessories")
+            notes = st.text_area("Additional Notes", height=60, key="new_notes")
+            intake_files = st.file_uploader(
+                "Intake photos (damage, accessories)",
+                type=list(IMAGE_TYPES + DOCUMENT_TYPES),
+                accept_multiple_files=True,
+                key="new_order_photos",
+            )
+
+            col_btn1, col_btn2, col_btn3 = st.columns(3)
+            with col_btn1:
+                remove_clicked = st.form_submit_button("🗑 Remove selected printers")
+            with col_btn2:
+                add_clicked = st.form_submit_button("➕ Add another printer")
+            with col_btn3:
+                submit = st.form_submit_button("🎫 Create Order", type="primary", use_container_width=True)
+
+            if remove_clicked:
+                st.session_state["temp_printers"] = [
+                    p for p, flag in zip(printers_list, remove_flags) if not flag
+                ]
+                if not st.session_state["temp_printers"]:
+                    st.session_state["temp_printers"] = [{"brand": "", "model": "", "serial": ""}]
+                st.rerun()
+
+            if add_clicked:
+                st.session_state["temp_printers"].append({"brand": "", "model": "", "serial": ""})
+                st.rerun()
+
+            if submit:
+                # Clean printers list
+                printers_clean = []
+                for p in st.session_state["temp_printers"]:
+                    brand = safe_text(p.get("brand", "")).strip()
+                    model = safe_text(p.get("model", "")).strip()
+                    serial = safe_text(p.get("serial", "")).strip()
+                    warranty = p.get("warranty", False) 
+                    if brand or model or serial:
+                        printers_clean.append({
+                            "brand": brand,
+                            "model": model,
+                            "serial": serial,
+                            "warranty": warranty,
+                        })
+
+                if not client_name or not client_phone or not issue_description:
+                    st.error("❌ Please fill in all required fields (*) for client and issue.")
+                elif not printers_clean:
+                    st.error("❌ Please add at least one printer (brand and model).")
+                else:
+                    order_id = crm.create_service_order(
+                        client_name, client_phone, client_email,
+                        printers_clean,
+                        issue_description, accessories, notes, date_received, date_pickup
+                    )
+                    if order_id and intake_files:
+                        crm.add_attachments(order_id, [(f.name, f.type or "", f.getvalue()) for f in intake_files])
+                    if order_id:
+                        st.session_state["last_created_order"] = order_id
+                        st.session_state["pdf_downloaded"] = False
+                        # Reset temp printers
+                        st.session_state["temp_printers"] = [{"brand": "", "model": "", "serial": "","warranty": False}]
+                        st.success(f"✅ Order Created: **{order_id}**")
+                        st.balloons()
+                        st.rerun()
+
+    if st.session_state["last_created_order"] and not st.session_state["pdf_downloaded"]:
+        df_fresh = crm.list_orders_df()
+        order = OrderRecord.from_df(df_fresh, st.session_state["last_created_order"])
+        if order is not None:
+            st.divider()
+            st.success(f"✅ Order Created: **{order['order_id']}**")
+            st.subheader("📄 Download Receipt")
+
+            # Get logo from session state
+            logo = st.session_state.get("logo_image", None)
+            pdf_buffer = generate_initial_receipt_pdf(
+                order, st.session_state["company_info"], logo, equipment=get_equipment_registry(crm.branch.code)
+            )
+
+            if st.download_button(
+                "📄 Download Initial Receipt",
+                pdf_buffer,
+                f"Initial_{order['order_id']}.pdf",
+                "application/pdf",
+                type="primary",
                 use_container_width=True,
-                type="primary" if st.session_state["active_tab"] == idx else "secondary",
+                key="dl_new_init",
             ):
-                # memorează de pe ce tab vii
-                st.session_state["last_tab"] = st.session_state["active_tab"]
-                st.session_state["active_tab"] = idx
+                st.session_state["last_created_order"] = None
+                st.session_state["pdf_downloaded"] = True
                 st.rerun()
 
-    st.divider()
-    active_tab = st.session_state["active_tab"]
 
-    # TAB 0: NEW ORDER
-    if active_tab == 0:
-        # dacă vii din alt tab, resetează starea de "ultimul order"
-        if st.session_state.get("last_tab") != 0:
-            st.session_state["last_created_order"] = None
-            st.session_state["pdf_downloaded"] = False
+def render_all_orders_tab(crm: PrinterServiceCRM, df_all_orders: pd.DataFrame):
+    """TAB 1: ALL ORDERS"""
+    st.header("All Service Orders")
+    df = df_all_orders
+    include_archive = st.checkbox("🗄️ Include archived orders", key="orders_include_archive")
+    if include_archive:
+        df = crm.list_orders_df(include_archive=True)
+    if not df.empty:
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("📊 Total Orders", len(df))
+        col2.metric("📥 Received", len(df[df["status"] == "Received"]))
+        col3.metric("✅ Ready", len(df[df["status"] == "Ready for Pickup"]))
+        col4.metric("🎉 Completed", len(df[df["status"] == "Completed"]))
+
+        query = st.text_input(
+            "🔎 Search",
+            key="orders_search",
+            placeholder="Client, phone, email, order id or serial",
+        )
+        if query.strip():
+            df = filter_orders(df, query)
+            st.caption(f"{len(df)} matching orders")
+
+        # selecția tabelului e o poziție de rând: alt filtru = tabel nou, fără selecție
+        view = (include_archive, query.strip())
+        if st.session_state.get("orders_table_view") != view:
+            st.session_state["orders_table_view"] = view
+            st.session_state["orders_table_gen"] = st.session_state.get("orders_table_gen", 0) + 1
+        # poziția se referă la rândurile afișate la click (rularea anterioară)
+        shown_before = st.session_state.get("orders_table_ids", [])
+        shown_ids = df["order_id"].tolist()
+        st.session_state["orders_table_ids"] = shown_ids
+
+        st.markdown("**Click on a row to edit or delete that order:**")
+        event = st.dataframe(
+            df[["order_id", "client_name", "printer_brand", "date_received", "status", "total_cost"]],
+            use_container_width=True,
+            selection_mode="single-row",
+            on_select="rerun",
+            key=f"orders_table_{st.session_state['orders_table_gen']}"
+        )
+
+        selected_order_id = None
+        if event and "selection" in event and event["selection"]["rows"]:
+            selected_idx = event["selection"]["rows"][0]
+            if selected_idx < len(shown_before) and shown_before[selected_idx] in set(shown_ids):
+                # comanda ștearsă / mutată între timp nu trece selecția pe rândul vecin
+                selected_order_id = shown_before[selected_idx]
+                st.session_state["selected_order_for_update"] = selected_order_id
+                st.session_state["previous_selected_order"] = selected_order_id
 
-        st.header("Create New Service Order")
+        if selected_order_id:
+            st.markdown(f"**Selected order:** `{selected_order_id}`")
+            col_a, col_b = st.columns(2)
+            with col_a:
+                if st.button("✏️ Edit selected order", key="btn_edit_selected", use_container_width=True):
+                    st.session_state["active_tab"] = 2
+                    st.rerun()
+            with col_b:
+                if st.button("🗑 Delete selected order", key="btn_delete_selected", type="secondary", use_container_width=True):
+                    if crm.delete_order(selected_order_id):
+                        st.success(f"🗑 Order {selected_order_id} deleted successfully!")
+                        st.session_state["selected_order_for_update"] = None
+                        st.rerun()
 
-        if not st.session_state["last_created_order"] or st.session_state["pdf_downloaded"]:
-            # Ensure temp_printers exists
-            if "temp_printers" not in st.session_state or not st.session_state["temp_printers"]:
-                st.session_state["temp_printers"] = [{"brand": "", "model": "", "serial": ""}]
+        strip_diacritics = st.checkbox("Export without diacritics", key="csv_strip_diacritics")
+        csv = (fold_frame(df) if strip_diacritics else df).to_csv(index=False)
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        st.download_button(
+            "📥 Export to CSV",
+            csv,
+            f"orders_{ts}.csv",
+            "text/csv",
+            key="dl_csv",
+            use_container_width=True,
+        )
+        render_day_labels_panel(df)
+    else:
+        st.info("📝 No orders yet. Create your first order in the 'New Order' tab!")
+
+
+def on_order_scan():
+    """Callback: a scanner "types" the receipt code + Enter; open that order and clear the field."""
+    text = st.session_state.get("update_order_scan", "")
+    if not text.strip():
+        return
+    order_id = parse_order_code(text, current_branch().prefix)
+    st.session_state["update_order_scan"] = ""
+    if order_id is None:
+        st.session_state["scan_invalid"] = True
+    else:
+        owner = branch_for_order(order_id, get_branches())
+        if owner is not None and owner.code != current_branch().code:
+            # chitanța altei filiale: comutăm pe filiala care deține comanda
+            st.session_state["branch"] = owner.code
+            reset_order_selection()
+        st.session_state["scanned_order"] = order_id
+    st.session_state["active_tab"] = 2
+
+
+def render_update_order_tab(crm: PrinterServiceCRM, df_all_orders: pd.DataFrame):
+    """TAB 2: UPDATE ORDER"""
+    st.header("Update Service Order")
+
+    df = df_all_orders
+
+    if not df.empty:
+        available_orders = df["order_id"].tolist()
+        # order_id → poziție în listă: căutare O(1) pentru selecție și scanare
+        order_positions = {oid: i for i, oid in enumerate(available_orders)}
+
+        st.text_input(
+            "📷 Scan receipt",
+            key="update_order_scan",
+            placeholder="Scan the QR on the receipt or type the order number",
+            on_change=on_order_scan,
+        )
+        scanned = st.session_state.pop("scanned_order", None)
+        if scanned:
+            if scanned in order_positions or crm.get_order(scanned) is not None:
+                st.session_state["selected_order_for_update"] = scanned
+                # selectbox-ul își reia valoarea din index=... la randarea de mai jos
+                st.session_state.pop("update_order_select", None)
+            else:
+                st.warning(f"⚠️ Order {scanned} not found.")
+        elif st.session_state.pop("scan_invalid", None):
+            st.warning("⚠️ Code not recognized (misread or wrong check digits). Scan again.")
+
+        selected_before = st.session_state["selected_order_for_update"]
+        if selected_before and selected_before not in order_positions:
+            # comandă arhivată, aleasă din "All Orders" cu arhiva inclusă (sau scanată)
+            order_positions[selected_before] = len(available_orders)
+            available_orders.append(selected_before)
+
+        default_idx = order_positions.get(st.session_state["selected_order_for_update"], 0)
+
+        def on_order_select():
+            st.session_state["active_tab"] = 2
+
+        selected_order_id = st.selectbox(
+            "Select Order",
+            available_orders,
+            index=default_idx,
+            key="update_order_select",
+            label_visibility="collapsed",
+            on_change=on_order_select
+        )
+
+        if selected_order_id:
+            # doar ultimele N comenzi deschise își păstrează cheile (ciorne, widget-uri)
+            get_order_state().touch(selected_order_id)
+            order = crm.get_order(selected_order_id)
+
+            if order is None:
+                st.error("❌ Order not found in current data.")
+            else:
+                # load printers for this order
+                printers_initial = load_printers_from_order(order)
+                state_key = f"upd_printers_{selected_order_id}"
+                if state_key not in st.session_state:
+                    st.session_state[state_key] = printers_initial if printers_initial else [{"brand": "", "model": "", "serial": ""}]
+                current_printers = st.session_state[state_key]
 
-            with st.form(key="new_order_form", clear_on_submit=False):
                 col1, col2 = st.columns(2)
                 with col1:
-                    st.subheader("Client Information")
-                    client_name = st.text_input("Name *", key="new_client_name")
-                    client_phone = st.text_input("Phone *", key="new_client_phone")
-                    client_email = st.text_input("Email", key="new_client_email")
+                    st.write(f"**Client:** {safe_text(order.get('client_name'))}")
+                    st.write(f"**Phone:** {safe_text(order.get('client_phone'))}")
+                    st.write(f"**Printer (main):** {safe_text(order.get('printer_brand'))} {safe_text(order.get('printer_model'))}")
+                    st.write(f"**Serial (main):** {safe_text(order.get('printer_serial'))}")
                 with col2:
-                    st.subheader("Order Dates")
-                    date_received = st.date_input("Date Received *", value=date.today(), key="new_date_received")
-                    # dacă vrei, poți pune aici value=date.today() în loc de None
-                    date_pickup = st.date_input("Scheduled Pickup (optional)", value=None, key="new_date_pickup")
+                    st.write(f"**Received:** {safe_text(order.get('date_received'))}")
+                    st.write(f"**Issue:** {safe_text(order.get('issue_description'))}")
+                    st.write(f"**Accessories:** {safe_text(order.get('accessories'))}")
+
+                st.divider()
 
                 st.subheader("Printers in This Order")
 
-                printers_list = st.session_state["temp_printers"]
-                remove_flags = []
+                # status și costuri pe imprimantă, doar pentru comenzile cu mai multe imprimante
+                multi_printer = len(current_printers) > 1
+                line_items = get_line_items(crm.branch.code).items_for(selected_order_id, current_printers)
+                if multi_printer and not get_line_items(crm.branch.code).has_items(selected_order_id) and line_items:
+                    # comandă fără poziții încă: costurile existente pornesc pe prima imprimantă
+                    line_items[0].labor_cost = safe_float(order.get("labor_cost"))
+                    line_items[0].parts_cost = max(
+                        safe_float(order.get("parts_cost")) - get_inventory(crm.branch.code).order_cost(selected_order_id), 0.0
+                    )
 
-                # Draw each printer row
-                for i, p in enumerate(printers_list):
+                remove_flags = []
+                for i, p in enumerate(current_printers):
                     st.markdown(f"**Printer #{i+1}**")
                     colA, colB, colC, colD, colE = st.columns([1.2, 1.2, 1.2, 0.8, 0.6])
                     with colA:
-                        p["brand"] = st.text_input(f"Brand #{i+1} *", value=p["brand"], key=f"new_printer_brand_{i}")
+                        p["brand"] = st.text_input(f"Brand #{i+1}", value=p["brand"], key=f"upd_brand_{selected_order_id}_{i}")
                     with colB:
-                        p["model"] = st.text_input(f"Model #{i+1} *", value=p["model"], key=f"new_printer_model_{i}")
+                        p["model"] = st.text_input(f"Model #{i+1}", value=p["model"], key=f"upd_model_{selected_order_id}_{i}")
                     with colC:
-                        p["serial"] = st.text_input(f"Serial #{i+1}", value=p["serial"], key=f"new_printer_serial_{i}")
+                        p["serial"] = st.text_input(f"Serial #{i+1}", value=p["serial"], key=f"upd_serial_{selected_order_id}_{i}")
+                        note = serial_history_note(p["serial"], selected_order_id, branch=crm.branch.code) if p["serial"] else ""
+                        if note:
+                            st.caption(note)
                     with colD:
                         # NOU: Checkbox Warranty
                         initial_warranty = p.get("warranty", False)
                         p["warranty"] = st.checkbox(
                             "Warranty",
                             value=initial_warranty,
-                            key=f"new_printer_warranty_{i}",
-                            help="Check this box if the printer is received under warranty."
+                            key=f"upd_warranty_printer_{selected_order_id}_{i}",
+                            help="Check this box if the printer is under warranty."
                         )
                     with colE:
                         remove_flags.append(
-                            st.checkbox("Remove", key=f"new_printer_remove_{i}")
+                            st.checkbox("Remove", key=f"upd_remove_printer_{selected_order_id}_{i}")
+                        )
+                    if multi_printer:
+                        item = line_items[i]
+                        colS, colL, colP, colT = st.columns([1.2, 1.2, 1.2, 1.4])
+                        item.status = colS.selectbox(
+                            f"Status #{i+1}",
+                            ITEM_STATUSES,
+                            index=ITEM_STATUSES.index(item.status),
+                            key=f"upd_item_status_{selected_order_id}_{i}",
+                        )
+                        item.labor_cost = colL.number_input(
+                            f"Labor #{i+1} (RON)",
+                            value=float(item.labor_cost),
+                            min_value=0.0,
+                            step=10.0,
+                            key=f"upd_item_labor_{selected_order_id}_{i}",
+                        )
+                        item.parts_cost = colP.number_input(
+                            f"Parts #{i+1} (RON)",
+                            value=float(item.parts_cost),
+                            min_value=0.0,
+                            step=10.0,
+                            key=f"upd_item_parts_{selected_order_id}_{i}",
                         )
+                        colT.metric(f"Printer #{i+1} total", f"{item.total:.2f} RON")
 
-                issue_description = st.text_area("Issue Description *", height=100, key="new_issue_description")
-                accessories = st.text_input("Accessories (cables, cartridges, etc.)", key="new_accessories")
-                notes = st.text_area("Additional Notes", height=60, key="new_notes")
-
-                col_btn1, col_btn2, col_btn3 = st.columns(3)
-                with col_btn1:
-                    remove_clicked = st.form_submit_button("🗑 Remove selected printers")
-                with col_btn2:
-                    add_clicked = st.form_submit_button("➕ Add another printer")
-                with col_btn3:
-                    submit = st.form_submit_button("🎫 Create Order", type="primary", use_container_width=True)
-
-                if remove_clicked:
-                    st.session_state["temp_printers"] = [
-                        p for p, flag in zip(printers_list, remove_flags) if not flag
-                    ]
-                    if not st.session_state["temp_printers"]:
-                        st.session_state["temp_printers"] = [{"brand": "", "model": "", "serial": ""}]
-                    st.rerun()
+                with st.expander("🕓 Change history", expanded=False):
+                    history = get_audit_log().history_df(selected_order_id)
+                    if history.empty:
+                        st.caption("No recorded changes yet.")
+                    else:
+                        st.dataframe(history.iloc[::-1], hide_index=True, use_container_width=True)
+
+                render_attachments(crm, selected_order_id, current_printers)
+
+                serials = [safe_text(p.get("serial")).strip() for p in current_printers]
+                serials = [sn for sn in serials if sn]
+                if serials:
+                    with st.expander("🔧 Repair history for these serials", expanded=False):
+                        equipment = get_equipment_registry(crm.branch.code)
+                        for serial in serials:
+                            st.markdown(f"**{serial}**")
+                            st.dataframe(equipment.history_df(serial), hide_index=True, use_container_width=True)
+
+                colp_r1, colp_r2 = st.columns(2)
+                with colp_r1:
+                    if st.button("🗑 Remove selected", key=f"upd_remove_selected_{selected_order_id}"):
+                        # 1) Ștergere locală
+                        st.session_state[state_key] = [
+                            p for p, flag in zip(current_printers, remove_flags) if not flag
+                        ]
+                        if not st.session_state[state_key]:
+                            st.session_state[state_key] = [{"brand": "", "model": "", "serial": ""}]
+
+                        # 2) Regenerăm JSON-ul pentru spreadsheet
+                        printers_clean = []
+                        for p in st.session_state[state_key]:
+                            brand = safe_text(p.get("brand", "")).strip()
+                            model = safe_text(p.get("model", "")).strip()
+                            serial = safe_text(p.get("serial", "")).strip()
+                            if brand or model or serial:
+                                printers_clean.append({
+                                    "brand": brand,
+                                    "model": model,
+                                    "serial": serial,
+                                })
+
+                        printers_json = json.dumps(printers_clean, ensure_ascii=False)
+
+                        # 3) Actualizăm și câmpurile legacy
+                        fb, fm, fs = "", "", ""
+                        if printers_clean:
+                            fb, fm, fs = printers_clean[0]["brand"], printers_clean[0]["model"], printers_clean[0]["serial"]
+
+                        # 4) Scriem în spreadsheet imediat
+                        crm.update_order(
+                            selected_order_id,
+                            printers_json=printers_json,
+                            printer_brand=fb,
+                            printer_model=fm,
+                            printer_serial=fs
+                        )
 
-                if add_clicked:
-                    st.session_state["temp_printers"].append({"brand": "", "model": "", "serial": ""})
-                    st.rerun()
+                        # 5) Reafișăm pagina
+                        st.success("🗑 Imprimantele selectate au fost șterse!")
+                        st.rerun()
+
+                with colp_r2:
+                    if st.button("➕ Add printer", key=f"upd_add_printer_btn_{selected_order_id}"):
+                        printers_list = st.session_state.get(state_key, [])
+                        printers_list.append({"brand": "", "model": "", "serial": ""})
+                        st.session_state[state_key] = printers_list
+                        st.rerun()
+
+                st.divider()
+
+                status_options = ITEM_STATUSES
+                current_status = safe_text(order.get("status")) or "Received"
+                if current_status not in status_options:
+                    current_status = "Received"
+                status_index = status_options.index(current_status)
+
+                new_status = st.selectbox(
+                    "Status",
+                    status_options,
+                    index=status_index,
+                    key=f"update_status_{selected_order_id}",
+                )
+                if multi_printer:
+                    suggested = rollup_status(line_items)
+                    if suggested != new_status:
+                        st.caption(f"ℹ️ Least advanced printer is '{suggested}'")
+
+                if new_status == "Completed":
+                    actual_pickup_date = st.date_input(
+                        "Actual Pickup Date",
+                        value=date.today(),
+                        key=f"update_pickup_date_{selected_order_id}",
+                    )
+                else:
+                    actual_pickup_date = None
+
+                st.subheader("Repair details")
+
+                repair_details = st.text_area(
+                    "Repairs performed",
+                    value=safe_text(order.get("repair_details")),
+                    height=100,
+                    key=f"update_repair_details_{selected_order_id}",
+                )
 
-                if submit:
+                inventory = get_inventory(crm.branch.code)
+                stock_parts = inventory.order_parts(selected_order_id)
+                stock_wanted = {}
+                if len(inventory):
+                    part_query = st.text_input(
+                        "🔎 Find part",
+                        key=f"update_part_query_{selected_order_id}",
+                        placeholder="SKU or name",
+                    )
+                    options = [p.sku for p in inventory.search(part_query, limit=30)]
+                    selected_key = f"update_stock_parts_{selected_order_id}"
+                    selected_skus = st.session_state.get(selected_key, list(stock_parts))
+                    options += [sku for sku in selected_skus if sku not in options]
+                    chosen = st.multiselect(
+                        "Parts from stock",
+                        options,
+                        default=[sku for sku in stock_parts if sku in options],
+                        format_func=lambda s: inventory.get(s).label if inventory.get(s) else s,
+                        key=selected_key,
+                    )
+                    if chosen:
+                        qty_cols = st.columns(min(len(chosen), 4))
+                        for i, sku in enumerate(chosen):
+                            stock_wanted[sku] = int(qty_cols[i % len(qty_cols)].number_input(
+                                f"Qty {sku}",
+                                min_value=1,
+                                step=1,
+                                value=int(stock_parts.get(sku, 1)),
+                                key=f"update_stock_qty_{selected_order_id}_{sku}",
+                            ))
+                        short = [
+                            sku for sku, qty in stock_wanted.items()
+                            if inventory.get(sku) and qty - stock_parts.get(sku, 0) > inventory.get(sku).on_hand
+                        ]
+                        if short:
+                            st.warning(f"⚠️ Not enough stock for: {', '.join(short)}")
+
+                stock_lines = inventory.describe(stock_parts)
+                parts_used = st.text_input(
+                    "Other parts used" if len(inventory) else "Parts used",
+                    value=strip_stock_lines(safe_text(order.get("parts_used")), stock_lines),
+                    key=f"update_parts_used_{selected_order_id}",
+                )
+
+                technician = st.text_input(
+                    "Technician",
+                    value=safe_text(order.get("technician")),
+                    key=f"update_technician_{selected_order_id}",
+                )
+
+                stock_cost = inventory.cost_of(selected_order_id, stock_wanted) if len(inventory) else 0.0
+                colc1, colc2, colc3 = st.columns(3)
+                if multi_printer:
+                    # totalurile comenzii = suma pozițiilor pe imprimantă
+                    labor_cost = round(sum(it.labor_cost for it in line_items), 2)
+                    other_parts_cost = round(sum(it.parts_cost for it in line_items), 2)
+                    colc1.metric("Labor cost (all printers)", f"{labor_cost:.2f} RON")
+                    colc2.metric("Parts cost (all printers)", f"{other_parts_cost:.2f} RON")
+                else:
+                    labor_cost = colc1.number_input(
+                        "Labor cost (RON)",
+                        value=safe_float(order.get("labor_cost")),
+                        min_value=0.0,
+                        step=10.0,
+                        key=f"update_labor_cost_{selected_order_id}",
+                    )
+                    other_parts_cost = colc2.number_input(
+                        "Other parts cost (RON)" if len(inventory) else "Parts cost (RON)",
+                        value=max(safe_float(order.get("parts_cost")) - inventory.order_cost(selected_order_id), 0.0),
+                        min_value=0.0,
+                        step=10.0,
+                        key=f"update_parts_cost_{selected_order_id}",
+                    )
+                parts_cost = round(stock_cost + other_parts_cost, 2)
+                if stock_cost:
+                    colc2.caption(f"+ {stock_cost:.2f} RON parts from stock")
+                colc3.metric("💰 Total", f"{labor_cost + parts_cost:.2f} RON")
+
+                if st.button("💾 Update Order", type="primary", key=f"update_order_btn_{selected_order_id}"):
                     # Clean printers list
                     printers_clean = []
-                    for p in st.session_state["temp_printers"]:
+                    for p in st.session_state[state_key]:
                         brand = safe_text(p.get("brand", "")).strip()
                         model = safe_text(p.get("model", "")).strip()
                         serial = safe_text(p.get("serial", "")).strip()
@@ -1098,413 +3322,359 @@ def main():
                                 "brand": brand,
                                 "model": model,
                                 "serial": serial,
-                                "warranty": warranty,
+                                "warranty": warranty, 
                             })
 
-                    if not client_name or not client_phone or not issue_description:
-                        st.error("❌ Please fill in all required fields (*) for client and issue.")
-                    elif not printers_clean:
-                        st.error("❌ Please add at least one printer (brand and model).")
-                    else:
-                        order_id = crm.create_service_order(
-                            client_name, client_phone, client_email,
-                            printers_clean,
-                            issue_description, accessories, notes, date_received, date_pickup
-                        )
-                        if order_id:
-                            st.session_state["last_created_order"] = order_id
-                            st.session_state["pdf_downloaded"] = False
-                            # Reset temp printers
-                            st.session_state["temp_printers"] = [{"brand": "", "model": "", "serial": "","warranty": False}]
-                            st.success(f"✅ Order Created: **{order_id}**")
-                            st.balloons()
-                            st.rerun()
-
-        if st.session_state["last_created_order"] and not st.session_state["pdf_downloaded"]:
-            df_fresh = crm.list_orders_df()
-            order_row = df_fresh[df_fresh["order_id"] == st.session_state["last_created_order"]]
-            if not order_row.empty:
-                order = order_row.iloc[0].to_dict()
+                    printers_json = json.dumps(printers_clean, ensure_ascii=False)
+
+                    first_brand = ""
+                    first_model = ""
+                    first_serial = ""
+                    if printers_clean:
+                        first_brand = printers_clean[0]["brand"]
+                        first_model = printers_clean[0]["model"]
+                        first_serial = printers_clean[0]["serial"]
+
+                    # piese, poziții și comandă sub același lacăt, ledger-ul ultimul: dacă o scriere
+                    # eșuează stocul rămâne neconsumat, iar Update din nou pornește de la ledger
+                    with crm.write_lock:
+                        stock_entries = []
+                        if len(inventory):
+                            stock_entries = crm.order_parts_entries(selected_order_id, stock_wanted)
+                            if stock_entries is None:
+                                st.stop()
+                            # costul din ledger-ul recitit (alt proces poate să fi scris între timp)
+                            parts_cost = round(inventory.cost_of(selected_order_id, stock_wanted) + other_parts_cost, 2)
+                        # pozițiile se aliniază cu imprimantele păstrate (fără rândurile goale)
+                        kept_items = [
+                            it for it, p in zip(line_items, st.session_state[state_key])
+                            if safe_text(p.get("brand", "")).strip() or safe_text(p.get("model", "")).strip()
+                            or safe_text(p.get("serial", "")).strip()
+                        ]
+                        for line_no, it in enumerate(kept_items):
+                            it.line_no = line_no
+                        if multi_printer or get_line_items(crm.branch.code).has_items(selected_order_id):
+                            items_to_save = kept_items if len(kept_items) > 1 else []
+                            if not crm.save_order_items(selected_order_id, items_to_save):
+                                st.stop()
+                        parts_used = "; ".join(inventory.describe(stock_wanted) + ([parts_used] if parts_used.strip() else []))
+
+                        updates = {
+                            "status": new_status,
+                            "repair_details": repair_details,
+                            "parts_used": parts_used,
+                            "technician": technician,
+                            "labor_cost": labor_cost,
+                            "parts_cost": parts_cost,
+                            "printers_json": printers_json,
+                            "printer_brand": first_brand,
+                            "printer_model": first_model,
+                            "printer_serial": first_serial,
+                        }
+
+                        if new_status == "Ready for Pickup" and not order.get("date_completed"):
+                            updates["date_completed"] = datetime.now().strftime("%Y-%m-%d")
+                        if new_status == "Completed":
+                            updates["date_picked_up"] = (
+                                actual_pickup_date.strftime("%Y-%m-%d")
+                                if actual_pickup_date
+                                else datetime.now().strftime("%Y-%m-%d")
+                            )
+
+                        if not crm.update_order(selected_order_id, **updates):
+                            st.stop()
+                        if not crm.append_ledger(stock_entries):
+                            st.error("❌ Order saved, but its stock movements were not recorded. "
+                                     "Press Update Order again to record them.")
+                            st.stop()
+                    st.success("✅ Order updated successfully!")
+                    st.rerun()
+
                 st.divider()
-                st.success(f"✅ Order Created: **{order['order_id']}**")
-                st.subheader("📄 Download Receipt")
+                st.subheader("📄 Download Receipts")
+
+                # Re-citim comanda proaspăt din sheet pentru PDF-uri actualizate
+                order_latest = crm.get_order(selected_order_id)
+                if order_latest is None:
+                    order_latest = order  # fallback la varianta veche deja încărcată
 
-                # Get logo from session state
                 logo = st.session_state.get("logo_image", None)
-                pdf_buffer = generate_initial_receipt_pdf(order, st.session_state["company_info"], logo)
-
-                if st.download_button(
-                    "📄 Download Initial Receipt",
-                    pdf_buffer,
-                    f"Initial_{order['order_id']}.pdf",
-                    "application/pdf",
-                    type="primary",
-                    use_container_width=True,
-                    key="dl_new_init",
-                ):
-                    st.session_state["last_created_order"] = None
-                    st.session_state["pdf_downloaded"] = True
-                    st.rerun()
 
-        # TAB 1: ALL ORDERS
-    elif active_tab == 1:
-        st.header("All Service Orders")
-        df = df_all_orders
-        if not df.empty:
-            col1, col2, col3, col4 = st.columns(4)
-            col1.metric("📊 Total Orders", len(df))
-            col2.metric("📥 Received", len(df[df["status"] == "Received"]))
-            col3.metric("✅ Ready", len(df[df["status"] == "Ready for Pickup"]))
-            col4.metric("🎉 Completed", len(df[df["status"] == "Completed"]))
-
-            st.markdown("**Click on a row to edit or delete that order:**")
-            event = st.dataframe(
-                df[["order_id", "client_name", "printer_brand", "date_received", "status", "total_cost"]],
-                use_container_width=True,
-                selection_mode="single-row",
-                on_select="rerun",
-                key="orders_table"
+                colp1, colp2, colp3 = st.columns(3)
+                with colp1:
+                    st.markdown("**Initial Receipt**")
+                    pdf_init = generate_initial_receipt_pdf(
+                        order_latest, st.session_state["company_info"], logo, equipment=get_equipment_registry(crm.branch.code)
+                    )
+                    st.download_button(
+                        "📄 Download Initial",
+                        pdf_init,
+                        f"Initial_{order_latest['order_id']}.pdf",
+                        "application/pdf",
+                        use_container_width=True,
+                        key=f"dl_upd_init_{order_latest['order_id']}",
+                    )
+                with colp2:
+                    st.markdown("**Completion Receipt**")
+                    pdf_comp = generate_completion_receipt_pdf(
+                        order_latest,
+                        st.session_state["company_info"],
+                        logo,
+                        items=get_line_items(crm.branch.code).items_for(selected_order_id, load_printers_from_order(order_latest))
+                        if get_line_items(crm.branch.code).has_items(selected_order_id) else None,
+                    )
+                    st.download_button(
+                        "📄 Download Completion",
+                        pdf_comp,
+                        f"Completion_{order_latest['order_id']}.pdf",
+                        "application/pdf",
+                        use_container_width=True,
+                        key=f"dl_upd_comp_{order_latest['order_id']}",
+                    )
+                with colp3:
+                    st.markdown("**Equipment Labels**")
+                    label_pdf, _, _, label_count = render_order_labels([order_latest])
+                    st.download_button(
+                        f"🏷️ Download Labels ({label_count})",
+                        label_pdf,
+                        f"Labels_{order_latest['order_id']}.pdf",
+                        "application/pdf",
+                        use_container_width=True,
+                        key=f"dl_upd_labels_{order_latest['order_id']}",
+                    )
+    else:
+        st.info("📝 No orders yet.")
+
+
+def render_reports_tab(df_all_orders: pd.DataFrame, branch: str = MAIN_CODE):
+    """TAB 3: REPORTS (df_all_orders has a "branch" column when it covers every branch)"""
+    st.header("Reports & Analytics")
+    df = df_all_orders
+    if not df.empty:
+        col1, col2, col3 = st.columns(3)
+        col1.metric("💰 Total Revenue", f"{df['total_cost'].sum():.2f} RON")
+        avg_cost = df[df["total_cost"] > 0]["total_cost"].mean() if len(df[df["total_cost"] > 0]) > 0 else 0
+        col2.metric("📊 Average Cost", f"{avg_cost:.2f} RON")
+        client_ids = client_ids_for_phones(df["client_phone"]) if "client_phone" in df.columns else pd.Series(dtype=object)
+        col3.metric("👥 Unique Clients", client_ids[client_ids != ""].nunique())
+
+        st.divider()
+        if BRANCH_COLUMN in df.columns:
+            st.subheader("By Branch")
+            branches = get_branches()
+            by_branch = df.groupby(BRANCH_COLUMN, sort=False).agg(
+                orders=("order_id", "size"), revenue=("total_cost", "sum")
             )
+            by_branch.index = [branches[code].name if code in branches else code for code in by_branch.index]
+            st.dataframe(by_branch.round(2), use_container_width=True)
 
-            selected_order_id = None
-            if event and "selection" in event and event["selection"]["rows"]:
-                selected_idx = event["selection"]["rows"][0]
-                selected_order_id = df.iloc[selected_idx]["order_id"]
-                st.session_state["selected_order_for_update"] = selected_order_id
-                st.session_state["previous_selected_order"] = selected_order_id
+        st.subheader("Orders by Status")
+        st.bar_chart(df["status"].value_counts())
 
-            if selected_order_id:
-                st.markdown(f"**Selected order:** `{selected_order_id}`")
-                col_a, col_b = st.columns(2)
-                with col_a:
-                    if st.button("✏️ Edit selected order", key="btn_edit_selected", use_container_width=True):
-                        st.session_state["active_tab"] = 2
-                        st.rerun()
-                with col_b:
-                    if st.button("🗑 Delete selected order", key="btn_delete_selected", type="secondary", use_container_width=True):
-                        if crm.delete_order(selected_order_id):
-                            st.success(f"🗑 Order {selected_order_id} deleted successfully!")
-                            st.session_state["selected_order_for_update"] = None
-                            st.rerun()
-
-            csv = df.to_csv(index=False)
-            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-            st.download_button(
-                "📥 Export to CSV",
-                csv,
-                f"orders_{ts}.csv",
-                "text/csv",
-                key="dl_csv",
+        # registrele sunt per filială: tabelele de mai jos sunt ale filialei curente
+        st.subheader("Top Clients")
+        st.dataframe(get_client_registry(branch).top_clients(10), hide_index=True, use_container_width=True)
+
+        st.subheader("Most Serviced Models")
+        st.dataframe(get_equipment_registry(branch).top_models(10), hide_index=True, use_container_width=True)
+
+        inventory = get_inventory(branch)
+        if len(inventory):
+            st.subheader("Low Stock")
+            low = inventory.low_stock()
+            if low.empty:
+                st.success("✅ All parts above reorder level")
+            else:
+                st.dataframe(low, hide_index=True, use_container_width=True)
+    else:
+        st.info("📝 No data yet.")
+
+
+def render_work_queue_tab(branch: str = MAIN_CODE):
+    """TAB 4: WORK QUEUE"""
+    st.header("Technician Work Queue")
+    queue = get_work_queue(branch)
+
+    overdue = queue.breaches()
+    if overdue:
+        st.error(f"⏰ {len(overdue)} open orders are past their SLA deadline")
+        with st.expander("Show overdue orders", expanded=False):
+            st.dataframe(
+                pd.DataFrame([
+                    {
+                        "order_id": job.order_id,
+                        "technician": job.technician,
+                        "client": job.client_name,
+                        "status": job.status,
+                        "deadline": job.deadline.isoformat(),
+                        "days_overdue": (date.today() - job.deadline).days,
+                    }
+                    for job in overdue
+                ]),
+                hide_index=True,
                 use_container_width=True,
             )
-        else:
-            st.info("📝 No orders yet. Create your first order in the 'New Order' tab!")
 
-# TAB 2: UPDATE ORDER
-    elif active_tab == 2:
-        st.header("Update Service Order")
+    technicians = queue.technicians()
+    if not technicians:
+        st.info("📝 No open orders.")
+        return
+
+    technician = st.selectbox("Technician", technicians, key="queue_technician")
+    job = queue.next_job(technician)
+    if job is not None:
+        st.subheader(f"▶️ Next job: {job.order_id}")
+        col1, col2, col3 = st.columns(3)
+        col1.write(f"**Client:** {job.client_name}")
+        col2.write(f"**Received:** {job.date_received.isoformat()}")
+        col3.write(f"**Deadline:** {job.deadline.isoformat()}" + (" · 🛡️ warranty" if job.warranty else ""))
+        if st.button("✏️ Open next job", key="queue_open_next", type="primary"):
+            st.session_state["selected_order_for_update"] = job.order_id
+            st.session_state["last_tab"] = 4
+            st.session_state["active_tab"] = 2
+            st.rerun()
 
-        df = df_all_orders
+    st.subheader("Queue")
+    st.dataframe(queue.queue_df(technician), hide_index=True, use_container_width=True)
 
-        if not df.empty:
-            available_orders = df["order_id"].tolist()
-
-            default_idx = 0
-            if st.session_state["selected_order_for_update"] in available_orders:
-                default_idx = available_orders.index(st.session_state["selected_order_for_update"])
-
-            def on_order_select():
-                st.session_state["active_tab"] = 2
-
-            selected_order_id = st.selectbox(
-                "Select Order",
-                available_orders,
-                index=default_idx,
-                key="update_order_select",
-                label_visibility="collapsed",
-                on_change=on_order_select
-            )
 
-            if selected_order_id:
-                df_fresh = crm._read_df(raw=True, ttl=0)
-                if df_fresh is None or df_fresh.empty:
-                    st.error("❌ Error reading current data from Google Sheets.")
-                else:
-                    order_row = df_fresh[df_fresh["order_id"] == selected_order_id]
+# ============================================================================
+# MAIN APP
+# ============================================================================
+def main():
+    trace = start_trace(
+        "rerun",
+        sample_rate=get_trace_sample_rate(),
+        force=st.session_state.get("trace_this_session", False),
+    )
+    try:
+        run_app()
+    finally:
+        if trace is not None:
+            get_trace_buffer().append(end_trace())
 
-                    if order_row.empty:
-                        st.error("❌ Order not found in current data.")
-                    else:
-                        order = order_row.iloc[0].to_dict()
-
-                        # load printers for this order
-                        printers_initial = load_printers_from_order(order)
-                        state_key = f"upd_printers_{selected_order_id}"
-                        if state_key not in st.session_state:
-                            st.session_state[state_key] = printers_initial if printers_initial else [{"brand": "", "model": "", "serial": ""}]
-                        current_printers = st.session_state[state_key]
-
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            st.write(f"**Client:** {safe_text(order.get('client_name'))}")
-                            st.write(f"**Phone:** {safe_text(order.get('client_phone'))}")
-                            st.write(f"**Printer (main):** {safe_text(order.get('printer_brand'))} {safe_text(order.get('printer_model'))}")
-                            st.write(f"**Serial (main):** {safe_text(order.get('printer_serial'))}")
-                        with col2:
-                            st.write(f"**Received:** {safe_text(order.get('date_received'))}")
-                            st.write(f"**Issue:** {safe_text(order.get('issue_description'))}")
-                            st.write(f"**Accessories:** {safe_text(order.get('accessories'))}")
-
-                        st.divider()
-
-                        st.subheader("Printers in This Order")
-
-                        remove_flags = []
-                        for i, p in enumerate(current_printers):
-                            st.markdown(f"**Printer #{i+1}**")
-                            colA, colB, colC, colD, colE = st.columns([1.2, 1.2, 1.2, 0.8, 0.6])
-                            with colA:
-                                p["brand"] = st.text_input(f"Brand #{i+1}", value=p["brand"], key=f"upd_brand_{selected_order_id}_{i}")
-                            with colB:
-                                p["model"] = st.text_input(f"Model #{i+1}", value=p["model"], key=f"upd_model_{selected_order_id}_{i}")
-                            with colC:
-                                p["serial"] = st.text_input(f"Serial #{i+1}", value=p["serial"], key=f"upd_serial_{selected_order_id}_{i}")
-                            with colD:
-                                # NOU: Checkbox Warranty
-                                initial_warranty = p.get("warranty", False)
-                                p["warranty"] = st.checkbox(
-                                    "Warranty",
-                                    value=initial_warranty,
-                                    key=f"upd_warranty_printer_{selected_order_id}_{i}",
-                                    help="Check this box if the printer is under warranty."
-                                )
-                            with colE:
-                                remove_flags.append(
-                                    st.checkbox("Remove", key=f"upd_remove_printer_{selected_order_id}_{i}")
-                                )
-
-                        colp_r1, colp_r2 = st.columns(2)
-                        with colp_r1:
-                            if st.button("🗑 Remove selected", key=f"upd_remove_selected_{selected_order_id}"):
-                                # 1) Ștergere locală
-                                st.session_state[state_key] = [
-                                    p for p, flag in zip(current_printers, remove_flags) if not flag
-                                ]
-                                if not st.session_state[state_key]:
-                                    st.session_state[state_key] = [{"brand": "", "model": "", "serial": ""}]
-
-                                # 2) Regenerăm JSON-ul pentru spreadsheet
-                                printers_clean = []
-                                for p in st.session_state[state_key]:
-                                    brand = safe_text(p.get("brand", "")).strip()
-                                    model = safe_text(p.get("model", "")).strip()
-                                    serial = safe_text(p.get("serial", "")).strip()
-                                    if brand or model or serial:
-                                        printers_clean.append({
-                                            "brand": brand,
-                                            "model": model,
-                                            "serial": serial,
-                                        })
-
-                                printers_json = json.dumps(printers_clean, ensure_ascii=False)
-
-                                # 3) Actualizăm și câmpurile legacy
-                                fb, fm, fs = "", "", ""
-                                if printers_clean:
-                                    fb, fm, fs = printers_clean[0]["brand"], printers_clean[0]["model"], printers_clean[0]["serial"]
-
-                                # 4) Scriem în spreadsheet imediat
-                                crm.update_order(
-                                    selected_order_id,
-                                    printers_json=printers_json,
-                                    printer_brand=fb,
-                                    printer_model=fm,
-                                    printer_serial=fs
-                                )
-
-                                # 5) Reafișăm pagina
-                                st.success("🗑 Imprimantele selectate au fost șterse!")
-                                st.rerun()
-
-                        with colp_r2:
-                            if st.button("➕ Add printer", key=f"upd_add_printer_btn_{selected_order_id}"):
-                                printers_list = st.session_state.get(state_key, [])
-                                printers_list.append({"brand": "", "model": "", "serial": ""})
-                                st.session_state[state_key] = printers_list
-                                st.rerun()
-
-                        st.divider()
-
-                        status_options = ["Received", "In Progress", "Ready for Pickup", "Completed"]
-                        current_status = safe_text(order.get("status")) or "Received"
-                        if current_status not in status_options:
-                            current_status = "Received"
-                        status_index = status_options.index(current_status)
-
-                        new_status = st.selectbox(
-                            "Status",
-                            status_options,
-                            index=status_index,
-                            key=f"update_status_{selected_order_id}",
-                        )
 
-                        if new_status == "Completed":
-                            actual_pickup_date = st.date_input(
-                                "Actual Pickup Date",
-                                value=date.today(),
-                                key=f"update_pickup_date_{selected_order_id}",
-                            )
-                        else:
-                            actual_pickup_date = None
+def run_app():
+    if not check_password():
+        st.stop()
 
-                        st.subheader("Repair details")
+    st.title("🖨️ Printer Service CRM")
+    st.markdown("### Professional Printer Service Management System")
 
-                        repair_details = st.text_area(
-                            "Repairs performed",
-                            value=safe_text(order.get("repair_details")),
-                            height=100,
-                            key=f"update_repair_details_{selected_order_id}",
-                        )
+    if "company_info" not in st.session_state:
+        try:
+            st.session_state["company_info"] = dict(st.secrets.get("company_info", {}))
+        except Exception:
+            st.session_state["company_info"] = {
+                "company_name": "Company Name",
+                "company_address": "Address",
+                "cui": "CUI",
+                "reg_com": "Reg.Com",
+                "phone": "Phone",
+                "email": "Email",
+            }
 
-                        parts_used = st.text_input(
-                            "Parts used",
-                            value=safe_text(order.get("parts_used")),
-                            key=f"update_parts_used_{selected_order_id}",
-                        )
+    # Sidebar
+    with st.sidebar:
+        st.header("⚙️ Configuration")
+        st.success(f"👤 {st.session_state.get('username', 'User')}")
 
-                        technician = st.text_input(
-                            "Technician",
-                            value=safe_text(order.get("technician")),
-                            key=f"update_technician_{selected_order_id}",
-                        )
+        if st.button("🚪 Logout", key="logout_btn"):
+            st.session_state["authenticated"] = False
+            st.rerun()
 
-                        colc1, colc2, colc3 = st.columns(3)
-                        labor_cost = colc1.number_input(
-                            "Labor cost (RON)",
-                            value=safe_float(order.get("labor_cost")),
-                            min_value=0.0,
-                            step=10.0,
-                            key=f"update_labor_cost_{selected_order_id}",
-                        )
-                        parts_cost = colc2.number_input(
-                            "Parts cost (RON)",
-                            value=safe_float(order.get("parts_cost")),
-                            min_value=0.0,
-                            step=10.0,
-                            key=f"update_parts_cost_{selected_order_id}",
-                        )
-                        colc3.metric("💰 Total", f"{labor_cost + parts_cost:.2f} RON")
-
-                        if st.button("💾 Update Order", type="primary", key=f"update_order_btn_{selected_order_id}"):
-                            # Clean printers list
-                            printers_clean = []
-                            for p in st.session_state[state_key]:
-                                brand = safe_text(p.get("brand", "")).strip()
-                                model = safe_text(p.get("model", "")).strip()
-                                serial = safe_text(p.get("serial", "")).strip()
-                                warranty = p.get("warranty", False) 
-                                if brand or model or serial:
-                                    printers_clean.append({
-                                        "brand": brand,
-                                        "model": model,
-                                        "serial": serial,
-                                        "warranty": warranty, 
-                                    })
-
-                            printers_json = json.dumps(printers_clean, ensure_ascii=False)
-
-                            first_brand = ""
-                            first_model = ""
-                            first_serial = ""
-                            if printers_clean:
-                                first_brand = printers_clean[0]["brand"]
-                                first_model = printers_clean[0]["model"]
-                                first_serial = printers_clean[0]["serial"]
-
-                            updates = {
-                                "status": new_status,
-                                "repair_details": repair_details,
-                                "parts_used": parts_used,
-                                "technician": technician,
-                                "labor_cost": labor_cost,
-                                "parts_cost": parts_cost,
-                                "printers_json": printers_json,
-                                "printer_brand": first_brand,
-                                "printer_model": first_model,
-                                "printer_serial": first_serial,
-                            }
-
-                            if new_status == "Ready for Pickup" and not order.get("date_completed"):
-                                updates["date_completed"] = datetime.now().strftime("%Y-%m-%d")
-                            if new_status == "Completed":
-                                updates["date_picked_up"] = (
-                                    actual_pickup_date.strftime("%Y-%m-%d")
-                                    if actual_pickup_date
-                                    else datetime.now().strftime("%Y-%m-%d")
-                                )
-
-                            if crm.update_order(selected_order_id, **updates):
-                                st.success("✅ Order updated successfully!")
-                                st.rerun()
-
-                        st.divider()
-                        st.subheader("📄 Download Receipts")
-
-                        # Re-citim comanda proaspăt din sheet pentru PDF-uri actualizate
-                        df_latest = crm._read_df(raw=True, ttl=0)
-                        if df_latest is not None and not df_latest.empty:
-                            mask = df_latest["order_id"] == selected_order_id
-                            if mask.any():
-                                order_latest = df_latest[mask].iloc[0].to_dict()
-                            else:
-                                order_latest = order  # fallback la varianta veche deja încărcată
-                        else:
-                            order_latest = order
-
-                        logo = st.session_state.get("logo_image", None)
-
-                        colp1, colp2 = st.columns(2)
-                        with colp1:
-                            st.markdown("**Initial Receipt**")
-                            pdf_init = generate_initial_receipt_pdf(order_latest, st.session_state["company_info"], logo)
-                            st.download_button(
-                                "📄 Download Initial",
-                                pdf_init,
-                                f"Initial_{order_latest['order_id']}.pdf",
-                                "application/pdf",
-                                use_container_width=True,
-                                key=f"dl_upd_init_{order_latest['order_id']}",
-                            )
-                        with colp2:
-                            st.markdown("**Completion Receipt**")
-                            pdf_comp = generate_completion_receipt_pdf(order_latest, st.session_state["company_info"], logo)
-                            st.download_button(
-                                "📄 Download Completion",
-                                pdf_comp,
-                                f"Completion_{order_latest['order_id']}.pdf",
-                                "application/pdf",
-                                use_container_width=True,
-                                key=f"dl_upd_comp_{order_latest['order_id']}",
-                            )
-        else:
-            st.info("📝 No orders yet.")
+        st.divider()
 
-    # TAB 3: REPORTS
-    elif active_tab == 3:
-        st.header("Reports & Analytics")
-        df = df_all_orders
-        if not df.empty:
-            col1, col2, col3 = st.columns(3)
-            col1.metric("💰 Total Revenue", f"{df['total_cost'].sum():.2f} RON")
-            avg_cost = df[df["total_cost"] > 0]["total_cost"].mean() if len(df[df["total_cost"] > 0]) > 0 else 0
-            col2.metric("📊 Average Cost", f"{avg_cost:.2f} RON")
-            col3.metric("👥 Unique Clients", df["client_name"].nunique())
+        with st.expander("🖼️ Company Logo", expanded=False):
+            if st.session_state.get("logo_image"):
+                st.image(st.session_state["logo_image"], width=150)
+                st.success("✅ Logo loaded from repository")
+            else:
+                st.warning("⚠️ Logo not found")
+                st.info("Add 'logo.png' to 'assets/' folder in your GitHub repo")
 
-            st.divider()
-            st.subheader("Orders by Status")
-            st.bar_chart(df["status"].value_counts())
-        else:
-            st.info("📝 No data yet.")
+        with st.expander("🏢 Company Details", expanded=False):
+            ci = st.session_state["company_info"]
+            ci["company_name"] = st.text_input("Company Name", value=ci["company_name"], key="company_name_input")
+            ci["company_address"] = st.text_input("Address", value=ci["company_address"], key="company_address_input")
+            ci["cui"] = st.text_input("CUI", value=ci["cui"], key="company_cui_input")
+            ci["reg_com"] = st.text_input("Reg.Com", value=ci["reg_com"], key="company_regcom_input")
+            ci["phone"] = st.text_input("Phone", value=ci["phone"], key="company_phone_input")
+            ci["email"] = st.text_input("Email", value=ci["email"], key="company_email_input")
+
+        render_branch_selector()
+
+        conn = get_sheets_connection()
+        with st.expander("📊 Google Sheets", expanded=False):
+            if conn:
+                st.success("✅ Connected to Google Sheets!")
+            else:
+                st.error("❌ Not connected to Google Sheets")
+
+        if st.session_state.get("username") == "admin":
+            render_performance_panel()
+            render_session_panel()
+            render_archive_panel()
+            render_notifications_panel()
+
+    conn = get_sheets_connection()
+    if not conn:
+        st.error("Cannot connect to Google Sheets. Check secrets configuration.")
+        st.stop()
+
+    crm = branch_crm(conn, current_branch().code)
+    st.session_state["crm"] = crm
+    crm.finish_warm_start()
+    if crm.serving_warm:
+        st.sidebar.caption(f"⚡ Local copy from {crm.warm_saved_at.replace('T', ' ')} · syncing with Google Sheets...")
+    df_all_orders, snapshot = load_indexes(crm)
+    for read in snapshot.failed:
+        if read.timed_out:
+            st.sidebar.warning(f"⏳ {read.worksheet} did not load in time; retrying on the next rerun")
+    maybe_snapshot(crm)
+    if st.session_state.get("username") == "admin":
+        render_backup_panel(crm)
+    render_inventory_panel(crm)
+    overdue = sync_work_queue(crm, df_all_orders).breaches()
+    if overdue:
+        st.sidebar.warning(f"⏰ {len(overdue)} open orders past SLA")
+
+    # Tab navigation
+    tab_titles = ["📥 New Order", "📋 All Orders", "✏️ Update Order", "📊 Reports", "🧰 Work Queue"]
+
+    cols = st.columns(len(tab_titles))
+    for idx, (col, title) in enumerate(zip(cols, tab_titles)):
+        with col:
+            if st.button(
+                title,
+                key=f"tab_btn_{idx}",
+                use_container_width=True,
+                type="primary" if st.session_state["active_tab"] == idx else "secondary",
+            ):
+                # memorează de pe ce tab vii
+                st.session_state["last_tab"] = st.session_state["active_tab"]
+                st.session_state["active_tab"] = idx
+                st.rerun()
+
+    st.divider()
+    active_tab = st.session_state["active_tab"]
+
+    with span(TAB_SPAN_NAMES[active_tab]):
+        if active_tab == 0:
+            render_new_order_tab(crm)
+        elif active_tab == 1:
+            render_all_orders_tab(crm, df_all_orders)
+        elif active_tab == 2:
+            render_update_order_tab(crm, df_all_orders)
+        elif active_tab == 3:
+            scope_all = len(get_branches()) > 1 and st.toggle("All branches", key="reports_all_branches")
+            df_reports = (
+                list_all_branches_df(conn, include_archive=True) if scope_all
+                else crm.list_orders_df(include_archive=True)
+            )
+            render_reports_tab(df_reports, crm.branch.code)
+        elif active_tab == 4:
+            render_work_queue_tab(crm.branch.code)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,77 @@
+"""
+Order codes printed as QR on the receipts and read back by a scanner.
+
+The code is the order id plus two mod-97 check digits (ISO 7064, as in
+IBAN): SRV-00012-48. A USB scanner types it like a keyboard, followed by
+Enter, into the focused text input; parse_order_code() rejects a misread
+code instead of opening the wrong order. Typed ids without check digits
+("SRV-00012", or just "12" for the current branch) are accepted too.
+
+QR drawings are encoded once per code and kept in an LRU cache, so a PDF
+only pays for drawing the modules, not for encoding them again. The
+cached drawings are shared by every session and reportlab tags their
+nodes while it renders them, so one QR is rendered at a time.
+"""
+import re
+import threading
+from functools import lru_cache
+from typing import Optional
+
+from reportlab.graphics import renderPDF
+from reportlab.graphics.barcode.qr import QrCodeWidget
+from reportlab.graphics.shapes import Drawing
+from reportlab.lib.units import mm
+
+
+ORDER_PREFIX = "SRV-"
+_CODE_RE = re.compile(r"^([A-Z]+-\d+)(?:-(\d{2}))?$")
+_RENDER_LOCK = threading.Lock()     # renderPDF pune/șterge _parent pe nodurile desenului din cache
+
+
+def check_digits(order_id: str) -> str:
+    """Two ISO 7064 mod 97-10 check digits over the alphanumerics of the id (A=10 … Z=35)."""
+    number = int("".join(str(int(ch, 36)) for ch in order_id.upper() if ch.isalnum()) or "0")
+    return f"{98 - (number * 100) % 97:02d}"
+
+
+def order_code(order_id: str) -> str:
+    return f"{order_id}-{check_digits(order_id)}"
+
+
+def parse_order_code(text: str, prefix: str = ORDER_PREFIX) -> Optional[str]:
+    """
+    The order id of a scanned/typed code, None if it is malformed or the
+    check digits are wrong. A bare number gets `prefix` (the current branch's).
+    """
+    text = (text or "").strip().upper()
+    if text.isdigit():
+        return f"{prefix}{int(text):05d}"
+    match = _CODE_RE.match(text)
+    if match is None:
+        return None
+    order_id, check = match.groups()
+    if check is not None and check != check_digits(order_id):
+        return None
+    return order_id
+
+
+@lru_cache(maxsize=2048)
+def qr_drawing(code: str, size: float) -> Drawing:
+    """The QR of `code` as a size × size drawing (points), encoded once per code."""
+    widget = QrCodeWidget(code, barLevel="M", barBorder=0)
+    x0, y0, x1, y1 = widget.getBounds()
+    # păstrăm doar pătratele desenate, nu widget-ul (care ar recodifica la fiecare randare)
+    modules = widget.draw()
+    drawing = Drawing(size, size, transform=[size / (x1 - x0), 0, 0, size / (y1 - y0), 0, 0])
+    drawing.add(modules)
+    return drawing
+
+
+def draw_order_qr(canvas, order_id: str, x: float, y: float, size: float):
+    """QR of the order code with its bottom-left corner at (x, y), the code printed under it."""
+    code = order_code(order_id)
+    drawing = qr_drawing(code, size)
+    with _RENDER_LOCK:
+        renderPDF.draw(drawing, canvas, x, y)
+    canvas.setFont("Helvetica", 6)
+    canvas.drawCentredString(x + size / 2, y - 2.5 * mm, code)
@@ -0,0 +1,261 @@
+"""
+Technician work queues with SLA deadlines.
+
+Every open order (Received / In Progress) gets a fixed deadline:
+date_received + SLA days (shorter for warranty jobs), or the scheduled
+pickup date if that comes first. Because the deadline does not change as
+time passes, ordering by it is the same as ordering by age, and each queue
+can be a plain heap:
+
+- one heap per technician ("next job" = the earliest deadline),
+- one global heap of deadlines not yet breached; advance(now) moves the
+  newly breached orders into a set, so alerts never rescan all orders.
+
+Updates are O(log n): a changed order gets a new heap entry and the old one
+is invalidated (lazy deletion).
+
+sync() gets the whole live sheet on every rerun. Each order's fingerprint
+(a hash of its status, technician and date columns, plus its printers for
+an open order: their warranty flags set the deadline) is kept, so orders
+changed outside this process (another API worker, the batch CLI, an edit
+in the sheet) are re-ingested, and orders no longer in the sheet leave the
+queue, without re-parsing the unchanged ones.
+"""
+import heapq
+import itertools
+import threading
+from datetime import date, datetime, timedelta
+from typing import Callable, Optional
+
+import pandas as pd
+
+from cells import safe_text
+
+
+OPEN_STATUSES = ("Received", "In Progress")
+UNASSIGNED = "Unassigned"
+DEFAULT_SLA_DAYS = 10
+DEFAULT_WARRANTY_SLA_DAYS = 7
+QUEUE_COLUMNS = [
+    "order_id", "client_name", "technician", "status", "date_received",
+    "date_pickup_scheduled", "printers_json", "printer_brand", "printer_model", "printer_serial",
+]
+# ce poate scoate o comandă din coadă sau îi poate muta termenul/tehnicianul
+FINGERPRINT_COLUMNS = ["status", "technician", "date_received", "date_pickup_scheduled"]
+# garanția (din printers_json) scurtează termenul; contează doar la comenzile deschise
+OPEN_FINGERPRINT_COLUMNS = ["printers_json"]
+
+
+def _parse_date(value) -> Optional[date]:
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()[:10]
+    if not text:
+        return None
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        return None
+
+
+class Job:
+    __slots__ = ("order_id", "client_name", "technician", "status", "warranty",
+                 "date_received", "deadline", "valid")
+
+    def __init__(self, order_id, client_name, technician, status, warranty, date_received, deadline):
+        self.order_id = order_id
+        self.client_name = client_name
+        self.technician = technician
+        self.status = status
+        self.warranty = warranty
+        self.date_received = date_received
+        self.deadline = deadline
+        self.valid = True
+
+    def sort_key(self):
+        # deadline întâi; la egalitate garanția, apoi cea mai veche comandă
+        return (self.deadline, not self.warranty, self.date_received, self.order_id)
+
+
+class WorkQueue:
+    def __init__(self, sla_days: int = DEFAULT_SLA_DAYS, warranty_sla_days: int = DEFAULT_WARRANTY_SLA_DAYS):
+        self.sla_days = sla_days
+        self.warranty_sla_days = warranty_sla_days
+        self._jobs = {}          # order_id → Job activ
+        self._queues = {}        # tehnician → heap de (sort_key, seq, Job)
+        self._pending = []       # heap global (deadline, seq, Job) încă în termen
+        self._breached = {}      # order_id → Job cu termenul depășit
+        self._prints = {}        # order_id → amprenta rândului ingerat (= comenzi văzute)
+        self._tiebreak = itertools.count()   # o comandă re-adăugată are aceeași cheie ca intrarea invalidată
+        self._lock = threading.Lock()
+        self.history_loaded = False
+
+    # ------------------------------------------------------------------ ingest
+    def deadline_for(self, date_received: date, warranty: bool, pickup: Optional[date]) -> date:
+        days = self.warranty_sla_days if warranty else self.sla_days
+        deadline = date_received + timedelta(days=days)
+        if pickup is not None and pickup < deadline:
+            deadline = pickup
+        return deadline
+
+    def sync(self, df: Optional[pd.DataFrame], load_printers: Callable[[dict], list]) -> int:
+        """
+        Bring the queue in step with df, the whole live sheet: orders that are
+        new or whose fingerprint changed are (re-)ingested, orders missing
+        from df are removed. Returns how many were ingested.
+        """
+        if df is None or df.empty or "order_id" not in df.columns:
+            return 0
+        ids = df["order_id"].tolist()
+        prints = _fingerprints(df)
+        with self._lock:
+            known = self._prints
+            stale = [known.get(oid) != fp for oid, fp in zip(ids, prints)]
+            count = 0
+            if any(stale):
+                count = self._upsert_rows(df[stale], load_printers, [fp for fp, s in zip(prints, stale) if s])
+            if len(known) != len(ids):
+                # șterse sau arhivate în altă parte
+                for order_id in known.keys() - set(ids):
+                    self._forget(order_id)
+            return count
+
+    def refresh(self, df: Optional[pd.DataFrame], load_printers: Callable[[dict], list]) -> int:
+        """Re-ingest created/updated orders (status, technician or dates may have changed)."""
+        if df is None or df.empty or "order_id" not in df.columns:
+            return 0
+        with self._lock:
+            return self._upsert_rows(df, load_printers, _fingerprints(df))
+
+    def remove_order(self, order_id: str):
+        with self._lock:
+            self._forget(order_id)
+
+    def _upsert_rows(self, df: pd.DataFrame, load_printers, prints: list) -> int:
+        if df.empty:
+            return 0
+        cols = [c for c in QUEUE_COLUMNS if c in df.columns]
+        count = 0
+        for order, fingerprint in zip(df[cols].to_dict("records"), prints):
+            self._upsert(order, load_printers, fingerprint)
+            count += 1
+        return count
+
+    def _upsert(self, order: dict, load_printers, fingerprint):
+        order_id = safe_text(order.get("order_id"))
+        self._prints[order_id] = fingerprint
+        self._remove(order_id)
+        status = safe_text(order.get("status")) or "Received"
+        received = _parse_date(order.get("date_received"))
+        if status not in OPEN_STATUSES or received is None:
+            return
+        warranty = any(p.get("warranty") for p in load_printers(order))
+        job = Job(
+            order_id,
+            safe_text(order.get("client_name")),
+            safe_text(order.get("technician")).strip() or UNASSIGNED,
+            status,
+            warranty,
+            received,
+            self.deadline_for(received, warranty, _parse_date(order.get("date_pickup_scheduled"))),
+        )
+        self._jobs[order_id] = job
+        seq = next(self._tiebreak)
+        heapq.heappush(self._queues.setdefault(job.technician, []), (job.sort_key(), seq, job))
+        heapq.heappush(self._pending, (job.deadline, seq, job))
+
+    def _remove(self, order_id: str):
+        job = self._jobs.pop(order_id, None)
+        if job is not None:
+            job.valid = False   # intrările din heap-uri sunt ignorate la citire
+        self._breached.pop(order_id, None)
+
+    def _forget(self, order_id: str):
+        self._prints.pop(order_id, None)
+        self._remove(order_id)
+
+    # ------------------------------------------------------------------ queries
+    def advance(self, today: Optional[date] = None) -> list:
+        """Move jobs whose deadline passed into the breached set; returns the new breaches."""
+        today = today or date.today()
+        newly = []
+        with self._lock:
+            while self._pending and self._pending[0][0] < today:
+                _, _, job = heapq.heappop(self._pending)
+                if job.valid:
+                    self._breached[job.order_id] = job
+                    newly.append(job)
+        return newly
+
+    def breaches(self, today: Optional[date] = None) -> list:
+        """All open jobs past their deadline, most overdue first."""
+        self.advance(today)
+        with self._lock:
+            return sorted(self._breached.values(), key=Job.sort_key)
+
+    def next_job(self, technician: str) -> Optional[Job]:
+        with self._lock:
+            heap = self._queues.get(technician, [])
+            while heap and not heap[0][-1].valid:
+                heapq.heappop(heap)
+            return heap[0][-1] if heap else None
+
+    def technicians(self) -> list:
+        with self._lock:
+            names = {job.technician for job in self._jobs.values()}
+        return sorted(names, key=lambda n: (n == UNASSIGNED, n.lower()))
+
+    def queue(self, technician: str, limit: int = 50) -> list:
+        """The technician's open jobs in priority order (without popping them)."""
+        with self._lock:
+            heap = self._queues.get(technician, [])
+            live = [entry for entry in heap if entry[-1].valid]
+            if len(live) < len(heap) // 2:
+                # compactăm heap-ul când intrările invalide sunt majoritare
+                heapq.heapify(live)
+                self._queues[technician] = live
+            return [entry[-1] for entry in heapq.nsmallest(limit, live)]
+
+    def queue_df(self, technician: str, today: Optional[date] = None, limit: int = 50) -> pd.DataFrame:
+        today = today or date.today()
+        rows = [
+            {
+                "order_id": job.order_id,
+                "client": job.client_name,
+                "status": job.status,
+                "warranty": job.warranty,
+                "received": job.date_received.isoformat(),
+                "age_days": (today - job.date_received).days,
+                "deadline": job.deadline.isoformat(),
+                "days_left": (job.deadline - today).days,
+            }
+            for job in self.queue(technician, limit)
+        ]
+        return pd.DataFrame(rows, columns=[
+            "order_id", "client", "status", "warranty", "received", "age_days", "deadline", "days_left",
+        ])
+
+
+def _fingerprints(df: pd.DataFrame) -> list:
+    """
+    One hash per row of the FINGERPRINT_COLUMNS df has (vectorized;
+    categoricals hash like their values), open orders mixing in their
+    OPEN_FINGERPRINT_COLUMNS. Closed orders skip those (hashing every
+    printers_json costs ~20x more): a closed order is not in the queue, and
+    reopening it changes its status, so it is re-ingested anyway.
+    """
+    cols = [c for c in FINGERPRINT_COLUMNS if c in df.columns]
+    if not cols:
+        return [0] * len(df)
+    prints = pd.util.hash_pandas_object(df[cols], index=False).to_numpy()
+    extra = [c for c in OPEN_FINGERPRINT_COLUMNS if c in df.columns]
+    if extra and "status" in df.columns:
+        open_rows = df["status"].isin(OPEN_STATUSES).to_numpy()
+        if open_rows.any():
+            prints = prints.copy()
+            prints[open_rows] ^= pd.util.hash_pandas_object(df.loc[open_rows, extra], index=False).to_numpy()
+    return prints.tolist()
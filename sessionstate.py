@@ -0,0 +1,106 @@
+"""
+Per-order session state with LRU eviction.
+
+The Update tab keys its widgets and drafts by order id (upd_printers_<id>,
+update_status_<id>, upd_brand_<id>_<i>, ...). Streamlit drops the values
+of widgets that are not rendered on a completed run, but a plain session
+key such as the printer draft (upd_printers_<id>) stays for the whole
+session, and widget values survive runs that are cut short by st.rerun().
+Over a shift one session collects state for hundreds of orders.
+
+OrderStateLRU remembers the orders a session opened, most recent last.
+Opening one more than `capacity` evicts every key of the oldest one, so a
+session only keeps the drafts of the orders it is working on.
+
+session_state_report() estimates what each key holds, for the admin panel.
+"""
+import io
+import sys
+from collections import OrderedDict
+
+import pandas as pd
+
+
+LRU_KEY = "_order_state_lru"
+DEFAULT_CAPACITY = 5
+
+
+def owned_by(key: str, order_id: str) -> bool:
+    """True for keys scoped to the order: ..._<order_id> or ..._<order_id>_<i>."""
+    return key.endswith(f"_{order_id}") or f"_{order_id}_" in key
+
+
+class OrderStateLRU:
+    __slots__ = ("state", "capacity")
+
+    def __init__(self, state, capacity: int = DEFAULT_CAPACITY):
+        self.state = state
+        self.capacity = max(1, capacity)
+
+    @property
+    def orders(self) -> OrderedDict:
+        if LRU_KEY not in self.state:
+            self.state[LRU_KEY] = OrderedDict()
+        return self.state[LRU_KEY]
+
+    def touch(self, order_id: str) -> list:
+        """Mark the order as the most recent; returns the orders whose state was evicted."""
+        orders = self.orders
+        orders[order_id] = None
+        orders.move_to_end(order_id)
+        evicted = []
+        while len(orders) > self.capacity:
+            oldest, _ = orders.popitem(last=False)
+            self.evict(oldest)
+            evicted.append(oldest)
+        return evicted
+
+    def evict(self, order_id: str) -> int:
+        """Delete every session key of the order; returns how many were removed."""
+        self.orders.pop(order_id, None)
+        keys = [k for k in list(self.state.keys()) if isinstance(k, str) and owned_by(k, order_id)]
+        for key in keys:
+            del self.state[key]
+        return len(keys)
+
+    def evict_all_but(self, order_id: str) -> int:
+        removed = 0
+        for other in [oid for oid in self.orders if oid != order_id]:
+            removed += self.evict(other)
+        return removed
+
+
+def approx_size(value, _seen=None, _depth: int = 0) -> int:
+    """
+    Rough deep size in bytes: containers and frames are followed, other
+    objects (CRM, registries) count shallowly since they are shared.
+    """
+    seen = _seen if _seen is not None else set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if isinstance(value, io.BytesIO):
+        return sys.getsizeof(value) + value.getbuffer().nbytes
+    size = sys.getsizeof(value)
+    if _depth >= 6:
+        return size
+    if isinstance(value, dict):
+        size += sum(approx_size(k, seen, _depth + 1) + approx_size(v, seen, _depth + 1) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(approx_size(v, seen, _depth + 1) for v in value)
+    return size
+
+
+def session_state_report(state) -> pd.DataFrame:
+    """One row per session key: key, type, approximate bytes and owning order (if any), largest first."""
+    orders = list(state.get(LRU_KEY, ()))
+    rows = []
+    for key in list(state.keys()):
+        value = state[key]
+        owner = next((oid for oid in orders if isinstance(key, str) and owned_by(key, oid)), "")
+        rows.append({"key": key, "type": type(value).__name__, "bytes": approx_size(value), "order": owner})
+    df = pd.DataFrame(rows, columns=["key", "type", "bytes", "order"])
+    return df.sort_values("bytes", ascending=False, ignore_index=True)
@@ -0,0 +1,136 @@
+"""
+Concurrent reads of several worksheets into one snapshot.
+
+A cold start reads the live orders, the archive and the child worksheets
+(parts, stock ledger, line items, attachments) to build the in-process
+indexes. One after another, each Sheets round trip adds up; here they run
+side by side on a small thread pool, so the start waits for the slowest
+read instead of the sum of all of them.
+
+    snapshot = load_sheets(read, {"Orders": 60, "Parts": 0, ...}, timeout=10)
+    snapshot.frame("Parts")          # None if the read failed or timed out
+    snapshot.usable("Parts")         # False only if it timed out
+    snapshot.get("Parts").missing    # the worksheet does not exist (not an error)
+
+Failures are partial: a read that raises is recorded with its error and
+the others still count. A read still running after `timeout` seconds is
+abandoned (its thread finishes in the background and the result is
+dropped), so the caller can skip whatever depended on it and try again
+later instead of waiting.
+
+All reads of a snapshot are started together and each frame is read once,
+so everything built from it in a rerun sees the same state of the sheets.
+"""
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Optional
+
+import pandas as pd
+
+
+DEFAULT_TIMEOUT = 15.0
+DEFAULT_WORKERS = 8
+
+
+def is_missing_worksheet(error: Exception) -> bool:
+    """True if a read failed only because the worksheet does not exist (gspread's WorksheetNotFound)."""
+    return type(error).__name__ == "WorksheetNotFound"
+
+
+class SheetRead:
+    __slots__ = ("worksheet", "ttl", "df", "error", "timed_out", "missing", "elapsed_ms")
+
+    def __init__(self, worksheet: str, ttl: int, df: Optional[pd.DataFrame] = None, error: str = "",
+                 timed_out: bool = False, missing: bool = False, elapsed_ms: float = 0.0):
+        self.worksheet = worksheet
+        self.ttl = ttl
+        self.df = df
+        self.error = error
+        self.timed_out = timed_out
+        self.missing = missing          # foaia nu există încă: df None, dar nu e o eroare
+        self.elapsed_ms = elapsed_ms
+
+    @property
+    def ok(self) -> bool:
+        return not self.error and not self.timed_out
+
+
+class SheetSnapshot:
+    __slots__ = ("reads", "elapsed_ms")
+
+    def __init__(self, reads: dict, elapsed_ms: float = 0.0):
+        self.reads = reads              # worksheet → SheetRead
+        self.elapsed_ms = elapsed_ms
+
+    def get(self, worksheet: str) -> Optional[SheetRead]:
+        return self.reads.get(worksheet)
+
+    def frame(self, worksheet: str) -> Optional[pd.DataFrame]:
+        read = self.reads.get(worksheet)
+        return read.df if read is not None and read.ok else None
+
+    def usable(self, *worksheets: str) -> bool:
+        """False if any of the worksheets timed out (worksheets not in the snapshot are fine)."""
+        return not any(self.reads[ws].timed_out for ws in worksheets if ws in self.reads)
+
+    @property
+    def failed(self) -> list:
+        return [read for read in self.reads.values() if not read.ok]
+
+
+def load_sheets(
+    read: Callable,
+    requests: dict,
+    timeout: Optional[float] = DEFAULT_TIMEOUT,
+    workers: int = DEFAULT_WORKERS,
+) -> SheetSnapshot:
+    """
+    read(worksheet, ttl) for every worksheet → ttl of `requests`, side by
+    side on up to `workers` threads; a single request runs inline. Each
+    read runs in a copy of the caller's context, so its tracing spans
+    belong to the current rerun.
+
+    `timeout` is counted from the start of the load. With at least as many
+    workers as requests (the default for the CRM's startup reads) every
+    read starts at once, so it is the budget of each read; queued reads
+    spend part of theirs waiting for a worker.
+    """
+    started = time.perf_counter()
+    if not requests:
+        return SheetSnapshot({})
+
+    def timed(worksheet: str, ttl: int) -> SheetRead:
+        t0 = time.perf_counter()
+        try:
+            df = read(worksheet, ttl)
+            return SheetRead(worksheet, ttl, df, elapsed_ms=(time.perf_counter() - t0) * 1000)
+        except Exception as e:
+            if is_missing_worksheet(e):
+                return SheetRead(worksheet, ttl, missing=True, elapsed_ms=(time.perf_counter() - t0) * 1000)
+            return SheetRead(worksheet, ttl, error=str(e) or type(e).__name__,
+                             elapsed_ms=(time.perf_counter() - t0) * 1000)
+
+    if len(requests) == 1:
+        (worksheet, ttl), = requests.items()
+        result = timed(worksheet, ttl)
+        return SheetSnapshot({worksheet: result}, result.elapsed_ms)
+
+    pool = ThreadPoolExecutor(max_workers=min(workers, len(requests)), thread_name_prefix="sheet-load")
+    try:
+        futures = {
+            ws: pool.submit(contextvars.copy_context().run, timed, ws, ttl) for ws, ttl in requests.items()
+        }
+        deadline = started + timeout if timeout else None
+        reads = {}
+        for ws, future in futures.items():
+            remaining = None if deadline is None else max(deadline - time.perf_counter(), 0.0)
+            try:
+                reads[ws] = future.result(timeout=remaining)
+            except FutureTimeout:
+                reads[ws] = SheetRead(ws, requests[ws], error=f"timed out after {timeout:g}s", timed_out=True,
+                                      elapsed_ms=(time.perf_counter() - started) * 1000)
+    finally:
+        # citirile rămase în urmă nu blochează rerun-ul; rezultatul lor se pierde
+        pool.shutdown(wait=False, cancel_futures=True)
+    return SheetSnapshot(reads, (time.perf_counter() - started) * 1000)
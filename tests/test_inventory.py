@@ -0,0 +1,32 @@
+import pandas as pd
+
+from inventory import KIND_RECEIVE, Inventory
+
+
+def test_ledger_sku_missing_from_catalog_keeps_its_stock():
+    inventory = Inventory()
+    parts = pd.DataFrame([{"sku": "FUSER-1", "name": "Fuser unit", "unit_price": 250.0, "reorder_level": 2}])
+    ledger = pd.DataFrame([
+        {"sku": "fuser-1", "qty_delta": 3, "unit_price": 250.0, "order_id": "", "kind": KIND_RECEIVE},
+        {"sku": "GONE", "qty_delta": 5, "unit_price": 10.0, "order_id": "", "kind": KIND_RECEIVE},
+        {"sku": "GONE", "qty_delta": -2, "unit_price": 10.0, "order_id": "SRV-00001", "kind": "consume"},
+    ])
+
+    inventory.load(parts, ledger)
+
+    assert inventory.loaded
+    assert inventory.get("FUSER-1").on_hand == 3
+    gone = inventory.get("GONE")
+    assert gone.on_hand == 3
+    assert (gone.name, gone.unit_price, gone.reorder_level) == ("GONE", 0.0, 0)
+    assert inventory.order_parts("SRV-00001") == {"GONE": 2}
+
+
+def test_receive_stock_for_sku_not_in_catalog():
+    inventory = Inventory()
+    inventory.load(None, None)
+
+    inventory.apply([{"sku": "new-part", "qty_delta": 4, "unit_price": 0.0, "order_id": "", "kind": KIND_RECEIVE}])
+
+    assert inventory.get("NEW-PART").on_hand == 4
+    assert [p.sku for p in inventory.search("new")] == ["NEW-PART"]
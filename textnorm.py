@@ -0,0 +1,100 @@
+"""
+Text normalization for receipts, search and export.
+
+The base-14 PDF fonts (Helvetica) only cover WinAnsi, so anything drawn on a
+receipt is folded to plain ASCII first: a precompiled str.translate table
+handles the common cases (Romanian comma/cedilla letters, ligatures,
+typographic punctuation), then Unicode NFKD strips any remaining accents.
+"""
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+
+# Litere care nu se descompun prin NFKD sau care au o transliterare consacrată
+_SPECIAL = {
+    "ș": "s", "Ș": "S", "ş": "s", "Ş": "S",
+    "ț": "t", "Ț": "T", "ţ": "t", "Ţ": "T",
+    "ă": "a", "Ă": "A", "â": "a", "Â": "A",
+    "î": "i", "Î": "I",
+    "ß": "ss", "æ": "ae", "Æ": "AE", "œ": "oe", "Œ": "OE",
+    "ø": "o", "Ø": "O", "ł": "l", "Ł": "L", "đ": "d", "Đ": "D",
+    "ð": "d", "Ð": "D", "þ": "th", "Þ": "Th", "ı": "i",
+    "‘": "'", "’": "'", "‚": "'", "‛": "'",
+    "“": '"', "”": '"', "„": '"', "«": '"', "»": '"',
+    "–": "-", "—": "-", "‐": "-", "‑": "-", "−": "-",
+    "…": "...", "•": "*", "·": ".", "⁄": "/",
+    " ": " ", " ": " ", " ": " ",
+    "€": "EUR", "№": "Nr.", "°": " grd",
+}
+_TRANSLATE_TABLE = str.maketrans(_SPECIAL)
+_REPLACEMENT = "?"
+
+
+@lru_cache(maxsize=8192)
+def _fold(text: str) -> str:
+    text = text.translate(_TRANSLATE_TABLE)
+    if text.isascii():
+        return text
+    decomposed = unicodedata.normalize("NFKD", text)
+    out = []
+    for ch in decomposed:
+        if ch.isascii():
+            out.append(ch)
+        elif unicodedata.combining(ch):
+            continue
+        else:
+            out.append(_REPLACEMENT)
+    return "".join(out)
+
+
+def fold_text(text):
+    """
+    ASCII-fold a string for Helvetica output; non-strings pass through unchanged.
+    Results are memoized, so repeated values (company info, brands) are free.
+    """
+    if not isinstance(text, str) or text.isascii():
+        return text
+    return _fold(text)
+
+
+def fold_series(values: pd.Series) -> pd.Series:
+    """
+    Vectorized fold_text for a whole column: each distinct value is folded
+    once and broadcast back, so cost scales with cardinality, not row count.
+    Missing values become "".
+    """
+    codes, uniques = pd.factorize(values, sort=False)
+    folded = [fold_text(u if isinstance(u, str) else str(u)) for u in uniques]
+    # factorize dă -1 pentru valori lipsă → ultimul element ("")
+    lookup = np.array(folded + [""], dtype=object)
+    return pd.Series(lookup[codes], index=values.index, dtype=object)
+
+
+def fold_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """fold_series applied to every text/categorical column (numeric columns untouched)."""
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        if s.dtype == object or isinstance(s.dtype, (pd.CategoricalDtype, pd.StringDtype)):
+            out[col] = fold_series(s)
+        else:
+            out[col] = s
+    return pd.DataFrame(out, index=df.index)
+
+
+def search_key_series(values: pd.Series) -> pd.Series:
+    """Case- and diacritic-insensitive form of a column, for substring search."""
+    return fold_series(values).str.lower()
+
+
+def search_key(text) -> str:
+    return (fold_text(text) or "").lower() if isinstance(text, str) else ""
+
+
+def name_index_keys(name: str) -> list:
+    """Folded name suffixes starting at each word ("ion popescu", "popescu"), for prefix indexes."""
+    words = search_key(name).split()
+    return [" ".join(words[i:]) for i in range(len(words))]
@@ -0,0 +1,202 @@
+"""
+Lightweight per-rerun tracing for the CRM app.
+
+A trace covers one Streamlit rerun; spans are opened around the hot paths
+(Sheets reads/writes, order-id computation, PDF generation, tab renders).
+When no trace is active (rerun not sampled) every span is a cheap no-op.
+"""
+import contextvars
+import functools
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+
+
+_current_trace = contextvars.ContextVar("crm_current_trace", default=None)
+_current_span = contextvars.ContextVar("crm_current_span", default=None)
+
+
+def _new_id(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start_ns", "end_ns", "attributes")
+
+    def __init__(self, name: str, parent_id: Optional[str] = None, attributes: Optional[dict] = None):
+        self.name = name
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+        }
+
+
+class Trace:
+    """All spans recorded during one rerun."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.trace_id = _new_id(16)
+        self.root = Span(name)
+        self.spans = [self.root]
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    @property
+    def duration_ms(self) -> float:
+        return self.root.duration_ms
+
+    def summary(self) -> dict:
+        """Total time and call count per span name (root excluded)."""
+        out = {}
+        for s in self.spans[1:]:
+            entry = out.setdefault(s.name, {"calls": 0, "total_ms": 0.0})
+            entry["calls"] += 1
+            entry["total_ms"] += s.duration_ms
+        return out
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "duration_ms": round(self.duration_ms, 3),
+            "spans": [s.to_dict() for s in self.spans],
+        }
+
+
+def start_trace(name: str, sample_rate: float = 0.0, force: bool = False) -> Optional[Trace]:
+    """
+    Start a trace for the current rerun if it is sampled.
+    Returns None (and leaves tracing disabled) when the rerun is not sampled.
+    """
+    if not force and (sample_rate <= 0 or random.random() >= sample_rate):
+        _current_trace.set(None)
+        _current_span.set(None)
+        return None
+    trace = Trace(name)
+    _current_trace.set(trace)
+    _current_span.set(trace.root)
+    return trace
+
+
+def end_trace() -> Optional[Trace]:
+    trace = _current_trace.get()
+    if trace is None:
+        return None
+    trace.root.end_ns = time.time_ns()
+    _current_trace.set(None)
+    _current_span.set(None)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a block inside the active trace; no-op if the rerun is not traced."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = _current_span.get()
+    s = Span(name, parent.span_id if parent else None, attributes)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except Exception as e:
+        s.attributes["error"] = repr(e)
+        raise
+    finally:
+        s.end_ns = time.time_ns()
+        _current_span.reset(token)
+        trace.add(s)
+
+
+def traced(name: Optional[str] = None):
+    """Decorator form of span()."""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_trace.get() is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TraceBuffer:
+    """Bounded history of finished traces (one buffer per session)."""
+
+    def __init__(self, maxlen: int = 50):
+        self.traces = deque(maxlen=maxlen)
+
+    def append(self, trace: Optional[Trace]):
+        if trace is not None:
+            self.traces.append(trace)
+
+    def clear(self):
+        self.traces.clear()
+
+    def last(self) -> Optional[Trace]:
+        return self.traces[-1] if self.traces else None
+
+    def to_json(self) -> str:
+        return json.dumps([t.to_dict() for t in self.traces], ensure_ascii=False, indent=2)
+
+    def to_otlp_json(self, service_name: str = "printer-crm") -> str:
+        """Export in the OTLP/JSON layout (resourceSpans → scopeSpans → spans)."""
+        spans = []
+        for t in self.traces:
+            for s in t.spans:
+                spans.append({
+                    "traceId": t.trace_id,
+                    "spanId": s.span_id,
+                    "parentSpanId": s.parent_id or "",
+                    "name": s.name,
+                    "kind": 1,
+                    "startTimeUnixNano": str(s.start_ns),
+                    "endTimeUnixNano": str(s.end_ns or s.start_ns),
+                    "attributes": [
+                        {"key": k, "value": {"stringValue": str(v)}}
+                        for k, v in s.attributes.items()
+                    ],
+                })
+        payload = {
+            "resourceSpans": [{
+                "resource": {
+                    "attributes": [{"key": "service.name", "value": {"stringValue": service_name}}],
+                },
+                "scopeSpans": [{"scope": {"name": "crm.tracing"}, "spans": spans}],
+            }],
+        }
+        return json.dumps(payload, indent=2)
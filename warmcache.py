@@ -0,0 +1,142 @@
+"""
+Local warm cache of the last known worksheets, for fast cold starts.
+
+After a deploy or an idle restart, the first PrinterServiceCRM has to
+download the whole Orders sheet (and the archive) before anything renders.
+With a warm cache the CRM starts from the frames it saved last time, one
+Arrow IPC file per worksheet read through a memory map, and does the real
+Sheets reads (header and schema checks) in a background thread; the fresh
+frames then replace the cached ones and are saved again. The thread only
+reads: if the sheets need a header or migrations, that happens on the
+script thread of the next rerun (PrinterServiceCRM.finish_warm_start).
+
+    .warmcache/Orders.arrow            raw frame as last read/written
+    .warmcache/Orders_Archive.arrow
+
+Only reads with a TTL are served from the cache, and only until the
+background sync finishes: reads with ttl=0 (every write path, the next
+order id) always go to Sheets.
+
+The files keep the raw-frame shape GSheetsConnection returns: object
+columns with NaN for empty cells, numbers stay numbers (costs) and
+everything else is text; numeric columns stay float64.
+"""
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+
+def _column(s: pd.Series) -> tuple:
+    """(Arrow array, kind) for one column; kind says how to rebuild the pandas column."""
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        return pa.array(s.to_numpy(dtype="float64", na_value=np.nan), type=pa.float64()), "float"
+    values = [None if v is None or (isinstance(v, float) and v != v) else v for v in s.tolist()]
+    present = [v for v in values if v is not None]
+    # coloană object doar cu numere (costurile citite din Sheets): rămân numere, dar într-o coloană object
+    if present and all(isinstance(v, float) for v in present):
+        return pa.array(values, type=pa.float64()), "object_float"
+    if present and all(isinstance(v, int) and not isinstance(v, bool) for v in present):
+        return pa.array(values, type=pa.int64()), "object_int"
+    return pa.array([None if v is None else str(v) for v in values], type=pa.string()), "str"
+
+
+def _to_table(df: pd.DataFrame, saved_at: str) -> pa.Table:
+    arrays, names, kinds = [], [], {}
+    for col in df.columns:
+        name = str(col)
+        array, kinds[name] = _column(df[col])
+        arrays.append(array)
+        names.append(name)
+    meta = {"saved_at": saved_at, "kinds": json.dumps(kinds)}
+    return pa.Table.from_arrays(arrays, names=names).replace_schema_metadata(meta)
+
+
+def _from_table(table: pa.Table, kinds: dict) -> pd.DataFrame:
+    out = {}
+    for name, column in zip(table.column_names, table.columns):
+        kind = kinds.get(name, "str")
+        if kind == "float":
+            out[name] = pd.Series(column.to_numpy(), dtype="float64")
+            continue
+        values = column.to_numpy(zero_copy_only=False).astype(object)
+        values[pd.isna(values)] = np.nan
+        if kind == "object_int":
+            values = np.array([v if v != v else int(v) for v in values], dtype=object)
+        out[name] = pd.Series(values, dtype=object)
+    return pd.DataFrame(out, columns=table.column_names)
+
+
+class WarmCache:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pending = {}           # worksheet → ultimul cadru de salvat
+        self._pending_lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="warm-cache")
+
+    def _file(self, worksheet: str) -> Path:
+        return self.path / f"{re.sub(r'[^A-Za-z0-9_.-]', '_', worksheet)}.arrow"
+
+    def save(self, worksheet: str, df: Optional[pd.DataFrame]) -> bool:
+        """Replace the cached frame of a worksheet (atomic; never raises)."""
+        if df is None:
+            return False
+        target = self._file(worksheet)
+        try:
+            table = _to_table(df, datetime.now().isoformat(timespec="seconds"))
+            with self._lock:
+                tmp = target.with_suffix(f".{threading.get_ident()}.tmp")
+                with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+                os.replace(tmp, target)
+            return True
+        except (OSError, pa.ArrowException):
+            return False
+
+    def save_later(self, worksheet: str, df: Optional[pd.DataFrame]):
+        """
+        Save in the background, after a Sheets write: saves queued for the same
+        worksheet collapse into the newest frame. `df` is copied (deep: pandas 2
+        has no copy-on-write by default), so later in-place edits by the
+        caller do not reach the file.
+        """
+        if df is None:
+            return
+        with self._pending_lock:
+            queued = worksheet in self._pending
+            self._pending[worksheet] = df.copy()
+        if not queued:
+            self._writer.submit(self._flush, worksheet)
+
+    def _flush(self, worksheet: str):
+        with self._pending_lock:
+            df = self._pending.pop(worksheet, None)
+        self.save(worksheet, df)
+
+    def flush(self):
+        """Wait for the queued background saves."""
+        self._writer.submit(lambda: None).result()
+
+    def load(self, worksheet: str) -> Optional[tuple]:
+        """(frame, saved_at) from the memory-mapped file, None if there is none or it is unreadable."""
+        path = self._file(worksheet)
+        if not path.exists():
+            return None
+        try:
+            with pa.memory_map(str(path)) as source:
+                table = pa.ipc.open_file(source).read_all()
+                meta = table.schema.metadata or {}
+                df = _from_table(table, json.loads(meta.get(b"kinds", b"{}")))
+        except (OSError, pa.ArrowException):
+            return None
+        return df, meta.get(b"saved_at", b"").decode()